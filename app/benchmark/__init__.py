@@ -0,0 +1,6 @@
+"""
+离线基准测试：合成素材（fixtures）、本地 TTS/LLM 替身（fakes）、阶段计时（suite）
+以及入口模块的启动导入耗时检查（importtime）
+
+运行方式见 app/benchmark/__main__.py 和 app/benchmark/importtime.py
+"""
@@ -0,0 +1,84 @@
+"""
+命令行入口
+
+    python -m app.benchmark --segments 10 --repeat 3 --output storage/benchmark/result.json
+    python -m app.benchmark --baseline storage/benchmark/baseline.json --threshold 0.15
+
+存在性能回退时退出码为 1，基线参数不一致时为 2
+"""
+
+import argparse
+import os
+import sys
+
+from loguru import logger
+
+from app.benchmark import suite
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.benchmark", description="NarratoAI 视频处理流水线基准测试")
+    parser.add_argument("--segments", type=int, default=10, help="脚本片段数")
+    parser.add_argument("--segment-seconds", type=float, default=5.0, help="每个片段的时长（秒）")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--threads", type=int, default=2, help="FFmpeg 线程数")
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段的重复次数")
+    parser.add_argument("--stages", default=",".join(suite.ALL_STAGES),
+                        help=f"逗号分隔的阶段列表，可选: {','.join(suite.ALL_STAGES)}")
+    parser.add_argument("--subtitles", action="store_true", help="合成时烧录字幕（需要 resource/fonts 中的字体）")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="模拟 LLM 响应延迟（秒）")
+    parser.add_argument("--workdir", default=None, help="素材和输出目录，默认 storage/benchmark")
+    parser.add_argument("--output", default=None, help="结果 JSON 路径")
+    parser.add_argument("--baseline", default=None, help="基线结果 JSON，用于回退检测")
+    parser.add_argument("--threshold", type=float, default=suite.DEFAULT_THRESHOLD, help="允许的耗时增长比例")
+    parser.add_argument("--keep", action="store_true", help="保留运行产生的输出文件")
+    args = parser.parse_args(argv)
+
+    if args.workdir is None:
+        from app.utils import utils
+        args.workdir = utils.storage_dir("benchmark", create=True)
+
+    ctx = suite.BenchmarkContext(
+        workdir=args.workdir,
+        segments=args.segments,
+        segment_seconds=args.segment_seconds,
+        width=args.width,
+        height=args.height,
+        fps=args.fps,
+        threads=args.threads,
+        subtitles=args.subtitles,
+        llm_latency=args.llm_latency,
+    )
+    stages = [name.strip() for name in args.stages.split(",") if name.strip()]
+    results = suite.run(ctx, stages=stages, repeat=args.repeat, keep=args.keep)
+
+    output = args.output or os.path.join(args.workdir, "result.json")
+    suite.save(results, output)
+    logger.info(f"基准测试结果已写入: {output}")
+
+    for name, stage in results["stages"].items():
+        wall = stage["wall_seconds"]
+        print(f"{name:<16} median {wall['median']:>8.3f}s  min {wall['min']:>8.3f}s  "
+              f"cpu {stage['cpu_seconds']:>8.3f}s  child cpu {stage['child_cpu_seconds']:>8.3f}s")
+
+    if not args.baseline:
+        return 0
+
+    baseline = suite.load(args.baseline)
+    mismatch = suite.params_mismatch(baseline, results)
+    if mismatch:
+        logger.error(f"基线参数与本次运行不一致，无法比较: {mismatch}")
+        return 2
+
+    regressions = 0
+    for row in suite.compare(baseline, results, args.threshold):
+        flag = "REGRESSION" if row["regression"] else "ok"
+        print(f"{row['stage']:<16} {row['baseline']:>8.3f}s -> {row['current']:>8.3f}s  x{row['ratio']:<6} {flag}")
+        regressions += row["regression"]
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
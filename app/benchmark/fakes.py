@@ -0,0 +1,132 @@
+"""
+基准测试使用的本地替身（TTS / LLM）
+
+基准测试必须离线、可复现，因此不调用任何在线服务：
+- fake_tts_multiple 与 voice.tts_multiple 的参数和返回结构一致，用正弦音模拟配音，时长与文字长度成正比
+- FakeTextProvider 是一个文本模型提供商，根据提示词中的片段数返回固定的解说文案 JSON
+"""
+
+import asyncio
+import json
+import os
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.benchmark import fixtures
+from app.services.llm.base import TextModelProvider
+
+FAKE_PROVIDER_NAME = "benchmark"
+
+# 模拟配音语速（字/秒）
+FAKE_TTS_CHARS_PER_SECOND = 4.0
+
+
+def fake_tts_multiple(task_id: str, list_script: list, voice_name: str, voice_rate: float, voice_pitch: float,
+                      tts_engine: str = "azure") -> List[Dict[str, Any]]:
+    """
+    离线模拟 voice.tts_multiple：为 OST != 1 的片段生成正弦音频和字幕文件
+
+    Args:
+        task_id: 任务ID
+        list_script: 脚本列表
+        voice_name: 语音名称（忽略）
+        voice_rate: 语音速率，影响模拟配音时长
+        voice_pitch: 语调（忽略）
+        tts_engine: TTS 引擎（忽略）
+
+    Returns:
+        List[Dict]: 与 voice.tts_multiple 相同结构的结果列表
+    """
+    from app.utils import utils
+
+    output_dir = utils.task_dir(task_id)
+    rate = voice_rate if voice_rate and voice_rate > 0 else 1.0
+    tts_results = []
+    for item in list_script:
+        if item['OST'] == 1:
+            continue
+        timestamp = item['timestamp'].replace(':', '_')
+        audio_file = os.path.join(output_dir, f"audio_{timestamp}.mp3")
+        subtitle_file = os.path.join(output_dir, f"subtitle_{timestamp}.srt")
+        text = item['narration']
+
+        duration = round(max(0.5, len(text) / (FAKE_TTS_CHARS_PER_SECOND * rate)), 3)
+        fixtures.generate_tone(audio_file, duration, frequency=300 + (item['_id'] % 10) * 50)
+        fixtures.write_srt(subtitle_file, fixtures.narration_cues(text, duration))
+
+        tts_results.append({
+            "_id": item['_id'],
+            "timestamp": item['timestamp'],
+            "audio_file": audio_file,
+            "subtitle_file": subtitle_file,
+            "duration": duration,
+            "text": text,
+        })
+    return tts_results
+
+
+@contextmanager
+def patched_tts() -> Iterator[None]:
+    """在上下文内用 fake_tts_multiple 替换 voice.tts_multiple"""
+    from app.services import voice
+
+    original = voice.tts_multiple
+    voice.tts_multiple = fake_tts_multiple
+    try:
+        yield
+    finally:
+        voice.tts_multiple = original
+
+
+class FakeTextProvider(TextModelProvider):
+    """返回固定解说文案的文本模型提供商，模拟固定的生成延迟"""
+
+    def __init__(self, segments: int = 10, segment_seconds: float = 5.0, latency: float = 0.0, **kwargs):
+        self.segments = segments
+        self.segment_seconds = segment_seconds
+        self.latency = latency
+        super().__init__(api_key="benchmark", model_name="benchmark", **kwargs)
+
+    @property
+    def provider_name(self) -> str:
+        return FAKE_PROVIDER_NAME
+
+    @property
+    def supported_models(self) -> List[str]:
+        return ["benchmark"]
+
+    async def _make_api_call(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        items = fixtures.generate_script(self.segments, self.segment_seconds)
+        return {"items": items}
+
+    async def generate_text(self,
+                            prompt: str,
+                            system_prompt: Optional[str] = None,
+                            temperature: float = 1.0,
+                            max_tokens: Optional[int] = None,
+                            response_format: Optional[str] = None,
+                            **kwargs) -> str:
+        response = await self._make_api_call({"prompt": prompt})
+        return json.dumps(response, ensure_ascii=False)
+
+
+@contextmanager
+def fake_text_provider(segments: int, segment_seconds: float, latency: float = 0.0) -> Iterator[FakeTextProvider]:
+    """
+    在上下文内注册 FakeTextProvider，可通过 provider="benchmark" 调用
+
+    退出时移除注册和实例缓存，不影响其他提供商
+    """
+    from app.services.llm.manager import LLMServiceManager
+
+    provider = FakeTextProvider(segments=segments, segment_seconds=segment_seconds, latency=latency)
+    cache_key = f"text_{FAKE_PROVIDER_NAME}"
+    LLMServiceManager.register_text_provider(FAKE_PROVIDER_NAME, FakeTextProvider)
+    LLMServiceManager._text_instance_cache[cache_key] = provider
+    try:
+        yield provider
+    finally:
+        LLMServiceManager._text_instance_cache.pop(cache_key, None)
+        LLMServiceManager._text_providers.pop(FAKE_PROVIDER_NAME, None)
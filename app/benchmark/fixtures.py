@@ -0,0 +1,215 @@
+"""
+基准测试合成素材
+
+所有素材都由 FFmpeg lavfi（testsrc2 / sine）和固定随机种子离线生成，
+相同参数生成的素材内容完全一致，并按参数缓存在工作目录中，重复运行无需重新生成
+"""
+
+import hashlib
+import json
+import os
+import random
+import subprocess
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+# 生成解说文案使用的字符集（固定，保证可复现）
+_CHARS = "的一是不了人在有他这中大来上们个到说和地也子时道出要就以会可下而过天去能对小多然于心学么之都好看起发当没成只如事把还用第样道想作种开美总从无情己面最女但现前些所同日手又行意动"
+
+# OST 类型循环：0 纯解说、1 纯原声、2 解说+原声
+DEFAULT_OST_PATTERN = (0, 2, 1)
+
+
+def _bitexact_args() -> List[str]:
+    """让输出文件不包含编码器版本等可变信息"""
+    return ["-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact"]
+
+
+def _run(cmd: List[str]):
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8",
+                            errors="ignore")
+    if result.returncode != 0:
+        raise RuntimeError(f"生成基准测试素材失败: {' '.join(cmd)}\n{result.stderr[-1000:]}")
+
+
+def _cached(path: str, params: Dict) -> bool:
+    """素材已存在且参数一致时跳过生成"""
+    marker = f"{path}.params.json"
+    if os.path.exists(path) and os.path.exists(marker):
+        with open(marker, "r", encoding="utf-8") as f:
+            return json.load(f) == params
+    return False
+
+
+def _mark(path: str, params: Dict):
+    with open(f"{path}.params.json", "w", encoding="utf-8") as f:
+        json.dump(params, f)
+
+
+def format_timestamp(seconds: float) -> str:
+    """秒数转换为 HH:MM:SS,mmm"""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def generate_source_video(path: str,
+                          duration: float,
+                          width: int = 1280,
+                          height: int = 720,
+                          fps: int = 25) -> str:
+    """
+    生成带音轨的测试视频（testsrc2 画面 + 440Hz 正弦音）
+
+    Args:
+        path: 输出路径
+        duration: 时长（秒）
+        width: 宽度
+        height: 高度
+        fps: 帧率
+
+    Returns:
+        str: 视频路径
+    """
+    params = {"duration": duration, "width": width, "height": height, "fps": fps}
+    if _cached(path, params):
+        return path
+
+    logger.info(f"生成测试视频: {path} ({width}x{height}, {duration}s)")
+    _run([
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-threads", "1",
+        "-c:a", "aac", "-b:a", "128k",
+        *_bitexact_args(),
+        "-shortest", path,
+    ])
+    _mark(path, params)
+    return path
+
+
+def generate_tone(path: str, duration: float, frequency: int = 660) -> str:
+    """
+    生成正弦音频（用于模拟 TTS 配音和背景音乐）
+
+    Args:
+        path: 输出路径（扩展名决定格式，如 .mp3）
+        duration: 时长（秒）
+        frequency: 频率（Hz）
+
+    Returns:
+        str: 音频路径
+    """
+    params = {"duration": round(duration, 3), "frequency": frequency}
+    if _cached(path, params):
+        return path
+
+    _run([
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency={frequency}:sample_rate=24000:duration={duration:.3f}",
+        "-ac", "1", *_bitexact_args(), path,
+    ])
+    _mark(path, params)
+    return path
+
+
+def synthetic_text(seed: int, length: int) -> str:
+    """生成固定种子的中文文本"""
+    rng = random.Random(seed)
+    sentences = []
+    remaining = length
+    while remaining > 0:
+        size = min(remaining, rng.randint(8, 20))
+        sentences.append("".join(rng.choice(_CHARS) for _ in range(size)))
+        remaining -= size
+    return "，".join(sentences) + "。"
+
+
+def generate_script(segments: int,
+                    segment_seconds: float,
+                    ost_pattern=DEFAULT_OST_PATTERN,
+                    chars_per_second: float = 4.0,
+                    seed: int = 42) -> List[Dict]:
+    """
+    生成剪辑脚本（与 LLM 生成的脚本结构一致）
+
+    Args:
+        segments: 片段数
+        segment_seconds: 每个片段在原视频中的时长（秒）
+        ost_pattern: OST 类型循环
+        chars_per_second: 解说文字速度，决定模拟配音时长
+        seed: 随机种子
+
+    Returns:
+        List[Dict]: 脚本列表
+    """
+    script = []
+    for idx in range(segments):
+        start = idx * segment_seconds
+        end = start + segment_seconds
+        ost = ost_pattern[idx % len(ost_pattern)]
+        # 解说时长略短于片段时长，保证裁剪区间落在原视频内
+        narration_chars = max(4, int(segment_seconds * 0.8 * chars_per_second))
+        script.append({
+            "_id": idx + 1,
+            "timestamp": f"{format_timestamp(start)}-{format_timestamp(end)}",
+            "picture": f"测试画面 {idx + 1}",
+            "narration": synthetic_text(seed + idx, narration_chars) if ost != 1 else f"播放原片{idx + 1}",
+            "OST": ost,
+        })
+    return script
+
+
+def write_script(path: str, script: List[Dict]) -> str:
+    """写入脚本 JSON 文件"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(script, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def write_srt(path: str, cues: List[Dict]) -> str:
+    """
+    写入 SRT 字幕
+
+    Args:
+        path: 输出路径
+        cues: [{"start": 秒, "end": 秒, "text": 文本}, ...]
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for idx, cue in enumerate(cues, 1):
+            f.write(f"{idx}\n{format_timestamp(cue['start'])} --> {format_timestamp(cue['end'])}\n{cue['text']}\n\n")
+    return path
+
+
+def narration_cues(text: str, duration: float, offset: float = 0.0) -> List[Dict]:
+    """按标点把解说文本平均分配到时长内，生成字幕条目"""
+    parts = [part for part in text.replace("。", "，").split("，") if part]
+    if not parts:
+        return []
+    total_chars = sum(len(part) for part in parts)
+    cues = []
+    position = offset
+    for part in parts:
+        length = duration * len(part) / total_chars
+        cues.append({"start": position, "end": position + length, "text": part})
+        position += length
+    return cues
+
+
+def ffmpeg_version() -> Optional[str]:
+    """FFmpeg 版本信息（写入基准测试结果，便于比较不同环境）"""
+    try:
+        result = subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                text=True, encoding="utf-8", errors="ignore")
+        return result.stdout.splitlines()[0] if result.stdout else None
+    except OSError:
+        return None
+
+
+def fixture_key(**params) -> str:
+    """根据素材参数生成目录名"""
+    return hashlib.md5(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:12]
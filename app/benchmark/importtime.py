@@ -0,0 +1,183 @@
+"""
+启动耗时检查：在子进程中以 python -X importtime 导入各入口模块，统计导入耗时并检查是否加载了重量级 SDK
+
+TTS 引擎（edge_tts、Azure、腾讯云、DashScope）、LLM SDK（litellm、openai、google-generativeai）
+和 moviepy 都应在首次使用对应引擎/提供商时才导入，只需要单个引擎的工作进程和命令行工具应在一秒内完成启动。
+
+    python -m app.benchmark.importtime
+    python -m app.benchmark.importtime --budget 0.5 --targets voice,llm --output storage/benchmark/importtime.json
+
+超出耗时预算或导入了不应加载的模块时退出码为 1
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+# 各入口模块的导入累计耗时预算（秒）
+DEFAULT_BUDGET_SECONDS = 0.8
+
+# 检查目标：导入语句和不应在导入阶段加载的模块
+TARGETS = {
+    "voice": {
+        "statement": "import app.services.voice",
+        "forbidden": ["edge_tts", "azure.cognitiveservices.speech", "tencentcloud", "dashscope", "moviepy",
+                      "litellm", "openai", "google.generativeai"],
+    },
+    "llm": {
+        "statement": ("import app.services.llm\n"
+                      "from app.services.llm.providers import register_all_providers\n"
+                      "register_all_providers()"),
+        "forbidden": ["litellm", "openai", "google.generativeai", "edge_tts", "moviepy"],
+    },
+    "material": {
+        "statement": "import app.services.material",
+        "forbidden": ["moviepy", "edge_tts", "litellm", "openai", "google.generativeai"],
+    },
+    "script_service": {
+        "statement": "import app.services.script_service",
+        "forbidden": ["litellm", "openai", "google.generativeai", "edge_tts"],
+    },
+}
+
+_LINE_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """
+    解析 -X importtime 输出
+
+    Args:
+        stderr: 子进程的标准错误输出
+
+    Returns:
+        List[Dict]: 每个模块的 {"module", "self_us", "cumulative_us", "depth"}，按导入完成顺序排列
+    """
+    rows = []
+    for line in stderr.splitlines():
+        match = _LINE_PATTERN.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        rows.append({
+            "module": module,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            # 嵌套层级：顶层模块前有 1 个空格，每深一层多 2 个空格
+            "depth": max(0, (len(indent) - 1) // 2),
+        })
+    return rows
+
+
+def _matches(module: str, prefix: str) -> bool:
+    return module == prefix or module.startswith(prefix + ".")
+
+
+def measure(statement: str, python: Optional[str] = None) -> Dict:
+    """
+    在新的解释器中执行导入语句并统计导入耗时
+
+    Args:
+        statement: 要执行的导入语句
+        python: 解释器路径，默认使用当前解释器
+
+    Returns:
+        Dict: 包含导入累计耗时、进程总耗时、已导入模块和最慢的顶层导入
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [_ROOT_DIR, env.get("PYTHONPATH", "")]))
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [python or sys.executable, "-X", "importtime", "-c", statement],
+        cwd=_ROOT_DIR, env=env, capture_output=True, text=True,
+    )
+    wall_seconds = time.perf_counter() - started
+
+    rows = parse_importtime(proc.stderr)
+    top_level = [row for row in rows if row["depth"] == 0]
+    import_seconds = sum(row["cumulative_us"] for row in top_level) / 1e6
+    slowest = sorted(top_level, key=lambda row: row["cumulative_us"], reverse=True)[:10]
+    error = ""
+    if proc.returncode != 0:
+        error = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")][-1:]
+        error = error[0] if error else f"exit code {proc.returncode}"
+
+    return {
+        "statement": statement,
+        "import_seconds": round(import_seconds, 4),
+        "wall_seconds": round(wall_seconds, 4),
+        "modules": [row["module"] for row in rows],
+        "slowest": [{"module": row["module"], "seconds": round(row["cumulative_us"] / 1e6, 4)} for row in slowest],
+        "error": error,
+    }
+
+
+def check(targets: Optional[List[str]] = None, budget: float = DEFAULT_BUDGET_SECONDS) -> Dict[str, Dict]:
+    """
+    检查各入口模块的导入耗时和重量级 SDK 加载情况
+
+    Args:
+        targets: 要检查的目标名称（TARGETS 的键），默认全部
+        budget: 导入累计耗时预算（秒）
+
+    Returns:
+        Dict[str, Dict]: 每个目标的测量结果，附带 forbidden_loaded（不应加载却已加载的模块）和 ok
+    """
+    results = {}
+    for name in targets or list(TARGETS):
+        target = TARGETS[name]
+        result = measure(target["statement"])
+        loaded = sorted({
+            prefix for prefix in target["forbidden"]
+            for module in result["modules"] if _matches(module, prefix)
+        })
+        result["forbidden_loaded"] = loaded
+        result["budget_seconds"] = budget
+        result["ok"] = not result["error"] and not loaded and result["import_seconds"] <= budget
+        results[name] = result
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.benchmark.importtime", description="入口模块导入耗时检查")
+    parser.add_argument("--targets", default=",".join(TARGETS), help=f"逗号分隔的检查目标，可选: {','.join(TARGETS)}")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS, help="导入累计耗时预算（秒）")
+    parser.add_argument("--output", default=None, help="结果 JSON 路径")
+    args = parser.parse_args(argv)
+
+    targets = [name.strip() for name in args.targets.split(",") if name.strip()]
+    unknown = [name for name in targets if name not in TARGETS]
+    if unknown:
+        parser.error(f"未知的检查目标: {', '.join(unknown)}")
+
+    results = check(targets, args.budget)
+    failed = 0
+    for name, result in results.items():
+        flag = "ok" if result["ok"] else "FAIL"
+        print(f"{name:<16} import {result['import_seconds']:>7.3f}s  process {result['wall_seconds']:>7.3f}s  {flag}")
+        if result["error"]:
+            print(f"    导入失败: {result['error']}")
+        if result["forbidden_loaded"]:
+            print(f"    启动时加载了: {', '.join(result['forbidden_loaded'])}")
+        if not result["ok"]:
+            for row in result["slowest"][:5]:
+                print(f"    {row['seconds']:>7.3f}s  {row['module']}")
+        failed += not result["ok"]
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
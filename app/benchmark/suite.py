@@ -0,0 +1,447 @@
+"""
+视频处理流水线基准测试
+
+使用合成素材和本地替身（见 fixtures / fakes）离线运行各处理阶段和完整流程，
+每个阶段重复多次取中位数，输出可比较的 JSON 结果，并支持与基线结果比较以发现性能回退。
+
+结果只在相同参数、相同 FFmpeg 版本和相近硬件之间有可比性，
+因此 meta 中记录了运行环境，比较时参数不一致会给出提示。
+"""
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from app.benchmark import fakes, fixtures
+from app.utils import async_runtime, metrics
+
+RESULT_SCHEMA_VERSION = 1
+
+# 所有可运行的阶段（按执行顺序，后面的阶段会复用前面阶段的输出）
+ALL_STAGES = ["narration", "clip", "combine", "merge_audio", "extract_frames", "merge_materials", "pipeline"]
+
+# 默认回退阈值：中位耗时增加超过 15% 视为回退
+DEFAULT_THRESHOLD = 0.15
+
+# 绝对耗时变化小于该值（秒）时忽略，避免极短阶段的计时噪声误报
+MIN_REGRESSION_SECONDS = 0.05
+
+
+class BenchmarkContext:
+    """一次基准测试运行的参数、素材和阶段间共享的中间结果"""
+
+    def __init__(self,
+                 workdir: str,
+                 segments: int = 10,
+                 segment_seconds: float = 5.0,
+                 width: int = 1280,
+                 height: int = 720,
+                 fps: int = 25,
+                 threads: int = 2,
+                 subtitles: bool = False,
+                 llm_latency: float = 0.0):
+        self.workdir = os.path.abspath(workdir)
+        self.segments = segments
+        self.segment_seconds = segment_seconds
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.threads = threads
+        self.subtitles = subtitles
+        self.llm_latency = llm_latency
+
+        self.task_prefix = f"benchmark_{fixtures.fixture_key(**self.params())}"
+        self.task_ids: List[str] = []
+        self.source_video = ""
+        self.bgm_file = ""
+        self.script: List[Dict] = []
+        self.script_path = ""
+        self.tts_results: List[Dict] = []
+        self.clips: Optional[Dict] = None
+        self.timed_script: Optional[List[Dict]] = None
+        self.combined_video = ""
+        self.merged_audio = ""
+
+    def params(self) -> Dict[str, Any]:
+        """影响结果可比性的参数"""
+        return {
+            "segments": self.segments,
+            "segment_seconds": self.segment_seconds,
+            "width": self.width,
+            "height": self.height,
+            "fps": self.fps,
+            "threads": self.threads,
+            "subtitles": self.subtitles,
+            "llm_latency": self.llm_latency,
+        }
+
+    def new_task_id(self, name: str) -> str:
+        task_id = f"{self.task_prefix}_{name}_{len(self.task_ids)}"
+        self.task_ids.append(task_id)
+        return task_id
+
+    def run_dir(self, name: str) -> str:
+        path = os.path.join(self.workdir, "runs", name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def cleanup(self):
+        """删除运行中生成的任务目录和输出，保留可复用的素材"""
+        from app.utils import utils
+
+        for task_id in self.task_ids:
+            shutil.rmtree(os.path.join(utils.task_dir(), task_id), ignore_errors=True)
+        shutil.rmtree(os.path.join(self.workdir, "runs"), ignore_errors=True)
+
+
+def prepare(ctx: BenchmarkContext):
+    """生成（或复用已缓存的）合成素材：原视频、背景音乐、脚本和模拟配音"""
+    fixture_dir = os.path.join(ctx.workdir, "fixtures", fixtures.fixture_key(**ctx.params()))
+    os.makedirs(fixture_dir, exist_ok=True)
+
+    duration = ctx.segments * ctx.segment_seconds + 1
+    ctx.source_video = fixtures.generate_source_video(
+        os.path.join(fixture_dir, "source.mp4"), duration, ctx.width, ctx.height, ctx.fps)
+    ctx.bgm_file = fixtures.generate_tone(os.path.join(fixture_dir, "bgm.mp3"), duration, frequency=220)
+    ctx.script = fixtures.generate_script(ctx.segments, ctx.segment_seconds)
+    ctx.script_path = fixtures.write_script(os.path.join(fixture_dir, "script.json"), ctx.script)
+    ctx.tts_results = fakes.fake_tts_multiple(
+        task_id=ctx.new_task_id("tts"),
+        list_script=ctx.script,
+        voice_name="benchmark",
+        voice_rate=1.0,
+        voice_pitch=1.0,
+    )
+
+
+def _ensure_clips(ctx: BenchmarkContext):
+    if ctx.clips is None:
+        _run_clip(ctx, ctx.run_dir("clip_setup"))
+
+
+def _ensure_combined(ctx: BenchmarkContext):
+    if not ctx.combined_video:
+        _run_combine(ctx, ctx.run_dir("combine_setup"))
+
+
+def _ensure_merged_audio(ctx: BenchmarkContext):
+    if not ctx.merged_audio:
+        _run_merge_audio(ctx, ctx.run_dir("merge_audio_setup"))
+
+
+def _run_narration(ctx: BenchmarkContext, run_dir: str) -> Dict[str, float]:
+    from app.services.llm.unified_service import UnifiedLLMService
+
+    with fakes.fake_text_provider(ctx.segments, ctx.segment_seconds, latency=ctx.llm_latency):
+        items = async_runtime.run(UnifiedLLMService.generate_narration_script(
+            prompt="benchmark", provider=fakes.FAKE_PROVIDER_NAME))
+    return {"items": len(items)}
+
+
+def _run_clip(ctx: BenchmarkContext, run_dir: str) -> Dict[str, float]:
+    from app.services import clip_video, update_script
+
+    ctx.clips = clip_video.clip_video_unified(
+        video_origin_path=ctx.source_video,
+        script_list=ctx.script,
+        tts_results=ctx.tts_results,
+        output_dir=run_dir,
+    )
+    ctx.timed_script = update_script.update_script_timestamps(
+        ctx.script,
+        ctx.clips,
+        {item['_id']: item['audio_file'] for item in ctx.tts_results},
+        {item['_id']: item['subtitle_file'] for item in ctx.tts_results},
+    )
+    ctx.combined_video = ""
+    ctx.merged_audio = ""
+    return {"clips": len(ctx.clips)}
+
+
+def _run_combine(ctx: BenchmarkContext, run_dir: str) -> Dict[str, float]:
+    from app.models.schema import VideoAspect
+    from app.services import merger_video
+
+    _ensure_clips(ctx)
+    video_paths = [item['video'] for item in ctx.timed_script if item.get('video')]
+    output = os.path.join(run_dir, "merger.mp4")
+    merger_video.combine_clip_videos(
+        output_video_path=output,
+        video_paths=video_paths,
+        video_ost_list=[item['OST'] for item in ctx.timed_script if item.get('video')],
+        video_aspect=VideoAspect.landscape,
+        threads=ctx.threads,
+        force_software_encoding=True,
+    )
+    ctx.combined_video = output
+    return {"output_bytes": os.path.getsize(output)}
+
+
+def _run_merge_audio(ctx: BenchmarkContext, run_dir: str) -> Dict[str, float]:
+    from app.services import audio_merger
+
+    _ensure_clips(ctx)
+    total_duration = sum(item['duration'] for item in ctx.timed_script)
+    ctx.merged_audio = audio_merger.merge_audio_files(
+        task_id=ctx.new_task_id("merge_audio"),
+        total_duration=total_duration,
+        list_script=ctx.timed_script,
+    )
+    return {"output_bytes": os.path.getsize(ctx.merged_audio)}
+
+
+def _run_extract_frames(ctx: BenchmarkContext, run_dir: str) -> Dict[str, float]:
+    from app.utils.video_processor import VideoProcessor
+
+    frames = VideoProcessor(ctx.source_video).extract_frames_by_interval(
+        run_dir, interval_seconds=ctx.segment_seconds, use_hw_accel=False)
+    return {"frames": len(frames)}
+
+
+def _run_merge_materials(ctx: BenchmarkContext, run_dir: str) -> Dict[str, float]:
+    from app.services import generate_video, subtitle_merger
+
+    _ensure_combined(ctx)
+    _ensure_merged_audio(ctx)
+    subtitle_path = None
+    if ctx.subtitles:
+        subtitle_path = subtitle_merger.merge_subtitle_files(
+            ctx.timed_script, output_file=os.path.join(run_dir, "merged.srt"))
+    output = os.path.join(run_dir, "combined.mp4")
+    generate_video.merge_materials(
+        video_path=ctx.combined_video,
+        audio_path=ctx.merged_audio,
+        output_path=output,
+        subtitle_path=subtitle_path,
+        bgm_path=ctx.bgm_file,
+        options={
+            'keep_original_audio': True,
+            'subtitle_enabled': ctx.subtitles,
+            'threads': ctx.threads,
+        },
+    )
+    return {"output_bytes": os.path.getsize(output)}
+
+
+@contextmanager
+def _patched_bgm(bgm_file: str) -> Iterator[None]:
+    """完整流程中固定使用合成背景音乐，避免 resource/songs 中的随机选择影响结果"""
+    from app.utils import utils
+
+    original = utils.get_bgm_file
+    utils.get_bgm_file = lambda *args, **kwargs: bgm_file
+    try:
+        yield
+    finally:
+        utils.get_bgm_file = original
+
+
+@contextmanager
+def _disabled_clip_cache() -> Iterator[None]:
+    """关闭跨任务片段缓存：重复运行时后几次会直接命中前一次的片段，测到的不再是裁剪耗时"""
+    from app.config import config
+
+    original = config.app.get("enable_clip_cache")
+    config.app["enable_clip_cache"] = False
+    try:
+        yield
+    finally:
+        if original is None:
+            config.app.pop("enable_clip_cache", None)
+        else:
+            config.app["enable_clip_cache"] = original
+
+
+def _run_pipeline(ctx: BenchmarkContext, run_dir: str) -> Dict[str, float]:
+    from app.models.schema import VideoAspect, VideoClipParams
+    from app.services import task as tm
+
+    params = VideoClipParams(
+        video_clip_json_path=ctx.script_path,
+        video_origin_path=ctx.source_video,
+        video_aspect=VideoAspect.landscape.value,
+        voice_name="benchmark",
+        tts_engine="benchmark",
+        subtitle_enabled=ctx.subtitles,
+        n_threads=ctx.threads,
+    )
+    with fakes.patched_tts(), _patched_bgm(ctx.bgm_file):
+        result = tm.start_subclip_unified(ctx.new_task_id("pipeline"), params)
+    output = result["videos"][0]
+    return {"output_bytes": os.path.getsize(output)}
+
+
+STAGES: Dict[str, Callable[[BenchmarkContext, str], Dict[str, float]]] = {
+    "narration": _run_narration,
+    "clip": _run_clip,
+    "combine": _run_combine,
+    "merge_audio": _run_merge_audio,
+    "extract_frames": _run_extract_frames,
+    "merge_materials": _run_merge_materials,
+    "pipeline": _run_pipeline,
+}
+
+
+def _summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    walls = [run["wall_seconds"] for run in runs]
+    return {
+        "wall_seconds": {
+            "median": round(statistics.median(walls), 4),
+            "min": round(min(walls), 4),
+            "max": round(max(walls), 4),
+        },
+        "cpu_seconds": round(statistics.median(run["cpu_seconds"] for run in runs), 4),
+        "child_cpu_seconds": round(statistics.median(run["child_cpu_seconds"] for run in runs), 4),
+        "peak_rss_bytes": max(run["peak_rss_bytes"] for run in runs),
+        "child_peak_rss_bytes": max(run["child_peak_rss_bytes"] for run in runs),
+        "subprocesses": statistics.median(run["subprocesses"] for run in runs),
+        "runs": runs,
+    }
+
+
+def run_stage(ctx: BenchmarkContext, name: str, repeat: int = 3) -> Dict[str, Any]:
+    """
+    重复运行单个阶段并汇总指标
+
+    Args:
+        ctx: 基准测试上下文
+        name: 阶段名称，见 ALL_STAGES
+        repeat: 重复次数
+
+    Returns:
+        Dict: 阶段汇总结果（中位耗时、CPU、峰值内存等），每次运行的明细在 runs 中
+    """
+    runs = []
+    for index in range(repeat):
+        run_dir = ctx.run_dir(f"{name}_{index}")
+        with metrics.measure(name, run=index) as measured:
+            counters = STAGES[name](ctx, run_dir)
+        run = {key: round(value, 4) if isinstance(value, float) else value
+               for key, value in measured.values.items()}
+        run["counters"] = counters
+        runs.append(run)
+        logger.info(f"[benchmark] {name} #{index + 1}/{repeat}: {run['wall_seconds']:.3f}s")
+    return _summarize(runs)
+
+
+def _git_commit() -> Optional[str]:
+    from app.utils import utils
+
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=utils.root_dir(),
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    """运行环境信息"""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": fixtures.ffmpeg_version(),
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run(ctx: BenchmarkContext, stages: Optional[List[str]] = None, repeat: int = 3, keep: bool = False) -> Dict:
+    """
+    运行基准测试
+
+    Args:
+        ctx: 基准测试上下文
+        stages: 要运行的阶段，默认全部
+        repeat: 每个阶段的重复次数
+        keep: 是否保留运行产生的输出文件
+
+    Returns:
+        Dict: 可直接写入 JSON 的结果
+    """
+    from app.utils import ffmpeg_utils
+
+    stages = stages or ALL_STAGES
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        raise ValueError(f"未知的基准测试阶段: {unknown}，可选: {ALL_STAGES}")
+
+    # 基准测试只在 CPU 上运行，保证不同机器之间结果可比
+    ffmpeg_utils.force_software_encoding()
+
+    results = {
+        "schema": RESULT_SCHEMA_VERSION,
+        "meta": environment(),
+        "params": dict(ctx.params(), repeat=repeat),
+        "stages": {},
+    }
+    try:
+        prepare(ctx)
+        with _disabled_clip_cache():
+            for name in [name for name in ALL_STAGES if name in stages]:
+                logger.info(f"[benchmark] 运行阶段: {name}")
+                results["stages"][name] = run_stage(ctx, name, repeat)
+    finally:
+        if not keep:
+            ctx.cleanup()
+    return results
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    比较两次基准测试的中位耗时
+
+    Args:
+        baseline: 基线结果
+        current: 本次结果
+        threshold: 允许的耗时增长比例，超过即视为回退
+
+    Returns:
+        List[Dict]: 每个共同阶段的比较结果，regression 为 True 表示性能回退
+    """
+    rows = []
+    for name, stage in current.get("stages", {}).items():
+        base_stage = baseline.get("stages", {}).get(name)
+        if not base_stage:
+            continue
+        base = base_stage["wall_seconds"]["median"]
+        value = stage["wall_seconds"]["median"]
+        ratio = value / base if base > 0 else float("inf")
+        rows.append({
+            "stage": name,
+            "baseline": base,
+            "current": value,
+            "ratio": round(ratio, 3),
+            "regression": ratio > 1 + threshold and value - base > MIN_REGRESSION_SECONDS,
+        })
+    return rows
+
+
+def params_mismatch(baseline: Dict, current: Dict) -> Dict[str, Any]:
+    """返回基线与本次结果中不一致的参数，非空时两者不可直接比较"""
+    base_params = baseline.get("params", {})
+    return {key: (base_params.get(key), value)
+            for key, value in current.get("params", {}).items()
+            if key != "repeat" and base_params.get(key) != value}
+
+
+def load(path: str) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(results: Dict, path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
@@ -190,6 +190,7 @@ class VideoClipParams(BaseModel):
     stroke_width: float = 1.5                   # 描边宽度
     subtitle_position: str = "bottom"   # top, bottom, center, custom
     custom_position: float = 70.0       # 自定义位置
+    subtitle_mode: Optional[str] = Field(default="soft", description="叠加解说的输出方式：soft 软字幕轨 / sidecar 外挂字幕（均直接复制原视频流），burn 烧录字幕（只重新编码字幕区间）")
 
     n_threads: Optional[int] = Field(default=16, description="线程数")    # 线程数，有助于提升视频处理速度
 
@@ -197,6 +198,10 @@ class VideoClipParams(BaseModel):
     original_volume: Optional[float] = Field(default=AudioVolumeDefaults.ORIGINAL_VOLUME, description="视频原声音量")
     bgm_volume: Optional[float] = Field(default=AudioVolumeDefaults.BGM_VOLUME, description="背景音乐音量")
 
+    preview_mode: Optional[str] = Field(default="", description="预览档位：为空时完整质量渲染，可选 360p / 480p")
+    preview_segments: Optional[List[int]] = Field(default=None, description="预览时只渲染的片段 _id 列表，为空表示全部片段")
+    output_aspects: Optional[List[str]] = Field(default=None, description="额外输出的画面比例（如 [\"16:9\", \"1:1\"]），与主比例共用配音、混音和字幕，从一次解码生成")
+
 
 
 
@@ -10,11 +10,11 @@
 
 import os
 import json
-import requests
 from typing import Dict, Any, Optional
 from loguru import logger
 from app.config import config
 from app.utils.utils import get_uuid, storage_dir
+from app.utils import http_client
 from app.services.subtitle_text import read_subtitle_text
 # 导入新的提示词管理系统
 from app.services.prompts import PromptManager
@@ -156,11 +156,13 @@ class SubtitleAnalyzer:
             url = f"{self.base_url}/models/{self.model}:generateContent"
 
             # 发送请求
-            response = requests.post(
+            response = http_client.post(
                 url,
                 json=payload,
                 headers={"Content-Type": "application/json", "x-goog-api-key": self.api_key},
-                timeout=120
+                timeout=120,
+                use_proxy=False,
+                retry_status=True
             )
 
             if response.status_code == 200:
@@ -247,7 +249,8 @@ class SubtitleAnalyzer:
             url = f"{self.base_url}/chat/completions"
 
             # 发送HTTP请求
-            response = requests.post(url, headers=self.headers, json=payload, timeout=120)
+            response = http_client.post(url, headers=self.headers, json=payload, timeout=120, use_proxy=False,
+                                        retry_status=True)
 
             # 解析响应
             if response.status_code == 200:
@@ -449,11 +452,13 @@ class SubtitleAnalyzer:
             url = f"{self.base_url}/models/{self.model}:generateContent"
 
             # 发送请求
-            response = requests.post(
+            response = http_client.post(
                 url,
                 json=payload,
                 headers={"Content-Type": "application/json", "x-goog-api-key": self.api_key},
-                timeout=120
+                timeout=120,
+                use_proxy=False,
+                retry_status=True
             )
 
             if response.status_code == 200:
@@ -544,7 +549,8 @@ class SubtitleAnalyzer:
             url = f"{self.base_url}/chat/completions"
 
             # 发送HTTP请求
-            response = requests.post(url, headers=self.headers, json=payload, timeout=120)
+            response = http_client.post(url, headers=self.headers, json=payload, timeout=120, use_proxy=False,
+                                        retry_status=True)
 
             # 解析响应
             if response.status_code == 200:
@@ -0,0 +1,322 @@
+"""
+多画面比例输出
+
+同一条解说需要同时发布竖屏、横屏、方形等多个版本时，原来只能把整个任务跑多次，
+配音、裁剪、解码和合成都要重复。这里在合并阶段之后一次完成所有版本：
+- 片段按原视频尺寸合并成母版（merger_video.combine_clip_videos 的 target_resolution）
+- 配音、原声和背景音乐只混合一次（generate_video.mix_audio_track），所有版本共用
+- 字幕按每个版本的画面尺寸重新排版，生成对应分辨率的 ASS 文件（字号按短边比例缩放，边距按画面比例计算）
+- 一条 FFmpeg 命令解码母版，split 成多路分支，各自缩放/填充/烧录字幕/编码输出
+
+用法:
+    outputs = aspect_variants.output_geometries(["9:16", "16:9"], lambda aspect: path_for(aspect))
+    aspect_variants.render_variants(master_path, mixed_audio_path, subtitle_path, outputs, style)
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from app.services.merger_video import VideoAspect
+from app.utils import ffmpeg_runner, render_profile, resource_scheduler
+
+_SRT_TIME = r"(\d+):(\d+):(\d+)[,.](\d+)"
+_SRT_CUE = re.compile(_SRT_TIME + r"\s*-->\s*" + _SRT_TIME)
+
+
+@dataclass
+class OutputGeometry:
+    """单个输出版本"""
+    aspect: str
+    width: int
+    height: int
+    path: str
+
+    @property
+    def label(self) -> str:
+        return aspect_label(self.aspect)
+
+
+@dataclass
+class SubtitleStyle:
+    """字幕样式（字号等按 base_size 对应的画面设计，其他画面按短边比例缩放）"""
+    font_path: Optional[str] = None
+    font_size: int = 36
+    color: str = "white"
+    stroke_color: str = "black"
+    stroke_width: float = 1.5
+    position: str = "bottom"        # top, bottom, center, custom
+    custom_position: float = 70.0
+    base_size: Tuple[int, int] = (1080, 1920)
+
+
+def aspect_label(aspect: str) -> str:
+    """画面比例的文件名标签，如 9:16 -> 9x16"""
+    return str(aspect).replace(":", "x")
+
+
+def output_geometries(aspects: Iterable[str], path_for: Callable[[str], str]) -> List[OutputGeometry]:
+    """
+    计算各输出版本的分辨率（去重，保持顺序；预览模式下按档位缩小）
+
+    Args:
+        aspects: 画面比例列表，如 ["9:16", "16:9"]
+        path_for: 根据画面比例返回输出路径
+
+    Returns:
+        List[OutputGeometry]: 输出版本
+    """
+    profile = render_profile.current()
+    geometries = []
+    seen = set()
+    for aspect in aspects:
+        aspect = VideoAspect(getattr(aspect, "value", aspect)).value
+        if aspect in seen:
+            continue
+        seen.add(aspect)
+        width, height = VideoAspect(aspect).to_resolution()
+        if profile is not None:
+            width, height = profile.scale_size(width, height)
+        geometries.append(OutputGeometry(aspect, width, height, path_for(aspect)))
+    return geometries
+
+
+def parse_srt(srt_path: str) -> List[Tuple[float, float, str]]:
+    """
+    读取 SRT 字幕
+
+    Returns:
+        List[Tuple[float, float, str]]: (开始秒, 结束秒, 文本)
+    """
+    with open(srt_path, "r", encoding="utf-8-sig", errors="replace") as f:
+        blocks = re.split(r"\n\s*\n", f.read().replace("\r\n", "\n"))
+
+    cues = []
+    for block in blocks:
+        lines = block.strip().split("\n")
+        for index, line in enumerate(lines):
+            match = _SRT_CUE.search(line)
+            if not match:
+                continue
+            values = [int(v) for v in match.groups()]
+            start = values[0] * 3600 + values[1] * 60 + values[2] + values[3] / 1000
+            end = values[4] * 3600 + values[5] * 60 + values[6] + values[7] / 1000
+            text = "\n".join(lines[index + 1:]).strip()
+            if text and end > start:
+                cues.append((start, end, text))
+            break
+    return cues
+
+
+def _ass_time(seconds: float) -> str:
+    centiseconds = int(round(max(0.0, seconds) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+
+def _ass_color(color: str, default: str = "&H00FFFFFF") -> str:
+    """颜色名或 #RRGGBB 转为 ASS 的 &HAABBGGRR"""
+    try:
+        from PIL import ImageColor
+
+        r, g, b = ImageColor.getrgb(color)[:3]
+    except Exception:
+        return default
+    return f"&H00{b:02X}{g:02X}{r:02X}"
+
+
+def _font_family(font_path: Optional[str]) -> str:
+    if not font_path or not os.path.exists(font_path):
+        return "Arial"
+    try:
+        from PIL import ImageFont
+
+        return ImageFont.truetype(font_path, 12).getname()[0] or "Arial"
+    except Exception:
+        return os.path.splitext(os.path.basename(font_path))[0]
+
+
+def layout_style(style: SubtitleStyle, width: int, height: int) -> dict:
+    """
+    按画面尺寸计算字幕排版：字号、描边按短边比例缩放，对齐方式和垂直边距与 MoviePy 合成时的位置规则一致
+
+    Returns:
+        dict: font_size、outline、alignment（ASS 数字键盘对齐）、margin_v、margin_h
+    """
+    scale = min(width, height) / max(1, min(style.base_size))
+    font_size = max(1, int(round(style.font_size * scale)))
+    if style.position == "top":
+        alignment, margin_v = 8, int(round(height * 0.05))
+    elif style.position == "center":
+        alignment, margin_v = 5, 0
+    elif style.position == "custom":
+        margin = 10
+        margin_v = int(round((height - font_size) * (style.custom_position / 100)))
+        alignment, margin_v = 8, max(margin, min(margin_v, height - font_size - margin))
+    else:
+        alignment, margin_v = 2, int(round(height * 0.05))
+    return {
+        "font_size": font_size,
+        "outline": round(style.stroke_width * scale, 2),
+        "alignment": alignment,
+        "margin_v": margin_v,
+        # 文本最大宽度为画面宽度的 90%
+        "margin_h": int(round(width * 0.05)),
+    }
+
+
+def write_ass(cues: List[Tuple[float, float, str]], ass_path: str, width: int, height: int,
+              style: SubtitleStyle) -> str:
+    """
+    生成指定画面尺寸的 ASS 字幕（PlayRes 与输出分辨率一致，libass 按像素排版并自动换行）
+
+    Args:
+        cues: parse_srt() 的结果
+        ass_path: 输出路径
+        width: 画面宽度
+        height: 画面高度
+        style: 字幕样式
+
+    Returns:
+        str: ASS 文件路径
+    """
+    layout = layout_style(style, width, height)
+    header = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 0",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
+        "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, "
+        "MarginL, MarginR, MarginV, Encoding",
+        f"Style: Default,{_font_family(style.font_path)},{layout['font_size']},{_ass_color(style.color)},"
+        f"&H000000FF,{_ass_color(style.stroke_color, '&H00000000')},&H00000000,0,0,0,0,100,100,0,0,1,"
+        f"{layout['outline']},0,{layout['alignment']},{layout['margin_h']},{layout['margin_h']},"
+        f"{layout['margin_v']},1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    events = []
+    for start, end, text in cues:
+        text = text.replace("{", "(").replace("}", ")").replace("\n", "\\N")
+        events.append(f"Dialogue: 0,{_ass_time(start)},{_ass_time(end)},Default,,0,0,0,,{text}")
+
+    with open(ass_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(header + events) + "\n")
+    return ass_path
+
+
+def filter_path(path: str) -> str:
+    """滤镜参数中的文件路径（转义冒号和单引号）"""
+    path = os.path.abspath(path).replace("\\", "/")
+    return "'" + path.replace(":", "\\:").replace("'", "\\'") + "'"
+
+
+def build_command(master_path: str, audio_path: Optional[str], outputs: List[OutputGeometry],
+                  subtitle_files: List[Optional[str]], graph_path: str,
+                  fonts_dir: Optional[str] = None) -> List[str]:
+    """
+    构建单次解码、多路输出的 FFmpeg 命令
+
+    Args:
+        master_path: 母版视频
+        audio_path: 共用音轨，为空时使用母版自带音轨
+        outputs: 输出版本
+        subtitle_files: 与 outputs 一一对应的 ASS 字幕路径（None 表示不烧录字幕）
+        graph_path: 写入滤镜图的脚本文件路径
+        fonts_dir: 字体目录
+
+    Returns:
+        List[str]: FFmpeg 命令
+    """
+    # 编码参数与 merger_video.process_single_video 一致，预览档位使用快速预设和低码率
+    profile = render_profile.current()
+    if profile is not None:
+        preset, frame_rate, audio_bitrate = profile.preset, str(profile.fps), profile.audio_bitrate
+        bitrate_args = ['-b:v', profile.video_bitrate, '-maxrate', profile.max_bitrate, '-bufsize', profile.buffer_size]
+    else:
+        preset, frame_rate, audio_bitrate = 'medium', '30', '192k'
+        bitrate_args = ['-b:v', '5M', '-maxrate', '8M', '-bufsize', '10M']
+
+    branches = "".join(f"[s{i}]" for i in range(len(outputs)))
+    graph = [f"[0:v]split={len(outputs)}{branches}"]
+    for i, (output, subtitle_file) in enumerate(zip(outputs, subtitle_files)):
+        width, height = output.width, output.height
+        chain = (f"[s{i}]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                 f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1")
+        if subtitle_file:
+            chain += f",subtitles=filename={filter_path(subtitle_file)}"
+            if fonts_dir:
+                chain += f":fontsdir={filter_path(fonts_dir)}"
+        graph.append(f"{chain}[v{i}]")
+    with open(graph_path, "w", encoding="utf-8") as f:
+        f.write(";\n".join(graph))
+
+    cmd = ['ffmpeg', '-y', '-i', master_path]
+    if audio_path:
+        cmd.extend(['-i', audio_path])
+    cmd.extend(['-filter_complex_script', graph_path])
+    audio_map = '1:a:0' if audio_path else '0:a?'
+    # 每路输出一个编码器，按当前任务的线程预算均分；resource_scheduler 按各路之和借出线程
+    output_threads = str(max(1, resource_scheduler.thread_budget() // len(outputs)))
+    for i, output in enumerate(outputs):
+        cmd.extend([
+            '-map', f'[v{i}]', '-map', audio_map,
+            '-r', frame_rate,
+            '-c:v', 'libx264', '-preset', preset, '-profile:v', 'high', *bitrate_args,
+            '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-b:a', audio_bitrate,
+            '-shortest', '-movflags', '+faststart',
+            '-threads', output_threads,
+            output.path,
+        ])
+    return cmd
+
+
+def render_variants(master_path: str, audio_path: Optional[str], subtitle_path: Optional[str],
+                    outputs: List[OutputGeometry], style: SubtitleStyle) -> List[str]:
+    """
+    从母版一次解码生成所有版本
+
+    Args:
+        master_path: 母版视频（按原视频尺寸合并的片段）
+        audio_path: 共用音轨（generate_video.mix_audio_track 的输出）
+        subtitle_path: SRT 字幕，为空时不烧录字幕
+        outputs: 输出版本
+        style: 字幕样式
+
+    Returns:
+        List[str]: 各版本的输出路径
+    """
+    if not outputs:
+        return []
+    work_dir = os.path.dirname(os.path.abspath(outputs[0].path))
+    os.makedirs(work_dir, exist_ok=True)
+
+    cues = parse_srt(subtitle_path) if subtitle_path and os.path.exists(subtitle_path) else []
+    subtitle_files = []
+    for output in outputs:
+        if cues:
+            ass_path = os.path.join(work_dir, f"subtitles_{output.label}_{output.width}x{output.height}.ass")
+            subtitle_files.append(write_ass(cues, ass_path, output.width, output.height, style))
+        else:
+            subtitle_files.append(None)
+
+    fonts_dir = os.path.dirname(style.font_path) if style.font_path else None
+    graph_path = os.path.join(work_dir, "aspect_variants_graph.txt")
+    cmd = build_command(master_path, audio_path, outputs, subtitle_files, graph_path, fonts_dir)
+
+    logger.info("一次解码输出 {} 个版本: {}".format(
+        len(outputs), ", ".join(f"{o.aspect} {o.width}x{o.height}" for o in outputs)))
+    ffmpeg_runner.run(cmd, text=False, description=f"多画面比例输出 x{len(outputs)}")
+    return [output.path for output in outputs]
@@ -12,11 +12,12 @@
 import os
 import subprocess
 import tempfile
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Sequence, Tuple, Dict, Any
 from loguru import logger
 from moviepy import AudioFileClip
 from pydub import AudioSegment
-import numpy as np
+
+from app.services import loudness
 
 
 class AudioNormalizer:
@@ -28,93 +29,44 @@ class AudioNormalizer:
         
     def analyze_audio_lufs(self, audio_path: str) -> Optional[float]:
         """
-        使用FFmpeg分析音频的LUFS响度
-        
+        使用FFmpeg ebur128滤镜分析音频的LUFS响度
+
+        视频文件直接读取其音频流，无需先导出临时音频文件
+
         Args:
-            audio_path: 音频文件路径
-            
+            audio_path: 音频或视频文件路径
+
         Returns:
             float: LUFS值，如果分析失败返回None
         """
         if not os.path.exists(audio_path):
             logger.error(f"音频文件不存在: {audio_path}")
             return None
-            
-        try:
-            # 使用FFmpeg的loudnorm滤镜分析音频响度
-            cmd = [
-                'ffmpeg', '-hide_banner', '-nostats',
-                '-i', audio_path,
-                '-af', 'loudnorm=I=-23:TP=-1:LRA=7:print_format=json',
-                '-f', 'null', '-'
-            ]
-            
-            result = subprocess.run(
-                cmd, 
-                capture_output=True, 
-                text=True, 
-                check=False
-            )
-            
-            # 从stderr中提取JSON信息
-            stderr_lines = result.stderr.split('\n')
-            json_start = False
-            json_lines = []
-            
-            for line in stderr_lines:
-                if line.strip() == '{':
-                    json_start = True
-                if json_start:
-                    json_lines.append(line)
-                if line.strip() == '}':
-                    break
-                    
-            if json_lines:
-                import json
-                try:
-                    loudness_data = json.loads('\n'.join(json_lines))
-                    input_i = float(loudness_data.get('input_i', 0))
-                    logger.info(f"音频 {os.path.basename(audio_path)} 的LUFS: {input_i}")
-                    return input_i
-                except (json.JSONDecodeError, ValueError) as e:
-                    logger.warning(f"解析LUFS数据失败: {e}")
-                    
-        except Exception as e:
-            logger.error(f"分析音频LUFS失败: {e}")
-            
-        return None
-    
+
+        result = loudness.measure(audio_path)
+        if result is None or result.get("method") != "ebur128":
+            return None
+
+        logger.info(f"音频 {os.path.basename(audio_path)} 的LUFS: {result['integrated']}")
+        return result["integrated"]
+
     def get_audio_rms(self, audio_path: str) -> Optional[float]:
         """
         计算音频的RMS值作为响度的简单估计
-        
+
+        通过降采样单声道PCM管道流式计算，不会把整段音频读入内存
+
         Args:
             audio_path: 音频文件路径
-            
+
         Returns:
             float: RMS值 (dB)，如果计算失败返回None
         """
         try:
-            audio = AudioSegment.from_file(audio_path)
-            # 转换为numpy数组
-            samples = np.array(audio.get_array_of_samples())
-            
-            # 如果是立体声，取平均值
-            if audio.channels == 2:
-                samples = samples.reshape((-1, 2))
-                samples = samples.mean(axis=1)
-            
-            # 计算RMS
-            rms = np.sqrt(np.mean(samples**2))
-            
-            # 转换为dB
-            if rms > 0:
-                rms_db = 20 * np.log10(rms / (2**15))  # 假设16位音频
+            rms_db = loudness.measure_rms(audio_path)
+            if rms_db is not None:
                 logger.info(f"音频 {os.path.basename(audio_path)} 的RMS: {rms_db:.2f} dB")
-                return rms_db
-            else:
-                return -60.0  # 静音
-                
+            return rms_db
         except Exception as e:
             logger.error(f"计算音频RMS失败: {e}")
             return None
@@ -233,26 +185,33 @@ class AudioNormalizer:
             logger.error(f"简单音频标准化失败: {e}")
             return False
     
-    def calculate_volume_adjustment(self, tts_path: str, original_path: str) -> Tuple[float, float]:
+    def calculate_volume_adjustment(self, tts_path: str, original_path: str,
+                                    tts_segments: Optional[Sequence[Tuple[str, float]]] = None) -> Tuple[float, float]:
         """
         计算TTS和原声的音量调整系数，使它们达到相似的响度
         
         Args:
             tts_path: TTS音频文件路径
-            original_path: 原声音频文件路径
+            original_path: 原声音频文件路径，也可以是包含原声的视频文件
+            tts_segments: 组成 tts_path 的各段TTS音频 [(路径, 时长)]，提供时改为测量各段再按时长合成，
+                各段响度按文件指纹缓存，重新生成时只需测量有变化的片段
             
         Returns:
             Tuple[float, float]: (TTS音量系数, 原声音量系数)
         """
-        # 分析两个音频的响度
-        tts_lufs = self.analyze_audio_lufs(tts_path)
-        original_lufs = self.analyze_audio_lufs(original_path)
-        
-        # 如果LUFS分析失败，使用RMS作为备用
-        if tts_lufs is None:
-            tts_lufs = self.get_audio_rms(tts_path)
-        if original_lufs is None:
-            original_lufs = self.get_audio_rms(original_path)
+        # 一次FFmpeg调用同时分析全部文件（原声可以直接传入视频文件），
+        # ebur128不可用时loudness服务会自动退化为RMS估算
+        if tts_segments:
+            results = loudness.measure_many([path for path, _ in tts_segments] + [original_path])
+            original_result = results[-1]
+            measured = [(result["integrated"], duration)
+                        for result, (_, duration) in zip(results[:-1], tts_segments) if result]
+            tts_lufs = loudness.combine_integrated([value for value, _ in measured],
+                                                   [duration for _, duration in measured])
+        else:
+            tts_result, original_result = loudness.measure_many([tts_path, original_path])
+            tts_lufs = tts_result["integrated"] if tts_result else None
+        original_lufs = original_result["integrated"] if original_result else None
         
         if tts_lufs is None or original_lufs is None:
             logger.warning("无法分析音频响度，使用默认音量设置")
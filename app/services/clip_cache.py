@@ -0,0 +1,158 @@
+"""
+跨任务共享的片段裁剪缓存
+
+clip_video_unified 的输出目录按任务脚本区分，不同任务从同一个视频裁剪相同区间时无法复用结果。
+这里按以下内容生成片段缓存键：
+- 原视频内容指纹（文件大小 + 均匀采样若干数据块的哈希），与文件名和路径无关，移动或重命名后仍可命中
+- 除输入/输出路径以外的完整 FFmpeg 参数，即裁剪起止时间、音频处理方式（OST）、编码器配置和画面滤镜
+
+写入缓存时复制一份，缓存文件与任务输出互不共享数据，任务之后原地改写输出也不会破坏缓存。
+命中时复制到任务输出路径；调用方声明输出只会被读取（read_only）时改用硬链接（跨文件系统时退化为复制），
+不再重新编码。缓存文件保存在产物存储的 segments 类别下，受配额和 LRU 淘汰管理。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from app.config import config
+from app.utils import artifact_store, ingest, metrics
+
+def is_enabled() -> bool:
+    return bool(config.app.get("enable_clip_cache", True))
+
+
+def source_fingerprint(file_path: str) -> str:
+    """
+    计算视频内容指纹：文件大小 + 均匀分布的采样块哈希（见 app.utils.ingest.file_fingerprint）
+
+    通过 ingest 导入的素材在写入时已计算好指纹，这里直接命中进程内缓存
+
+    Args:
+        file_path: 视频文件路径
+
+    Returns:
+        str: 指纹字符串
+    """
+    return ingest.file_fingerprint(file_path)
+
+
+def clip_key(source_path: str, cmd: List[str], output_path: str) -> str:
+    """
+    根据原视频指纹和 FFmpeg 参数生成片段缓存键
+
+    Args:
+        source_path: 原视频路径
+        cmd: 裁剪用的 FFmpeg 命令
+        output_path: 命令中的输出路径（不参与计算）
+
+    Returns:
+        str: 缓存键（带扩展名的文件名）
+    """
+    args = []
+    for arg in cmd[1:]:
+        if arg == source_path:
+            args.append("<source>")
+        elif arg == output_path:
+            continue
+        elif arg == "-y":
+            continue
+        else:
+            args.append(arg)
+    payload = json.dumps({"source": source_fingerprint(source_path), "args": args}, sort_keys=True)
+    extension = os.path.splitext(output_path)[1] or ".mp4"
+    return hashlib.md5(payload.encode("utf-8")).hexdigest() + extension
+
+
+def place(src: str, dst: str, link: bool = False):
+    """
+    把 src 放到 dst，dst 已存在时先删除（断开与其他文件共享的数据）
+
+    Args:
+        src: 源文件
+        dst: 目标路径
+        link: 是否优先硬链接（dst 与 src 共享数据，只能用于之后只读的文件），不支持时复制
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+def _store_clip(store: artifact_store.ArtifactStore, key: str, output_path: str):
+    cache_path = store.path("segments", key)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # 先复制到临时名再原子替换，避免并发任务看到写了一半的缓存文件
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        place(output_path, tmp_path)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"写入片段缓存失败: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    store.commit("segments", key)
+
+
+def run_cached(cmd: List[str], source_path: str, output_path: str, render: Callable[[Dict[str, Any]], bool],
+               read_only: bool = False) -> bool:
+    """
+    优先从缓存获取片段，未命中时调用 render() 生成并写入缓存
+
+    Args:
+        cmd: 裁剪用的 FFmpeg 命令（用于生成缓存键）
+        source_path: 原视频路径
+        output_path: 片段输出路径
+        render: 实际执行裁剪的函数，返回是否成功；参数为结果字典，改用备用命令生成片段时应写入
+            outcome["fallback"]，这样的片段与 cmd 不对应，不写入缓存
+        read_only: 输出之后只会被读取，命中时可以硬链接到缓存文件
+
+    Returns:
+        bool: 片段是否已生成到 output_path
+    """
+    outcome: Dict[str, Any] = {}
+    if not is_enabled():
+        return render(outcome)
+
+    try:
+        key = clip_key(source_path, cmd, output_path)
+        store = artifact_store.get_store()
+        cached = store.lookup("segments", key)
+    except OSError as e:
+        logger.warning(f"片段缓存不可用，直接裁剪: {e}")
+        return render(outcome)
+
+    stage = metrics.current_stage()
+    if cached:
+        try:
+            place(cached, output_path, link=read_only)
+            logger.info(f"♻️ 复用已缓存片段: {os.path.basename(output_path)}")
+            if stage is not None:
+                stage.add(clip_cache_hits=1)
+            return True
+        except OSError as e:
+            logger.warning(f"复用缓存片段失败，重新裁剪: {e}")
+
+    # 之前的输出可能是指向缓存文件的硬链接，先删除，避免 render() 原地覆盖时改写缓存
+    if os.path.lexists(output_path):
+        os.remove(output_path)
+    success = render(outcome)
+    if stage is not None:
+        stage.add(clip_cache_misses=1)
+    if outcome.get("fallback"):
+        # 备用命令（软件编码、降低质量等）生成的片段不能代表 cmd，否则一次临时故障会让之后的任务一直复用降级片段
+        logger.debug(f"片段由备用命令 {outcome['fallback']} 生成，不写入缓存: {os.path.basename(output_path)}")
+    elif success and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        _store_clip(store, key, output_path)
+    return success
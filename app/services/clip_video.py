@@ -16,7 +16,8 @@ from loguru import logger
 from typing import Dict, List, Optional
 from pathlib import Path
 
-from app.utils import ffmpeg_utils
+from app.utils import ffmpeg_utils, ffmpeg_runner, metrics, artifact_store, render_profile
+from app.services import clip_cache
 
 def parse_timestamp(timestamp: str) -> tuple:
     """
@@ -233,7 +234,8 @@ def execute_ffmpeg_with_fallback(
     input_path: str,
     output_path: str,
     start_time: str,
-    end_time: str
+    end_time: str,
+    outcome: Optional[Dict] = None
 ) -> bool:
     """
     执行ffmpeg命令，带有智能fallback机制
@@ -245,26 +247,16 @@ def execute_ffmpeg_with_fallback(
         output_path: 输出路径
         start_time: 开始时间
         end_time: 结束时间
+        outcome: 可选的结果字典，改用备用方案时写入 outcome["fallback"] = 错误类型
         
     Returns:
         bool: 是否成功
     """
     try:
         # logger.debug(f"执行ffmpeg命令: {' '.join(cmd)}")
-        
-        # 在Windows系统上使用UTF-8编码处理输出
-        is_windows = os.name == 'nt'
-        process_kwargs = {
-            "stdout": subprocess.PIPE,
-            "stderr": subprocess.PIPE,
-            "text": True,
-            "check": True
-        }
-        
-        if is_windows:
-            process_kwargs["encoding"] = 'utf-8'
-        
-        result = subprocess.run(cmd, **process_kwargs)
+
+        # 共享执行器：实时解析进度，卡住时终止并重试
+        ffmpeg_runner.run(cmd, description=f"裁剪 {timestamp}")
         
         # 验证输出文件
         if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
@@ -281,6 +273,8 @@ def execute_ffmpeg_with_fallback(
         # 智能错误分析
         error_type = analyze_ffmpeg_error(error_msg)
         logger.debug(f"错误类型分析: {error_type}")
+        if outcome is not None:
+            outcome["fallback"] = error_type
         
         # 根据错误类型选择fallback策略
         if error_type == "filter_chain_error":
@@ -475,19 +469,8 @@ def execute_simple_command(cmd: List[str], timestamp: str, method_name: str) ->
     """
     try:
         logger.debug(f"执行{method_name}命令: {' '.join(cmd)}")
-        
-        is_windows = os.name == 'nt'
-        process_kwargs = {
-            "stdout": subprocess.PIPE,
-            "stderr": subprocess.PIPE,
-            "text": True,
-            "check": True
-        }
-        
-        if is_windows:
-            process_kwargs["encoding"] = 'utf-8'
-        
-        subprocess.run(cmd, **process_kwargs)
+
+        ffmpeg_runner.run(cmd, description=f"{method_name} {timestamp}")
         
         output_path = cmd[-1]  # 输出路径总是最后一个参数
         if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
@@ -588,10 +571,14 @@ def _process_narration_only_segment(
         encoder_config, hwaccel_args, remove_audio=True
     )
 
-    # 执行命令
-    success = execute_ffmpeg_with_fallback(
-        cmd, timestamp, video_origin_path, output_path,
-        ffmpeg_start_time, ffmpeg_end_time
+    # 执行命令（相同原视频和参数的片段跨任务复用；片段之后只会被合并读取）
+    success = clip_cache.run_cached(
+        cmd, video_origin_path, output_path,
+        lambda outcome: execute_ffmpeg_with_fallback(
+            cmd, timestamp, video_origin_path, output_path,
+            ffmpeg_start_time, ffmpeg_end_time, outcome=outcome
+        ),
+        read_only=True,
     )
 
     return output_path if success else None
@@ -631,10 +618,14 @@ def _process_original_audio_segment(
         encoder_config, hwaccel_args, remove_audio=False
     )
 
-    # 执行命令
-    success = execute_ffmpeg_with_fallback(
-        cmd, timestamp, video_origin_path, output_path,
-        ffmpeg_start_time, ffmpeg_end_time
+    # 执行命令（相同原视频和参数的片段跨任务复用；片段之后只会被合并读取）
+    success = clip_cache.run_cached(
+        cmd, video_origin_path, output_path,
+        lambda outcome: execute_ffmpeg_with_fallback(
+            cmd, timestamp, video_origin_path, output_path,
+            ffmpeg_start_time, ffmpeg_end_time, outcome=outcome
+        ),
+        read_only=True,
     )
 
     return output_path if success else None
@@ -683,10 +674,14 @@ def _process_mixed_segment(
         encoder_config, hwaccel_args, remove_audio=False
     )
 
-    # 执行命令
-    success = execute_ffmpeg_with_fallback(
-        cmd, timestamp, video_origin_path, output_path,
-        ffmpeg_start_time, ffmpeg_end_time
+    # 执行命令（相同原视频和参数的片段跨任务复用；片段之后只会被合并读取）
+    success = clip_cache.run_cached(
+        cmd, video_origin_path, output_path,
+        lambda outcome: execute_ffmpeg_with_fallback(
+            cmd, timestamp, video_origin_path, output_path,
+            ffmpeg_start_time, ffmpeg_end_time, outcome=outcome
+        ),
+        read_only=True,
     )
 
     return output_path if success else None
@@ -745,6 +740,11 @@ def _build_ffmpeg_command_with_audio_control(
         cmd.extend(["-ar", "44100", "-ac", "2"])
         logger.debug("OST=1/2: 保持原声")
 
+    # 预览档位：裁剪时直接缩小画面
+    profile = render_profile.current()
+    if profile is not None:
+        cmd.extend(["-vf", profile.scale_filter()])
+
     # 像素格式
     cmd.extend(["-pix_fmt", encoder_config["pixel_format"]])
 
@@ -804,14 +804,17 @@ def clip_video_unified(
     # 如果未提供task_id，则根据输入生成一个唯一ID
     if task_id is None:
         content_for_hash = f"{video_origin_path}_{json.dumps(script_list)}"
+        profile = render_profile.current()
+        if profile is not None:
+            # 预览片段与完整质量片段分开存放，互不覆盖
+            content_for_hash += f"_preview_{profile.name}"
         task_id = hashlib.md5(content_for_hash.encode()).hexdigest()
 
-    # 设置输出目录
+    # 设置输出目录（默认目录由产物存储管理配额，处理期间固定，防止被淘汰）
+    store = None
     if output_dir is None:
-        output_dir = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
-            "storage", "temp", "clip_video_unified", task_id
-        )
+        store = artifact_store.get_store()
+        output_dir = store.pin("clips", task_id)
 
     # 确保输出目录存在
     Path(output_dir).mkdir(parents=True, exist_ok=True)
@@ -832,6 +835,13 @@ def clip_video_unified(
 
     # 获取编码器配置
     encoder_config = get_safe_encoder_config(hwaccel_type)
+    profile = render_profile.current()
+    if profile is not None:
+        # 预览档位：统一使用 libx264 快速预设，小分辨率下软件编码已足够快，也避免硬件编码器不支持缩放滤镜
+        hwaccel_args = []
+        encoder_config = dict(encoder_config, video_codec="libx264", pixel_format="yuv420p",
+                              preset=profile.preset, quality_value=str(profile.crf))
+        logger.info(f"👀 预览模式（{profile.name}）：使用 libx264 {profile.preset} 编码")
     logger.debug(f"编码器配置: {encoder_config}")
 
     # 统计信息
@@ -850,24 +860,28 @@ def clip_video_unified(
         logger.info(f"📹 [{i}/{total_clips}] 处理片段 ID:{_id}, OST:{ost}, 时间戳:{timestamp}")
 
         try:
-            if ost == 0:  # 纯解说片段
-                output_path = _process_narration_only_segment(
-                    video_origin_path, script_item, tts_map, output_dir,
-                    encoder_config, hwaccel_args
-                )
-            elif ost == 1:  # 纯原声片段
-                output_path = _process_original_audio_segment(
-                    video_origin_path, script_item, output_dir,
-                    encoder_config, hwaccel_args
-                )
-            elif ost == 2:  # 解说+原声混合片段
-                output_path = _process_mixed_segment(
-                    video_origin_path, script_item, tts_map, output_dir,
-                    encoder_config, hwaccel_args
-                )
-            else:
-                logger.warning(f"未知的OST类型: {ost}，跳过片段 {_id}")
-                continue
+            with metrics.stage("clip_segment", segment=_id, ost=ost) as clip_stage, \
+                    ffmpeg_runner.progress_scope((i - 1) / total_clips, i / total_clips):
+                if ost == 0:  # 纯解说片段
+                    output_path = _process_narration_only_segment(
+                        video_origin_path, script_item, tts_map, output_dir,
+                        encoder_config, hwaccel_args
+                    )
+                elif ost == 1:  # 纯原声片段
+                    output_path = _process_original_audio_segment(
+                        video_origin_path, script_item, output_dir,
+                        encoder_config, hwaccel_args
+                    )
+                elif ost == 2:  # 解说+原声混合片段
+                    output_path = _process_mixed_segment(
+                        video_origin_path, script_item, tts_map, output_dir,
+                        encoder_config, hwaccel_args
+                    )
+                else:
+                    logger.warning(f"未知的OST类型: {ost}，跳过片段 {_id}")
+                    continue
+                if output_path and os.path.exists(output_path):
+                    clip_stage.add(output_bytes=os.path.getsize(output_path))
 
             if output_path and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
                 result[_id] = output_path
@@ -884,6 +898,11 @@ def clip_video_unified(
     # 最终统计
     logger.info(f"📊 统一视频裁剪完成: 成功 {success_count}/{total_clips}, 失败 {len(failed_clips)}")
 
+    if store is not None:
+        # 登记后仍保持固定：在任务的 retain() 内时直到任务结束（后续合并还要读取片段）才解除
+        store.commit("clips", task_id)
+        store.release("clips", task_id)
+
     # 检查是否有失败的片段
     if failed_clips:
         logger.warning(f"⚠️  以下片段处理失败: {failed_clips}")
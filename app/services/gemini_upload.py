@@ -0,0 +1,364 @@
+"""
+Gemini 视频转录上传流水线
+
+视频转录只需要低帧率的画面和清晰的人声，上传完整原视频既浪费带宽又拖慢 Gemini 的文件处理：
+1. 用 FFmpeg 生成转录专用代理文件（低帧率、小分辨率、单声道低码率音频），
+   按原视频内容指纹缓存在产物存储的 proxies 类别下
+2. 通过 Files API 的分块可续传协议上传，网络中断后查询服务端已接收的偏移继续上传
+3. 以指数退避轮询文件状态，直到 ACTIVE
+4. 上传得到的文件句柄按 (API 地址, API Key, 代理文件) 记录在 storage/gemini_uploads.json，
+   在过期前（Gemini 文件保留 48 小时）再次转录同一视频时直接复用，不再上传
+
+API 地址可通过 gemini_api_base 配置，便于在本地桩服务上测试
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+import requests
+from loguru import logger
+
+from app.config import config
+from app.services import clip_cache
+from app.utils import artifact_store, ffmpeg_runner, http_client, utils
+
+DEFAULT_API_BASE = "https://generativelanguage.googleapis.com"
+
+# 分块大小必须是 256KB 的整数倍
+CHUNK_ALIGNMENT = 256 * 1024
+
+# 复用已上传文件时要求的剩余有效期（秒），保证转录请求期间文件不会过期
+REUSE_MARGIN_SECONDS = 3600
+
+
+class GeminiUploadError(Exception):
+    """上传或文件处理失败"""
+
+
+def proxy_settings() -> Dict:
+    """转录代理文件的编码参数"""
+    return {
+        "fps": float(config.app.get("gemini_proxy_fps", 1)),
+        "height": int(config.app.get("gemini_proxy_height", 360)),
+        "crf": int(config.app.get("gemini_proxy_crf", 32)),
+        "audio_bitrate": str(config.app.get("gemini_proxy_audio_bitrate", "32k")),
+        "audio_rate": 16000,
+    }
+
+
+def build_proxy_command(input_path: str, output_path: str, settings: Dict) -> list:
+    """
+    构建生成转录代理文件的 FFmpeg 命令
+
+    Args:
+        input_path: 原视频路径
+        output_path: 代理文件输出路径
+        settings: proxy_settings() 返回的编码参数
+
+    Returns:
+        list: FFmpeg 命令
+    """
+    height = settings["height"]
+    return [
+        "ffmpeg", "-y", "-i", input_path,
+        "-vf", f"fps={settings['fps']},scale=-2:'min({height},ih)'",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", str(settings["crf"]), "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-ac", "1", "-ar", str(settings["audio_rate"]), "-b:a", settings["audio_bitrate"],
+        "-movflags", "+faststart",
+        output_path,
+    ]
+
+
+def proxy_key(input_path: str, settings: Optional[Dict] = None) -> str:
+    """代理文件缓存键：原视频内容指纹 + 编码参数"""
+    settings = settings or proxy_settings()
+    payload = json.dumps({"source": clip_cache.source_fingerprint(input_path), "settings": settings}, sort_keys=True)
+    return hashlib.md5(payload.encode("utf-8")).hexdigest() + ".mp4"
+
+
+def build_proxy(input_path: str, output_path: str, settings: Optional[Dict] = None) -> str:
+    """
+    生成转录代理文件（先写临时文件，完成后原子替换）
+
+    Returns:
+        str: 代理文件路径
+    """
+    settings = settings or proxy_settings()
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp.mp4"
+    try:
+        ffmpeg_runner.run(build_proxy_command(input_path, tmp_path, settings), text=False)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logger.info(f"转录代理文件已生成: {output_path} "
+                f"({os.path.getsize(input_path) / 1e6:.1f}MB -> {os.path.getsize(output_path) / 1e6:.1f}MB)")
+    return output_path
+
+
+def _parse_expiration(value: Optional[str]) -> float:
+    """解析 RFC 3339 时间（如 2024-05-01T12:00:00.123456789Z），失败时返回 0"""
+    if not value:
+        return 0.0
+    try:
+        text = value.replace("Z", "+00:00")
+        if "." in text:
+            # 纳秒精度截断为微秒
+            head, _, tail = text.partition(".")
+            digits = "".join(ch for ch in tail if ch.isdigit())
+            text = f"{head}.{digits[:6]}{tail[len(digits):]}"
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return 0.0
+
+
+class GeminiFileClient:
+    """Gemini Files API 客户端（可续传上传、状态查询）"""
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None,
+                 chunk_size: Optional[int] = None, max_retries: int = 5):
+        self.api_key = api_key
+        self.base_url = (base_url or config.app.get("gemini_api_base") or DEFAULT_API_BASE).rstrip("/")
+        chunk_size = chunk_size or int(float(config.app.get("gemini_upload_chunk_mb", 8)) * 1024 * 1024)
+        self.chunk_size = max(CHUNK_ALIGNMENT, chunk_size // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT)
+        self.max_retries = max_retries
+
+    def _headers(self, **extra) -> Dict[str, str]:
+        headers = {"x-goog-api-key": self.api_key}
+        headers.update(extra)
+        return headers
+
+    def start_upload(self, size: int, mime_type: str, display_name: str) -> str:
+        """发起可续传上传，返回上传地址"""
+        response = http_client.post(
+            f"{self.base_url}/upload/v1beta/files",
+            headers=self._headers(**{
+                "X-Goog-Upload-Protocol": "resumable",
+                "X-Goog-Upload-Command": "start",
+                "X-Goog-Upload-Header-Content-Length": str(size),
+                "X-Goog-Upload-Header-Content-Type": mime_type,
+                "Content-Type": "application/json",
+            }),
+            json={"file": {"display_name": display_name}},
+        )
+        upload_url = response.headers.get("X-Goog-Upload-URL")
+        if response.status_code != 200 or not upload_url:
+            raise GeminiUploadError(f"发起上传失败: HTTP {response.status_code} {response.text[:200]}")
+        return upload_url
+
+    def query_upload(self, upload_url: str) -> Dict:
+        """查询上传状态，返回 {"status", "received", "file"}"""
+        response = http_client.post(upload_url, headers=self._headers(**{"X-Goog-Upload-Command": "query"}))
+        if response.status_code != 200:
+            raise GeminiUploadError(f"查询上传状态失败: HTTP {response.status_code}")
+        status = response.headers.get("X-Goog-Upload-Status", "active")
+        received = int(response.headers.get("X-Goog-Upload-Size-Received", 0))
+        file = response.json().get("file") if status == "final" and response.content else None
+        return {"status": status, "received": received, "file": file}
+
+    def upload(self, file_path: str, mime_type: str = "video/mp4", display_name: Optional[str] = None,
+               progress_callback: Optional[Callable[[float], None]] = None) -> Dict:
+        """
+        分块上传文件，失败时查询服务端已接收的偏移并续传
+
+        Args:
+            file_path: 文件路径
+            mime_type: 文件类型
+            display_name: 显示名称，默认为文件名
+            progress_callback: 上传进度回调，参数为 0~1 的完成比例
+
+        Returns:
+            Dict: Files API 返回的文件资源（name、uri、mimeType、state、expirationTime 等）
+        """
+        size = os.path.getsize(file_path)
+        upload_url = self.start_upload(size, mime_type, display_name or os.path.basename(file_path))
+        offset = 0
+        failures = 0
+        started = time.monotonic()
+
+        with open(file_path, "rb") as f:
+            while True:
+                f.seek(offset)
+                chunk = f.read(self.chunk_size)
+                last = offset + len(chunk) >= size
+                try:
+                    response = http_client.post(
+                        upload_url,
+                        data=chunk,
+                        headers=self._headers(**{
+                            "X-Goog-Upload-Command": "upload, finalize" if last else "upload",
+                            "X-Goog-Upload-Offset": str(offset),
+                        }),
+                    )
+                    error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+                except requests.exceptions.RequestException as e:
+                    response, error = None, str(e)
+
+                if error is None:
+                    offset += len(chunk)
+                    failures = 0
+                    if progress_callback:
+                        progress_callback(offset / size if size else 1.0)
+                    if last:
+                        logger.info(f"上传完成: {size / 1e6:.1f}MB, 耗时 {time.monotonic() - started:.1f}s")
+                        return response.json()["file"]
+                    continue
+
+                failures += 1
+                if failures > self.max_retries:
+                    raise GeminiUploadError(f"上传失败（已重试 {self.max_retries} 次）: {error}")
+                delay = min(2 ** failures, 30)
+                logger.warning(f"上传分块失败（偏移 {offset}）: {error}，{delay}s 后续传")
+                time.sleep(delay)
+                try:
+                    state = self.query_upload(upload_url)
+                except (GeminiUploadError, requests.exceptions.RequestException) as e:
+                    logger.warning(f"查询上传状态失败，从当前偏移重试: {e}")
+                    continue
+                if state["status"] == "final" and state["file"]:
+                    return state["file"]
+                offset = state["received"]
+
+    def get_file(self, name: str) -> Optional[Dict]:
+        """获取文件资源，文件不存在（已过期或被删除）时返回 None"""
+        response = http_client.get(f"{self.base_url}/v1beta/{name}", headers=self._headers())
+        if response.status_code in (403, 404):
+            return None
+        if response.status_code != 200:
+            raise GeminiUploadError(f"获取文件状态失败: HTTP {response.status_code}")
+        return response.json()
+
+    def wait_active(self, name: str, timeout: float = 600, initial_delay: float = 1.0,
+                    max_delay: float = 10.0) -> Dict:
+        """
+        以指数退避轮询文件状态，直到 ACTIVE
+
+        Returns:
+            Dict: 文件资源
+
+        Raises:
+            GeminiUploadError: 文件处理失败、消失或超时
+        """
+        deadline = time.monotonic() + timeout
+        delay = initial_delay
+        while True:
+            file = self.get_file(name)
+            if file is None:
+                raise GeminiUploadError(f"文件不存在: {name}")
+            state = file.get("state", "STATE_UNSPECIFIED")
+            if state == "ACTIVE":
+                return file
+            if state == "FAILED":
+                raise GeminiUploadError(f"Gemini 文件处理失败: {file.get('error') or name}")
+            if time.monotonic() + delay > deadline:
+                raise GeminiUploadError(f"等待 Gemini 文件处理超时: {name}")
+            time.sleep(delay)
+            delay = min(delay * 1.5, max_delay)
+
+
+class UploadRegistry:
+    """已上传文件句柄的持久化记录（JSON 文件）"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(utils.storage_dir(create=True), "gemini_uploads.json")
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries: Dict[str, Dict]):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str, margin: float = REUSE_MARGIN_SECONDS) -> Optional[Dict]:
+        """获取剩余有效期大于 margin 的记录"""
+        with self._lock:
+            entry = self._load().get(key)
+        if entry and entry.get("expires_at", 0) - time.time() > margin:
+            return entry
+        return None
+
+    def put(self, key: str, file: Dict):
+        with self._lock:
+            now = time.time()
+            entries = {k: v for k, v in self._load().items() if v.get("expires_at", 0) > now}
+            entries[key] = {
+                "name": file["name"],
+                "uri": file.get("uri", ""),
+                "mime_type": file.get("mimeType", "video/mp4"),
+                "expires_at": _parse_expiration(file.get("expirationTime")) or now + 47 * 3600,
+            }
+            self._save(entries)
+
+    def remove(self, key: str):
+        with self._lock:
+            entries = self._load()
+            if entries.pop(key, None) is not None:
+                self._save(entries)
+
+
+def upload_for_transcription(video_path: str, api_key: str, base_url: Optional[str] = None,
+                             progress_callback: Optional[Callable[[int, str], None]] = None,
+                             registry: Optional[UploadRegistry] = None) -> Dict:
+    """
+    生成（或复用）转录代理文件并上传到 Gemini，返回 ACTIVE 状态的文件句柄
+
+    Args:
+        video_path: 原视频路径
+        api_key: Gemini API Key
+        base_url: API 地址，默认读取 gemini_api_base 配置
+        progress_callback: 进度回调 (百分比, 描述)
+        registry: 上传记录，默认使用 storage/gemini_uploads.json
+
+    Returns:
+        Dict: {"name", "uri", "mime_type"}
+    """
+    client = GeminiFileClient(api_key, base_url)
+    registry = registry or UploadRegistry()
+    settings = proxy_settings()
+    key = proxy_key(video_path, settings)
+    # 文件只对上传时使用的 API Key 所属项目可见，记录键中只保存 Key 的哈希
+    account = hashlib.sha256(f"{client.base_url}|{api_key}".encode("utf-8")).hexdigest()[:16]
+    registry_key = f"{account}:{key}"
+
+    entry = registry.get(registry_key)
+    if entry:
+        file = client.get_file(entry["name"])
+        if file and file.get("state") == "ACTIVE":
+            logger.info(f"复用已上传的 Gemini 文件: {entry['name']}")
+            return entry
+        registry.remove(registry_key)
+
+    store = artifact_store.get_store()
+    with store.pinned("proxies", key) as proxy_path:
+        if store.lookup("proxies", key) is None:
+            if progress_callback:
+                progress_callback(15, "生成转录代理文件")
+            build_proxy(video_path, proxy_path, settings)
+            store.commit("proxies", key)
+
+        if progress_callback:
+            progress_callback(20, "上传视频至 Google cloud")
+        file = client.upload(proxy_path, "video/mp4", display_name=os.path.basename(video_path))
+
+    if progress_callback:
+        progress_callback(30, "上传成功, 开始解析")
+    file = client.wait_active(file["name"])
+    registry.put(registry_key, file)
+    if progress_callback:
+        progress_callback(40, "解析完成, 开始转录...")
+    return registry.get(registry_key, margin=0) or {
+        "name": file["name"], "uri": file.get("uri", ""), "mime_type": file.get("mimeType", "video/mp4"),
+    }
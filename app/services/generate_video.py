@@ -8,10 +8,11 @@
 @Date   : 2025/5/7 上午11:55 
 '''
 
+import bisect
+import math
 import os
 import traceback
-import tempfile
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from loguru import logger
 from moviepy import (
     VideoFileClip,
@@ -24,8 +25,9 @@ from moviepy import (
 from moviepy.video.tools.subtitles import SubtitlesClip
 from PIL import ImageFont
 
-from app.utils import utils
+from app.utils import utils, render_profile, resource_scheduler, ffmpeg_runner, ingest
 from app.models.schema import AudioVolumeDefaults
+from app.services import aspect_variants, region_burn, windowed_render
 from app.services.audio_normalizer import AudioNormalizer, normalize_audio_for_mixing
 
 
@@ -96,6 +98,9 @@ def merge_materials(
             - threads: 处理线程数，默认2
             - fps: 输出帧率，默认30
             - subtitle_enabled: 是否启用字幕，默认True
+            - time_range: (开始秒, 结束秒)，只渲染该区间（分窗口渲染时使用）
+            - video_only: 只输出画面和字幕，不合成音轨（分窗口渲染时使用）
+            - tts_segments: 组成配音的各段 TTS [(音频路径, 时长)]，智能音量按片段批量测量响度
             
     返回:
         输出视频的路径
@@ -103,13 +108,16 @@ def merge_materials(
     # 合并选项默认值
     if options is None:
         options = {}
+
+    # 长视频按时间窗口分段渲染，避免整部视频常驻内存
+    if not (options.get('time_range') or options.get('video_only')):
+        duration = ingest.media_info(video_path).get('duration') or 0
+        if windowed_render.should_window(duration, options):
+            return _merge_materials_windowed(video_path, audio_path, output_path, subtitle_path, bgm_path,
+                                             options, duration)
     
     # 设置默认参数值 - 使用统一的音量配置
-    voice_volume = options.get('voice_volume', AudioVolumeDefaults.VOICE_VOLUME)
-    bgm_volume = options.get('bgm_volume', AudioVolumeDefaults.BGM_VOLUME)
-    # 修复bug: 将原声音量默认值从0.0改为0.7，确保短剧解说模式下原片音量正常
-    original_audio_volume = options.get('original_audio_volume', AudioVolumeDefaults.ORIGINAL_VOLUME)
-    keep_original_audio = options.get('keep_original_audio', True)  # 默认保留原声
+    voice_volume, bgm_volume, original_audio_volume, keep_original_audio = _audio_options(options)
     subtitle_font = options.get('subtitle_font', '')
     subtitle_font_size = options.get('subtitle_font_size', 40)
     subtitle_color = options.get('subtitle_color', '#FFFFFF')
@@ -121,28 +129,14 @@ def merge_materials(
     threads = options.get('threads', 2)
     fps = options.get('fps', 30)
     subtitle_enabled = options.get('subtitle_enabled', True)
+    time_range = options.get('time_range')
+    video_only = options.get('video_only', False)
 
     # 配置日志 - 便于调试问题
-    logger.info(f"音量配置详情:")
-    logger.info(f"  - 配音音量: {voice_volume}")
-    logger.info(f"  - 背景音乐音量: {bgm_volume}")
-    logger.info(f"  - 原声音量: {original_audio_volume}")
-    logger.info(f"  - 是否保留原声: {keep_original_audio}")
     logger.info(f"字幕配置详情:")
     logger.info(f"  - 是否启用字幕: {subtitle_enabled}")
     logger.info(f"  - 字幕文件路径: {subtitle_path}")
 
-    # 音量参数验证
-    def validate_volume(volume, name):
-        if not (AudioVolumeDefaults.MIN_VOLUME <= volume <= AudioVolumeDefaults.MAX_VOLUME):
-            logger.warning(f"{name}音量 {volume} 超出有效范围 [{AudioVolumeDefaults.MIN_VOLUME}, {AudioVolumeDefaults.MAX_VOLUME}]，将被限制")
-            return max(AudioVolumeDefaults.MIN_VOLUME, min(volume, AudioVolumeDefaults.MAX_VOLUME))
-        return volume
-
-    voice_volume = validate_volume(voice_volume, "配音")
-    bgm_volume = validate_volume(bgm_volume, "背景音乐")
-    original_audio_volume = validate_volume(original_audio_volume, "原声")
-
     # 处理透明背景色问题 - MoviePy 2.1.1不支持'transparent'值
     if subtitle_bg_color == 'transparent':
         subtitle_bg_color = None  # None在新版MoviePy中表示透明背景
@@ -162,26 +156,20 @@ def merge_materials(
     
     # 加载视频
     try:
-        video_clip = VideoFileClip(video_path)
+        video_clip = VideoFileClip(video_path, audio=not video_only)
         logger.info(f"视频尺寸: {video_clip.size[0]}x{video_clip.size[1]}, 时长: {video_clip.duration}秒")
+
+        range_start, range_end = 0.0, video_clip.duration
+        if time_range:
+            range_start = max(0.0, time_range[0])
+            range_end = min(video_clip.duration, time_range[1])
+            video_clip = video_clip.subclipped(range_start, range_end)
+            logger.info(f"只渲染区间 {range_start:.2f}s - {range_end:.2f}s")
         
         # 提取视频原声(如果需要)
         original_audio = None
-        if keep_original_audio and original_audio_volume > 0:
-            try:
-                original_audio = video_clip.audio
-                if original_audio:
-                    # 关键修复：只有当音量不为1.0时才进行音量调整，保持原声音量不变
-                    if abs(original_audio_volume - 1.0) > 0.001:  # 使用小的容差值比较浮点数
-                        original_audio = original_audio.with_effects([afx.MultiplyVolume(original_audio_volume)])
-                        logger.info(f"已提取视频原声，音量调整为: {original_audio_volume}")
-                    else:
-                        logger.info("已提取视频原声，保持原始音量不变")
-                else:
-                    logger.warning("视频没有音轨，无法提取原声")
-            except Exception as e:
-                logger.error(f"提取视频原声失败: {str(e)}")
-                original_audio = None
+        if not video_only:
+            original_audio = _extract_original_audio(video_clip, keep_original_audio, original_audio_volume)
         
         # 移除原始音轨，稍后会合并新的音频
         video_clip = video_clip.without_audio()
@@ -191,83 +179,12 @@ def merge_materials(
         raise
     
     # 处理背景音乐和所有音频轨道合成
-    audio_tracks = []
-
-    # 智能音量调整（可选功能）
-    if AudioVolumeDefaults.ENABLE_SMART_VOLUME and audio_path and os.path.exists(audio_path) and original_audio is not None:
-        try:
-            normalizer = AudioNormalizer()
-            temp_dir = tempfile.mkdtemp()
-            temp_original_path = os.path.join(temp_dir, "temp_original.wav")
-
-            # 保存原声到临时文件进行分析
-            original_audio.write_audiofile(temp_original_path, verbose=False, logger=None)
-
-            # 计算智能音量调整
-            tts_adjustment, original_adjustment = normalizer.calculate_volume_adjustment(
-                audio_path, temp_original_path
-            )
-
-            # 应用智能调整，但保留用户设置的相对比例
-            smart_voice_volume = voice_volume * tts_adjustment
-            smart_original_volume = original_audio_volume * original_adjustment
-
-            # 限制音量范围，避免过度调整
-            smart_voice_volume = max(0.1, min(1.5, smart_voice_volume))
-            smart_original_volume = max(0.1, min(2.0, smart_original_volume))
-
-            voice_volume = smart_voice_volume
-            original_audio_volume = smart_original_volume
-
-            logger.info(f"智能音量调整 - TTS: {voice_volume:.2f}, 原声: {original_audio_volume:.2f}")
-
-            # 清理临时文件
-            import shutil
-            shutil.rmtree(temp_dir)
-
-        except Exception as e:
-            logger.warning(f"智能音量分析失败，使用原始设置: {e}")
-
-    # 先添加主音频（配音）
-    if audio_path and os.path.exists(audio_path):
-        try:
-            voice_audio = AudioFileClip(audio_path).with_effects([afx.MultiplyVolume(voice_volume)])
-            audio_tracks.append(voice_audio)
-            logger.info(f"已添加配音音频，音量: {voice_volume}")
-        except Exception as e:
-            logger.error(f"加载配音音频失败: {str(e)}")
-
-    # 添加原声（如果需要）
-    if original_audio is not None:
-        # 重新应用调整后的音量（因为original_audio已经应用了一次音量）
-        # 计算需要的额外调整
-        current_volume_in_original = 1.0  # original_audio中已应用的音量
-        additional_adjustment = original_audio_volume / current_volume_in_original
-
-        adjusted_original_audio = original_audio.with_effects([afx.MultiplyVolume(additional_adjustment)])
-        audio_tracks.append(adjusted_original_audio)
-        logger.info(f"已添加视频原声，最终音量: {original_audio_volume}")
-
-    # 添加背景音乐（如果有）
-    if bgm_path and os.path.exists(bgm_path):
-        try:
-            bgm_clip = AudioFileClip(bgm_path).with_effects([
-                afx.MultiplyVolume(bgm_volume),
-                afx.AudioFadeOut(3),
-                afx.AudioLoop(duration=video_clip.duration),
-            ])
-            audio_tracks.append(bgm_clip)
-            logger.info(f"已添加背景音乐，音量: {bgm_volume}")
-        except Exception as e:
-            logger.error(f"添加背景音乐失败: \n{traceback.format_exc()}")
-
-    # 合成最终的音频轨道
-    if audio_tracks:
-        final_audio = CompositeAudioClip(audio_tracks)
-        video_clip = video_clip.with_audio(final_audio)
-        logger.info(f"已合成所有音频轨道，共{len(audio_tracks)}个")
-    else:
-        logger.warning("没有可用的音频轨道，输出视频将没有声音")
+    if not video_only:
+        final_audio = _compose_audio(video_clip.duration, original_audio, video_path, audio_path, bgm_path,
+                                     voice_volume, bgm_volume, original_audio_volume,
+                                     tts_segments=options.get('tts_segments'))
+        if final_audio is not None:
+            video_clip = video_clip.with_audio(final_audio)
     
     # 处理字体路径
     font_path = None
@@ -364,9 +281,12 @@ def merge_materials(
                     make_textclip=make_textclip
                 )
 
-                # 创建每个字幕片段
+                # 创建每个字幕片段（只渲染区间时只保留区间内的字幕，时间换算到区间内）
                 text_clips = []
-                for item in sub.subtitles:
+                for (start, end), text in sub.subtitles:
+                    if end <= range_start or start >= range_end:
+                        continue
+                    item = ((max(start, range_start) - range_start, min(end, range_end) - range_start), text)
                     clip = create_text_clip(subtitle_item=item)
                     text_clips.append(clip)
 
@@ -385,13 +305,14 @@ def merge_materials(
     
     # 导出最终视频
     try:
-        video_clip.write_videofile(
-            output_path,
-            audio_codec="aac",
-            temp_audiofile_path=output_dir,
-            threads=threads,
-            fps=fps,
-        )
+        with resource_scheduler.cpu(threads) as granted_threads:
+            video_clip.write_videofile(
+                output_path,
+                audio_codec="aac",
+                temp_audiofile_path=output_dir,
+                threads=granted_threads,
+                **_write_videofile_options(fps),
+            )
         logger.success(f"素材合并完成: {output_path}")
     except Exception as e:
         logger.error(f"导出视频失败: {str(e)}")
@@ -404,6 +325,218 @@ def merge_materials(
     return output_path
 
 
+def _merge_materials_windowed(video_path: str, audio_path: str, output_path: str, subtitle_path: Optional[str],
+                              bgm_path: Optional[str], options: Dict[str, Any], duration: float) -> str:
+    """merge_materials 的分窗口渲染：整条音轨单独混合一次，画面和字幕按窗口渲染后无损拼接"""
+    base_path = os.path.splitext(output_path)[0]
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    mixed_audio_path = mix_audio_track(video_path, audio_path, f"{base_path}_audio.m4a", bgm_path, options)
+    kwargs = dict(video_path=video_path, audio_path=audio_path, output_path=output_path,
+                  subtitle_path=subtitle_path, bgm_path=bgm_path, options=options)
+    fps = _write_videofile_options(options.get('fps', 30)).get('fps')
+    return windowed_render.render(merge_materials, kwargs, duration, fps, mixed_audio_path,
+                                  work_dir=f"{base_path}_windows")
+
+
+def _audio_options(options: Dict[str, Any]) -> Tuple[float, float, float, bool]:
+    """
+    从合并选项中读取并校验音量设置
+
+    Returns:
+        Tuple[float, float, float, bool]: (配音音量, 背景音乐音量, 原声音量, 是否保留原声)
+    """
+    voice_volume = options.get('voice_volume', AudioVolumeDefaults.VOICE_VOLUME)
+    bgm_volume = options.get('bgm_volume', AudioVolumeDefaults.BGM_VOLUME)
+    # 修复bug: 将原声音量默认值从0.0改为0.7，确保短剧解说模式下原片音量正常
+    original_audio_volume = options.get('original_audio_volume', AudioVolumeDefaults.ORIGINAL_VOLUME)
+    keep_original_audio = options.get('keep_original_audio', True)  # 默认保留原声
+
+    logger.info(f"音量配置详情:")
+    logger.info(f"  - 配音音量: {voice_volume}")
+    logger.info(f"  - 背景音乐音量: {bgm_volume}")
+    logger.info(f"  - 原声音量: {original_audio_volume}")
+    logger.info(f"  - 是否保留原声: {keep_original_audio}")
+
+    # 音量参数验证
+    def validate_volume(volume, name):
+        if not (AudioVolumeDefaults.MIN_VOLUME <= volume <= AudioVolumeDefaults.MAX_VOLUME):
+            logger.warning(f"{name}音量 {volume} 超出有效范围 [{AudioVolumeDefaults.MIN_VOLUME}, {AudioVolumeDefaults.MAX_VOLUME}]，将被限制")
+            return max(AudioVolumeDefaults.MIN_VOLUME, min(volume, AudioVolumeDefaults.MAX_VOLUME))
+        return volume
+
+    return (validate_volume(voice_volume, "配音"), validate_volume(bgm_volume, "背景音乐"),
+            validate_volume(original_audio_volume, "原声"), keep_original_audio)
+
+
+def _extract_original_audio(video_clip, keep_original_audio: bool, original_audio_volume: float):
+    """提取视频原声（不需要保留原声或视频没有音轨时返回 None）"""
+    original_audio = None
+    if keep_original_audio and original_audio_volume > 0:
+        try:
+            original_audio = video_clip.audio
+            if original_audio:
+                # 关键修复：只有当音量不为1.0时才进行音量调整，保持原声音量不变
+                if abs(original_audio_volume - 1.0) > 0.001:  # 使用小的容差值比较浮点数
+                    original_audio = original_audio.with_effects([afx.MultiplyVolume(original_audio_volume)])
+                    logger.info(f"已提取视频原声，音量调整为: {original_audio_volume}")
+                else:
+                    logger.info("已提取视频原声，保持原始音量不变")
+            else:
+                logger.warning("视频没有音轨，无法提取原声")
+        except Exception as e:
+            logger.error(f"提取视频原声失败: {str(e)}")
+            original_audio = None
+    return original_audio
+
+
+def _compose_audio(duration: float, original_audio, video_path: str, audio_path: str, bgm_path: Optional[str],
+                   voice_volume: float, bgm_volume: float, original_audio_volume: float,
+                   tts_segments: Optional[list] = None):
+    """
+    合成配音、原声和背景音乐
+
+    Args:
+        duration: 视频时长（背景音乐循环到该时长）
+        original_audio: _extract_original_audio() 提取的原声
+        video_path: 视频路径（智能音量分析原声响度）
+        audio_path: 配音路径
+        bgm_path: 背景音乐路径
+        tts_segments: 组成配音的各段 TTS [(音频路径, 时长)]，智能音量在一次调用中批量测量各段响度
+
+    Returns:
+        CompositeAudioClip: 合成后的音轨，没有可用音轨时返回 None
+    """
+    audio_tracks = []
+
+    # 智能音量调整（可选功能）
+    if AudioVolumeDefaults.ENABLE_SMART_VOLUME and audio_path and os.path.exists(audio_path) and original_audio is not None:
+        try:
+            normalizer = AudioNormalizer()
+
+            # 直接从视频文件的音频流分析原声响度，无需导出临时 WAV
+            tts_adjustment, original_adjustment = normalizer.calculate_volume_adjustment(
+                audio_path, video_path, tts_segments=tts_segments
+            )
+
+            # 应用智能调整，但保留用户设置的相对比例
+            smart_voice_volume = voice_volume * tts_adjustment
+            smart_original_volume = original_audio_volume * original_adjustment
+
+            # 限制音量范围，避免过度调整
+            smart_voice_volume = max(0.1, min(1.5, smart_voice_volume))
+            smart_original_volume = max(0.1, min(2.0, smart_original_volume))
+
+            voice_volume = smart_voice_volume
+            original_audio_volume = smart_original_volume
+
+            logger.info(f"智能音量调整 - TTS: {voice_volume:.2f}, 原声: {original_audio_volume:.2f}")
+
+        except Exception as e:
+            logger.warning(f"智能音量分析失败，使用原始设置: {e}")
+
+    # 先添加主音频（配音）
+    if audio_path and os.path.exists(audio_path):
+        try:
+            voice_audio = AudioFileClip(audio_path).with_effects([afx.MultiplyVolume(voice_volume)])
+            audio_tracks.append(voice_audio)
+            logger.info(f"已添加配音音频，音量: {voice_volume}")
+        except Exception as e:
+            logger.error(f"加载配音音频失败: {str(e)}")
+
+    # 添加原声（如果需要）
+    if original_audio is not None:
+        # 重新应用调整后的音量（因为original_audio已经应用了一次音量）
+        # 计算需要的额外调整
+        current_volume_in_original = 1.0  # original_audio中已应用的音量
+        additional_adjustment = original_audio_volume / current_volume_in_original
+
+        adjusted_original_audio = original_audio.with_effects([afx.MultiplyVolume(additional_adjustment)])
+        audio_tracks.append(adjusted_original_audio)
+        logger.info(f"已添加视频原声，最终音量: {original_audio_volume}")
+
+    # 添加背景音乐（如果有）
+    if bgm_path and os.path.exists(bgm_path):
+        try:
+            bgm_clip = AudioFileClip(bgm_path).with_effects([
+                afx.MultiplyVolume(bgm_volume),
+                afx.AudioFadeOut(3),
+                afx.AudioLoop(duration=duration),
+            ])
+            audio_tracks.append(bgm_clip)
+            logger.info(f"已添加背景音乐，音量: {bgm_volume}")
+        except Exception as e:
+            logger.error(f"添加背景音乐失败: \n{traceback.format_exc()}")
+
+    # 合成最终的音频轨道
+    if not audio_tracks:
+        logger.warning("没有可用的音频轨道，输出视频将没有声音")
+        return None
+    logger.info(f"已合成所有音频轨道，共{len(audio_tracks)}个")
+    return CompositeAudioClip(audio_tracks)
+
+
+def mix_audio_track(
+    video_path: str,
+    audio_path: str,
+    output_path: str,
+    bgm_path: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None
+) -> Optional[str]:
+    """
+    只生成最终音轨（配音 + 原声 + 背景音乐），混音规则与 merge_materials 相同
+
+    多画面比例输出时各版本共用这一条音轨，不必每个版本重新混音
+
+    Args:
+        video_path: 合并后的视频路径（提供原声和时长）
+        audio_path: 配音路径
+        output_path: 输出音频路径（.m4a）
+        bgm_path: 背景音乐路径
+        options: 同 merge_materials 的音量选项
+
+    Returns:
+        str: 输出音频路径，没有可用音轨时返回 None
+    """
+    options = options or {}
+    voice_volume, bgm_volume, original_audio_volume, keep_original_audio = _audio_options(options)
+    video_clip = VideoFileClip(video_path)
+    try:
+        original_audio = _extract_original_audio(video_clip, keep_original_audio, original_audio_volume)
+        final_audio = _compose_audio(video_clip.duration, original_audio, video_path, audio_path, bgm_path,
+                                     voice_volume, bgm_volume, original_audio_volume,
+                                     tts_segments=options.get('tts_segments'))
+        if final_audio is None:
+            return None
+        final_audio = final_audio.with_duration(video_clip.duration)
+        final_audio.write_audiofile(output_path, fps=44100, codec="aac", bitrate="192k", logger=None)
+        logger.success(f"音轨混合完成: {output_path}")
+        return output_path
+    finally:
+        video_clip.close()
+
+
+def _write_videofile_options(fps: Optional[int] = None) -> Dict[str, Any]:
+    """
+    当前渲染档位对应的 write_videofile 编码参数
+
+    Args:
+        fps: 调用方指定的输出帧率，为 None 时沿用 MoviePy 默认（原视频帧率）
+
+    Returns:
+        Dict[str, Any]: 需要额外传给 write_videofile 的参数，完整质量渲染时只包含 fps
+    """
+    write_options = {} if fps is None else {'fps': fps}
+    profile = render_profile.current()
+    if profile is not None:
+        write_options.update({
+            'fps': min(fps, profile.fps) if fps else profile.fps,
+            'preset': profile.preset,
+            'bitrate': profile.video_bitrate,
+            'audio_bitrate': profile.audio_bitrate,
+        })
+    return write_options
+
+
 def parse_timestamp_range(timestamp: str) -> tuple[float, float]:
     """
     解析时间戳范围 "00:00:00,000-00:00:05,900"
@@ -429,6 +562,92 @@ def parse_timestamp_range(timestamp: str) -> tuple[float, float]:
     return start_time, end_time
 
 
+def _narration_audio(
+    original_audio,
+    duration: float,
+    narration_segments: list,
+    time_offset: float,
+    mute_original_audio: bool,
+    bgm_path: Optional[str],
+    voice_volume: float,
+    bgm_volume: float,
+    original_audio_volume: float
+) -> Optional[CompositeAudioClip]:
+    """
+    叠加解说的最终音轨：原声（可静音）+ 按时间戳放置的配音 + 背景音乐
+
+    Args:
+        original_audio: 原视频音轨，没有原声时为 None
+        duration: 输出时长（秒）
+        narration_segments: 解说片段列表，见 merge_narration_to_full_video
+        time_offset: 只输出原视频某个区间时的区间起点，解说时间戳需要减去它
+        mute_original_audio: 是否静音原声
+        bgm_path: 背景音乐路径
+        voice_volume: 配音音量
+        bgm_volume: 背景音乐音量
+        original_audio_volume: 原声音量
+
+    Returns:
+        CompositeAudioClip: 合成的音轨，没有任何音轨时返回 None
+    """
+    # 关键修复：先添加原声（如果存在），确保视频时长基于原声
+    audio_tracks = []
+
+    # 添加原声作为基础轨道（确保视频时长基于原声）
+    if original_audio:
+        if original_audio_volume != 1.0:
+            original_audio = original_audio.with_effects([afx.MultiplyVolume(original_audio_volume)])
+        audio_tracks.append(original_audio)
+        logger.info(f"已添加视频原声（基础轨道），最终音量: {original_audio_volume}")
+
+    # 添加配音片段（只设置起始时间，不设置结束时间）
+    for i, segment in enumerate(narration_segments, 1):
+        timestamp = segment['timestamp']
+        audio_path = segment['audio_path']
+
+        try:
+            # 解析时间戳
+            start_time, end_time = parse_timestamp_range(timestamp)
+            start_time, end_time = start_time - time_offset, end_time - time_offset
+            segment_duration = end_time - start_time
+
+            logger.info(f"处理片段 {i}/{len(narration_segments)}: {timestamp} ({segment_duration:.2f}s)")
+
+            # 加载配音音频
+            voice_clip = AudioFileClip(audio_path)
+
+            # 调整配音音量
+            voice_clip = voice_clip.with_effects([afx.MultiplyVolume(voice_volume)])
+
+            # 关键修复：只设置起始时间，不设置结束时间
+            # 这样配音会在原声轨道上叠加播放
+            voiced_clip = voice_clip.set_start(start_time)
+            audio_tracks.append(voiced_clip)
+
+        except Exception as e:
+            logger.warning(f"处理片段 {i} 失败: {str(e)}")
+            continue
+
+    # 如果需要静音原声，移除原声轨道
+    if mute_original_audio and len(audio_tracks) > 1 and original_audio:
+        # 第一个轨道是原声，移除它
+        audio_tracks = audio_tracks[1:]
+        logger.info("已移除原声轨道（静音模式）")
+
+    # 添加BGM
+    if bgm_path and os.path.exists(bgm_path):
+        bgm_clip = AudioFileClip(bgm_path)
+        bgm_clip = bgm_clip.with_effects([afx.MultiplyVolume(bgm_volume)])
+        bgm_clip = bgm_clip.with_effects([afx.AudioLoop(duration=duration)])
+        audio_tracks.append(bgm_clip)
+        logger.info(f"已添加背景音乐，音量: {bgm_volume}")
+
+    if not audio_tracks:
+        logger.warning("没有音频轨道，视频将无声音")
+        return None
+    return CompositeAudioClip(audio_tracks)
+
+
 def merge_narration_to_full_video(
     video_path: str,
     narration_segments: list,
@@ -451,7 +670,8 @@ def merge_narration_to_full_video(
         output_path: 输出文件路径
         mute_original_audio: 是否静音原声（在解说时段），默认True
         bgm_path: 背景音乐文件路径
-        options: 其他选项配置
+        options: 其他选项配置，time_range 为 (开始秒, 结束秒) 时只输出原视频的该区间（用于预览选定片段和分窗口渲染），
+            video_only 为 True 时只输出画面和字幕，不合成音轨（分窗口渲染时使用）
 
     Returns:
         输出视频的路径
@@ -460,6 +680,13 @@ def merge_narration_to_full_video(
     if options is None:
         options = {}
 
+    # 长片按时间窗口分段渲染，避免整部视频和整条合成音轨常驻内存
+    if not (options.get('time_range') or options.get('video_only')):
+        info = ingest.media_info(video_path)
+        if windowed_render.should_window(info.get('duration') or 0, options):
+            return _merge_narration_windowed(video_path, narration_segments, output_path, mute_original_audio,
+                                             bgm_path, options, info)
+
     # 设置默认参数值
     voice_volume = options.get('voice_volume', AudioVolumeDefaults.VOICE_VOLUME)
     bgm_volume = options.get('bgm_volume', AudioVolumeDefaults.BGM_VOLUME)
@@ -474,6 +701,8 @@ def merge_narration_to_full_video(
     stroke_width = options.get('stroke_width', 1)
     threads = options.get('threads', 2)
     subtitle_enabled = options.get('subtitle_enabled', True)
+    time_range = options.get('time_range')
+    video_only = options.get('video_only', False)
 
     logger.info(f"开始叠加解说到完整原视频...")
     logger.info(f"  ① 原视频: {video_path}")
@@ -486,13 +715,31 @@ def merge_narration_to_full_video(
         video_clip = VideoFileClip(video_path)
         logger.info(f"原视频时长: {video_clip.duration}秒")
 
+        # 只输出选定区间时，解说时间戳需要减去区间起点
+        time_offset = 0.0
+        if time_range:
+            range_start = max(0.0, time_range[0])
+            range_end = min(video_clip.duration, time_range[1])
+            video_clip = video_clip.subclipped(range_start, range_end)
+            time_offset = range_start
+            logger.info(f"只输出区间 {range_start:.2f}s - {range_end:.2f}s")
+
+        # 预览档位：缩小画面，字幕字号按相同比例缩小
+        profile = render_profile.current()
+        if profile is not None:
+            scale = profile.scale_factor(*video_clip.size)
+            if scale < 1.0:
+                video_clip = video_clip.resized(new_size=profile.scale_size(*video_clip.size))
+                subtitle_font_size = max(1, int(round(subtitle_font_size * scale)))
+                logger.info(f"预览模式（{profile.name}）：输出尺寸 {video_clip.size[0]}x{video_clip.size[1]}")
+
         # 提取视频原声
         original_audio = None
         try:
-            original_audio = video_clip.audio
+            original_audio = None if video_only else video_clip.audio
             if original_audio:
                 logger.info(f"已提取视频原声，音量: {original_audio_volume}")
-            else:
+            elif not video_only:
                 logger.warning("视频没有音轨，无法提取原声")
         except Exception as e:
             logger.error(f"提取视频原声失败: {str(e)}")
@@ -505,68 +752,17 @@ def merge_narration_to_full_video(
         logger.error(f"加载视频失败: {str(e)}")
         raise
 
-    # 2. 创建配音音频片段（只在指定时间段）
-    # 关键修复：先添加原声（如果存在），确保视频时长基于原声
-    audio_tracks = []
-
-    # 2.1 添加原声作为基础轨道（确保视频时长基于原声）
-    if original_audio:
-        if original_audio_volume != 1.0:
-            original_audio = original_audio.with_effects([afx.MultiplyVolume(original_audio_volume)])
-        audio_tracks.append(original_audio)
-        logger.info(f"已添加视频原声（基础轨道），最终音量: {original_audio_volume}")
-
-    # 2.2 添加配音片段（只设置起始时间，不设置结束时间）
-    for i, segment in enumerate(narration_segments, 1):
-        timestamp = segment['timestamp']
-        audio_path = segment['audio_path']
-
-        try:
-            # 解析时间戳
-            start_time, end_time = parse_timestamp_range(timestamp)
-            duration = end_time - start_time
-
-            logger.info(f"处理片段 {i}/{len(narration_segments)}: {timestamp} ({duration:.2f}s)")
-
-            # 加载配音音频
-            voice_clip = AudioFileClip(audio_path)
-
-            # 调整配音音量
-            voice_clip = voice_clip.with_effects([afx.MultiplyVolume(voice_volume)])
-
-            # 关键修复：只设置起始时间，不设置结束时间
-            # 这样配音会在原声轨道上叠加播放
-            if mute_original_audio:
-                # 如果需要静音原声，不将原声添加到音频轨道
-                # 原声已在上面添加，这里需要特殊处理
-                pass
-            voiced_clip = voice_clip.set_start(start_time)
-            audio_tracks.append(voiced_clip)
-
-        except Exception as e:
-            logger.warning(f"处理片段 {i} 失败: {str(e)}")
-            continue
-
-    # 2.3 如果需要静音原声，移除原声轨道
-    if mute_original_audio and len(audio_tracks) > 1 and original_audio:
-        # 第一个轨道是原声，移除它
-        audio_tracks = audio_tracks[1:]
-        logger.info("已移除原声轨道（静音模式）")
-
-    # 4. 添加BGM
-    if bgm_path and os.path.exists(bgm_path):
-        bgm_clip = AudioFileClip(bgm_path)
-        bgm_clip = bgm_clip.with_effects([afx.MultiplyVolume(bgm_volume)])
-        bgm_clip = bgm_clip.with_effects([afx.AudioLoop(duration=video_clip.duration)])
-        audio_tracks.append(bgm_clip)
-        logger.info(f"已添加背景音乐，音量: {bgm_volume}")
-
-    # 5. 合成最终音频
-    if audio_tracks:
+    # 2~5. 合成最终音频
+    final_audio = None
+    if not video_only:
+        final_audio = _narration_audio(
+            original_audio, video_clip.duration, narration_segments, time_offset, mute_original_audio,
+            bgm_path, voice_volume, bgm_volume, original_audio_volume
+        )
+    if final_audio is not None:
         # 验证视频时长在处理音频前
         logger.info(f"合成音频前视频时长: {video_clip.duration}秒")
 
-        final_audio = CompositeAudioClip(audio_tracks)
         video_clip = video_clip.without_audio()
         video_clip = video_clip.with_audio(final_audio)
 
@@ -574,8 +770,6 @@ def merge_narration_to_full_video(
         logger.info(f"合成音频后视频时长: {video_clip.duration}秒")
 
         logger.info("音频合成完成")
-    else:
-        logger.warning("没有音频轨道，视频将无声音")
 
     # 6. 叠加字幕（只在解说时段）
     if subtitle_enabled and narration_segments:
@@ -591,6 +785,9 @@ def merge_narration_to_full_video(
                 try:
                     # 解析时间戳
                     start_time, end_time = parse_timestamp_range(segment['timestamp'])
+                    start_time, end_time = start_time - time_offset, end_time - time_offset
+                    if end_time <= 0 or start_time >= video_clip.duration:
+                        continue
 
                     logger.info(f"添加字幕 {i}: {segment['timestamp']}")
 
@@ -612,13 +809,15 @@ def merge_narration_to_full_video(
     output_dir = os.path.dirname(output_path)
     os.makedirs(output_dir, exist_ok=True)
 
-    video_clip.write_videofile(
-        output_path,
-        codec='libx264',
-        audio_codec='aac',
-        threads=threads,
-        logger=None
-    )
+    with resource_scheduler.cpu(threads) as granted_threads:
+        video_clip.write_videofile(
+            output_path,
+            codec='libx264',
+            audio_codec='aac',
+            threads=granted_threads,
+            logger=None,
+            **_write_videofile_options()
+        )
 
     # 验证输出视频时长
     try:
@@ -639,6 +838,305 @@ def merge_narration_to_full_video(
     return output_path
 
 
+
+def _merge_narration_windowed(video_path: str, narration_segments: list, output_path: str,
+                              mute_original_audio: bool, bgm_path: Optional[str], options: Dict[str, Any],
+                              info: Dict[str, Any]) -> str:
+    """merge_narration_to_full_video 的分窗口渲染：整条音轨只解码音频混合一次，画面和字幕按窗口渲染后无损拼接"""
+    base_path = os.path.splitext(output_path)[0]
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    mixed_audio_path = _write_narration_audio(video_path, info, narration_segments, f"{base_path}_audio.m4a",
+                                              0.0, info['duration'], mute_original_audio, bgm_path, options)
+    kwargs = dict(video_path=video_path, narration_segments=narration_segments, output_path=output_path,
+                  mute_original_audio=mute_original_audio, bgm_path=bgm_path, options=options)
+    fps = _write_videofile_options().get('fps') or info.get('fps')
+    return windowed_render.render(merge_narration_to_full_video, kwargs, info['duration'], fps, mixed_audio_path,
+                                  work_dir=f"{base_path}_windows")
+
+
+def narration_cues(narration_segments: list, time_offset: float = 0.0) -> list:
+    """
+    把各解说片段的字幕（时间从 0 开始）换算到原视频时间轴上，超出片段时段的部分截掉
+
+    Args:
+        narration_segments: 解说片段列表，见 merge_narration_to_full_video
+        time_offset: 只输出原视频某个区间时的区间起点
+
+    Returns:
+        list: [(开始秒, 结束秒, 文本)]，按开始时间排序
+    """
+    cues = []
+    for segment in narration_segments:
+        subtitle_path = segment.get('subtitle_path')
+        if not is_valid_subtitle_file(subtitle_path):
+            continue
+        try:
+            start_time, end_time = parse_timestamp_range(segment['timestamp'])
+            start_time, end_time = start_time - time_offset, end_time - time_offset
+            for cue_start, cue_end, text in aspect_variants.parse_srt(subtitle_path):
+                cue_start, cue_end = start_time + cue_start, min(start_time + cue_end, end_time)
+                if cue_end > max(cue_start, 0):
+                    cues.append((max(cue_start, 0.0), cue_end, text))
+        except Exception as e:
+            logger.warning(f"读取解说字幕失败: {subtitle_path} => {str(e)}")
+    return sorted(cues)
+
+
+def write_srt(cues: list, srt_path: str) -> str:
+    """把 [(开始秒, 结束秒, 文本)] 写成 SRT 文件"""
+    with open(srt_path, 'w', encoding='utf-8') as f:
+        for idx, (start_time, end_time, text) in enumerate(cues, 1):
+            f.write(f"{idx}\n{utils.format_time(start_time)} --> {utils.format_time(end_time)}\n{text}\n\n")
+    return srt_path
+
+
+def _write_narration_audio(
+    video_path: str,
+    info: Dict[str, Any],
+    narration_segments: list,
+    audio_path: str,
+    range_start: float,
+    range_end: float,
+    mute_original_audio: bool,
+    bgm_path: Optional[str],
+    options: Dict[str, Any]
+) -> Optional[str]:
+    """
+    只解码音频，混合叠加解说的最终音轨并写入 AAC 文件
+
+    Args:
+        video_path: 原视频文件路径
+        info: ingest.media_info() 的结果
+        narration_segments: 解说片段列表，见 merge_narration_to_full_video
+        audio_path: 输出音频路径（.m4a）
+        range_start: 输出区间起点（秒）
+        range_end: 输出区间终点（秒）
+        mute_original_audio: 是否静音原声
+        bgm_path: 背景音乐文件路径
+        options: 同 merge_narration_to_full_video
+
+    Returns:
+        str: 音频路径，没有任何音轨时返回 None
+    """
+    voice_volume = options.get('voice_volume', AudioVolumeDefaults.VOICE_VOLUME)
+    bgm_volume = options.get('bgm_volume', AudioVolumeDefaults.BGM_VOLUME)
+    original_audio_volume = options.get('original_audio_volume', 1.0 if not mute_original_audio else 0.0)
+    duration = range_end - range_start
+
+    original_audio = None
+    if info.get('has_audio'):
+        try:
+            original_audio = AudioFileClip(video_path)
+            if range_start > 0 or range_end < info['duration']:
+                original_audio = original_audio.subclipped(range_start, range_end)
+        except Exception as e:
+            logger.error(f"提取视频原声失败: {str(e)}")
+            original_audio = None
+    try:
+        final_audio = _narration_audio(
+            original_audio, duration, narration_segments, range_start, mute_original_audio,
+            bgm_path, voice_volume, bgm_volume, original_audio_volume
+        )
+        if final_audio is None:
+            return None
+        profile = render_profile.current()
+        final_audio.with_duration(duration).write_audiofile(
+            audio_path, fps=44100, codec="aac", bitrate=profile.audio_bitrate if profile is not None else "192k",
+            logger=None
+        )
+        logger.info("音频合成完成")
+        return audio_path
+    finally:
+        if original_audio is not None:
+            original_audio.close()
+
+
+def _narration_subtitle_style(options: Dict[str, Any], width: int, height: int) -> aspect_variants.SubtitleStyle:
+    """按 merge_narration_to_full_video 的字幕选项生成 ASS 字幕样式（字号对应原视频画面）"""
+    subtitle_font = options.get('subtitle_font', '')
+    return aspect_variants.SubtitleStyle(
+        font_path=os.path.join(utils.font_dir(), subtitle_font) if subtitle_font else None,
+        font_size=options.get('subtitle_font_size', 40),
+        color=options.get('subtitle_color', '#FFFFFF'),
+        stroke_color=options.get('stroke_color', '#000000'),
+        stroke_width=options.get('stroke_width', 1),
+        position=options.get('subtitle_position', 'bottom'),
+        custom_position=options.get('custom_position', 70),
+        base_size=(width, height),
+    )
+
+
+def _copy_start(video_path: str, start: float) -> float:
+    """
+    直接复制视频流时输出区间的实际起点：start 之前最近的关键帧
+
+    读取不到关键帧时返回 start（此时 FFmpeg 仍会从之前的关键帧开始输出）
+    """
+    params = region_burn.stream_params(video_path)
+    keyframes = region_burn.keyframe_times(video_path, params.get("start_time", 0.0))
+    index = bisect.bisect_right(keyframes, start + 1e-3) - 1
+    if index < 0:
+        return start
+    # 向上取整到毫秒，-ss 不会落到关键帧之前而退回上一个关键帧
+    return math.ceil(keyframes[index] * 1000) / 1000
+
+
+def remux_narration_to_full_video(
+    video_path: str,
+    narration_segments: list,
+    output_path: str,
+    mute_original_audio: bool = True,
+    bgm_path: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    叠加解说的快速输出：原视频的视频流直接复制，只重新混合音轨，字幕作为软字幕输出
+
+    整片叠加解说时画面并没有变化，用 merge_narration_to_full_video 重新编码整部原视频需要数小时，
+    这里只混音并 remux，耗时与原视频大小（磁盘读写）相关。
+
+    预览档位下画面按档位缩小并快速重新编码（转码时 -ss 按帧精确裁剪）；直接复制视频流时只能从关键帧开始，
+    输出区间的起点会对齐到之前最近的关键帧，音轨和字幕按对齐后的起点生成，保证音画同步。
+
+    Args:
+        video_path: 原视频文件路径（完整视频）
+        narration_segments: 解说片段列表，见 merge_narration_to_full_video
+        output_path: 输出文件路径（.mp4）
+        mute_original_audio: 是否静音原声
+        bgm_path: 背景音乐文件路径
+        options: 同 merge_narration_to_full_video；subtitle_mode 为 soft 时字幕作为 mov_text 字幕轨封装进视频，
+            为 sidecar 时在视频旁输出同名 .srt 和按画面尺寸排版的 .ass 外挂字幕
+
+    Returns:
+        输出视频的路径
+    """
+    if options is None:
+        options = {}
+
+    subtitle_enabled = options.get('subtitle_enabled', True)
+    subtitle_mode = options.get('subtitle_mode', 'soft')
+    time_range = options.get('time_range')
+
+    logger.info(f"开始叠加解说到完整原视频（视频流复制，字幕: {subtitle_mode if subtitle_enabled else '无'}）...")
+    logger.info(f"  ① 原视频: {video_path}")
+    logger.info(f"  ② 解说片段数: {len(narration_segments)}")
+    logger.info(f"  ③ 静音原声: {'是' if mute_original_audio else '否'}")
+    logger.info(f"  ④ 输出: {output_path}")
+
+    info = ingest.media_info(video_path)
+    if not info.get('duration'):
+        raise ValueError(f"无法读取视频时长: {video_path}")
+
+    profile = render_profile.current()
+    range_start, range_end = 0.0, info['duration']
+    if time_range:
+        range_start = max(0.0, time_range[0])
+        range_end = min(info['duration'], time_range[1])
+        if profile is None:
+            range_start = _copy_start(video_path, range_start)
+        logger.info(f"只输出区间 {range_start:.3f}s - {range_end:.3f}s")
+    duration = range_end - range_start
+    width, height = info.get('width') or 1920, info.get('height') or 1080
+    if profile is not None:
+        width, height = profile.scale_size(width, height)
+
+    output_dir = os.path.dirname(output_path)
+    os.makedirs(output_dir, exist_ok=True)
+    base_path = os.path.splitext(output_path)[0]
+
+    # 1. 混合音轨（只解码音频）
+    audio_path = _write_narration_audio(video_path, info, narration_segments, f"{base_path}_audio.m4a",
+                                        range_start, range_end, mute_original_audio, bgm_path, options)
+
+    # 2. 字幕
+    cues = narration_cues(narration_segments, range_start) if subtitle_enabled else []
+    srt_path = None
+    if cues:
+        srt_path = write_srt(cues, f"{base_path}.srt")
+        if subtitle_mode == 'sidecar':
+            aspect_variants.write_ass(cues, f"{base_path}.ass", width, height,
+                                      _narration_subtitle_style(options, width, height))
+            logger.info(f"已输出外挂字幕: {base_path}.srt / {base_path}.ass")
+
+    # 3. 封装：视频流复制（预览档位重新编码），音轨已是 AAC 直接复制
+    cmd = ["ffmpeg", "-y"]
+    if time_range:
+        cmd += ["-ss", f"{range_start:.3f}", "-t", f"{duration:.3f}"]
+    cmd += ["-i", video_path]
+    maps = ["-map", "0:v:0"]
+    if audio_path:
+        cmd += ["-i", audio_path]
+        maps += ["-map", "1:a:0"]
+    embed_subtitles = srt_path is not None and subtitle_mode == 'soft'
+    if embed_subtitles:
+        cmd += ["-i", srt_path]
+        maps += ["-map", f"{2 if audio_path else 1}:s:0"]
+    if profile is not None:
+        cmd += maps + ["-vf", f"scale={width}:{height}", "-r", str(profile.fps),
+                       "-c:v", "libx264", "-preset", profile.preset, "-crf", str(profile.crf),
+                       "-maxrate", profile.max_bitrate, "-bufsize", profile.buffer_size, "-pix_fmt", "yuv420p",
+                       "-c:a", "copy"]
+    else:
+        cmd += maps + ["-c:v", "copy", "-c:a", "copy"]
+    if embed_subtitles:
+        cmd += ["-c:s", "mov_text", "-metadata:s:s:0", "title=解说字幕", "-disposition:s:0", "default"]
+    cmd += ["-movflags", "+faststart", output_path]
+
+    ffmpeg_runner.run(cmd)
+    logger.success(f"视频生成成功: {output_path}")
+    return output_path
+
+
+def burn_narration_regions(
+    video_path: str,
+    narration_segments: list,
+    output_path: str,
+    mute_original_audio: bool = True,
+    bgm_path: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    烧录字幕的叠加解说：只重新编码字幕所在的关键帧区间，其余部分直接复制原视频流（见 region_burn）
+
+    长片解说稀疏时，大部分画面不需要解码。输出与 merge_narration_to_full_video 相同尺寸，
+    只输出区间（options 的 time_range）或预览档位需要缩小画面时请使用 merge_narration_to_full_video。
+
+    Args:
+        参数同 merge_narration_to_full_video
+
+    Returns:
+        输出视频的路径
+
+    Raises:
+        region_burn.RegionBurnUnsupported: 原视频不适合局部重新编码，调用方应回退到 merge_narration_to_full_video
+    """
+    if options is None:
+        options = {}
+    if options.get('time_range'):
+        raise region_burn.RegionBurnUnsupported("只输出区间时不使用局部重新编码")
+
+    logger.info(f"开始叠加解说到完整原视频（只重新编码字幕区间）...")
+    logger.info(f"  ① 原视频: {video_path}")
+    logger.info(f"  ② 解说片段数: {len(narration_segments)}")
+    logger.info(f"  ③ 静音原声: {'是' if mute_original_audio else '否'}")
+    logger.info(f"  ④ 输出: {output_path}")
+
+    info = ingest.media_info(video_path)
+    if not info.get('duration') or not info.get('width'):
+        raise region_burn.RegionBurnUnsupported(f"无法读取视频信息: {video_path}")
+
+    output_dir = os.path.dirname(output_path)
+    os.makedirs(output_dir, exist_ok=True)
+    base_path = os.path.splitext(output_path)[0]
+
+    audio_path = _write_narration_audio(video_path, info, narration_segments, f"{base_path}_audio.m4a",
+                                        0.0, info['duration'], mute_original_audio, bgm_path, options)
+    cues = narration_cues(narration_segments) if options.get('subtitle_enabled', True) else []
+    style = _narration_subtitle_style(options, info['width'], info['height'])
+    return region_burn.render(video_path, info['duration'], cues, audio_path, output_path, style,
+                              work_dir=f"{base_path}_regions", fonts_dir=utils.font_dir())
+
+
  
 def wrap_text(text, max_width, font="Arial", fontsize=60):
     """
@@ -7,16 +7,15 @@ from typing import List
 from loguru import logger
 from openai import OpenAI
 from openai import AzureOpenAI
-from moviepy import VideoFileClip
 from openai.types.chat import ChatCompletion
 import google.generativeai as gemini
-from googleapiclient.errors import ResumableUploadError
 from google.api_core.exceptions import *
 from google.generativeai.types import *
 import subprocess
 from typing import Union, TextIO
 
 from app.config import config
+from app.services import gemini_upload
 from app.utils.utils import clean_model_output
 
 _max_retries = 5
@@ -393,7 +392,7 @@ def _generate_response_video(prompt: str, llm_provider_video: str, video_file: U
 
 def compress_video(input_path: str, output_path: str):
     """
-    压缩视频文件
+    生成用于 Gemini 转录的代理视频（低帧率、小分辨率、单声道低码率音频）
     Args:
         input_path: 输入视频文件路径
         output_path: 输出压缩后的视频文件路径
@@ -404,8 +403,7 @@ def compress_video(input_path: str, output_path: str):
         return
 
     try:
-        clip = VideoFileClip(input_path)
-        clip.write_videofile(output_path, codec='libx264', audio_codec='aac', bitrate="500k", audio_bitrate="128k")
+        gemini_upload.build_proxy(input_path, output_path)
     except subprocess.CalledProcessError as e:
         logger.error(f"视频压缩失败: {e}")
         raise
@@ -427,18 +425,10 @@ def generate_script(
         str: 生成的脚本
     """
     try:
-        # 1. 压缩视频
-        compressed_video_path = f"{os.path.splitext(video_path)[0]}_compressed.mp4"
-        compress_video(video_path, compressed_video_path)
-
-        # 在关键步骤更新进度
-        if progress_callback:
-            progress_callback(15, "压缩完成")  # 例如,在压缩视频后
-
-        # 2. 转录视频
+        # 1. 转录视频（上传流水线会生成并缓存转录代理文件）
         transcription = gemini_video_transcription(
             video_name=video_name,
-            video_path=compressed_video_path,
+            video_path=video_path,
             language=language,
             llm_provider_video=config.app["video_llm_provider"],
             progress_callback=progress_callback
@@ -488,22 +478,14 @@ def gemini_video_transcription(video_name: str, video_path: str, language: str,
 
     logger.debug(f"视频名称: {video_name}")
     try:
-        if progress_callback:
-            progress_callback(20, "上传视频至 Google cloud")
-        gemini_video_file = gemini.upload_file(video_path)
-        logger.debug(f"视频 {gemini_video_file.name} 上传至 Google cloud 成功, 开始解析...")
-        while gemini_video_file.state.name == "PROCESSING":
-            gemini_video_file = gemini.get_file(gemini_video_file.name)
-            if progress_callback:
-                progress_callback(30, "上传成功, 开始解析")  # 更新进度为20%
-        if gemini_video_file.state.name == "FAILED":
-            raise ValueError(gemini_video_file.state.name)
-        elif gemini_video_file.state.name == "ACTIVE":
-            if progress_callback:
-                progress_callback(40, "解析完成, 开始转录...")  # 更新进度为30%
-            logger.debug("解析完成, 开始转录...")
-    except ResumableUploadError as err:
-        logger.error(f"上传视频至 Google cloud 失败, 用户的位置信息不支持用于该API; \n{traceback.format_exc()}")
+        # 生成转录代理文件、分块可续传上传并等待处理完成；同一视频在文件过期前复用已上传的句柄
+        uploaded = gemini_upload.upload_for_transcription(
+            video_path, api_key=api_key, progress_callback=progress_callback
+        )
+        gemini_video_file = gemini.get_file(uploaded["name"])
+        logger.debug(f"视频 {gemini_video_file.name} 已就绪, 开始转录...")
+    except gemini_upload.GeminiUploadError as err:
+        logger.error(f"上传视频至 Google cloud 失败: {err}\n{traceback.format_exc()}")
         return False
     except FailedPrecondition as err:
         logger.error(f"400 用户位置不支持 Google API 使用。\n{traceback.format_exc()}")
@@ -10,6 +10,8 @@ NarratoAI 大模型服务模块
 - TextModelProvider: 文本模型提供商基类
 - LLMServiceManager: 大模型服务管理器
 - OutputValidator: 输出格式验证器
+- NarrationItemStreamParser: 流式输出增量解析器
+- routing: 备用模型的故障转移、请求对冲与熔断
 
 支持的供应商:
 视觉模型: Gemini, QwenVL, Siliconflow
@@ -19,6 +21,7 @@ NarratoAI 大模型服务模块
 from .manager import LLMServiceManager
 from .base import BaseLLMProvider, VisionModelProvider, TextModelProvider
 from .validators import OutputValidator, ValidationError
+from .stream_parser import NarrationItemStreamParser
 from .exceptions import LLMServiceError, ProviderNotFoundError, ConfigurationError
 
 # 提供商注册由 webui.py:main() 显式调用（见 LLM 提供商注册机制重构）
@@ -30,6 +33,7 @@ __all__ = [
     'VisionModelProvider',
     'TextModelProvider',
     'OutputValidator',
+    'NarrationItemStreamParser',
     'ValidationError',
     'LLMServiceError',
     'ProviderNotFoundError', 
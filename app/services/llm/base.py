@@ -5,7 +5,7 @@
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, AsyncIterator, Iterable, Iterator
 from pathlib import Path
 import PIL.Image
 from loguru import logger
@@ -105,7 +105,7 @@ class VisionModelProvider(BaseLLMProvider):
     
     @abstractmethod
     async def analyze_images(self,
-                           images: List[Union[str, Path, PIL.Image.Image]],
+                           images: Iterable[Union[str, Path, PIL.Image.Image, bytes]],
                            prompt: str,
                            batch_size: int = 10,
                            **kwargs) -> List[str]:
@@ -113,7 +113,7 @@ class VisionModelProvider(BaseLLMProvider):
         分析图片并返回结果
         
         Args:
-            images: 图片路径列表或PIL图片对象列表
+            images: 图片路径、PIL图片对象或JPEG字节数据，可以是列表或生成器
             prompt: 分析提示词
             batch_size: 批处理大小
             **kwargs: 其他参数
@@ -122,33 +122,109 @@ class VisionModelProvider(BaseLLMProvider):
             分析结果列表
         """
         pass
-    
-    def _prepare_images(self, images: List[Union[str, Path, PIL.Image.Image]]) -> List[PIL.Image.Image]:
-        """预处理图片，统一转换为PIL.Image对象"""
+
+    async def analyze_video(self,
+                            video_path: str,
+                            prompt: str,
+                            progress_callback=None,
+                            **kwargs) -> str:
+        """
+        上传视频并按提示词分析（如视频转录）
+
+        默认实现不支持视频输入，支持视频文件的提供商应重写此方法
+
+        Args:
+            video_path: 视频文件路径
+            prompt: 分析提示词
+            progress_callback: 进度回调 (百分比, 描述)
+            **kwargs: 其他参数
+
+        Returns:
+            分析结果文本
+
+        Raises:
+            LLMServiceError: 提供商不支持视频输入时抛出
+        """
+        raise LLMServiceError(f"{self.provider_name} 不支持视频分析，请使用 Gemini 模型")
+
+    # 视觉模型输入图片的最大边长
+    MAX_IMAGE_SIZE = 1024
+
+    def _prepare_image(self, img: Union[str, Path, PIL.Image.Image, bytes]) -> Optional[Union[PIL.Image.Image, bytes]]:
+        """
+        预处理单张图片
+
+        - bytes: 视为已缩放好的 JPEG 数据，原样返回
+        - 尺寸不超过目标大小的 JPEG 文件: 直接返回文件内容，避免解码后再次有损编码
+        - 其他情况: 转换为 PIL.Image 并缩放到目标大小
+
+        Returns:
+            PIL.Image 或 JPEG 字节数据，失败时返回 None
+        """
+        try:
+            if isinstance(img, (bytes, bytearray)):
+                return bytes(img)
+
+            if isinstance(img, (str, Path)):
+                # PIL.Image.open 只读取文件头，不会解码像素数据
+                with PIL.Image.open(img) as probe:
+                    fits = probe.size[0] <= self.MAX_IMAGE_SIZE and probe.size[1] <= self.MAX_IMAGE_SIZE
+                    is_jpeg = probe.format == "JPEG"
+                if fits and is_jpeg:
+                    with open(img, "rb") as f:
+                        return f.read()
+                pil_img = PIL.Image.open(img)
+            elif isinstance(img, PIL.Image.Image):
+                pil_img = img
+            else:
+                logger.warning(f"不支持的图片类型: {type(img)}")
+                return None
+
+            # 调整图片大小以优化性能
+            if pil_img.size[0] > self.MAX_IMAGE_SIZE or pil_img.size[1] > self.MAX_IMAGE_SIZE:
+                pil_img.thumbnail((self.MAX_IMAGE_SIZE, self.MAX_IMAGE_SIZE), PIL.Image.Resampling.LANCZOS)
+
+            return pil_img
+
+        except Exception as e:
+            logger.error(f"加载图片失败 {img if not isinstance(img, (bytes, bytearray)) else '<bytes>'}: {str(e)}")
+            return None
+
+    def _prepare_images(self, images: Iterable[Union[str, Path, PIL.Image.Image, bytes]]) -> List[Union[PIL.Image.Image, bytes]]:
+        """预处理图片，统一转换为PIL.Image对象或JPEG字节数据"""
         processed_images = []
-        
+
         for img in images:
-            try:
-                if isinstance(img, (str, Path)):
-                    pil_img = PIL.Image.open(img)
-                elif isinstance(img, PIL.Image.Image):
-                    pil_img = img
-                else:
-                    logger.warning(f"不支持的图片类型: {type(img)}")
-                    continue
-                
-                # 调整图片大小以优化性能
-                if pil_img.size[0] > 1024 or pil_img.size[1] > 1024:
-                    pil_img.thumbnail((1024, 1024), PIL.Image.Resampling.LANCZOS)
-                
-                processed_images.append(pil_img)
-                
-            except Exception as e:
-                logger.error(f"加载图片失败 {img}: {str(e)}")
-                continue
-        
+            prepared = self._prepare_image(img)
+            if prepared is not None:
+                processed_images.append(prepared)
+
         return processed_images
 
+    def _iter_image_batches(self,
+                            images: Iterable[Union[str, Path, PIL.Image.Image, bytes]],
+                            batch_size: int) -> Iterator[List[Union[PIL.Image.Image, bytes]]]:
+        """
+        惰性地按批次预处理图片
+
+        每次只加载一个批次的图片，处理长视频的数千帧时内存占用保持平稳；
+        images 可以是列表，也可以是逐帧产出数据的生成器
+
+        Yields:
+            预处理后的图片批次
+        """
+        batch = []
+        for img in images:
+            prepared = self._prepare_image(img)
+            if prepared is None:
+                continue
+            batch.append(prepared)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
 
 class TextModelProvider(BaseLLMProvider):
     """文本生成模型提供商基类"""
@@ -177,6 +253,39 @@ class TextModelProvider(BaseLLMProvider):
         """
         pass
     
+    async def generate_text_stream(self,
+                                   prompt: str,
+                                   system_prompt: Optional[str] = None,
+                                   temperature: float = 1.0,
+                                   max_tokens: Optional[int] = None,
+                                   response_format: Optional[str] = None,
+                                   **kwargs) -> AsyncIterator[str]:
+        """
+        流式生成文本内容，逐段返回模型输出
+
+        默认实现不支持真正的流式输出，会在完整生成后一次性返回全部内容，
+        支持流式接口的提供商应重写此方法
+
+        Args:
+            prompt: 用户提示词
+            system_prompt: 系统提示词
+            temperature: 生成温度
+            max_tokens: 最大token数
+            response_format: 响应格式 ('json' 或 None)
+            **kwargs: 其他参数
+
+        Yields:
+            生成的文本片段
+        """
+        yield await self.generate_text(
+            prompt=prompt,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_format=response_format,
+            **kwargs
+        )
+
     def _build_messages(self, prompt: str, system_prompt: Optional[str] = None) -> List[Dict[str, str]]:
         """构建消息列表"""
         messages = []
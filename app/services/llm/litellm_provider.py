@@ -8,24 +8,14 @@ LiteLLM 统一提供商实现
 import asyncio
 import base64
 import io
-from typing import List, Dict, Any, Optional, Union
+import threading
+import time
+from typing import List, Dict, Any, Optional, Union, AsyncIterator, Iterable
 from pathlib import Path
 import PIL.Image
 from loguru import logger
 
-try:
-    import litellm
-    from litellm import acompletion, completion
-    from litellm.exceptions import (
-        AuthenticationError as LiteLLMAuthError,
-        RateLimitError as LiteLLMRateLimitError,
-        BadRequestError as LiteLLMBadRequestError,
-        APIError as LiteLLMAPIError
-    )
-except ImportError:
-    logger.error("LiteLLM 未安装。请运行: pip install litellm")
-    raise
-
+from app.utils import metrics, resource_scheduler
 from .base import VisionModelProvider, TextModelProvider
 from .exceptions import (
     APICallError,
@@ -52,8 +42,74 @@ def configure_litellm():
     logger.info(f"LiteLLM 配置完成: retries={litellm.num_retries}, timeout={litellm.request_timeout}s")
 
 
-# 初始化配置
-configure_litellm()
+# LiteLLM 导入耗时较长（会加载 openai、tiktoken 等依赖），注册提供商时不导入，
+# 首次创建提供商实例时由 _ensure_litellm() 导入并配置
+litellm = None
+acompletion = None
+completion = None
+LiteLLMAuthError = None
+LiteLLMRateLimitError = None
+LiteLLMBadRequestError = None
+LiteLLMAPIError = None
+_litellm_lock = threading.Lock()
+
+
+def _ensure_litellm():
+    """导入并配置 LiteLLM（只执行一次）"""
+    global litellm, acompletion, completion
+    global LiteLLMAuthError, LiteLLMRateLimitError, LiteLLMBadRequestError, LiteLLMAPIError
+    if litellm is not None:
+        return
+    with _litellm_lock:
+        if litellm is not None:
+            return
+        try:
+            import litellm as _litellm
+            from litellm.exceptions import (
+                AuthenticationError,
+                RateLimitError as _RateLimitError,
+                BadRequestError,
+                APIError
+            )
+        except ImportError:
+            logger.error("LiteLLM 未安装。请运行: pip install litellm")
+            raise
+        acompletion, completion = _litellm.acompletion, _litellm.completion
+        LiteLLMAuthError, LiteLLMRateLimitError = AuthenticationError, _RateLimitError
+        LiteLLMBadRequestError, LiteLLMAPIError = BadRequestError, APIError
+        litellm = _litellm
+        configure_litellm()
+
+
+async def _timed_acompletion(kind: str, provider: str, **completion_kwargs):
+    """调用 acompletion 并记录延迟和 token 用量"""
+    started = time.perf_counter()
+    try:
+        async with resource_scheduler.api_slot(provider):
+            response = await acompletion(**completion_kwargs)
+    except Exception:
+        metrics.record_llm_call(kind, provider, completion_kwargs.get("model", ""),
+                                time.perf_counter() - started, status="error")
+        raise
+    prompt_tokens, completion_tokens = metrics.usage_tokens(getattr(response, "usage", None))
+    metrics.record_llm_call(kind, provider, completion_kwargs.get("model", ""),
+                            time.perf_counter() - started,
+                            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    return response
+
+
+async def _close_stream(response):
+    """关闭 LiteLLM 流式响应及其底层的 HTTP 流"""
+    for stream in (response, getattr(response, "completion_stream", None)):
+        close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+        if close is None:
+            continue
+        try:
+            result = close()
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception as e:
+            logger.debug(f"关闭流式响应失败: {str(e)}")
 
 
 class LiteLLMVisionProvider(VisionModelProvider):
@@ -127,8 +183,10 @@ class LiteLLMVisionProvider(VisionModelProvider):
             self._api_base = self.base_url
             logger.debug(f"使用自定义 API base URL: {self.base_url}")
 
+        _ensure_litellm()
+
     async def analyze_images(self,
-                           images: List[Union[str, Path, PIL.Image.Image]],
+                           images: Iterable[Union[str, Path, PIL.Image.Image, bytes]],
                            prompt: str,
                            batch_size: int = 10,
                            **kwargs) -> List[str]:
@@ -136,7 +194,7 @@ class LiteLLMVisionProvider(VisionModelProvider):
         使用 LiteLLM 分析图片
 
         Args:
-            images: 图片路径列表或PIL图片对象列表
+            images: 图片路径、PIL图片对象或JPEG字节数据，可以是列表或生成器
             prompt: 分析提示词
             batch_size: 批处理大小
             **kwargs: 其他参数
@@ -144,27 +202,24 @@ class LiteLLMVisionProvider(VisionModelProvider):
         Returns:
             分析结果列表
         """
-        logger.info(f"开始使用 LiteLLM ({self.model_name}) 分析 {len(images)} 张图片")
-
-        # 预处理图片
-        processed_images = self._prepare_images(images)
+        total = len(images) if hasattr(images, "__len__") else "流式输入的"
+        logger.info(f"开始使用 LiteLLM ({self.model_name}) 分析 {total} 张图片")
 
-        # 分批处理
+        # 按批次惰性预处理，只在内存中保留当前批次的图片
         results = []
-        for i in range(0, len(processed_images), batch_size):
-            batch = processed_images[i:i + batch_size]
-            logger.info(f"处理第 {i//batch_size + 1} 批，共 {len(batch)} 张图片")
+        for batch_index, batch in enumerate(self._iter_image_batches(images, batch_size)):
+            logger.info(f"处理第 {batch_index + 1} 批，共 {len(batch)} 张图片")
 
             try:
                 result = await self._analyze_batch(batch, prompt, **kwargs)
                 results.append(result)
             except Exception as e:
-                logger.error(f"批次 {i//batch_size + 1} 处理失败: {str(e)}")
+                logger.error(f"批次 {batch_index + 1} 处理失败: {str(e)}")
                 results.append(f"批次处理失败: {str(e)}")
 
         return results
 
-    async def _analyze_batch(self, batch: List[PIL.Image.Image], prompt: str, **kwargs) -> str:
+    async def _analyze_batch(self, batch: List[Union[PIL.Image.Image, bytes]], prompt: str, **kwargs) -> str:
         """分析一批图片"""
         # 构建 LiteLLM 格式的消息
         content = [{"type": "text", "text": prompt}]
@@ -183,8 +238,55 @@ class LiteLLMVisionProvider(VisionModelProvider):
             "role": "user",
             "content": content
         }]
+        return await self._complete(messages, **kwargs)
 
-        # 调用 LiteLLM
+    async def analyze_video(self,
+                            video_path: str,
+                            prompt: str,
+                            progress_callback=None,
+                            **kwargs) -> str:
+        """
+        通过 Gemini Files API 上传视频后分析
+
+        视频先生成转录代理文件并分块可续传上传（见 gemini_upload），再以文件引用的方式传给模型
+
+        Args:
+            video_path: 视频文件路径
+            prompt: 分析提示词
+            progress_callback: 进度回调 (百分比, 描述)
+            **kwargs: 其他参数
+
+        Returns:
+            分析结果文本
+        """
+        if self.provider_name.lower() not in ("gemini", "google"):
+            return await super().analyze_video(video_path, prompt, progress_callback, **kwargs)
+
+        from app.services import gemini_upload
+
+        logger.info(f"开始使用 LiteLLM ({self.model_name}) 分析视频: {video_path}")
+        try:
+            uploaded = await asyncio.to_thread(
+                gemini_upload.upload_for_transcription,
+                video_path,
+                kwargs.get("api_key") or self.api_key,
+                progress_callback=progress_callback,
+            )
+        except Exception as e:
+            logger.error(f"Gemini 视频上传失败: {str(e)}")
+            raise APICallError(f"视频上传失败: {str(e)}")
+
+        messages = [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "file", "file": {"file_id": uploaded["uri"], "format": uploaded["mime_type"]}},
+            ]
+        }]
+        return await self._complete(messages, **kwargs)
+
+    async def _complete(self, messages: List[Dict[str, Any]], **kwargs) -> str:
+        """调用 LiteLLM 完成一次视觉请求，并把 LiteLLM 异常映射为统一异常"""
         try:
             # 准备参数
             effective_model_name = self.model_name
@@ -223,7 +325,7 @@ class LiteLLMVisionProvider(VisionModelProvider):
             if "api_base" in kwargs:
                 completion_kwargs["api_base"] = kwargs["api_base"]
 
-            response = await acompletion(**completion_kwargs)
+            response = await _timed_acompletion("vision", self.provider_name, **completion_kwargs)
 
             if response.choices and len(response.choices) > 0:
                 content = response.choices[0].message.content
@@ -251,8 +353,14 @@ class LiteLLMVisionProvider(VisionModelProvider):
             logger.error(f"LiteLLM 调用失败: {str(e)}")
             raise APICallError(f"调用失败: {str(e)}")
 
-    def _image_to_base64(self, img: PIL.Image.Image) -> str:
-        """将PIL图片转换为base64编码"""
+    def _image_to_base64(self, img: Union[PIL.Image.Image, bytes]) -> str:
+        """将PIL图片或JPEG字节数据转换为base64编码"""
+        if isinstance(img, bytes):
+            # 已经是目标尺寸的 JPEG 数据，直接编码，避免二次有损压缩
+            return base64.b64encode(img).decode('utf-8')
+
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
         img_buffer = io.BytesIO()
         img.save(img_buffer, format='JPEG', quality=85)
         img_bytes = img_buffer.getvalue()
@@ -346,6 +454,8 @@ class LiteLLMTextProvider(TextModelProvider):
             self._api_base = self.base_url
             logger.debug(f"使用自定义 API base URL: {self.base_url}")
 
+        _ensure_litellm()
+
     async def generate_text(self,
                           prompt: str,
                           system_prompt: Optional[str] = None,
@@ -367,6 +477,71 @@ class LiteLLMTextProvider(TextModelProvider):
         Returns:
             生成的文本内容
         """
+        completion_kwargs = self._build_completion_kwargs(
+            prompt, system_prompt, temperature, max_tokens, response_format, **kwargs
+        )
+        messages = completion_kwargs["messages"]
+
+        try:
+            # 调用 LiteLLM（自动重试）
+            response = await _timed_acompletion("text", self.provider_name, **completion_kwargs)
+
+            if response.choices and len(response.choices) > 0:
+                content = response.choices[0].message.content
+
+                # 清理可能的 markdown 代码块（针对不支持 JSON mode 的模型）
+                if response_format == "json" and "response_format" not in completion_kwargs:
+                    content = self._clean_json_output(content)
+
+                logger.debug(f"LiteLLM 调用成功，消耗 tokens: {response.usage.total_tokens if response.usage else 'N/A'}")
+                return content
+            else:
+                raise APICallError("LiteLLM 返回空响应")
+
+        except LiteLLMAuthError as e:
+            logger.error(f"LiteLLM 认证失败: {str(e)}")
+            raise AuthenticationError()
+        except LiteLLMRateLimitError as e:
+            logger.error(f"LiteLLM 速率限制: {str(e)}")
+            raise RateLimitError()
+        except LiteLLMBadRequestError as e:
+            error_msg = str(e)
+            # 处理不支持 response_format 的情况
+            if "response_format" in error_msg and response_format == "json":
+                logger.warning(f"模型不支持 response_format，重试不带格式约束的请求")
+                completion_kwargs.pop("response_format", None)
+                messages[-1]["content"] += "\n\n请确保输出严格的JSON格式，不要包含任何其他文字或标记。"
+
+                # 重试
+                response = await _timed_acompletion("text", self.provider_name, **completion_kwargs)
+                if response.choices and len(response.choices) > 0:
+                    content = response.choices[0].message.content
+                    content = self._clean_json_output(content)
+                    return content
+                else:
+                    raise APICallError("LiteLLM 返回空响应")
+
+            # 检查是否是安全过滤
+            if "SAFETY" in error_msg.upper() or "content_filter" in error_msg.lower():
+                raise ContentFilterError(f"内容被安全过滤器阻止: {error_msg}")
+
+            logger.error(f"LiteLLM 请求错误: {error_msg}")
+            raise APICallError(f"请求错误: {error_msg}")
+        except LiteLLMAPIError as e:
+            logger.error(f"LiteLLM API 错误: {str(e)}")
+            raise APICallError(f"API 错误: {str(e)}")
+        except Exception as e:
+            logger.error(f"LiteLLM 调用失败: {str(e)}")
+            raise APICallError(f"调用失败: {str(e)}")
+
+    def _build_completion_kwargs(self,
+                                 prompt: str,
+                                 system_prompt: Optional[str],
+                                 temperature: float,
+                                 max_tokens: Optional[int],
+                                 response_format: Optional[str],
+                                 **kwargs) -> Dict[str, Any]:
+        """构建 LiteLLM completion 调用参数（generate_text 与 generate_text_stream 共用）"""
         # 构建消息列表
         messages = self._build_messages(prompt, system_prompt)
 
@@ -419,22 +594,88 @@ class LiteLLMTextProvider(TextModelProvider):
         if "api_base" in kwargs:
             completion_kwargs["api_base"] = kwargs["api_base"]
 
-        try:
-            # 调用 LiteLLM（自动重试）
-            response = await acompletion(**completion_kwargs)
+        return completion_kwargs
 
-            if response.choices and len(response.choices) > 0:
-                content = response.choices[0].message.content
+    async def generate_text_stream(self,
+                                   prompt: str,
+                                   system_prompt: Optional[str] = None,
+                                   temperature: float = 1.0,
+                                   max_tokens: Optional[int] = None,
+                                   response_format: Optional[str] = None,
+                                   **kwargs) -> AsyncIterator[str]:
+        """
+        使用 LiteLLM 流式生成文本，逐段返回模型输出
 
-                # 清理可能的 markdown 代码块（针对不支持 JSON mode 的模型）
-                if response_format == "json" and "response_format" not in completion_kwargs:
-                    content = self._clean_json_output(content)
+        Args:
+            prompt: 用户提示词
+            system_prompt: 系统提示词
+            temperature: 生成温度
+            max_tokens: 最大token数
+            response_format: 响应格式 ('json' 或 None)
+            **kwargs: 其他参数
 
-                logger.debug(f"LiteLLM 调用成功，消耗 tokens: {response.usage.total_tokens if response.usage else 'N/A'}")
-                return content
-            else:
-                raise APICallError("LiteLLM 返回空响应")
+        Yields:
+            生成的文本片段
+        """
+        completion_kwargs = self._build_completion_kwargs(
+            prompt, system_prompt, temperature, max_tokens, response_format, **kwargs
+        )
+        completion_kwargs["stream"] = True
+        # 让最后一个数据块携带 token 用量，否则流式调用的用量统计始终为 0
+        completion_kwargs["stream_options"] = {"include_usage": True}
+        messages = completion_kwargs["messages"]
+        started = time.perf_counter()
+        status = "error"
+        usage = None
+        response = None
+        received = 0
 
+        try:
+            # 并发名额在整个流式响应期间保持占用
+            async with resource_scheduler.api_slot(self.provider_name):
+                # 提供商不支持的可选参数逐个去掉后重试（两个都不支持时最多重试两次）
+                while response is None:
+                    try:
+                        response = await acompletion(**completion_kwargs)
+                    except LiteLLMBadRequestError as e:
+                        if "stream_options" in str(e) and "stream_options" in completion_kwargs:
+                            # 不支持 stream_options 的提供商：不统计用量
+                            logger.warning(f"模型不支持 stream_options，重试不统计 token 用量的流式请求")
+                            completion_kwargs.pop("stream_options")
+                        elif "response_format" in str(e) and "response_format" in completion_kwargs:
+                            # 处理不支持 response_format 的情况，流式输出由调用方负责清理代码块标记
+                            logger.warning(f"模型不支持 response_format，重试不带格式约束的流式请求")
+                            completion_kwargs.pop("response_format")
+                            messages[-1]["content"] += "\n\n请确保输出严格的JSON格式，不要包含任何其他文字或标记。"
+                        else:
+                            raise
+
+                try:
+                    async for chunk in response:
+                        if getattr(chunk, "usage", None):
+                            usage = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta
+                        content = getattr(delta, "content", None) if delta else None
+                        if content:
+                            received += len(content)
+                            yield content
+                finally:
+                    # 调用方提前关闭（或出错）时关闭底层 HTTP 流，服务端停止生成，连接随即释放
+                    await _close_stream(response)
+
+            if received == 0:
+                raise APICallError("LiteLLM 流式调用返回空响应")
+            status = "ok"
+            logger.debug(f"LiteLLM 流式调用完成，共接收 {received} 字符")
+
+        except GeneratorExit:
+            # 调用方拿到所需内容后提前关闭流（如解说文案解析完成），已收到内容即视为成功；
+            # 携带用量的最后一个数据块不会到达，token 用量记为 0
+            if received:
+                status = "ok"
+            raise
         except LiteLLMAuthError as e:
             logger.error(f"LiteLLM 认证失败: {str(e)}")
             raise AuthenticationError()
@@ -443,33 +684,23 @@ class LiteLLMTextProvider(TextModelProvider):
             raise RateLimitError()
         except LiteLLMBadRequestError as e:
             error_msg = str(e)
-            # 处理不支持 response_format 的情况
-            if "response_format" in error_msg and response_format == "json":
-                logger.warning(f"模型不支持 response_format，重试不带格式约束的请求")
-                completion_kwargs.pop("response_format", None)
-                messages[-1]["content"] += "\n\n请确保输出严格的JSON格式，不要包含任何其他文字或标记。"
-
-                # 重试
-                response = await acompletion(**completion_kwargs)
-                if response.choices and len(response.choices) > 0:
-                    content = response.choices[0].message.content
-                    content = self._clean_json_output(content)
-                    return content
-                else:
-                    raise APICallError("LiteLLM 返回空响应")
-
-            # 检查是否是安全过滤
             if "SAFETY" in error_msg.upper() or "content_filter" in error_msg.lower():
                 raise ContentFilterError(f"内容被安全过滤器阻止: {error_msg}")
-
             logger.error(f"LiteLLM 请求错误: {error_msg}")
             raise APICallError(f"请求错误: {error_msg}")
         except LiteLLMAPIError as e:
             logger.error(f"LiteLLM API 错误: {str(e)}")
             raise APICallError(f"API 错误: {str(e)}")
+        except APICallError:
+            raise
         except Exception as e:
-            logger.error(f"LiteLLM 调用失败: {str(e)}")
-            raise APICallError(f"调用失败: {str(e)}")
+            logger.error(f"LiteLLM 流式调用失败: {str(e)}")
+            raise APICallError(f"流式调用失败: {str(e)}")
+        finally:
+            prompt_tokens, completion_tokens = metrics.usage_tokens(usage)
+            metrics.record_llm_call("text_stream", self.provider_name, completion_kwargs.get("model", ""),
+                                    time.perf_counter() - started, status=status,
+                                    prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
 
     def _clean_json_output(self, output: str) -> str:
         """清理JSON输出，移除markdown标记等"""
@@ -207,6 +207,66 @@ class LLMServiceManager:
             logger.error(f"创建文本模型提供商实例失败: {provider_name} - {str(e)}")
             raise ConfigurationError(f"创建提供商实例失败: {str(e)}")
     
+    @classmethod
+    def get_fallback_vision_provider(cls) -> Optional[VisionModelProvider]:
+        """
+        获取备用视觉模型提供商实例（请求对冲 / 故障转移使用，见 routing）
+
+        配置项为 vision_fallback_provider（默认 litellm）、vision_fallback_model_name、
+        vision_fallback_api_key、vision_fallback_base_url
+
+        Returns:
+            备用视觉模型提供商实例，未配置备用模型时返回 None
+        """
+        return cls._get_fallback_provider("vision", cls._vision_providers, cls._vision_instance_cache)
+
+    @classmethod
+    def get_fallback_text_provider(cls) -> Optional[TextModelProvider]:
+        """
+        获取备用文本模型提供商实例（请求对冲 / 故障转移使用，见 routing）
+
+        配置项为 text_fallback_provider（默认 litellm）、text_fallback_model_name、
+        text_fallback_api_key、text_fallback_base_url
+
+        Returns:
+            备用文本模型提供商实例，未配置备用模型时返回 None
+        """
+        return cls._get_fallback_provider("text", cls._text_providers, cls._text_instance_cache)
+
+    @classmethod
+    def _get_fallback_provider(cls, kind: str, providers: dict, instance_cache: dict):
+        """按 {kind}_fallback_* 配置创建（并缓存）备用提供商实例"""
+        config_prefix = f"{kind}_fallback"
+        model_name = config.app.get(f'{config_prefix}_model_name')
+        if not model_name:
+            return None
+
+        cache_key = config_prefix
+        if cache_key in instance_cache:
+            return instance_cache[cache_key]
+
+        provider_name = (config.app.get(f'{config_prefix}_provider') or 'litellm').lower()
+        if provider_name not in providers:
+            raise ProviderNotFoundError(provider_name)
+
+        api_key = config.app.get(f'{config_prefix}_api_key')
+        if not api_key:
+            raise ConfigurationError(f"缺少API密钥配置: {config_prefix}_api_key")
+
+        try:
+            instance = providers[provider_name](
+                api_key=api_key,
+                model_name=model_name,
+                base_url=config.app.get(f'{config_prefix}_base_url')
+            )
+        except Exception as e:
+            logger.error(f"创建备用模型提供商实例失败: {provider_name} - {str(e)}")
+            raise ConfigurationError(f"创建提供商实例失败: {str(e)}")
+
+        instance_cache[cache_key] = instance
+        logger.info(f"创建备用{'视觉' if kind == 'vision' else '文本'}模型提供商实例: {provider_name} - {model_name}")
+        return instance
+
     @classmethod
     def clear_cache(cls):
         """清空提供商实例缓存"""
@@ -4,9 +4,8 @@
 为现有代码提供向后兼容的接口，方便逐步迁移到新的LLM服务架构
 """
 
-import asyncio
 import json
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Callable
 from pathlib import Path
 import PIL.Image
 from loguru import logger
@@ -15,6 +14,8 @@ from .unified_service import UnifiedLLMService
 from .exceptions import LLMServiceError
 # 导入新的提示词管理系统
 from app.services.prompts import PromptManager
+from app.config import config
+from app.utils import async_runtime
 
 # 提供商注册由 webui.py:main() 显式调用（见 LLM 提供商注册机制重构）
 # 这样更可靠，错误也更容易调试
@@ -22,7 +23,9 @@ from app.services.prompts import PromptManager
 
 def _run_async_safely(coro_func, *args, **kwargs):
     """
-    安全地运行异步协程，处理各种事件循环情况
+    在进程级异步运行时中运行协程并等待结果
+
+    所有同步调用共用同一个长期事件循环，LLM 提供商的异步 HTTP 客户端和连接可以跨调用复用
 
     Args:
         coro_func: 协程函数（不是协程对象）
@@ -32,28 +35,8 @@ def _run_async_safely(coro_func, *args, **kwargs):
     Returns:
         协程的执行结果
     """
-    def run_in_new_loop():
-        """在新的事件循环中运行协程"""
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(coro_func(*args, **kwargs))
-        finally:
-            loop.close()
-            asyncio.set_event_loop(None)
-
     try:
-        # 尝试获取当前事件循环
-        try:
-            loop = asyncio.get_running_loop()
-            # 如果有运行中的事件循环，使用线程池执行
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(run_in_new_loop)
-                return future.result()
-        except RuntimeError:
-            # 没有运行中的事件循环，直接运行
-            return run_in_new_loop()
+        return async_runtime.run(coro_func(*args, **kwargs))
     except Exception as e:
         logger.error(f"异步执行失败: {str(e)}")
         raise LLMServiceError(f"异步执行失败: {str(e)}")
@@ -102,6 +85,19 @@ class LegacyLLMAdapter:
                 }
             )
 
+            if config.app.get('llm_stream_output', False):
+                try:
+                    items = _run_async_safely(
+                        UnifiedLLMService.generate_narration_script,
+                        prompt=prompt,
+                        system_prompt="你是一名专业的短视频解说文案撰写专家。",
+                        temperature=1.5,
+                        stream=True
+                    )
+                    return json.dumps({"items": items}, ensure_ascii=False)
+                except Exception as e:
+                    logger.warning(f"流式生成解说文案失败，回退到非流式生成: {str(e)}")
+
             # 使用统一服务生成文案
             result = _run_async_safely(
                 UnifiedLLMService.generate_text,
@@ -182,11 +178,13 @@ class VisionAnalyzerAdapter:
 
             # 转换为旧格式以保持向后兼容性
             # 新实现返回 List[str]，需要转换为 List[Dict]
+            # images 也可以是逐帧产出数据的生成器，此时无法预知总数
+            total = len(images) if hasattr(images, '__len__') else None
             compatible_results = []
             for i, result in enumerate(results):
                 # 计算这个批次处理的图片数量
                 start_idx = i * batch_size
-                end_idx = min(start_idx + batch_size, len(images))
+                end_idx = min(start_idx + batch_size, total) if total is not None else start_idx + batch_size
                 images_processed = end_idx - start_idx
 
                 compatible_results.append({
@@ -196,7 +194,7 @@ class VisionAnalyzerAdapter:
                     'model_used': self.model
                 })
 
-            logger.info(f"图片分析完成，共处理 {len(images)} 张图片，生成 {len(compatible_results)} 个批次结果")
+            logger.info(f"图片分析完成，生成 {len(compatible_results)} 个批次结果")
             return compatible_results
 
         except Exception as e:
@@ -271,7 +269,8 @@ class SubtitleAnalyzerAdapter:
                 "temperature": 1.0
             }
     
-    def generate_narration_script(self, short_name: str, plot_analysis: str, subtitle_content: str = "", temperature: float = 0.7) -> Dict[str, Any]:
+    def generate_narration_script(self, short_name: str, plot_analysis: str, subtitle_content: str = "", temperature: float = 0.7,
+                                  on_item: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
         """
         生成解说文案 - 兼容原有接口
 
@@ -280,6 +279,7 @@ class SubtitleAnalyzerAdapter:
             plot_analysis: 剧情分析内容
             subtitle_content: 原始字幕内容，用于提供准确的时间戳信息
             temperature: 生成温度
+            on_item: 流式生成时每完成一个片段的回调（需开启 llm_stream_output）
 
         Returns:
             生成结果字典
@@ -296,6 +296,38 @@ class SubtitleAnalyzerAdapter:
                 }
             )
             
+            if config.app.get('llm_stream_output', False):
+                delivered = []
+
+                def deliver(item: Dict[str, Any]):
+                    delivered.append(item)
+                    if on_item:
+                        on_item(item)
+
+                try:
+                    items = self._run_async_safely(
+                        UnifiedLLMService.generate_narration_script,
+                        prompt=prompt,
+                        system_prompt="你是一位专业的短视频解说脚本撰写专家。",
+                        provider=self.provider,
+                        temperature=temperature,
+                        stream=True,
+                        on_item=deliver,
+                        api_key=self.api_key,
+                        api_base=self.base_url
+                    )
+                    return {
+                        "status": "success",
+                        "narration_script": json.dumps({"items": items}, ensure_ascii=False),
+                        "model": self.model,
+                        "temperature": temperature
+                    }
+                except Exception as e:
+                    if delivered:
+                        # 已交付的片段可能已经开始配音，重新生成会得到另一份文案，不再回退
+                        raise LLMServiceError(f"流式生成解说文案在第 {len(delivered)} 个片段后失败: {str(e)}")
+                    logger.warning(f"流式生成解说文案失败，回退到非流式生成: {str(e)}")
+
             # 使用统一服务生成文案
             result = self._run_async_safely(
                 UnifiedLLMService.generate_text,
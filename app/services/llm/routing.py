@@ -0,0 +1,214 @@
+"""
+大模型请求路由：请求对冲、故障转移与熔断
+
+解说生成的总耗时主要取决于提供商的长尾延迟，而不是平均延迟。配置了备用模型（{kind}_fallback_*）后：
+- 故障转移：主模型调用失败时改用备用模型重试一次
+- 请求对冲（llm_hedge_enabled）：主模型超过对冲延迟仍未返回时，向备用模型发送相同请求，
+  先返回的有效结果胜出，另一个请求被取消。对冲延迟 = 主模型近期成功调用延迟的 p95（llm_hedge_percentile），
+  限制在 [llm_hedge_min_delay, llm_hedge_latency_budget] 之间，样本不足时使用延迟预算
+- 熔断：某个模型连续失败 llm_circuit_failure_threshold 次后熔断 llm_circuit_cooldown 秒，
+  期间直接使用另一个模型；冷却结束后放行一次试探请求，成功则恢复
+
+用法:
+    result = await routing.call("text", lambda provider: provider.generate_text(prompt=prompt), provider_name)
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from loguru import logger
+
+from app.config import config
+from .manager import LLMServiceManager
+
+# 计算 p95 使用的近期成功调用延迟样本数
+LATENCY_WINDOW = 50
+
+# 样本少于该数量时对冲延迟使用延迟预算
+MIN_LATENCY_SAMPLES = 5
+
+
+class _RouteState:
+    """单个模型的延迟样本和熔断状态"""
+
+    def __init__(self):
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+
+_states: Dict[str, _RouteState] = {}
+_lock = threading.Lock()
+
+
+def _route_key(kind: str, provider) -> str:
+    return f"{kind}:{getattr(provider, 'provider_name', '')}:{getattr(provider, 'model_name', '')}"
+
+
+def percentile_latency(key: str, percentile: float) -> Optional[float]:
+    """
+    模型近期成功调用延迟的百分位数
+
+    Args:
+        key: 路由键
+        percentile: 百分位（0~1）
+
+    Returns:
+        float: 延迟（秒），样本不足时返回 None
+    """
+    with _lock:
+        samples = sorted(_states[key].latencies) if key in _states else []
+    if len(samples) < MIN_LATENCY_SAMPLES:
+        return None
+    index = min(len(samples) - 1, max(0, math.ceil(percentile * len(samples)) - 1))
+    return samples[index]
+
+
+def hedge_delay(key: str) -> float:
+    """主模型的对冲延迟（秒）：近期 p95 延迟，限制在 [最小延迟, 延迟预算] 之间"""
+    budget = float(config.app.get("llm_hedge_latency_budget", 60))
+    min_delay = float(config.app.get("llm_hedge_min_delay", 5))
+    p95 = percentile_latency(key, float(config.app.get("llm_hedge_percentile", 0.95)))
+    if p95 is None:
+        return budget
+    return max(min_delay, min(budget, p95))
+
+
+def available(key: str) -> bool:
+    """模型是否可用（未熔断，或冷却结束后还没有试探请求在进行）"""
+    with _lock:
+        state = _states.setdefault(key, _RouteState())
+        if state.open_until <= 0:
+            return True
+        if time.monotonic() < state.open_until or state.probing:
+            return False
+        state.probing = True
+        return True
+
+
+def record_success(key: str, latency: float):
+    """记录一次成功调用：加入延迟样本，清零失败计数并关闭熔断"""
+    with _lock:
+        state = _states.setdefault(key, _RouteState())
+        state.latencies.append(latency)
+        if state.open_until:
+            logger.info(f"模型恢复可用: {key}")
+        state.consecutive_failures = 0
+        state.open_until = 0.0
+        state.probing = False
+
+
+def record_failure(key: str):
+    """记录一次失败调用：连续失败达到阈值（或试探请求失败）时熔断"""
+    threshold = int(config.app.get("llm_circuit_failure_threshold", 3))
+    cooldown = float(config.app.get("llm_circuit_cooldown", 60))
+    with _lock:
+        state = _states.setdefault(key, _RouteState())
+        state.consecutive_failures += 1
+        state.probing = False
+        if state.open_until or state.consecutive_failures >= threshold:
+            state.open_until = time.monotonic() + cooldown
+            logger.warning(f"模型连续失败 {state.consecutive_failures} 次，熔断 {cooldown:.0f} 秒: {key}")
+
+
+def reset():
+    """清空延迟样本和熔断状态"""
+    with _lock:
+        _states.clear()
+
+
+async def _timed(key: str, request: Callable[[Any], Awaitable[Any]], provider) -> Any:
+    """执行一次请求并记录延迟 / 失败（被取消的请求不计入）"""
+    started = time.monotonic()
+    try:
+        result = await request(provider)
+    except asyncio.CancelledError:
+        with _lock:
+            _states.setdefault(key, _RouteState()).probing = False
+        raise
+    except Exception:
+        record_failure(key)
+        raise
+    if not result:
+        record_failure(key)
+        raise ValueError("模型返回了空结果")
+    record_success(key, time.monotonic() - started)
+    return result
+
+
+async def call(kind: str, request: Callable[[Any], Awaitable[Any]], provider_name: Optional[str] = None,
+               replayable: bool = True) -> Any:
+    """
+    按路由策略调用模型
+
+    Args:
+        kind: vision 或 text
+        request: 接收提供商实例、发起请求的协程函数，可能对主备两个模型各调用一次
+        provider_name: 主模型提供商名称，为空时使用配置中的默认值
+        replayable: 请求能否重复发送（参数是只能遍历一次的生成器时传 False，此时不对冲也不故障转移，只按熔断状态选择模型）
+
+    Returns:
+        第一个有效结果
+
+    Raises:
+        Exception: 所有可用模型都失败时抛出最后一个错误
+    """
+    if kind == "vision":
+        primary = LLMServiceManager.get_vision_provider(provider_name)
+        fallback = LLMServiceManager.get_fallback_vision_provider()
+    else:
+        primary = LLMServiceManager.get_text_provider(provider_name)
+        fallback = LLMServiceManager.get_fallback_text_provider()
+
+    if fallback is None:
+        return await request(primary)
+
+    routes = [(_route_key(kind, primary), primary), (_route_key(kind, fallback), fallback)]
+    # 主模型熔断时直接使用备用模型
+    if not available(routes[0][0]):
+        logger.info(f"主模型已熔断，使用备用模型: {routes[1][0]}")
+        routes.reverse()
+    first_key, first = routes[0]
+    second_key, second = routes[1]
+
+    tasks = [asyncio.ensure_future(_timed(first_key, request, first))]
+    try:
+        hedging = replayable and config.app.get("llm_hedge_enabled", False)
+        delay = hedge_delay(first_key) if hedging else None
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done and tasks[0].exception() is None:
+            return tasks[0].result()
+
+        if done:
+            # 主模型失败：故障转移到备用模型
+            error = tasks[0].exception()
+            if not replayable or not available(second_key):
+                raise error
+            logger.warning(f"模型调用失败，故障转移到备用模型 {second_key}: {error}")
+            return await _timed(second_key, request, second)
+
+        if not available(second_key):
+            return await tasks[0]
+
+        # 主模型超过对冲延迟仍未返回：向备用模型发送相同请求，先返回的有效结果胜出
+        logger.info(f"模型 {first_key} 超过 {delay:.1f}s 未返回，对冲请求备用模型 {second_key}")
+        tasks.append(asyncio.ensure_future(_timed(second_key, request, second)))
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # 落败或调用方取消时，取消仍在进行的请求
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,210 @@
+"""
+流式输出增量解析器
+
+在大模型逐 token 输出 JSON 的同时，增量解析 items 数组中的每个对象，
+每完成一个对象就立即解析、校验并交给调用方，无需等待完整响应
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional
+from loguru import logger
+
+from .exceptions import ValidationError
+from .validators import OutputValidator
+
+
+class NarrationItemStreamParser:
+    """
+    解说文案 items 数组的增量解析器
+
+    支持以下输出形式：
+    - {"items": [{...}, {...}]}
+    - [{...}, {...}]
+    - 以上两种形式外包裹 markdown 代码块（```json ... ```）
+
+    用法:
+        parser = NarrationItemStreamParser()
+        for chunk in chunks:
+            for item in parser.feed(chunk):
+                ...
+        parser.close()
+    """
+
+    _ITEMS_KEY_PATTERN = re.compile(r'"items"\s*:\s*\[')
+    _BARE_ARRAY_PATTERN = re.compile(r'^\s*(?:```(?:json)?\s*)?\[')
+
+    def __init__(self, validate: bool = True, max_preamble_chars: int = 8192):
+        """
+        Args:
+            validate: 是否使用 OutputValidator 校验每个完成的 item
+            max_preamble_chars: 在找到 items 数组之前允许的最大前导字符数，
+                超出则认为输出格式错误并提前终止
+        """
+        self.validate = validate
+        self.max_preamble_chars = max_preamble_chars
+
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._array_closed = False
+
+        # 当前对象的扫描状态
+        self._obj_start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+        self.items: List[Dict[str, Any]] = []
+
+    @property
+    def finished(self) -> bool:
+        """items 数组是否已经完整结束"""
+        return self._array_closed
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        输入一段新的输出文本
+
+        Args:
+            chunk: 模型新输出的文本片段
+
+        Returns:
+            本次新完成的 item 列表（可能为空）
+
+        Raises:
+            ValidationError: 输出格式错误或 item 校验失败时抛出
+        """
+        if not chunk or self._array_closed:
+            return []
+
+        self._buffer += chunk
+
+        if not self._in_array and not self._locate_array():
+            return []
+
+        return self._scan()
+
+    def close(self) -> List[Dict[str, Any]]:
+        """
+        结束解析，检查输出是否完整
+
+        Returns:
+            全部已解析的 item 列表
+
+        Raises:
+            ValidationError: 未找到 items 数组或输出被截断时抛出
+        """
+        if not self._in_array:
+            raise ValidationError("流式输出中未找到 items 数组", "stream_no_items", self._buffer[:500])
+
+        if not self._array_closed:
+            if self._obj_start is not None:
+                raise ValidationError(
+                    f"流式输出在第{len(self.items) + 1}项中途被截断",
+                    "stream_truncated",
+                    self._buffer[self._obj_start:][:500]
+                )
+            # 对象都已完整，只是缺少结尾的 ]，按已解析内容处理
+            logger.warning(f"流式输出缺少 items 数组结束标记，已解析 {len(self.items)} 项")
+
+        if not self.items:
+            raise ValidationError("流式输出的 items 数组为空", "stream_empty_items")
+
+        return self.items
+
+    def _locate_array(self) -> bool:
+        """在缓冲区中查找 items 数组的起始位置"""
+        match = self._ITEMS_KEY_PATTERN.search(self._buffer)
+        if match is None:
+            match = self._BARE_ARRAY_PATTERN.match(self._buffer)
+
+        if match is None:
+            if len(self._buffer) > self.max_preamble_chars:
+                raise ValidationError(
+                    f"输出前 {self.max_preamble_chars} 个字符内未找到 items 数组",
+                    "stream_no_items",
+                    self._buffer[:500]
+                )
+            return False
+
+        self._in_array = True
+        self._pos = match.end()
+        return True
+
+    def _scan(self) -> List[Dict[str, Any]]:
+        """从上次停止的位置继续扫描缓冲区"""
+        completed = []
+        buffer = self._buffer
+        length = len(buffer)
+        pos = self._pos
+
+        while pos < length:
+            char = buffer[pos]
+
+            if self._obj_start is None:
+                # 数组层级：只允许空白、逗号、对象起始和数组结束
+                if char == "{":
+                    self._obj_start = pos
+                    self._depth = 1
+                elif char == "]":
+                    self._array_closed = True
+                    pos += 1
+                    break
+                elif not (char.isspace() or char == ","):
+                    raise ValidationError(
+                        f"items 数组中出现非法字符: {char!r}",
+                        "stream_malformed",
+                        buffer[max(0, pos - 50):pos + 50]
+                    )
+                pos += 1
+                continue
+
+            # 对象内部：跟踪字符串与嵌套层级
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.append(self._emit(buffer[self._obj_start:pos + 1]))
+                    self._obj_start = None
+            pos += 1
+
+        self._pos = pos
+
+        # 丢弃已处理的前缀，避免缓冲区无限增长
+        if self._obj_start is None:
+            self._buffer = buffer[pos:]
+            self._pos = 0
+        elif self._obj_start > 0:
+            self._buffer = buffer[self._obj_start:]
+            self._pos -= self._obj_start
+            self._obj_start = 0
+
+        return completed
+
+    def _emit(self, raw: str) -> Dict[str, Any]:
+        """解析并校验一个完整的 item"""
+        index = len(self.items)
+        try:
+            item = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValidationError(f"第{index + 1}项JSON格式无效: {str(e)}", "stream_json_parse", raw)
+
+        if not isinstance(item, dict):
+            raise ValidationError(f"第{index + 1}项不是对象类型", "stream_item_type", raw)
+
+        if self.validate:
+            OutputValidator._validate_narration_item(item, index)
+
+        self.items.append(item)
+        return item
@@ -4,14 +4,16 @@
 提供简化的API接口，方便现有代码迁移到新的架构
 """
 
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, AsyncIterator, Callable, Iterable
 from pathlib import Path
 import PIL.Image
 from loguru import logger
 
 from .manager import LLMServiceManager
+from . import routing
 from .validators import OutputValidator
-from .exceptions import LLMServiceError
+from .stream_parser import NarrationItemStreamParser
+from .exceptions import LLMServiceError, ValidationError
 
 # 提供商注册由 webui.py:main() 显式调用（见 LLM 提供商注册机制重构）
 # 这样更可靠，错误也更容易调试
@@ -21,7 +23,7 @@ class UnifiedLLMService:
     """统一的大模型服务接口"""
     
     @staticmethod
-    async def analyze_images(images: List[Union[str, Path, PIL.Image.Image]],
+    async def analyze_images(images: Iterable[Union[str, Path, PIL.Image.Image, bytes]],
                            prompt: str,
                            provider: Optional[str] = None,
                            batch_size: int = 10,
@@ -30,7 +32,7 @@ class UnifiedLLMService:
         分析图片内容
         
         Args:
-            images: 图片路径列表或PIL图片对象列表
+            images: 图片路径、PIL图片对象或JPEG字节数据，可以是列表或生成器（按批次惰性加载）
             prompt: 分析提示词
             provider: 视觉模型提供商名称，如果不指定则使用配置中的默认值
             batch_size: 批处理大小
@@ -43,24 +45,65 @@ class UnifiedLLMService:
             LLMServiceError: 服务调用失败时抛出
         """
         try:
-            # 获取视觉模型提供商
-            vision_provider = LLMServiceManager.get_vision_provider(provider)
-            
-            # 执行图片分析
-            results = await vision_provider.analyze_images(
-                images=images,
-                prompt=prompt,
-                batch_size=batch_size,
-                **kwargs
+            # 按路由策略执行图片分析（配置了备用模型时熔断 / 故障转移 / 对冲）
+            # 生成器只能遍历一次，不能对冲或故障转移；列表可以对主备模型各发送一次
+            results = await routing.call(
+                "vision",
+                lambda vision_provider: vision_provider.analyze_images(
+                    images=images,
+                    prompt=prompt,
+                    batch_size=batch_size,
+                    **kwargs
+                ),
+                provider,
+                replayable=isinstance(images, (list, tuple))
             )
             
-            logger.info(f"图片分析完成，共处理 {len(images)} 张图片，生成 {len(results)} 个结果")
+            logger.info(f"图片分析完成，共生成 {len(results)} 个批次结果")
             return results
             
         except Exception as e:
             logger.error(f"图片分析失败: {str(e)}")
             raise LLMServiceError(f"图片分析失败: {str(e)}")
-    
+
+    @staticmethod
+    async def analyze_video(video_path: str,
+                            prompt: str,
+                            provider: Optional[str] = None,
+                            progress_callback=None,
+                            **kwargs) -> str:
+        """
+        上传视频并分析内容（如视频转录），目前只有 Gemini 模型支持
+
+        Args:
+            video_path: 视频文件路径
+            prompt: 分析提示词
+            provider: 视觉模型提供商名称，如果不指定则使用配置中的默认值
+            progress_callback: 进度回调 (百分比, 描述)
+            **kwargs: 其他参数
+
+        Returns:
+            分析结果文本
+
+        Raises:
+            LLMServiceError: 服务调用失败时抛出
+        """
+        try:
+            # 上传记录按视频复用，主备模型各调用一次不会重复上传同一个文件
+            return await routing.call(
+                "vision",
+                lambda vision_provider: vision_provider.analyze_video(
+                    video_path=video_path,
+                    prompt=prompt,
+                    progress_callback=progress_callback,
+                    **kwargs
+                ),
+                provider
+            )
+        except Exception as e:
+            logger.error(f"视频分析失败: {str(e)}")
+            raise LLMServiceError(f"视频分析失败: {str(e)}")
+
     @staticmethod
     async def generate_text(prompt: str,
                           system_prompt: Optional[str] = None,
@@ -88,17 +131,18 @@ class UnifiedLLMService:
             LLMServiceError: 服务调用失败时抛出
         """
         try:
-            # 获取文本模型提供商
-            text_provider = LLMServiceManager.get_text_provider(provider)
-            
-            # 执行文本生成
-            result = await text_provider.generate_text(
-                prompt=prompt,
-                system_prompt=system_prompt,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                response_format=response_format,
-                **kwargs
+            # 按路由策略执行文本生成（配置了备用模型时熔断 / 故障转移 / 对冲）
+            result = await routing.call(
+                "text",
+                lambda text_provider: text_provider.generate_text(
+                    prompt=prompt,
+                    system_prompt=system_prompt,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    response_format=response_format,
+                    **kwargs
+                ),
+                provider
             )
             
             logger.info(f"文本生成完成，生成内容长度: {len(result)} 字符")
@@ -108,11 +152,112 @@ class UnifiedLLMService:
             logger.error(f"文本生成失败: {str(e)}")
             raise LLMServiceError(f"文本生成失败: {str(e)}")
     
+    @staticmethod
+    async def generate_text_stream(prompt: str,
+                                   system_prompt: Optional[str] = None,
+                                   provider: Optional[str] = None,
+                                   temperature: float = 1.0,
+                                   max_tokens: Optional[int] = None,
+                                   response_format: Optional[str] = None,
+                                   **kwargs) -> AsyncIterator[str]:
+        """
+        流式生成文本内容
+
+        Args:
+            prompt: 用户提示词
+            system_prompt: 系统提示词
+            provider: 文本模型提供商名称，如果不指定则使用配置中的默认值
+            temperature: 生成温度
+            max_tokens: 最大token数
+            response_format: 响应格式 ('json' 或 None)
+            **kwargs: 其他参数
+
+        Yields:
+            生成的文本片段
+
+        Raises:
+            LLMServiceError: 服务调用失败时抛出
+        """
+        provider_stream = None
+        try:
+            text_provider = LLMServiceManager.get_text_provider(provider)
+
+            provider_stream = text_provider.generate_text_stream(
+                prompt=prompt,
+                system_prompt=system_prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                response_format=response_format,
+                **kwargs
+            )
+            async for chunk in provider_stream:
+                yield chunk
+
+        except Exception as e:
+            logger.error(f"流式文本生成失败: {str(e)}")
+            raise LLMServiceError(f"流式文本生成失败: {str(e)}")
+        finally:
+            # 调用方提前关闭时 async for 不会关闭内层生成器，需要显式关闭以释放连接和并发名额
+            if provider_stream is not None:
+                await provider_stream.aclose()
+
+    @staticmethod
+    async def stream_narration_items(prompt: str,
+                                     system_prompt: Optional[str] = None,
+                                     provider: Optional[str] = None,
+                                     temperature: float = 1.0,
+                                     validate_output: bool = True,
+                                     **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式生成解说文案，items 数组中每完成一个片段就立即返回
+
+        输出格式错误或片段校验失败时会立即中止生成，不必等待完整响应
+
+        Args:
+            prompt: 提示词
+            system_prompt: 系统提示词
+            provider: 文本模型提供商名称
+            temperature: 生成温度
+            validate_output: 是否校验每个片段
+            **kwargs: 其他参数
+
+        Yields:
+            解说文案片段
+
+        Raises:
+            ValidationError: 输出格式错误时抛出
+            LLMServiceError: 服务调用失败时抛出
+        """
+        parser = NarrationItemStreamParser(validate=validate_output)
+
+        text_stream = UnifiedLLMService.generate_text_stream(
+            prompt=prompt,
+            system_prompt=system_prompt,
+            provider=provider,
+            temperature=temperature,
+            response_format="json",
+            **kwargs
+        )
+        try:
+            async for chunk in text_stream:
+                for item in parser.feed(chunk):
+                    yield item
+                if parser.finished:
+                    break
+        finally:
+            # 提前结束或格式错误时关闭底层连接，避免继续消耗 token
+            await text_stream.aclose()
+
+        parser.close()
+        logger.info(f"流式解说文案生成完成，共 {len(parser.items)} 个片段")
+
     @staticmethod
     async def generate_narration_script(prompt: str,
                                       provider: Optional[str] = None,
                                       temperature: float = 1.0,
                                       validate_output: bool = True,
+                                      stream: bool = False,
+                                      on_item: Optional[Callable[[Dict[str, Any]], None]] = None,
                                       **kwargs) -> List[Dict[str, Any]]:
         """
         生成解说文案
@@ -122,6 +267,8 @@ class UnifiedLLMService:
             provider: 文本模型提供商名称
             temperature: 生成温度
             validate_output: 是否验证输出格式
+            stream: 是否使用流式生成，逐个片段解析
+            on_item: 流式生成时每完成一个片段的回调，可用于提前启动配音等后续处理
             **kwargs: 其他参数
             
         Returns:
@@ -130,6 +277,24 @@ class UnifiedLLMService:
         Raises:
             LLMServiceError: 服务调用失败时抛出
         """
+        if stream:
+            items = []
+            try:
+                async for item in UnifiedLLMService.stream_narration_items(
+                    prompt=prompt,
+                    provider=provider,
+                    temperature=temperature,
+                    validate_output=validate_output,
+                    **kwargs
+                ):
+                    items.append(item)
+                    if on_item:
+                        on_item(item)
+            except ValidationError as e:
+                logger.error(f"流式解说文案格式错误，已中止生成: {e.message}")
+                raise LLMServiceError(f"解说文案生成失败: {e.message}")
+            return items
+
         try:
             # 生成文本
             result = await UnifiedLLMService.generate_text(
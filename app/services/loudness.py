@@ -0,0 +1,290 @@
+"""
+音频响度分析服务
+
+直接从源文件的音频流测量响度，无需先导出临时 WAV：
+- 使用 FFmpeg ebur128 滤镜一次流式遍历得到 EBU R128 综合响度 (LUFS)、响度范围和真峰值
+- 多个文件（如全部 TTS 音频）合并为一次 FFmpeg 调用批量分析，避免重复启动进程
+- ebur128 不可用时退化为降采样单声道 PCM 管道计算 RMS，不再用 pydub 把整段音频读入内存
+- 结果按文件指纹（路径、大小、修改时间）缓存在内存和 temp/loudness 目录中
+"""
+
+import json
+import math
+import os
+import re
+import subprocess
+import threading
+from typing import Dict, List, Optional, Sequence
+
+from loguru import logger
+
+from app.utils import metrics
+
+# 静音或分析失败时使用的最低响度
+SILENCE_LUFS = -70.0
+
+# 单次 FFmpeg 调用最多分析的文件数，避免命令行过长或打开过多文件
+MAX_BATCH_SIZE = 32
+
+# RMS 备用方案使用的降采样率（只用于估算响度，不需要高采样率）
+RMS_SAMPLE_RATE = 8000
+
+_SUMMARY_PATTERN = re.compile(r"\[Parsed_ebur128_(\d+) @ [^\]]+\] Summary:")
+_VALUE_PATTERNS = {
+    "integrated": re.compile(r"^\s*I:\s+(-?[\d.]+|-inf)\s+LUFS"),
+    "lra": re.compile(r"^\s*LRA:\s+(-?[\d.]+|-inf)\s+LU"),
+    "true_peak": re.compile(r"^\s*Peak:\s+(-?[\d.]+|-inf)\s+dBFS"),
+}
+
+_memory_cache: Dict[str, Dict[str, float]] = {}
+_cache_lock = threading.Lock()
+
+
+def _fingerprint(file_path: str) -> Optional[str]:
+    """根据路径、文件大小和修改时间生成缓存键，文件不存在时返回 None"""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    from app.utils import utils
+
+    return utils.md5(f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}")
+
+
+def _cache_file(key: str) -> str:
+    from app.utils import utils
+
+    return os.path.join(utils.temp_dir("loudness"), f"{key}.json")
+
+
+def _load_cached(key: str) -> Optional[Dict[str, float]]:
+    with _cache_lock:
+        if key in _memory_cache:
+            return _memory_cache[key]
+    try:
+        with open(_cache_file(key), "r", encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return None
+    with _cache_lock:
+        _memory_cache[key] = result
+    return result
+
+
+def _store_cached(key: str, result: Dict[str, float]):
+    with _cache_lock:
+        _memory_cache[key] = result
+    try:
+        with open(_cache_file(key), "w", encoding="utf-8") as f:
+            json.dump(result, f)
+    except OSError as e:
+        logger.debug(f"写入响度缓存失败: {e}")
+
+
+def _parse_float(value: str) -> float:
+    return SILENCE_LUFS if value == "-inf" else float(value)
+
+
+def _parse_ebur128_summaries(stderr: str) -> Dict[int, Dict[str, float]]:
+    """
+    解析 ebur128 滤镜在结束时输出的 Summary 段
+
+    Returns:
+        {滤镜实例序号: {"integrated": ..., "lra": ..., "true_peak": ...}}
+    """
+    summaries: Dict[int, Dict[str, float]] = {}
+    current = None
+    for line in stderr.splitlines():
+        match = _SUMMARY_PATTERN.search(line)
+        if match:
+            current = int(match.group(1))
+            summaries[current] = {}
+            continue
+        if current is None:
+            continue
+        for name, pattern in _VALUE_PATTERNS.items():
+            value_match = pattern.match(line)
+            if value_match and name not in summaries[current]:
+                summaries[current][name] = _parse_float(value_match.group(1))
+                break
+    return {index: values for index, values in summaries.items() if "integrated" in values}
+
+
+def _run_ebur128(paths: Sequence[str]) -> List[Optional[Dict[str, float]]]:
+    """一次 FFmpeg 调用分析多个文件的第一条音频流"""
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-nostdin"]
+    for path in paths:
+        cmd += ["-i", path]
+
+    chains = [
+        f"[{idx}:a:0]ebur128=peak=true:framelog=quiet[loud{idx}]"
+        for idx in range(len(paths))
+    ]
+    cmd += ["-filter_complex", ";".join(chains)]
+    for idx in range(len(paths)):
+        cmd += ["-map", f"[loud{idx}]", "-f", "null", "-"]
+
+    result = subprocess.run(
+        cmd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        errors="ignore",
+        check=False,
+    )
+    if result.returncode != 0:
+        logger.debug(f"ebur128 分析失败: {result.stderr[-500:]}")
+        return [None] * len(paths)
+
+    # 滤镜实例序号按输入顺序递增
+    summaries = _parse_ebur128_summaries(result.stderr)
+    ordered = [summaries[index] for index in sorted(summaries)]
+    if len(ordered) != len(paths):
+        logger.debug(f"ebur128 输出数量不匹配: 期望 {len(paths)}，实际 {len(ordered)}")
+        return [None] * len(paths)
+    return ordered
+
+
+def measure_rms(file_path: str, sample_rate: int = RMS_SAMPLE_RATE) -> Optional[float]:
+    """
+    通过降采样单声道 PCM 管道流式计算 RMS (dBFS)
+
+    Args:
+        file_path: 音频或视频文件路径
+        sample_rate: 降采样率
+
+    Returns:
+        float: RMS 值 (dBFS)，失败返回 None
+    """
+    import numpy as np
+
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin",
+        "-i", file_path,
+        "-map", "0:a:0", "-ac", "1", "-ar", str(sample_rate),
+        "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1",
+    ]
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        metrics.record_subprocess()
+    except OSError as e:
+        logger.error(f"启动 FFmpeg 失败: {e}")
+        return None
+
+    square_sum = 0.0
+    sample_count = 0
+    pending = b""
+    try:
+        while True:
+            chunk = process.stdout.read(sample_rate * 2 * 10)
+            if not chunk:
+                break
+            chunk = pending + chunk
+            usable = len(chunk) - len(chunk) % 2
+            pending = chunk[usable:]
+            samples = np.frombuffer(chunk[:usable], dtype=np.int16).astype(np.float64)
+            square_sum += float(np.dot(samples, samples))
+            sample_count += samples.size
+    finally:
+        process.stdout.close()
+        process.wait()
+
+    if process.returncode != 0 or sample_count == 0:
+        return None
+
+    rms = math.sqrt(square_sum / sample_count)
+    if rms <= 0:
+        return SILENCE_LUFS
+    return 20 * math.log10(rms / 32768.0)
+
+
+def measure_many(paths: Sequence[str], use_cache: bool = True) -> List[Optional[Dict[str, float]]]:
+    """
+    批量测量多个文件的响度
+
+    Args:
+        paths: 音频或视频文件路径列表（视频取第一条音频流）
+        use_cache: 是否使用响度缓存
+
+    Returns:
+        与 paths 一一对应的列表，每项为
+        {"integrated": LUFS, "lra": LU, "true_peak": dBFS, "method": "ebur128" | "rms"}，
+        文件不存在或分析失败时为 None
+    """
+    results: List[Optional[Dict[str, float]]] = [None] * len(paths)
+    keys: List[Optional[str]] = [None] * len(paths)
+    pending: List[int] = []
+
+    for idx, path in enumerate(paths):
+        key = _fingerprint(path) if path else None
+        if key is None:
+            logger.warning(f"音频文件不存在: {path}")
+            continue
+        keys[idx] = key
+        cached = _load_cached(key) if use_cache else None
+        if cached is not None:
+            results[idx] = cached
+        else:
+            pending.append(idx)
+
+    for batch_start in range(0, len(pending), MAX_BATCH_SIZE):
+        batch = pending[batch_start:batch_start + MAX_BATCH_SIZE]
+        measured = _run_ebur128([paths[idx] for idx in batch])
+        # 批量分析失败时逐个重试，避免一个损坏的文件影响整批
+        if len(batch) > 1 and all(item is None for item in measured):
+            measured = [_run_ebur128([paths[idx]])[0] for idx in batch]
+
+        for idx, values in zip(batch, measured):
+            if values is not None:
+                values = dict(values, method="ebur128")
+            else:
+                rms = measure_rms(paths[idx])
+                if rms is None:
+                    logger.warning(f"无法分析音频响度: {paths[idx]}")
+                    continue
+                values = {"integrated": rms, "method": "rms"}
+            results[idx] = values
+            _store_cached(keys[idx], values)
+
+    return results
+
+
+def measure(file_path: str, use_cache: bool = True) -> Optional[Dict[str, float]]:
+    """
+    测量单个文件的响度，参数和返回值同 measure_many()
+    """
+    return measure_many([file_path], use_cache=use_cache)[0]
+
+
+def integrated_loudness(file_path: str, use_cache: bool = True) -> Optional[float]:
+    """
+    获取文件的综合响度 (LUFS，RMS 备用方案下为 dBFS)
+
+    Returns:
+        float: 响度值，失败返回 None
+    """
+    result = measure(file_path, use_cache=use_cache)
+    return None if result is None else result["integrated"]
+
+
+def combine_integrated(values: Sequence[float], durations: Sequence[float]) -> Optional[float]:
+    """
+    估算多段音频拼接后的综合响度
+
+    按时长对各段能量加权平均（忽略 EBU R128 的相对门限），用于由各段 TTS 的响度得到整条配音的响度
+
+    Args:
+        values: 各段的综合响度 (LUFS)
+        durations: 各段时长（秒）
+
+    Returns:
+        float: 综合响度，没有有效片段时返回 None
+    """
+    total = sum(duration for duration in durations if duration > 0)
+    if total <= 0:
+        return None
+    energy = sum(10 ** (value / 10) * duration for value, duration in zip(values, durations) if duration > 0)
+    if energy <= 0:
+        return SILENCE_LUFS
+    return max(SILENCE_LUFS, 10 * math.log10(energy / total))
@@ -5,16 +5,20 @@ import traceback
 from urllib.parse import urlencode
 from datetime import datetime
 import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
 from typing import List, Optional
 from loguru import logger
-from moviepy.video.io.VideoFileClip import VideoFileClip
 
 from app.config import config
 from app.models.schema import VideoAspect, VideoConcatMode, MaterialInfo
 from app.utils import utils
 from app.utils import ffmpeg_utils
+from app.utils import http_client
+from app.utils import artifact_store
+from app.utils import ingest
 
 requested_count = 0
 
@@ -52,10 +56,9 @@ def search_videos_pexels(
     logger.info(f"searching videos: {query_url}, with proxies: {config.proxy}")
 
     try:
-        r = requests.get(
+        r = http_client.get(
             query_url,
             headers=headers,
-            proxies=config.proxy,
             verify=False,
             timeout=(30, 60),
         )
@@ -111,9 +114,7 @@ def search_videos_pixabay(
     logger.info(f"searching videos: {query_url}, with proxies: {config.proxy}")
 
     try:
-        r = requests.get(
-            query_url, proxies=config.proxy, verify=False, timeout=(30, 60)
-        )
+        r = http_client.get(query_url, verify=False, timeout=(30, 60))
         response = r.json()
         video_items = []
         if "hits" not in response:
@@ -146,7 +147,9 @@ def search_videos_pixabay(
     return []
 
 
-def save_video(video_url: str, save_dir: str = "") -> str:
+def save_video(video_url: str, save_dir: str = "", stop_event: Optional[threading.Event] = None) -> str:
+    # 默认缓存目录由产物存储管理：只有完整下载并校验过的文件才算命中，超出配额时按 LRU 淘汰
+    store = artifact_store.get_store() if not save_dir else None
     if not save_dir:
         save_dir = utils.storage_dir("cache_videos")
 
@@ -159,34 +162,70 @@ def save_video(video_url: str, save_dir: str = "") -> str:
     video_path = f"{save_dir}/{video_id}.mp4"
 
     # if video already exists, return the path
-    if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
+    if store is not None:
+        if store.lookup("cache_videos", f"{video_id}.mp4"):
+            logger.info(f"video already exists: {video_path}")
+            return video_path
+    elif os.path.exists(video_path) and os.path.getsize(video_path) > 0:
         logger.info(f"video already exists: {video_path}")
         return video_path
 
     # if video does not exist, download it
-    with open(video_path, "wb") as f:
-        f.write(
-            requests.get(
-                video_url, proxies=config.proxy, verify=False, timeout=(60, 240)
-            ).content
+    # 写入期间固定条目，其他任务的 lookup() 不会把正在写入的文件当作半成品删除
+    if store is not None:
+        store.pin("cache_videos", f"{video_id}.mp4")
+    try:
+        return _download_video(video_url, video_path, store, video_id, stop_event)
+    finally:
+        if store is not None:
+            store.unpin("cache_videos", f"{video_id}.mp4")
+
+
+def _download_video(video_url: str, video_path: str, store, video_id: str,
+                    stop_event: Optional[threading.Event]) -> str:
+    """下载并校验视频，有效时登记到产物存储"""
+    # 分块写入临时文件后原子重命名，同时计算内容指纹，不会把整个视频读入内存
+    try:
+        result = ingest.ingest_url(
+            video_url, video_path, verify=False, timeout=(60, 240),
+            max_retries=int(config.app.get("material_download_retries", 3)), stop_event=stop_event,
         )
+    except Exception as e:
+        if stop_event is not None and stop_event.is_set():
+            logger.info(f"素材时长已足够，中止下载（已下载部分保留以便续传）: {video_url}")
+        else:
+            logger.warning(f"下载视频失败: {video_url} => {str(e)}")
+        return ""
 
-    if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
-        try:
-            clip = VideoFileClip(video_path)
-            duration = clip.duration
-            fps = clip.fps
-            clip.close()
-            if duration > 0 and fps > 0:
-                return video_path
-        except Exception as e:
-            try:
-                os.remove(video_path)
-            except Exception as e:
-                logger.warning(f"无效的视频文件: {video_path} => {str(e)}")
+    if _is_valid_video(video_path, result.probe):
+        if store is not None:
+            store.commit("cache_videos", f"{video_id}.mp4")
+        return video_path
+
+    logger.warning(f"无效的视频文件: {video_path}")
+    try:
+        os.remove(video_path)
+    except Exception as e:
+        logger.warning(f"删除无效视频失败: {video_path} => {str(e)}")
     return ""
 
 
+def _is_valid_video(video_path: str, info: dict) -> bool:
+    """根据导入时的 ffprobe 结果校验视频，ffprobe 不可用时退回 MoviePy"""
+    if info:
+        return info.get("duration", 0) > 0 and info.get("fps", 0) > 0
+    try:
+        from moviepy.video.io.VideoFileClip import VideoFileClip
+
+        clip = VideoFileClip(video_path)
+        duration = clip.duration
+        fps = clip.fps
+        clip.close()
+        return duration > 0 and fps > 0
+    except Exception:
+        return False
+
+
 def download_videos(
     task_id: str,
     search_terms: List[str],
@@ -220,7 +259,6 @@ def download_videos(
     logger.info(
         f"found total videos: {len(valid_video_items)}, required duration: {audio_duration} seconds, found duration: {found_duration} seconds"
     )
-    video_paths = []
 
     material_directory = config.app.get("material_directory", "").strip()
     if material_directory == "task":
@@ -231,26 +269,79 @@ def download_videos(
     if video_contact_mode.value == VideoConcatMode.random.value:
         random.shuffle(valid_video_items)
 
+    video_paths = _download_until_covered(
+        valid_video_items, material_directory, audio_duration, max_clip_duration
+    )
+    logger.success(f"downloaded {len(video_paths)} videos")
+    return video_paths
+
+
+def _download_until_covered(
+    video_items: List[MaterialInfo],
+    save_dir: str,
+    audio_duration: float,
+    max_clip_duration: int,
+) -> List[str]:
+    """
+    用有界线程池并发下载素材，累计时长覆盖音频后停止
+
+    结果按素材顺序累计（与串行下载时的顺序一致），同时最多有 workers 个下载在进行；
+    时长覆盖后不再提交新的下载，正在进行的下载在下一个数据块处中止，.part 文件留待下次续传。
+
+    Args:
+        video_items: 候选素材（已按拼接模式排序）
+        save_dir: 保存目录，为空时使用产物存储的 cache_videos
+        audio_duration: 需要覆盖的音频时长（秒）
+        max_clip_duration: 每个素材最多使用的时长（秒）
+
+    Returns:
+        List[str]: 下载成功的视频路径
+    """
+    workers = max(1, int(config.app.get("material_download_workers", 4)))
+    stop_event = threading.Event()
+    video_paths = []
     total_duration = 0.0
-    for item in valid_video_items:
-        try:
-            logger.info(f"downloading video: {item.url}")
-            saved_video_path = save_video(
-                video_url=item.url, save_dir=material_directory
-            )
-            if saved_video_path:
-                logger.info(f"video saved: {saved_video_path}")
-                video_paths.append(saved_video_path)
-                seconds = min(max_clip_duration, item.duration)
-                total_duration += seconds
-                if total_duration > audio_duration:
-                    logger.info(
-                        f"total duration of downloaded videos: {total_duration} seconds, skip downloading more"
-                    )
+
+    def download(item: MaterialInfo) -> str:
+        logger.info(f"downloading video: {item.url}")
+        return save_video(video_url=item.url, save_dir=save_dir, stop_event=stop_event)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="material-download")
+    pending = deque()
+    items = iter(video_items)
+    try:
+        while True:
+            # 保持最多 workers 个下载在进行
+            while len(pending) < workers:
+                item = next(items, None)
+                if item is None:
                     break
-        except Exception as e:
-            logger.error(f"failed to download video: {utils.to_json(item)} => {str(e)}")
-    logger.success(f"downloaded {len(video_paths)} videos")
+                pending.append((item, executor.submit(download, item)))
+            if not pending:
+                break
+
+            item, future = pending.popleft()
+            try:
+                saved_video_path = future.result()
+            except Exception as e:
+                logger.error(f"failed to download video: {utils.to_json(item)} => {str(e)}")
+                continue
+            if not saved_video_path:
+                continue
+
+            logger.info(f"video saved: {saved_video_path}")
+            video_paths.append(saved_video_path)
+            # 优先使用 ffprobe 得到的实际时长（按内容指纹缓存，不会重复探测）
+            duration = ingest.media_info(saved_video_path).get("duration") or item.duration
+            total_duration += min(max_clip_duration, duration)
+            if total_duration > audio_duration:
+                logger.info(
+                    f"total duration of downloaded videos: {total_duration} seconds, skip downloading more"
+                )
+                break
+    finally:
+        stop_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
     return video_paths
 
 
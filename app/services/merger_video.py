@@ -15,7 +15,7 @@ from enum import Enum
 from typing import List, Optional, Tuple
 from loguru import logger
 
-from app.utils import ffmpeg_utils
+from app.utils import ffmpeg_utils, ffmpeg_runner, metrics, render_profile
 
 
 class VideoAspect(Enum):
@@ -155,6 +155,18 @@ def process_single_video(
     if not os.path.exists(input_path):
         raise FileNotFoundError(f"找不到视频文件: {input_path}")
 
+    # 预览档位：软件编码、快速预设、低码率和低帧率
+    profile = render_profile.current()
+    if profile is not None:
+        hwaccel = None
+        frame_rate = str(profile.fps)
+        x264_preset = profile.preset
+        bitrate_args = ['-b:v', profile.video_bitrate, '-maxrate', profile.max_bitrate, '-bufsize', profile.buffer_size]
+    else:
+        frame_rate = '30'
+        x264_preset = 'medium'
+        bitrate_args = ['-b:v', '5M', '-maxrate', '8M', '-bufsize', '10M']
+
     # 构建基本命令
     command = ['ffmpeg', '-y']
 
@@ -205,7 +217,7 @@ def process_single_video(
     pad_filter = f"pad={target_width}:{target_height}:(ow-iw)/2:(oh-ih)/2"
     command.extend([
         '-vf', f"{scale_filter},{pad_filter}",
-        '-r', '30',  # 设置帧率为30fps
+        '-r', frame_rate,  # 设置帧率（默认30fps）
     ])
 
     # 关键修复：选择编码器时优先使用纯NVENC（无硬件解码）
@@ -239,13 +251,11 @@ def process_single_video(
     
     if not hwaccel:
         logger.info("使用软件编码器(libx264)")
-        command.extend(['-c:v', 'libx264', '-preset', 'medium', '-profile:v', 'high'])
+        command.extend(['-c:v', 'libx264', '-preset', x264_preset, '-profile:v', 'high'])
 
     # 设置视频比特率和其他参数
+    command.extend(bitrate_args)
     command.extend([
-        '-b:v', '5M',
-        '-maxrate', '8M',
-        '-bufsize', '10M',
         '-pix_fmt', 'yuv420p',  # 兼容性更好的颜色格式
     ])
 
@@ -255,7 +265,7 @@ def process_single_video(
     # 执行命令
     try:
         # logger.info(f"执行FFmpeg命令: {' '.join(command)}")
-        process = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        process = ffmpeg_runner.run(command, text=False)
         # logger.info(f"视频处理成功: {output_path}")
         return output_path
     except subprocess.CalledProcessError as e:
@@ -285,19 +295,17 @@ def process_single_video(
                 # 保持原有的视频过滤器
                 fallback_cmd.extend([
                     '-vf', f"{scale_filter},{pad_filter}",
-                    '-r', '30',
+                    '-r', frame_rate,
                     '-c:v', 'libx264',
-                    '-preset', 'medium',
+                    '-preset', x264_preset,
                     '-profile:v', 'high',
-                    '-b:v', '5M',
-                    '-maxrate', '8M',
-                    '-bufsize', '10M',
+                    *bitrate_args,
                     '-pix_fmt', 'yuv420p',
                     output_path
                 ])
 
                 logger.info("执行软件编码备选方案")
-                subprocess.run(fallback_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                ffmpeg_runner.run(fallback_cmd, text=False)
                 logger.info(f"使用软件编码成功处理视频: {output_path}")
                 return output_path
             except subprocess.CalledProcessError as fallback_error:
@@ -313,7 +321,7 @@ def process_single_video(
                         '-crf', '23', '-pix_fmt', 'yuv420p',
                         output_path
                     ]
-                    subprocess.run(basic_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                    ffmpeg_runner.run(basic_cmd, text=False)
                     logger.info(f"使用基本编码参数成功处理视频: {output_path}")
                     return output_path
                 except subprocess.CalledProcessError as basic_error:
@@ -332,6 +340,7 @@ def combine_clip_videos(
         video_aspect: VideoAspect = VideoAspect.portrait,
         threads: int = 4,
         force_software_encoding: bool = False,  # 新参数，强制使用软件编码
+        target_resolution: Optional[Tuple[int, int]] = None,
 ) -> str:
     """
     合并子视频
@@ -342,6 +351,7 @@ def combine_clip_videos(
         video_aspect: 屏幕比例
         threads: 线程数
         force_software_encoding: 是否强制使用软件编码（忽略硬件加速检测）
+        target_resolution: 指定输出分辨率 (宽, 高)，优先于 video_aspect（多画面比例输出时按原视频尺寸合并母版）
 
     Returns:
         str: 合并后的视频路径
@@ -355,8 +365,17 @@ def combine_clip_videos(
     os.makedirs(output_dir, exist_ok=True)
 
     # 获取目标分辨率
-    aspect = VideoAspect(video_aspect)
-    video_width, video_height = aspect.to_resolution()
+    if target_resolution:
+        video_width, video_height = target_resolution
+    else:
+        video_width, video_height = VideoAspect(video_aspect).to_resolution()
+
+    # 预览档位：按短边缩小目标分辨率
+    profile = render_profile.current()
+    if profile is not None:
+        video_width, video_height = profile.scale_size(video_width, video_height)
+        force_software_encoding = True
+        logger.info(f"预览模式（{profile.name}）：目标分辨率 {video_width}x{video_height}")
 
     # 检测可用的硬件加速选项
     hwaccel = None if force_software_encoding else get_hardware_acceleration_option()
@@ -414,18 +433,21 @@ def combine_clip_videos(
 
     try:
         # 第一阶段：处理所有视频片段到中间文件
-        for segment in video_segments:
-            # 处理单个视频，去除或保留音频
+        for position, segment in enumerate(video_segments):
+            # 处理单个视频，去除或保留音频（前 70% 进度）
             temp_output = os.path.join(temp_dir, f"processed_{segment['index']}.mp4")
             try:
-                process_single_video(
-                    input_path=segment['path'],
-                    output_path=temp_output,
-                    target_width=video_width,
-                    target_height=video_height,
-                    keep_audio=segment['keep_audio'],
-                    hwaccel=hwaccel
-                )
+                with metrics.stage("normalize", segment=segment["index"]), \
+                        ffmpeg_runner.progress_scope(0.7 * position / len(video_segments),
+                                                     0.7 * (position + 1) / len(video_segments)):
+                    process_single_video(
+                        input_path=segment['path'],
+                        output_path=temp_output,
+                        target_width=video_width,
+                        target_height=video_height,
+                        keep_audio=segment['keep_audio'],
+                        hwaccel=hwaccel
+                    )
                 processed_videos.append({
                     "index": segment["index"],
                     "path": temp_output,
@@ -438,14 +460,15 @@ def combine_clip_videos(
                 if hwaccel and not force_software_encoding:
                     logger.info(f"尝试使用软件编码处理视频 {segment['path']}")
                     try:
-                        process_single_video(
-                            input_path=segment['path'],
-                            output_path=temp_output,
-                            target_width=video_width,
-                            target_height=video_height,
-                            keep_audio=segment['keep_audio'],
-                            hwaccel=None  # 使用软件编码
-                        )
+                        with metrics.stage("normalize", segment=segment["index"], fallback="software"):
+                            process_single_video(
+                                input_path=segment['path'],
+                                output_path=temp_output,
+                                target_width=video_width,
+                                target_height=video_height,
+                                keep_audio=segment['keep_audio'],
+                                hwaccel=None  # 使用软件编码
+                            )
                         processed_videos.append({
                             "index": segment["index"],
                             "path": temp_output,
@@ -481,14 +504,16 @@ def combine_clip_videos(
                 '-safe', '0',
                 '-i', concat_file,
                 '-c:v', 'libx264',
-                '-preset', 'medium',
+                '-preset', profile.preset if profile is not None else 'medium',
                 '-profile:v', 'high',
                 '-an',  # 不包含音频
                 '-threads', str(threads),
                 video_concat_path
             ]
 
-            subprocess.run(concat_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            # 视频流合并占后 30% 进度，之后的音频处理很快
+            with ffmpeg_runner.progress_scope(0.7, 1.0):
+                ffmpeg_runner.run(concat_cmd, text=False)
             logger.info("视频流合并完成")
 
             # 2. 提取并合并有音频的片段
@@ -513,7 +538,7 @@ def combine_clip_videos(
                     '-b:a', '128k',
                     audio_file
                 ]
-                subprocess.run(extract_audio_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                ffmpeg_runner.run(extract_audio_cmd, text=False)
                 audio_files.append({
                     "index": segment["index"],
                     "path": audio_file
@@ -559,7 +584,7 @@ def combine_clip_videos(
                 '-b:a', '128k',
                 silence_audio
             ]
-            subprocess.run(create_silence_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            ffmpeg_runner.run(create_silence_cmd, text=False)
 
             # 5. 创建复杂滤镜命令以混合音频
             filter_script = os.path.join(temp_dir, "filter_script.txt")
@@ -598,7 +623,7 @@ def combine_clip_videos(
                 mixed_audio
             ]
 
-            subprocess.run(audio_mix_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            ffmpeg_runner.run(audio_mix_cmd, text=False)
             logger.info("音频混合完成")
 
             # 7. 将合并的视频和混合的音频组合在一起
@@ -614,7 +639,7 @@ def combine_clip_videos(
                 output_video_path
             ]
 
-            subprocess.run(final_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            ffmpeg_runner.run(final_cmd, text=False)
             logger.info("视频最终合并完成")
 
             return output_video_path
@@ -639,7 +664,7 @@ def combine_clip_videos(
                     output_video_path
                 ]
 
-                subprocess.run(backup_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                ffmpeg_runner.run(backup_cmd, text=False)
                 logger.warning("使用备用方法（无音频）成功合并视频")
                 return output_video_path
             except Exception as backup_error:
@@ -0,0 +1,274 @@
+"""
+只重新编码字幕所在区间的字幕烧录
+
+叠加解说烧录字幕时，原来整部视频的每一帧都要重新编码，而字幕只出现在解说时段。这里：
+- 读取原视频的关键帧时间（只解封装，不解码）
+- 把每条字幕的时间范围向外扩展到关键帧边界，相邻区间合并，得到需要重新编码的区间
+- 只有这些区间解码、烧录字幕、按原视频的编码格式重新编码，其余部分直接复制视频流
+- 各段输出为 MPEG-TS（参数集随关键帧携带），用 concat demuxer 拼接后与混合音轨一起封装；
+  MP4 中使用 avc3/hev1 标签，解码器按每个关键帧携带的参数集解码，而不是只用第一个片段的 avcC/hvcC
+
+重新编码的片段与原视频流的编码、档次、级别、参考帧数、分辨率、像素格式不一致时抛出 RegionBurnUnsupported，
+调用方回退到整体重新编码。
+
+用法:
+    region_burn.render(video_path, duration, cues, mixed_audio_path, output_path, style, work_dir)
+"""
+
+import bisect
+import json
+import os
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.services import aspect_variants
+from app.utils import ffmpeg_runner
+
+# 可以重新编码并与原视频流拼接的编码格式
+ENCODERS = {
+    "h264": "libx264",
+    "hevc": "libx265",
+}
+
+# 两个重新编码区间之间的直接复制部分短于该值（秒）时合并为一个区间，减少 FFmpeg 调用次数
+MIN_COPY_SECONDS = 2.0
+
+# 参数集放在码流内（而不是只放在 MP4 的 avcC/hvcC 中）的 MP4 编码标签
+INBAND_TAGS = {
+    "h264": "avc3",
+    "hevc": "hev1",
+}
+
+# 拼接时必须与原视频流一致的参数
+_COMPATIBLE_KEYS = ("codec_name", "profile", "level", "refs", "width", "height", "pix_fmt")
+
+
+class RegionBurnUnsupported(Exception):
+    """原视频不适合局部重新编码（编码格式不支持、读取不到关键帧或重新编码后参数不一致）"""
+
+
+def stream_params(video_path: str) -> Dict:
+    """
+    读取第一条视频流的编码参数
+
+    Returns:
+        Dict: codec_name、profile、level、refs、pix_fmt、width、height，以及文件的 start_time（秒）；
+            读取失败时返回空字典
+    """
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0", "-print_format", "json",
+        "-show_entries", "stream=codec_name,profile,level,refs,pix_fmt,width,height:format=start_time",
+        video_path,
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=60)
+        info = json.loads(result.stdout or "{}")
+        streams = info.get("streams", [])
+        start_time = float(info.get("format", {}).get("start_time") or 0.0)
+    except (OSError, subprocess.SubprocessError, ValueError) as e:
+        logger.warning(f"读取视频流参数失败: {video_path} => {e}")
+        return {}
+    if not streams:
+        return {}
+    return dict(streams[0], start_time=start_time)
+
+
+def keyframe_times(video_path: str, start_time: float = 0.0) -> List[float]:
+    """
+    读取视频流所有关键帧的时间（只读取数据包，不解码）
+
+    Args:
+        video_path: 视频路径
+        start_time: 文件的起始时间戳（秒）。FFmpeg 的 -ss 和字幕时间都从起始时间算起，
+            数据包的 pts_time 需要减去它才能在同一时间轴上比较
+
+    Returns:
+        List[float]: 升序的关键帧时间（秒，相对文件起始时间）
+    """
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags", "-of", "csv=print_section=0",
+        video_path,
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"读取关键帧失败: {video_path} => {e}")
+        return []
+
+    times = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" not in flags:
+            continue
+        try:
+            times.append(max(0.0, float(pts_time) - start_time))
+        except ValueError:
+            continue
+    return sorted(set(times))
+
+
+def plan_regions(cues: List[Tuple[float, float, str]], keyframes: List[float],
+                 duration: float) -> List[Tuple[float, float, bool]]:
+    """
+    把时间轴切分为直接复制和重新编码的区间，所有切分点都在关键帧上
+
+    Args:
+        cues: 字幕 [(开始秒, 结束秒, 文本)]
+        keyframes: 升序的关键帧时间
+        duration: 视频时长
+
+    Returns:
+        List[Tuple[float, float, bool]]: 覆盖整个时间轴的 [(开始秒, 结束秒, 是否重新编码)]
+    """
+    if not keyframes:
+        return [(0.0, duration, bool(cues))]
+
+    # 字幕时段向外扩展到关键帧边界：起点取之前最近的关键帧，终点取之后最近的关键帧
+    burn = []
+    for start, end, _ in sorted(cues):
+        index = bisect.bisect_right(keyframes, start) - 1
+        region_start = keyframes[index] if index >= 0 else 0.0
+        index = bisect.bisect_left(keyframes, end)
+        region_end = keyframes[index] if index < len(keyframes) else duration
+        if burn and region_start - burn[-1][1] < MIN_COPY_SECONDS:
+            burn[-1] = (burn[-1][0], max(burn[-1][1], region_end))
+        else:
+            burn.append((region_start, region_end))
+
+    regions = []
+    position = 0.0
+    for start, end in burn:
+        if start > position:
+            regions.append((position, start, False))
+        regions.append((start, end, True))
+        position = end
+    if position < duration:
+        regions.append((position, duration, False))
+    return regions
+
+
+def _encode_args(params: Dict) -> List[str]:
+    """与原视频流一致的编码参数（档次、级别、参考帧数）"""
+    args = ["-c:v", ENCODERS[params["codec_name"]], "-preset", "medium", "-crf", "18"]
+    if params.get("pix_fmt"):
+        args += ["-pix_fmt", params["pix_fmt"]]
+    profile = (params.get("profile") or "").lower().replace(" ", "")
+    level = int(params.get("level") or 0)
+    refs = int(params.get("refs") or 0)
+    if params["codec_name"] == "h264":
+        profile = "baseline" if profile == "constrainedbaseline" else profile
+        if profile in ("baseline", "main", "high", "high10", "high422", "high444"):
+            args += ["-profile:v", profile]
+        if level > 0:
+            # ffprobe 输出 level_idc（如 40 表示 4.0）
+            args += ["-level", f"{level / 10:.1f}"]
+        if refs > 0:
+            args += ["-refs", str(refs)]
+    else:
+        x265_params = []
+        if profile in ("main", "main10", "mainstillpicture"):
+            args += ["-profile:v", profile]
+        if level > 0:
+            # HEVC 的 level_idc 是级别的 30 倍（如 120 表示 4.0）
+            x265_params.append(f"level-idc={level / 30:.1f}")
+        if refs > 0:
+            x265_params.append(f"ref={refs}")
+        if x265_params:
+            args += ["-x265-params", ":".join(x265_params)]
+    return args
+
+
+def _check_compatible(source: Dict, segment_path: str):
+    """重新编码的片段必须能与原视频流直接拼接"""
+    params = stream_params(segment_path)
+    mismatched = [key for key in _COMPATIBLE_KEYS if params.get(key) != source.get(key)]
+    if mismatched:
+        details = ", ".join(f"{key}: {source.get(key)} -> {params.get(key)}" for key in mismatched)
+        raise RegionBurnUnsupported(f"重新编码的片段与原视频流参数不一致（{details}）")
+
+
+def render(video_path: str, duration: float, cues: List[Tuple[float, float, str]], audio_path: Optional[str],
+           output_path: str, style: aspect_variants.SubtitleStyle, work_dir: str,
+           fonts_dir: Optional[str] = None) -> str:
+    """
+    只重新编码字幕所在的关键帧区间，其余部分直接复制视频流
+
+    Args:
+        video_path: 原视频
+        duration: 原视频时长（秒）
+        cues: 原视频时间轴上的字幕 [(开始秒, 结束秒, 文本)]
+        audio_path: 最终音轨，为空时输出无声视频
+        output_path: 输出路径（.mp4）
+        style: 字幕样式
+        work_dir: 中间文件目录
+        fonts_dir: 字体目录
+
+    Returns:
+        str: 输出路径
+
+    Raises:
+        RegionBurnUnsupported: 原视频不适合局部重新编码
+    """
+    source = stream_params(video_path)
+    if source.get("codec_name") not in ENCODERS:
+        raise RegionBurnUnsupported(f"不支持局部重新编码的视频编码: {source.get('codec_name') or '未知'}")
+    keyframes = keyframe_times(video_path, source.get("start_time", 0.0))
+    if not keyframes:
+        raise RegionBurnUnsupported("读取不到关键帧")
+
+    regions = plan_regions(cues, keyframes, duration)
+    burned = sum(end - start for start, end, reencode in regions if reencode)
+    logger.info(f"局部烧录字幕：{len(regions)} 个区间，重新编码 {burned:.1f}s / {duration:.1f}s")
+
+    os.makedirs(work_dir, exist_ok=True)
+    width, height = source["width"], source["height"]
+    segment_paths = []
+    for i, (start, end, reencode) in enumerate(regions):
+        segment_path = os.path.join(work_dir, f"region_{i:04d}.ts")
+        cmd = ["ffmpeg", "-y", "-ss", f"{start:.6f}", "-i", video_path, "-t", f"{end - start:.6f}",
+               "-map", "0:v:0", "-an", "-sn"]
+        if reencode:
+            # 字幕时间换算到片段内（片段从 0 开始）
+            region_cues = [(max(cue_start, start) - start, min(cue_end, end) - start, text)
+                           for cue_start, cue_end, text in cues if cue_end > start and cue_start < end]
+            ass_path = aspect_variants.write_ass(region_cues, os.path.join(work_dir, f"region_{i:04d}.ass"),
+                                                 width, height, style)
+            subtitle_filter = f"subtitles=filename={aspect_variants.filter_path(ass_path)}"
+            if fonts_dir:
+                subtitle_filter += f":fontsdir={aspect_variants.filter_path(fonts_dir)}"
+            # 保持原视频的帧时间戳，拼接后与直接复制的部分无缝衔接
+            cmd += ["-vf", subtitle_filter, *_encode_args(source), "-vsync", "passthrough"]
+        else:
+            cmd += ["-c:v", "copy"]
+        cmd += ["-f", "mpegts", segment_path]
+
+        with ffmpeg_runner.progress_scope(i / len(regions), (i + 1) / len(regions)):
+            ffmpeg_runner.run(cmd)
+        if reencode:
+            _check_compatible(source, segment_path)
+        segment_paths.append(segment_path)
+
+    concat_file = os.path.join(work_dir, "regions.txt")
+    with open(concat_file, "w", encoding="utf-8") as f:
+        for segment_path in segment_paths:
+            f.write(f"file '{os.path.abspath(segment_path)}'\n")
+
+    cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", concat_file]
+    maps = ["-map", "0:v:0"]
+    if audio_path:
+        cmd += ["-i", audio_path]
+        maps += ["-map", "1:a:0"]
+    # 各片段的参数集可能不同（如 SPS 中的 VUI、码率相关字段），使用 avc3/hev1 让解码器按码流内的参数集解码
+    cmd += maps + ["-c", "copy", "-tag:v", INBAND_TAGS[source["codec_name"]], "-movflags", "+faststart", output_path]
+    ffmpeg_runner.run(cmd)
+
+    for segment_path in segment_paths:
+        try:
+            os.remove(segment_path)
+        except OSError:
+            pass
+    logger.success(f"局部烧录字幕完成: {output_path}")
+    return output_path
@@ -7,7 +7,7 @@ from app.utils import video_processor
 from loguru import logger
 from typing import List, Dict, Any, Callable
 
-from app.utils import utils, gemini_analyzer, video_processor
+from app.utils import utils, gemini_analyzer, video_processor, artifact_store, ingest
 from app.utils.script_generator import ScriptProcessor
 from app.config import config
 
@@ -80,42 +80,44 @@ class ScriptGenerator:
         threshold: int
     ) -> List[str]:
         """提取视频关键帧"""
-        video_hash = utils.md5(video_path + str(os.path.getmtime(video_path)))
-        video_keyframes_dir = os.path.join(self.keyframes_dir, video_hash)
-        
-        # 检查缓存
+        video_hash = ingest.content_key(video_path)
+        store = artifact_store.get_store()
+
+        # 检查缓存（只有完整提取并登记过的关键帧目录才算命中）
         keyframe_files = []
-        if os.path.exists(video_keyframes_dir):
-            for filename in sorted(os.listdir(video_keyframes_dir)):
+        cached_dir = store.lookup("keyframes", video_hash)
+        if cached_dir:
+            for filename in sorted(os.listdir(cached_dir)):
                 if filename.endswith('.jpg'):
-                    keyframe_files.append(os.path.join(video_keyframes_dir, filename))
+                    keyframe_files.append(os.path.join(cached_dir, filename))
                     
             if keyframe_files:
-                logger.info(f"Using cached keyframes: {video_keyframes_dir}")
+                logger.info(f"Using cached keyframes: {cached_dir}")
                 return keyframe_files
                 
         # 提取新的关键帧
-        os.makedirs(video_keyframes_dir, exist_ok=True)
-        
-        try:
-            processor = video_processor.VideoProcessor(video_path)
-            processor.process_video_pipeline(
-                output_dir=video_keyframes_dir,
-                skip_seconds=skip_seconds,
-                threshold=threshold
-            )
+        with store.pinned("keyframes", video_hash) as video_keyframes_dir:
+            os.makedirs(video_keyframes_dir, exist_ok=True)
 
-            for filename in sorted(os.listdir(video_keyframes_dir)):
-                if filename.endswith('.jpg'):
-                    keyframe_files.append(os.path.join(video_keyframes_dir, filename))
-                    
-            return keyframe_files
-            
-        except Exception as e:
-            if os.path.exists(video_keyframes_dir):
-                import shutil
-                shutil.rmtree(video_keyframes_dir)
-            raise
+            try:
+                processor = video_processor.VideoProcessor(video_path)
+                processor.process_video_pipeline(
+                    output_dir=video_keyframes_dir,
+                    skip_seconds=skip_seconds,
+                    threshold=threshold
+                )
+
+                for filename in sorted(os.listdir(video_keyframes_dir)):
+                    if filename.endswith('.jpg'):
+                        keyframe_files.append(os.path.join(video_keyframes_dir, filename))
+
+            except Exception as e:
+                store.discard("keyframes", video_hash)
+                raise
+
+            # 解除固定前登记，避免其他任务的 lookup() 在两者之间把目录当作半成品删除
+            store.commit("keyframes", video_hash)
+        return keyframe_files
             
     async def _process_with_llm(
         self,
@@ -1,8 +1,18 @@
 import ast
+import json
+import os
+import sqlite3
+import threading
+import time
 from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional
+
 from app.config import config
 from app.models import const
 
+# 任务结束状态，到达后 watch_task() 停止
+FINISHED_STATES = (const.TASK_STATE_COMPLETE, const.TASK_STATE_FAILED)
+
 
 # Base class for state management
 class BaseState(ABC):
@@ -14,11 +24,47 @@ class BaseState(ABC):
     def get_task(self, task_id: str):
         pass
 
+    @abstractmethod
+    def _wait_for_update(self, task_id: str, last: Optional[dict], timeout: float) -> Optional[dict]:
+        """
+        等待任务状态与 last 不同
+
+        Returns:
+            dict: 更新后的任务状态；超时返回 None
+        """
+        pass
+
+    def watch_task(self, task_id: str, timeout: float = 5.0) -> Iterator[dict]:
+        """
+        订阅任务状态变化，替代定时轮询 get_task()
+
+        每次任务状态变化时产出最新的完整任务信息，任务完成或失败后结束。
+        超过 timeout 秒没有收到更新时会重新读取一次，防止漏掉通知。
+
+        Args:
+            task_id: 任务ID
+            timeout: 两次检查之间的最长等待时间（秒）
+
+        Yields:
+            dict: 任务信息
+        """
+        last = self.get_task(task_id)
+        if last is not None:
+            yield last
+        while last is None or last.get("state") not in FINISHED_STATES:
+            task = self._wait_for_update(task_id, last, timeout)
+            if task is None:
+                task = self.get_task(task_id)
+            if task is not None and task != last:
+                last = task
+                yield task
+
 
 # Memory state management
 class MemoryState(BaseState):
     def __init__(self):
         self._tasks = {}
+        self._changed = threading.Condition()
 
     def update_task(
         self,
@@ -31,11 +77,13 @@ class MemoryState(BaseState):
         if progress > 100:
             progress = 100
 
-        self._tasks[task_id] = {
-            "state": state,
-            "progress": progress,
-            **kwargs,
-        }
+        with self._changed:
+            self._tasks[task_id] = {
+                "state": state,
+                "progress": progress,
+                **kwargs,
+            }
+            self._changed.notify_all()
 
     def get_task(self, task_id: str):
         return self._tasks.get(task_id, None)
@@ -44,13 +92,34 @@ class MemoryState(BaseState):
         if task_id in self._tasks:
             del self._tasks[task_id]
 
+    def _wait_for_update(self, task_id: str, last: Optional[dict], timeout: float) -> Optional[dict]:
+        with self._changed:
+            if self._changed.wait_for(lambda: self._tasks.get(task_id) != last, timeout):
+                return self._tasks.get(task_id)
+        return None
+
 
 # Redis state management
 class RedisState(BaseState):
-    def __init__(self, host="localhost", port=6379, db=0, password=None):
+    """
+    Redis 任务状态
+
+    - 所有字段以 JSON 编码，通过一次 pipeline 写入，同时发布到任务频道
+    - 任务完成/失败后按 finished_ttl 设置过期时间，处理中的任务按 active_ttl 续期（0 表示不过期）
+    """
+
+    CHANNEL_PREFIX = "narrato:task:"
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None, finished_ttl=86400, active_ttl=0):
         import redis
 
         self._redis = redis.StrictRedis(host=host, port=port, db=db, password=password)
+        self._finished_ttl = int(finished_ttl or 0)
+        self._active_ttl = int(active_ttl or 0)
+
+    @classmethod
+    def channel(cls, task_id: str) -> str:
+        return f"{cls.CHANNEL_PREFIX}{task_id}"
 
     def update_task(
         self,
@@ -68,9 +137,17 @@ class RedisState(BaseState):
             "progress": progress,
             **kwargs,
         }
+        encoded = {field: self._encode(value) for field, value in fields.items()}
 
-        for field, value in fields.items():
-            self._redis.hset(task_id, field, str(value))
+        ttl = self._finished_ttl if state in FINISHED_STATES else self._active_ttl
+        pipe = self._redis.pipeline()
+        pipe.hset(task_id, mapping=encoded)
+        if ttl > 0:
+            pipe.expire(task_id, ttl)
+        else:
+            pipe.persist(task_id)
+        pipe.publish(self.channel(task_id), json.dumps(encoded, ensure_ascii=False))
+        pipe.execute()
 
     def get_task(self, task_id: str):
         task_data = self._redis.hgetall(task_id)
@@ -86,14 +163,63 @@ class RedisState(BaseState):
     def delete_task(self, task_id: str):
         self._redis.delete(task_id)
 
+    def _wait_for_update(self, task_id: str, last: Optional[dict], timeout: float) -> Optional[dict]:
+        # watch_task() 覆盖为基于订阅的实现，这里仅作为单次等待的备用
+        time.sleep(timeout)
+        return None
+
+    def watch_task(self, task_id: str, timeout: float = 5.0) -> Iterator[dict]:
+        """
+        通过 Redis pub/sub 订阅任务状态变化，参数和行为同 BaseState.watch_task()
+
+        先订阅再读取当前状态，避免两者之间的更新丢失
+        """
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel(task_id))
+        try:
+            last = self.get_task(task_id)
+            if last is not None:
+                yield last
+            while last is None or last.get("state") not in FINISHED_STATES:
+                message = pubsub.get_message(timeout=timeout)
+                if message is None:
+                    # 超时或连接抖动，重新读取完整状态
+                    task = self.get_task(task_id)
+                else:
+                    update = json.loads(message["data"])
+                    task = dict(last or {})
+                    task.update({field: self._decode(value) for field, value in update.items()})
+                if task is not None and task != last:
+                    last = task
+                    yield task
+        finally:
+            pubsub.close()
+
+    @staticmethod
+    def _encode(value) -> str:
+        return json.dumps(value, ensure_ascii=False, default=str)
+
+    @staticmethod
+    def _decode(value: str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+
     @staticmethod
     def _convert_to_original_type(value):
         """
         Convert the value from byte string to its original data type.
-        You can extend this method to handle other data types as needed.
+        Values are stored as JSON; older entries written with str() are still
+        parsed with ast.literal_eval.
         """
         value_str = value.decode("utf-8")
 
+        try:
+            return json.loads(value_str)
+        except ValueError:
+            pass
+
         try:
             # try to convert byte string array to list
             return ast.literal_eval(value_str)
@@ -106,17 +232,260 @@ class RedisState(BaseState):
         return value_str
 
 
+# SQLite state management
+class SqliteState(BaseState):
+    """
+    基于 SQLite（WAL 模式）的本地任务状态，同一主机上的多个进程可共享任务状态
+
+    - 仅更新进度的写入会在内存中合并，最多每 flush_interval 秒落盘一次；
+      状态变化或携带其他字段的更新立即写入
+    - tasks 表按 state、created_at 建立索引，支持 list_tasks() 查询
+    - 变化通知通过轮询 PRAGMA data_version 实现，未发生写入时不读取表数据
+    """
+
+    def __init__(self, path: str = "", flush_interval: float = 0.5, poll_interval: float = 0.2):
+        if not path:
+            from app.utils import utils
+
+            path = os.path.join(utils.storage_dir(create=True), "tasks.db")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._path = path
+        self._flush_interval = flush_interval
+        self._poll_interval = poll_interval
+        self._local = threading.local()
+        self._pending: Dict[str, dict] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        self._last_flush = 0.0
+        self._changed = threading.Condition()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                state INTEGER NOT NULL,
+                progress INTEGER NOT NULL DEFAULT 0,
+                data TEXT NOT NULL DEFAULT '{}',
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_state_created ON tasks (state, created_at);
+            CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks (created_at);
+            """
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 连接不能跨线程使用，每个线程各自持有一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def update_task(
+        self,
+        task_id: str,
+        state: int = const.TASK_STATE_PROCESSING,
+        progress: int = 0,
+        **kwargs,
+    ):
+        progress = int(progress)
+        if progress > 100:
+            progress = 100
+
+        fields = {
+            "state": state,
+            "progress": progress,
+            **kwargs,
+        }
+
+        with self._pending_lock:
+            previous = self._pending.pop(task_id, None)
+            fields = dict(previous or {}, **fields)
+            # 只更新进度且距上次写入不足 flush_interval：合并到待写入批次中
+            batched = (not kwargs
+                       and state not in FINISHED_STATES
+                       and (previous is None or previous["state"] == state)
+                       and time.monotonic() - self._last_flush < self._flush_interval)
+            if batched:
+                self._pending[task_id] = fields
+                self._schedule_flush()
+
+        if not batched:
+            self.flush(extra={task_id: fields})
+        self._notify()
+
+    def _schedule_flush(self):
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self._flush_interval, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def flush(self, extra: Optional[Dict[str, dict]] = None):
+        """把待写入的进度更新（以及 extra 中的更新）在一个事务中写入数据库"""
+        with self._pending_lock:
+            batch = self._pending
+            self._pending = {}
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            self._last_flush = time.monotonic()
+        if extra:
+            batch.update(extra)
+        if not batch:
+            return
+
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for task_id, fields in batch.items():
+                fields = dict(fields)
+                state = fields.pop("state")
+                progress = fields.pop("progress")
+                row = conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+                data = json.loads(row[0]) if row else {}
+                data.update(fields)
+                conn.execute(
+                    """
+                    INSERT INTO tasks (task_id, state, progress, data, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(task_id) DO UPDATE SET
+                        state = excluded.state,
+                        progress = excluded.progress,
+                        data = excluded.data,
+                        updated_at = excluded.updated_at
+                    """,
+                    (task_id, state, progress, json.dumps(data, ensure_ascii=False, default=str), now, now),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _row_to_task(row) -> dict:
+        state, progress, data, created_at, updated_at = row
+        return {
+            "state": state,
+            "progress": progress,
+            **json.loads(data),
+        }
+
+    def get_task(self, task_id: str):
+        row = self._connection().execute(
+            "SELECT state, progress, data, created_at, updated_at FROM tasks WHERE task_id = ?",
+            (task_id,),
+        ).fetchone()
+        task = self._row_to_task(row) if row else None
+        with self._pending_lock:
+            pending = self._pending.get(task_id)
+        if pending is not None:
+            task = dict(task or {}, **pending)
+        return task
+
+    def list_tasks(self, state: Optional[int] = None, since: Optional[float] = None, limit: int = 100) -> List[dict]:
+        """
+        按状态和创建时间查询任务
+
+        Args:
+            state: 任务状态，None 表示全部
+            since: 只返回该时间戳（秒）之后创建的任务
+            limit: 最多返回条数
+
+        Returns:
+            List[dict]: 任务列表（含 task_id、created_at、updated_at），按创建时间倒序
+        """
+        self.flush()
+        conditions, args = [], []
+        if state is not None:
+            conditions.append("state = ?")
+            args.append(state)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            args.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._connection().execute(
+            f"SELECT task_id, state, progress, data, created_at, updated_at FROM tasks {where} "
+            f"ORDER BY created_at DESC LIMIT ?",
+            (*args, limit),
+        ).fetchall()
+        return [
+            dict(self._row_to_task(row[1:]), task_id=row[0], created_at=row[4], updated_at=row[5])
+            for row in rows
+        ]
+
+    def delete_task(self, task_id: str):
+        with self._pending_lock:
+            self._pending.pop(task_id, None)
+        self._connection().execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+
+    def purge_finished(self, older_than: float) -> int:
+        """
+        删除在 older_than 秒之前就已结束的任务
+
+        Returns:
+            int: 删除的任务数
+        """
+        placeholders = ",".join("?" * len(FINISHED_STATES))
+        cursor = self._connection().execute(
+            f"DELETE FROM tasks WHERE state IN ({placeholders}) AND updated_at < ?",
+            (*FINISHED_STATES, time.time() - older_than),
+        )
+        return cursor.rowcount
+
+    def _data_version(self) -> int:
+        return self._connection().execute("PRAGMA data_version").fetchone()[0]
+
+    def _wait_for_update(self, task_id: str, last: Optional[dict], timeout: float) -> Optional[dict]:
+        deadline = time.monotonic() + timeout
+        version = self._data_version()
+        task = self.get_task(task_id)
+        while task == last:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            # 本进程内的写入通过条件变量唤醒，其他进程的写入通过 data_version 变化发现
+            with self._changed:
+                notified = self._changed.wait(min(self._poll_interval, remaining))
+            current = self._data_version()
+            if notified or current != version:
+                version = current
+                task = self.get_task(task_id)
+        return task
+
+
 # Global state
 _enable_redis = config.app.get("enable_redis", False)
 _redis_host = config.app.get("redis_host", "localhost")
 _redis_port = config.app.get("redis_port", 6379)
 _redis_db = config.app.get("redis_db", 0)
 _redis_password = config.app.get("redis_password", None)
+_redis_finished_ttl = config.app.get("redis_task_ttl", 86400)
+_redis_active_ttl = config.app.get("redis_active_task_ttl", 0)
+
+# state_backend 未配置或为空时沿用 enable_redis 开关
+_state_backend = config.app.get("state_backend") or ("redis" if _enable_redis else "memory")
+_sqlite_state_path = config.app.get("sqlite_state_path", "")
 
-state = (
-    RedisState(
-        host=_redis_host, port=_redis_port, db=_redis_db, password=_redis_password
+if _state_backend == "redis":
+    state = RedisState(
+        host=_redis_host,
+        port=_redis_port,
+        db=_redis_db,
+        password=_redis_password or None,
+        finished_ttl=_redis_finished_ttl,
+        active_ttl=_redis_active_ttl,
     )
-    if _enable_redis
-    else MemoryState()
-)
+elif _state_backend == "sqlite":
+    state = SqliteState(path=_sqlite_state_path)
+else:
+    state = MemoryState()
@@ -0,0 +1,306 @@
+"""
+脚本与字幕对齐
+
+将解说脚本的句子与语音识别得到的字幕条目做一次全局序列对齐：
+- 每句脚本对应连续的 1~max_merge 条字幕（识别结果常把一句话拆成多条）
+- 允许跳过识别噪声字幕或没有对应字幕的脚本句子（带惩罚）
+- 只在按累计字符数估计的对齐路径附近的带状区域内进行动态规划，复杂度约为 O(句子数 × 带宽 × max_merge)
+- 文本相似度使用字符二元组的 Dice 系数，带状区域内的相似度用 numpy 一次性批量计算，动态规划逐行向量化
+"""
+
+import re
+import bisect
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.models import const
+
+# 去除空白和标点，仅保留用于比较的字符
+_STRIP_PATTERN = re.compile(
+    "[\\s" + re.escape("".join(const.PUNCTUATIONS)) + "，。！？；：、“”‘’（）《》…—\"'()\\[\\]-]+"
+)
+
+# 低于该相似度的匹配会记录警告
+MISMATCH_THRESHOLD = 0.8
+
+# 跳过一条字幕 / 一句脚本的惩罚分
+SKIP_CUE_PENALTY = 0.3
+SKIP_SCRIPT_PENALTY = 0.5
+
+_NEG_INF = float("-inf")
+_EPSILON = 1e-9
+
+# Unicode 码位空间大小，用于把字符二元组编码为整数
+_CODE_SPACE = 0x110000
+
+
+def normalize_text(text: str) -> str:
+    """文本规范化：转小写并去除空白和标点"""
+    return _STRIP_PATTERN.sub("", text.lower())
+
+
+def _gram_table(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    统计每段文本的字符二元组（过短的文本退化为单字）
+
+    二元组编码为 前一字符码位 * 0x110000 + 后一字符码位，单字编码为其码位（不会与二元组冲突）
+
+    Returns:
+        Tuple: (文本下标, 二元组编码, 次数)，按文本下标、二元组编码升序排列
+    """
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    chars = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    owners = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+    pairs = np.flatnonzero(owners[:-1] == owners[1:])
+    singles = (np.cumsum(lengths) - lengths)[lengths == 1]
+    codes = np.concatenate((chars[pairs] * _CODE_SPACE + chars[pairs + 1], chars[singles]))
+    owners = np.concatenate((owners[pairs], owners[singles]))
+    keys, counts = np.unique(owners * _CODE_SPACE * _CODE_SPACE + codes, return_counts=True)
+    return keys // (_CODE_SPACE * _CODE_SPACE), keys % (_CODE_SPACE * _CODE_SPACE), counts
+
+
+def _similarities(script_table, cue_table, n: int, m: int, lows: np.ndarray, span: int,
+                  max_merge: int) -> np.ndarray:
+    """
+    批量计算带状区域内所有候选匹配的二元组 Dice 系数
+
+    脚本的每个 (句子, 二元组, 次数) 作为一个条目；字幕二元组按 (二元组, 字幕下标) 排序，
+    每个条目在带状区域内的出现位置只需两次二分查找。出现次数不会超过脚本中次数的条目直接累加，
+    其余条目在窗口前缀和上取 min()。
+
+    Returns:
+        np.ndarray: 形状为 (句子数, span, max_merge)，[i, o, k-1] 为第 i 句与从 lows[i]+o 开始的 k 条字幕的相似度
+    """
+    entry_line, entry_code, entry_limit = script_table
+    cue_owner, cue_code, cue_count = cue_table
+    script_totals = np.bincount(entry_line, weights=entry_limit, minlength=n)
+    cue_cum = np.concatenate(([0.0], np.cumsum(np.bincount(cue_owner, weights=cue_count, minlength=m))))
+
+    # 二元组压缩编号后，字幕二元组的键为 编号 * m + 字幕下标，同一二元组在相邻字幕中的键连续
+    vocab, entry_gram = np.unique(entry_code, return_inverse=True)
+    position = np.minimum(np.searchsorted(vocab, cue_code), max(0, len(vocab) - 1))
+    shared = (vocab[position] == cue_code) if len(vocab) else np.zeros(len(cue_code), dtype=bool)
+    cue_keys = position[shared] * m + cue_owner[shared]
+    order = np.argsort(cue_keys)
+    cue_keys, cue_count = cue_keys[order], cue_count[shared][order]
+
+    window = span + max_merge - 1
+    entry_low = lows[entry_line]
+    first = np.searchsorted(cue_keys, entry_gram * m + entry_low)
+    last = np.searchsorted(cue_keys, entry_gram * m + np.minimum(entry_low + window, m))
+    hits = last - first
+    hit_entry = np.repeat(np.arange(len(hits)), hits)
+    hit_pos = np.arange(len(hit_entry)) - np.repeat(np.cumsum(hits) - hits, hits) + np.repeat(first, hits)
+    hit_offset = cue_keys[hit_pos] - entry_gram[hit_entry] * m - entry_low[hit_entry]
+    hit_count = cue_count[hit_pos]
+
+    # 带状区域内出现总次数不超过脚本中次数的二元组，min() 不起作用，交集直接按出现位置累加到覆盖它的各个窗口
+    window_total = np.bincount(hit_entry, weights=hit_count, minlength=len(hits))
+    capped = window_total > entry_limit
+    simple = ~capped[hit_entry]
+    simple_offset = hit_offset[simple]
+    simple_cell = entry_line[hit_entry[simple]] * span + simple_offset
+    simple_count = hit_count[simple]
+    cells = []
+    weights = []
+    for back in range(max_merge):
+        valid = (simple_offset >= back) & (simple_offset < span + back)
+        base = (simple_cell[valid] - back) * max_merge
+        for k in range(back + 1, max_merge + 1):
+            cells.append(base + k - 1)
+            weights.append(simple_count[valid])
+    overlap = np.bincount(np.concatenate(cells), weights=np.concatenate(weights),
+                          minlength=n * span * max_merge).reshape(n, span, max_merge)
+
+    # 其余二元组按窗口前缀和取 min()，再按句子汇总
+    capped_entries = np.flatnonzero(capped)
+    if len(capped_entries):
+        capped_rows = np.searchsorted(capped_entries, hit_entry[~simple])
+        cumulative = np.zeros((len(capped_entries), window + 1), dtype=np.int32)
+        cumulative[capped_rows, hit_offset[~simple] + 1] = hit_count[~simple]
+        np.cumsum(cumulative, axis=1, out=cumulative)
+        lines, line_starts = np.unique(entry_line[capped_entries], return_index=True)
+        limits = entry_limit[capped_entries][:, None]
+        for k in range(1, max_merge + 1):
+            overlap[lines, :, k - 1] += np.add.reduceat(
+                np.minimum(cumulative[:, k:k + span] - cumulative[:, :span], limits), line_starts, axis=0)
+
+    starts = lows[:, None, None] + np.arange(span)[None, :, None]
+    merged_totals = cue_cum[np.minimum(starts + np.arange(1, max_merge + 1), m)] - cue_cum[np.minimum(starts, m)]
+    sims = 2.0 * overlap / np.maximum(script_totals[:, None, None] + merged_totals, 1.0)
+    return sims
+
+
+def align(script_lines: Sequence[str],
+          cue_texts: Sequence[str],
+          max_merge: int = 4,
+          band: Optional[int] = None) -> List[Tuple[Optional[Tuple[int, int]], float]]:
+    """
+    全局对齐脚本句子与字幕条目
+
+    带状区域的中心按累计字符数估计：第 i 句脚本之前的文字占全部脚本的比例，
+    应与对应字幕之前的文字占全部字幕的比例接近，因此一句脚本被拆成多条字幕时
+    不会偏离带状区域。
+
+    相似度一次性批量计算；动态规划逐行向量化，行内连续跳过字幕等价于 (得分 + 惩罚 × j) 的前缀最大值，
+    回溯时按与逐项转移相同的优先顺序还原每一步。
+
+    Args:
+        script_lines: 脚本句子列表
+        cue_texts: 字幕文本列表
+        max_merge: 一句脚本最多合并的字幕条数
+        band: 动态规划带宽（字幕条数），默认根据长度自动计算
+
+    Returns:
+        与 script_lines 一一对应的列表，每项为 ((起始字幕下标, 结束字幕下标+1), 相似度)，
+        没有对应字幕的句子为 (None, 0.0)
+    """
+    n, m = len(script_lines), len(cue_texts)
+    if n == 0:
+        return []
+    if m == 0:
+        return [(None, 0.0)] * n
+
+    if band is None:
+        band = max(12, max_merge * 3, int(0.01 * m))
+
+    script_norm = [normalize_text(line) for line in script_lines]
+    cue_norm = [normalize_text(text) for text in cue_texts]
+
+    # 按累计字符比例估计每句脚本对应的字幕位置
+    script_chars = max(1, sum(len(text) for text in script_norm))
+    cue_chars = max(1, sum(len(text) for text in cue_norm))
+    cue_cum = [0.0]
+    for text in cue_norm:
+        cue_cum.append(cue_cum[-1] + len(text) / cue_chars)
+    centers = []
+    position = 0.0
+    for i in range(n + 1):
+        centers.append(min(m, bisect.bisect_left(cue_cum, position - 1e-9)))
+        if i < n:
+            position += len(script_norm[i]) / script_chars
+    centers[n] = m
+
+    # 第 i 行的带状区域为 [lows[i], highs[i]]，统一按 span 列存储，超出部分得分为 -inf
+    lows = [max(0, center - band) for center in centers]
+    highs = [min(m, center + band) for center in centers]
+    span = 2 * band + 1
+    sims = _similarities(_gram_table(script_norm), _gram_table(cue_norm), n, m,
+                         np.asarray(lows[:n], dtype=np.int64), span, max_merge)
+
+    # 转移到下一行第 t 列的候选：列 k-1 来自本行第 t+shift-k 列合并 k 条字幕（shift 为两行带状区域起点之差）
+    merges = np.arange(1, max_merge + 1)
+    source_offsets = np.arange(span)[:, None] - merges[None, :]
+    shifts = np.diff(np.asarray(lows, dtype=np.int64))
+    sources = source_offsets[None, :, :] + shifts[:, None, None]
+    gains = np.where((sources >= 0) & (sources < span),
+                     sims[np.arange(n)[:, None, None], np.clip(sources, 0, span - 1), merges - 1], 0.0)
+    ramp = SKIP_CUE_PENALTY * np.arange(span)
+    extended = np.full(2 * (span + max_merge), _NEG_INF)
+    # windows[p, k-1] 是 extended[p + max_merge - k] 的视图，即本行第 p-k 列
+    windows = np.lib.stride_tricks.sliding_window_view(extended, max_merge)[:, ::-1]
+
+    before_skip, after_skip = [], []
+    row = np.full(span, _NEG_INF)
+    row[0] = 0.0
+    for i in range(n + 1):
+        before_skip.append(row)
+        row = np.maximum(row, np.maximum.accumulate(row + ramp) - ramp)
+        row[highs[i] - lows[i] + 1:] = _NEG_INF
+        after_skip.append(row)
+        if i == n:
+            break
+
+        shift = int(shifts[i])
+        if shift >= span + max_merge:
+            row = np.full(span, _NEG_INF)
+            continue
+        extended[max_merge:max_merge + span] = row
+        matched = (windows[shift:shift + span] + gains[i]).max(axis=1)
+        row = np.maximum(matched, extended[max_merge + shift:max_merge + shift + span] - SKIP_SCRIPT_PENALTY)
+
+    # 从终点回溯
+    final = after_skip[n]
+    if not np.isfinite(final).any():
+        return [(None, 0.0)] * n
+    result: List[Tuple[Optional[Tuple[int, int]], float]] = [(None, 0.0)] * n
+    i, j = n, m
+    if not np.isfinite(final[m - lows[n]]):
+        j = lows[n] + int(np.argmax(final))
+    while (i, j) != (0, 0):
+        offset = j - lows[i]
+        score = after_skip[i][offset]
+        # 与逐项转移的优先顺序一致：同分时直接转移优先于跳过字幕，合并条数多的优先于少的，最后才是跳过脚本句子
+        if score > before_skip[i][offset] + _EPSILON:
+            j -= 1
+            continue
+        previous = after_skip[i - 1]
+        prev_low = lows[i - 1]
+        step = None
+        for k in range(max_merge, 0, -1):
+            source = j - k - prev_low
+            if 0 <= source < span and j - k <= highs[i - 1] and \
+                    abs(previous[source] + sims[i - 1, source, k - 1] - score) <= _EPSILON:
+                step = k
+                break
+        if step is None:
+            i -= 1
+            continue
+        result[i - 1] = ((j - step, j), float(sims[i - 1, j - step - prev_low, step - 1]))
+        j -= step
+        i -= 1
+
+    return result
+
+
+def correct_cues(script_lines: Sequence[str],
+                 subtitle_items: Sequence[Tuple[int, str, str]],
+                 max_merge: int = 4) -> Tuple[List[Tuple[int, str, str]], bool]:
+    """
+    用脚本句子校正字幕条目
+
+    Args:
+        script_lines: 脚本句子列表
+        subtitle_items: subtitle.file_to_subtitles 返回的 (序号, "开始 --> 结束", 文本) 列表
+        max_merge: 一句脚本最多合并的字幕条数
+
+    Returns:
+        Tuple[List, bool]: (校正后的字幕条目列表, 是否有修改)
+    """
+    alignment = align(script_lines, [item[2] for item in subtitle_items], max_merge=max_merge)
+
+    times = []
+    for item in subtitle_items:
+        start_time, end_time = item[1].split(" --> ")
+        times.append((start_time.strip(), end_time.strip()))
+
+    # 先确定匹配句子的时间，未匹配句子使用相邻句子之间的空隙
+    spans: List[Optional[Tuple[str, str]]] = []
+    for cue_range, _ in alignment:
+        if cue_range is None:
+            spans.append(None)
+        else:
+            spans.append((times[cue_range[0]][0], times[cue_range[1] - 1][1]))
+
+    corrected = len(script_lines) != len(subtitle_items)
+    new_items = []
+    for idx, (line, (cue_range, score)) in enumerate(zip(script_lines, alignment)):
+        line = line.strip()
+        span = spans[idx]
+        if span is None:
+            logger.warning(f"Extra script line: {line}")
+            prev_end = next((spans[k][1] for k in range(idx - 1, -1, -1) if spans[k]), "00:00:00,000")
+            next_start = next((spans[k][0] for k in range(idx + 1, len(spans)) if spans[k]), prev_end)
+            span = (prev_end, next_start)
+            corrected = True
+        elif cue_range[1] - cue_range[0] != 1 or subtitle_items[cue_range[0]][2].strip() != line:
+            if score < MISMATCH_THRESHOLD:
+                merged_text = " ".join(item[2].strip() for item in subtitle_items[cue_range[0]:cue_range[1]])
+                logger.warning(f"Mismatch - Script: {line}, Subtitle: {merged_text}")
+            corrected = True
+
+        new_items.append((len(new_items) + 1, f"{span[0]} --> {span[1]}", line))
+
+    return new_items, corrected
@@ -10,9 +10,10 @@ from app.config import config
 from app.config.audio_config import AudioConfig, get_recommended_volumes_for_content
 from app.models import const
 from app.models.schema import VideoClipParams
-from app.services import (voice, audio_merger, subtitle_merger, clip_video, merger_video, update_script, generate_video)
+from app.services import (voice, audio_merger, subtitle_merger, clip_video, merger_video, update_script, generate_video,
+                          aspect_variants, region_burn)
 from app.services import state as sm
-from app.utils import utils
+from app.utils import utils, metrics, ffmpeg_runner, artifact_store, render_profile, resource_scheduler, ingest
 
 
 def start_subclip(task_id: str, params: VideoClipParams, subclip_path_videos: dict = None):
@@ -239,7 +240,9 @@ def start_subclip(task_id: str, params: VideoClipParams, subclip_path_videos: di
         'subtitle_bg_color': None,  # 直接使用None表示透明背景
         'subtitle_position': params.subtitle_position,
         'custom_position': params.custom_position,
-        'threads': params.n_threads
+        'threads': params.n_threads,
+        # 智能音量在一次 FFmpeg 调用中测量全部 TTS 片段的响度
+        'tts_segments': [(result['audio_file'], result['duration']) for result in tts_results],
     }
     generate_video.merge_materials(
         video_path=combined_video_path,
@@ -263,6 +266,78 @@ def start_subclip(task_id: str, params: VideoClipParams, subclip_path_videos: di
     return kwargs
 
 
+def _progress_callback(task_id: str):
+    """把 FFmpeg 实时进度写入任务状态"""
+    def update(progress: float):
+        sm.state.update_task(task_id, state=const.TASK_STATE_PROCESSING, progress=int(progress))
+    return update
+
+
+def _preview_profile(params: VideoClipParams):
+    """根据参数获取预览档位，完整质量渲染时返回 None"""
+    preview_mode = getattr(params, 'preview_mode', '')
+    if not preview_mode:
+        return None
+    return render_profile.get_preview_profile(preview_mode)
+
+
+def _select_preview_segments(list_script: list, segment_ids) -> list:
+    """
+    预览时只保留选定的片段
+
+    Args:
+        list_script: 完整脚本列表
+        segment_ids: 需要保留的片段 _id 列表，为空时保留全部
+
+    Returns:
+        list: 选定的片段（保持原有顺序）
+    """
+    if not segment_ids:
+        return list_script
+    wanted = set(segment_ids)
+    selected = [segment for segment in list_script if segment.get('_id') in wanted]
+    if not selected:
+        raise ValueError(f"预览片段 {sorted(wanted)} 不在脚本中")
+    logger.info(f"预览模式：只渲染 {len(selected)}/{len(list_script)} 个片段")
+    return selected
+
+
+def _output_aspects(params: VideoClipParams) -> list:
+    """需要输出的画面比例：主比例 video_aspect 在前，加上 output_aspects 中的其他比例（去重）"""
+    primary = merger_video.VideoAspect(params.video_aspect).value
+    aspects = [primary]
+    for aspect in getattr(params, 'output_aspects', None) or []:
+        aspect = merger_video.VideoAspect(getattr(aspect, 'value', aspect)).value
+        if aspect not in aspects:
+            aspects.append(aspect)
+    return aspects
+
+
+def _master_resolution(video_clips: list, params: VideoClipParams) -> tuple:
+    """多画面比例输出时母版的分辨率：与裁剪片段（即原视频）一致，无法读取时使用主比例的分辨率"""
+    if video_clips:
+        info = ingest.media_info(video_clips[0])
+        if info.get("width") and info.get("height"):
+            return info["width"] // 2 * 2, info["height"] // 2 * 2
+    return merger_video.VideoAspect(params.video_aspect).to_resolution()
+
+
+def _output_path(task_id: str, file_name: str) -> str:
+    """任务输出文件路径，预览输出加上档位前缀，不覆盖完整质量的成片"""
+    profile = render_profile.current()
+    if profile is not None:
+        file_name = f"preview_{profile.name}_{file_name}"
+    return path.join(utils.task_dir(task_id), file_name)
+
+
+def _tts_dir(task_id: str) -> str:
+    """配音和字幕的输出目录，预览使用档位子目录，不覆盖完整质量渲染的同名文件"""
+    profile = render_profile.current()
+    if profile is None:
+        return utils.task_dir(task_id)
+    return path.join(utils.task_dir(task_id), f"preview_{profile.name}")
+
+
 def start_subclip_unified(task_id: str, params: VideoClipParams):
     """
     统一视频裁剪处理函数 - 完全基于OST类型的新实现
@@ -273,7 +348,26 @@ def start_subclip_unified(task_id: str, params: VideoClipParams):
     Args:
         task_id: 任务ID
         params: 视频参数
-    """
+
+    各阶段的耗时和资源消耗会写入任务目录下的 metrics.json；
+    任务目录在处理期间被固定，成功结束后登记到产物存储（只统计占用，不淘汰）。
+    任务登记到 resource_scheduler，编码线程数不超过 params.n_threads 和按活动任务数平分的份额。
+    params.preview_mode 不为空时输出低分辨率快速预览（时间线、音频和字幕与成片一致），
+    可通过 params.preview_segments 只渲染部分片段
+    """
+    store = artifact_store.get_store()
+    # 裁剪片段在整个任务期间保持固定（retain），合并前不会被其他任务的写入淘汰
+    with store.pinned("tasks", task_id), store.retain(), metrics.task(task_id), \
+            render_profile.use(_preview_profile(params)), \
+            resource_scheduler.task(task_id, n_threads=params.n_threads):
+        result = _run_subclip_unified(task_id, params)
+        # 只登记成功完成的任务目录
+        store.commit("tasks", task_id)
+        return result
+
+
+def _run_subclip_unified(task_id: str, params: VideoClipParams):
+    """start_subclip_unified 的实际处理流程"""
     global merged_audio_path, merged_subtitle_path
 
     logger.info(f"\n\n## 开始统一视频处理任务: {task_id}")
@@ -304,6 +398,11 @@ def start_subclip_unified(task_id: str, params: VideoClipParams):
         logger.error(f"解说脚本文件不存在: {video_script_path}，请先点击【保存脚本】按钮保存脚本后再生成视频")
         raise ValueError("解说脚本文件不存在！请先点击【保存脚本】按钮保存脚本后再生成视频。")
 
+    profile = render_profile.current()
+    if profile is not None:
+        list_script = _select_preview_segments(list_script, params.preview_segments)
+        video_ost = [i['OST'] for i in list_script]
+
     """
     2. 使用 TTS 生成音频素材
     """
@@ -315,14 +414,16 @@ def start_subclip_unified(task_id: str, params: VideoClipParams):
     ]
     logger.debug(f"需要生成TTS的片段数: {len(tts_segments)}")
 
-    tts_results = voice.tts_multiple(
-        task_id=task_id,
-        list_script=tts_segments,  # 只传入需要TTS的片段
-        tts_engine=params.tts_engine,
-        voice_name=params.voice_name,
-        voice_rate=params.voice_rate,
-        voice_pitch=params.voice_pitch,
-    )
+    with metrics.stage("tts"):
+        tts_results = voice.tts_multiple(
+            task_id=task_id,
+            list_script=tts_segments,  # 只传入需要TTS的片段
+            tts_engine=params.tts_engine,
+            voice_name=params.voice_name,
+            voice_rate=params.voice_rate,
+            voice_pitch=params.voice_pitch,
+            output_dir=_tts_dir(task_id),
+        )
 
     sm.state.update_task(task_id, state=const.TASK_STATE_PROCESSING, progress=20)
 
@@ -332,11 +433,12 @@ def start_subclip_unified(task_id: str, params: VideoClipParams):
     logger.info("\n\n## 3. 统一视频裁剪（基于OST类型）")
 
     # 使用新的统一裁剪策略
-    video_clip_result = clip_video.clip_video_unified(
-        video_origin_path=params.video_origin_path,
-        script_list=list_script,
-        tts_results=tts_results
-    )
+    with metrics.stage("clip"), ffmpeg_runner.progress_scope(20, 60, callback=_progress_callback(task_id)):
+        video_clip_result = clip_video.clip_video_unified(
+            video_origin_path=params.video_origin_path,
+            script_list=list_script,
+            tts_results=tts_results
+        )
 
     # 更新 list_script 中的时间戳和路径信息
     tts_clip_result = {tts_result['_id']: tts_result['audio_file'] for tts_result in tts_results}
@@ -357,15 +459,17 @@ def start_subclip_unified(task_id: str, params: VideoClipParams):
     if tts_segments:
         try:
             # 合并音频文件
-            merged_audio_path = audio_merger.merge_audio_files(
-                task_id=task_id,
-                total_duration=total_duration,
-                list_script=new_script_list
-            )
+            with metrics.stage("mix"):
+                merged_audio_path = audio_merger.merge_audio_files(
+                    task_id=task_id,
+                    total_duration=total_duration,
+                    list_script=new_script_list
+                )
             logger.info(f"音频文件合并成功->{merged_audio_path}")
 
             # 合并字幕文件
-            merged_subtitle_path = subtitle_merger.merge_subtitle_files(new_script_list)
+            with metrics.stage("subtitle_merge"):
+                merged_subtitle_path = subtitle_merger.merge_subtitle_files(new_script_list)
             if merged_subtitle_path:
                 logger.info(f"字幕文件合并成功->{merged_subtitle_path}")
             else:
@@ -389,7 +493,7 @@ def start_subclip_unified(task_id: str, params: VideoClipParams):
     final_video_paths = []
     combined_video_paths = []
 
-    combined_video_path = path.join(utils.task_dir(task_id), f"merger.mp4")
+    combined_video_path = _output_path(task_id, "merger.mp4")
     logger.info(f"\n\n## 5. 合并视频: => {combined_video_path}")
 
     # 使用统一裁剪后的视频片段
@@ -403,19 +507,25 @@ def start_subclip_unified(task_id: str, params: VideoClipParams):
 
     logger.info(f"准备合并 {len(video_clips)} 个视频片段")
 
-    merger_video.combine_clip_videos(
-        output_video_path=combined_video_path,
-        video_paths=video_clips,
-        video_ost_list=video_ost,
-        video_aspect=params.video_aspect,
-        threads=params.n_threads
-    )
+    # 多画面比例输出：按原视频尺寸合并母版，各版本在最后一步从母版一次解码生成
+    output_aspects = _output_aspects(params)
+    master_resolution = _master_resolution(video_clips, params) if len(output_aspects) > 1 else None
+
+    with metrics.stage("concat"), ffmpeg_runner.progress_scope(60, 80, callback=_progress_callback(task_id)):
+        merger_video.combine_clip_videos(
+            output_video_path=combined_video_path,
+            video_paths=video_clips,
+            video_ost_list=video_ost,
+            video_aspect=params.video_aspect,
+            threads=params.n_threads,
+            target_resolution=master_resolution
+        )
     sm.state.update_task(task_id, state=const.TASK_STATE_PROCESSING, progress=80)
 
     """
     6. 合并字幕/BGM/配音/视频
     """
-    output_video_path = path.join(utils.task_dir(task_id), f"combined.mp4")
+    output_video_path = _output_path(task_id, "combined.mp4")
     logger.info(f"\n\n## 6. 最后一步: 合并字幕/BGM/配音/视频 -> {output_video_path}")
 
     bgm_path = utils.get_bgm_file()
@@ -453,18 +563,32 @@ def start_subclip_unified(task_id: str, params: VideoClipParams):
         'subtitle_bg_color': None,
         'subtitle_position': params.subtitle_position,
         'custom_position': params.custom_position,
-        'threads': params.n_threads
+        'threads': params.n_threads,
+        # 智能音量在一次 FFmpeg 调用中测量全部 TTS 片段的响度
+        'tts_segments': [(result['audio_file'], result['duration']) for result in tts_results],
     }
-    generate_video.merge_materials(
-        video_path=combined_video_path,
-        audio_path=merged_audio_path,
-        subtitle_path=merged_subtitle_path,
-        bgm_path=bgm_path,
-        output_path=output_video_path,
-        options=options
-    )
+    if profile is not None:
+        # 合并阶段已按预览档位缩小画面，字幕字号按相同比例缩小
+        scale = profile.scale_factor(*merger_video.VideoAspect(params.video_aspect).to_resolution())
+        options['subtitle_font_size'] = max(1, int(round(params.font_size * scale)))
+    with metrics.stage("compose") as compose_stage:
+        if len(output_aspects) > 1:
+            final_video_paths.extend(_compose_aspect_variants(
+                task_id, params, output_aspects, combined_video_path,
+                merged_audio_path, merged_subtitle_path, bgm_path, options
+            ))
+        else:
+            generate_video.merge_materials(
+                video_path=combined_video_path,
+                audio_path=merged_audio_path,
+                subtitle_path=merged_subtitle_path,
+                bgm_path=bgm_path,
+                output_path=output_video_path,
+                options=options
+            )
+            final_video_paths.append(output_video_path)
+        compose_stage.add(output_bytes=sum(os.path.getsize(p) for p in final_video_paths if os.path.exists(p)))
 
-    final_video_paths.append(output_video_path)
     combined_video_paths.append(combined_video_path)
 
     logger.success(f"统一处理任务 {task_id} 已完成, 生成 {len(final_video_paths)} 个视频.")
@@ -477,6 +601,46 @@ def start_subclip_unified(task_id: str, params: VideoClipParams):
     return kwargs
 
 
+def _compose_aspect_variants(task_id: str, params: VideoClipParams, output_aspects: list, master_path: str,
+                             audio_path: str, subtitle_path: str, bgm_path: str, options: dict) -> list:
+    """
+    多画面比例输出：共用一条混音音轨，字幕按各版本画面重新排版，从母版一次解码生成所有版本
+
+    主比例输出到 combined.mp4，其他比例输出到 combined_<比例>.mp4（如 combined_16x9.mp4）
+
+    Returns:
+        list: 各版本的输出路径（主比例在前）
+    """
+    primary = output_aspects[0]
+    outputs = aspect_variants.output_geometries(
+        output_aspects,
+        lambda aspect: _output_path(task_id, "combined.mp4" if aspect == primary
+                                    else f"combined_{aspect_variants.aspect_label(aspect)}.mp4")
+    )
+    mixed_audio_path = generate_video.mix_audio_track(
+        video_path=master_path,
+        audio_path=audio_path,
+        output_path=_output_path(task_id, "mixed_audio.m4a"),
+        bgm_path=bgm_path,
+        options=options
+    )
+
+    if not (params.subtitle_enabled and subtitle_path and generate_video.is_valid_subtitle_file(subtitle_path)):
+        subtitle_path = None
+    style = aspect_variants.SubtitleStyle(
+        font_path=path.join(utils.font_dir(), params.font_name) if params.font_name else None,
+        font_size=params.font_size,
+        color=params.text_fore_color,
+        stroke_color=params.stroke_color,
+        stroke_width=params.stroke_width,
+        position=params.subtitle_position,
+        custom_position=params.custom_position,
+        # 字号按主比例的完整分辨率设计，其他版本（包括预览档位）按短边比例缩放
+        base_size=merger_video.VideoAspect(primary).to_resolution(),
+    )
+    return aspect_variants.render_variants(master_path, mixed_audio_path, subtitle_path, outputs, style)
+
+
 def validate_params(video_path, audio_path, output_file, params):
     """
     验证输入参数
@@ -522,7 +686,16 @@ def start_overlay_narration(task_id: str, params: VideoClipParams):
     Args:
         task_id: 任务ID
         params: 视频参数
+
+    params.preview_mode 不为空时输出低分辨率快速预览；
+    指定 params.preview_segments 时只输出覆盖这些片段的原视频区间
     """
+    with render_profile.use(_preview_profile(params)), resource_scheduler.task(task_id, n_threads=params.n_threads):
+        return _run_overlay_narration(task_id, params)
+
+
+def _run_overlay_narration(task_id: str, params: VideoClipParams):
+    """start_overlay_narration 的实际处理流程"""
     logger.info(f"\n\n## 开始叠加解说任务: {task_id}")
     sm.state.update_task(task_id, state=const.TASK_STATE_PROCESSING, progress=0)
 
@@ -545,6 +718,13 @@ def start_overlay_narration(task_id: str, params: VideoClipParams):
     else:
         raise ValueError("解说脚本文件不存在！")
 
+    # 预览选定片段时只输出覆盖这些片段的区间
+    time_range = None
+    if render_profile.current() is not None and params.preview_segments:
+        list_script = _select_preview_segments(list_script, params.preview_segments)
+        ranges = [generate_video.parse_timestamp_range(segment['timestamp']) for segment in list_script]
+        time_range = (min(start for start, _ in ranges), max(end for _, end in ranges))
+
     """
     2. 使用 TTS 生成音频素材
     """
@@ -563,6 +743,7 @@ def start_overlay_narration(task_id: str, params: VideoClipParams):
         voice_name=params.voice_name,
         voice_rate=params.voice_rate,
         voice_pitch=params.voice_pitch,
+        output_dir=_tts_dir(task_id),
     )
 
     sm.state.update_task(task_id, state=const.TASK_STATE_PROCESSING, progress=20)
@@ -600,7 +781,7 @@ def start_overlay_narration(task_id: str, params: VideoClipParams):
     """
     logger.info("\n\n## 5. 叠加解说到完整原视频")
 
-    output_video_path = path.join(utils.task_dir(task_id), f"overlay_narration.mp4")
+    output_video_path = _output_path(task_id, "overlay_narration.mp4")
 
     # 获取"静音原声"选项
     mute_original_audio = st.session_state.get('mute_original_audio', True)
@@ -626,13 +807,17 @@ def start_overlay_narration(task_id: str, params: VideoClipParams):
         'subtitle_bg_color': None,
         'subtitle_position': params.subtitle_position,
         'custom_position': params.custom_position,
-        'threads': params.n_threads
+        'stroke_color': params.stroke_color,
+        'stroke_width': params.stroke_width,
+        'subtitle_mode': params.subtitle_mode,
+        'threads': params.n_threads,
+        'time_range': time_range
     }
 
     logger.info(f"音量配置 - TTS: {final_tts_volume}, BGM: {final_bgm_volume}, 原声: {options['original_audio_volume']}")
 
-    # 调用新的叠加配音函数
-    generate_video.merge_narration_to_full_video(
+    # 画面不变时直接复制原视频流，只有明确要求烧录字幕时才重新编码整部视频
+    merge_kwargs = dict(
         video_path=params.video_origin_path,
         narration_segments=narration_segments,
         output_path=output_video_path,
@@ -640,6 +825,23 @@ def start_overlay_narration(task_id: str, params: VideoClipParams):
         bgm_path=bgm_path,
         options=options
     )
+    fast_merge, stage_name = generate_video.remux_narration_to_full_video, "remux"
+    if params.subtitle_enabled and params.subtitle_mode == "burn":
+        # 烧录字幕时只重新编码字幕区间；预览档位需要缩小整个画面，只能整体重新编码
+        if render_profile.current() is None:
+            fast_merge, stage_name = generate_video.burn_narration_regions, "region_burn"
+        else:
+            fast_merge = None
+    if fast_merge is None:
+        generate_video.merge_narration_to_full_video(**merge_kwargs)
+    else:
+        try:
+            with metrics.stage(stage_name), ffmpeg_runner.progress_scope(40, 100, callback=_progress_callback(task_id)):
+                fast_merge(**merge_kwargs)
+        except (ffmpeg_runner.FFmpegError, region_burn.RegionBurnUnsupported) as e:
+            # 原视频编码无法直接封装进 MP4、无法与重新编码的片段拼接等情况，回退到整体重新编码
+            logger.warning(f"视频流复制失败，改为整体重新编码输出: {e}")
+            generate_video.merge_narration_to_full_video(**merge_kwargs)
 
     sm.state.update_task(task_id, state=const.TASK_STATE_COMPLETE, progress=100)
 
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Gemini 分块可续传上传测试
+
+在本地桩服务上模拟 Files API：分块上传、上传中途失败后按服务端已接收的偏移续传、轮询文件状态直到 ACTIVE
+"""
+
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.config import config
+from app.services import gemini_upload
+from app.utils import http_client
+
+CHUNK_SIZE = gemini_upload.CHUNK_ALIGNMENT
+
+
+class _FilesApiStub(BaseHTTPRequestHandler):
+    """Files API 桩：第一次续传分块只接收一部分数据后返回 503"""
+
+    state = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body=b"", headers=None):
+        self.send_response(code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        state = self.state
+        state["api_keys"].add(self.headers.get("x-goog-api-key"))
+        if self.path.startswith("/upload/v1beta/files"):
+            state["starts"] += 1
+            state["data"] = bytearray()
+            return self._send(200, b"{}", {"X-Goog-Upload-URL": f"{state['base_url']}/session/1"})
+
+        command = self.headers["X-Goog-Upload-Command"]
+        if command == "query":
+            state["queries"] += 1
+            return self._send(200, b"{}", {"X-Goog-Upload-Status": "active",
+                                           "X-Goog-Upload-Size-Received": str(len(state["data"]))})
+
+        offset = int(self.headers["X-Goog-Upload-Offset"])
+        state["offsets"].append(offset)
+        if offset != len(state["data"]):
+            return self._send(400)
+        if state["fail_once"] and offset > 0:
+            state["fail_once"] = False
+            state["data"] += body[:1000]
+            return self._send(503)
+        state["data"] += body
+        if "finalize" not in command:
+            return self._send(200)
+        file = {"file": {"name": "files/abc", "uri": f"{state['base_url']}/v1beta/files/abc",
+                         "mimeType": "video/mp4", "state": "PROCESSING",
+                         "expirationTime": "2099-01-01T00:00:00.123456789Z"}}
+        return self._send(200, json.dumps(file).encode("utf-8"))
+
+    def do_GET(self):
+        state = self.state
+        state["gets"] += 1
+        file = {"name": "files/abc", "uri": f"{state['base_url']}/v1beta/files/abc", "mimeType": "video/mp4",
+                "state": "ACTIVE" if state["gets"] >= 3 else "PROCESSING",
+                "expirationTime": "2099-01-01T00:00:00Z"}
+        self._send(200, json.dumps(file).encode("utf-8"))
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    monkeypatch.setitem(config.app, "http_max_retries", 0)
+    monkeypatch.setattr(http_client, "get_proxies", dict)
+    http_client.close_session()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FilesApiStub)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    _FilesApiStub.state = {"base_url": base_url, "data": bytearray(), "fail_once": True, "api_keys": set(),
+                           "starts": 0, "queries": 0, "gets": 0, "offsets": []}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield base_url, _FilesApiStub.state
+    server.shutdown()
+    server.server_close()
+    http_client.close_session()
+
+
+def test_upload_resumes_from_received_offset(stub_server, monkeypatch, tmp_path):
+    base_url, state = stub_server
+    monkeypatch.setattr(gemini_upload.time, "sleep", lambda seconds: None)
+    payload = os.urandom(3 * CHUNK_SIZE + 123)
+    video = tmp_path / "proxy.mp4"
+    video.write_bytes(payload)
+
+    client = gemini_upload.GeminiFileClient("key", base_url, chunk_size=CHUNK_SIZE)
+    file = client.upload(str(video))
+
+    assert file["name"] == "files/abc"
+    assert bytes(state["data"]) == payload
+    assert state["starts"] == 1
+    assert state["queries"] == 1
+    # 第二个分块失败后从服务端已接收的偏移继续，而不是重新上传整个文件
+    assert state["offsets"] == [0, CHUNK_SIZE, CHUNK_SIZE + 1000, 2 * CHUNK_SIZE + 1000]
+    assert state["api_keys"] == {"key"}
+
+
+def test_wait_active_polls_until_active(stub_server, monkeypatch):
+    base_url, state = stub_server
+    delays = []
+    monkeypatch.setattr(gemini_upload.time, "sleep", delays.append)
+
+    client = gemini_upload.GeminiFileClient("key", base_url)
+    file = client.wait_active("files/abc")
+
+    assert file["state"] == "ACTIVE"
+    assert state["gets"] == 3
+    assert delays == sorted(delays)
+
+
+def test_registry_reuses_until_expiration(tmp_path):
+    registry = gemini_upload.UploadRegistry(str(tmp_path / "uploads.json"))
+    registry.put("video", {"name": "files/abc", "uri": "uri", "mimeType": "video/mp4",
+                           "expirationTime": "2099-01-01T00:00:00.123456789Z"})
+    assert gemini_upload.UploadRegistry(str(tmp_path / "uploads.json")).get("video")["uri"] == "uri"
+
+    registry.put("expired", {"name": "files/old", "uri": "old", "expirationTime": "2000-01-01T00:00:00Z"})
+    assert registry.get("expired") is None
+
+    registry.remove("video")
+    assert registry.get("video") is None
+    assert gemini_upload._parse_expiration("not a date") == 0
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+素材下载测试
+
+在本地桩服务上模拟素材 CDN：传输中途断开连接后按 Range 续传、.part 已完整时的 416、
+忽略 Range 的 200、stop_event 中止下载，以及并发下载在时长覆盖音频后停止
+"""
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.config import config
+from app.models.schema import MaterialInfo
+from app.services import material
+from app.utils import http_client, ingest
+
+PAYLOAD = os.urandom(64 * 1024 + 123)
+
+
+class _CdnStub(BaseHTTPRequestHandler):
+    """素材 CDN 桩：drop_at 不为 0 时第一次完整响应只发送部分数据后断开连接"""
+
+    state = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        state = self.state
+        range_header = self.headers.get("Range")
+        state["ranges"].append((self.path, range_header))
+        if self.path == "/slow":
+            return self._trickle()
+        if self.path == state["wait_for_slow"]:
+            # 等慢速下载开始后再响应，时长覆盖时它一定正在进行
+            state["slow_started"].wait(5)
+        payload = state["files"][self.path]
+
+        if range_header and state["honour_range"]:
+            start = int(range_header[len("bytes="):].rstrip("-"))
+            if start >= len(payload):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(payload)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(payload) - 1}/{len(payload)}")
+            body = payload[start:]
+        else:
+            self.send_response(200)
+            body = payload
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if state["drop_at"] and not range_header:
+            # 声明完整长度但只发送一部分，随后关闭连接
+            self.wfile.write(body[:state["drop_at"]])
+            self.wfile.flush()
+            state["drop_at"] = 0
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def _trickle(self):
+        """持续缓慢发送数据，直到客户端断开连接"""
+        self.send_response(200)
+        self.send_header("Content-Length", str(1024 * 1024 * 1024))
+        self.end_headers()
+        self.state["slow_started"].set()
+        try:
+            for _ in range(1000):
+                self.wfile.write(b"\0" * 1024)
+                self.wfile.flush()
+                time.sleep(0.01)
+        except OSError:
+            self.state["slow_closed"].set()
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    monkeypatch.setitem(config.app, "http_max_retries", 0)
+    monkeypatch.setattr(http_client, "get_proxies", dict)
+    # 较小的读取块，断开连接前已收到的数据能写入 .part
+    monkeypatch.setattr(ingest, "DOWNLOAD_CHUNK_SIZE", 1024)
+    http_client.close_session()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _CdnStub)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    _CdnStub.state = {"files": {"/video.mp4": PAYLOAD}, "honour_range": True, "drop_at": 0, "ranges": [],
+                      "wait_for_slow": None, "slow_started": threading.Event(), "slow_closed": threading.Event()}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield base_url, _CdnStub.state
+    server.shutdown()
+    server.server_close()
+    http_client.close_session()
+
+
+def test_ingest_url_resumes_with_range(stub_server, tmp_path):
+    base_url, state = stub_server
+    state["drop_at"] = 20000
+    dest = str(tmp_path / "video.mp4")
+
+    result = ingest.ingest_url(f"{base_url}/video.mp4", dest, probe_media=False)
+
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+    assert not os.path.exists(dest + ".part")
+    assert result.size == len(PAYLOAD)
+    assert result.fingerprint == ingest.file_fingerprint(dest)
+    # 第二次请求从断开前已写入的位置继续，而不是重新下载整个文件
+    assert len(state["ranges"]) == 2
+    assert state["ranges"][0][1] is None
+    offset = int(state["ranges"][1][1][len("bytes="):].rstrip("-"))
+    assert 0 < offset <= 20000
+
+
+def test_ingest_url_treats_416_as_complete(stub_server, tmp_path):
+    base_url, state = stub_server
+    dest = str(tmp_path / "video.mp4")
+    with open(dest + ".part", "wb") as f:
+        f.write(PAYLOAD)
+
+    result = ingest.ingest_url(f"{base_url}/video.mp4", dest, probe_media=False)
+
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+    assert result.size == len(PAYLOAD)
+    assert state["ranges"] == [("/video.mp4", f"bytes={len(PAYLOAD)}-")]
+
+
+def test_ingest_url_restarts_when_range_ignored(stub_server, tmp_path):
+    base_url, state = stub_server
+    state["honour_range"] = False
+    dest = str(tmp_path / "video.mp4")
+    with open(dest + ".part", "wb") as f:
+        f.write(b"stale" * 1000)
+
+    result = ingest.ingest_url(f"{base_url}/video.mp4", dest, probe_media=False)
+
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+    assert result.size == len(PAYLOAD)
+    assert state["ranges"] == [("/video.mp4", "bytes=5000-")]
+
+
+def test_ingest_url_abort_keeps_part(stub_server, tmp_path):
+    base_url, state = stub_server
+    dest = str(tmp_path / "video.mp4")
+    with open(dest + ".part", "wb") as f:
+        f.write(PAYLOAD[:1000])
+    stop_event = threading.Event()
+    stop_event.set()
+
+    with pytest.raises(ingest.IngestError):
+        ingest.ingest_url(f"{base_url}/video.mp4", dest, probe_media=False, stop_event=stop_event)
+    assert not os.path.exists(dest)
+    assert os.path.getsize(dest + ".part") == 1000
+
+    # 下一次下载同一路径时从断点继续
+    ingest.ingest_url(f"{base_url}/video.mp4", dest, probe_media=False)
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+    assert [range_header for _, range_header in state["ranges"]] == ["bytes=1000-", "bytes=1000-"]
+
+
+def test_download_stops_once_audio_covered(stub_server, monkeypatch, tmp_path):
+    base_url, state = stub_server
+    state["files"].update({"/a.mp4": PAYLOAD, "/b.mp4": PAYLOAD, "/d.mp4": PAYLOAD})
+    state["wait_for_slow"] = "/b.mp4"
+    monkeypatch.setitem(config.app, "material_download_workers", 2)
+    monkeypatch.setattr(material, "_is_valid_video", lambda video_path, info: True)
+    monkeypatch.setattr(ingest, "media_info", lambda file_path: {"duration": 3.0})
+
+    items = []
+    for path in ("/a.mp4", "/b.mp4", "/slow", "/d.mp4"):
+        item = MaterialInfo()
+        item.url = f"{base_url}{path}"
+        item.duration = 3
+        items.append(item)
+
+    video_paths = material._download_until_covered(items, str(tmp_path), audio_duration=5, max_clip_duration=5)
+
+    assert [os.path.getsize(path) for path in video_paths] == [len(PAYLOAD), len(PAYLOAD)]
+    # 时长覆盖后正在进行的下载在下一个数据块处中止，.part 保留以便续传，后续素材不再提交
+    assert state["slow_closed"].wait(10)
+    requested = [path for path, _ in state["ranges"]]
+    assert sorted(requested) == ["/a.mp4", "/b.mp4", "/slow"]
+    part_files = [name for name in os.listdir(tmp_path) if name.endswith(".part")]
+    assert len(part_files) == 1
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+分窗口渲染测试
+
+在当前进程中逐个渲染窗口时，每个窗口的编码会自行借出 CPU 线程，render() 不能在外层持有 CPU 线程，
+否则 CPU 线程较少时内层申请永远等不到资源
+"""
+
+import os
+import threading
+
+from app.config import config
+from app.services import windowed_render
+from app.utils import ffmpeg_runner, resource_scheduler
+
+
+def _fake_render(output_path, options=None, **kwargs):
+    """模拟 merge_materials：按选项中的线程数借出 CPU 线程后写出窗口文件"""
+    with resource_scheduler.cpu(options.get("threads")) as threads:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(f"{options['time_range']} {threads}")
+    return output_path
+
+
+def test_sequential_windows_with_small_cpu_budget(monkeypatch, tmp_path):
+    monkeypatch.setitem(config.app, "scheduler_cpu_threads", 2)
+    monkeypatch.setitem(config.app, "render_window_minutes", 1)
+    monkeypatch.setitem(config.app, "render_window_workers", 1)
+    monkeypatch.setattr(resource_scheduler, "_scheduler", resource_scheduler.ResourceScheduler())
+    commands = []
+    monkeypatch.setattr(ffmpeg_runner, "run", lambda cmd, *args, **kwargs: commands.append(cmd))
+
+    kwargs = {"output_path": str(tmp_path / "final.mp4"), "options": {"threads": 2}}
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(path=windowed_render.render(
+        _fake_render, kwargs, 100, 25, None, str(tmp_path / "windows"))), daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+
+    assert not worker.is_alive(), "分窗口渲染在等待 CPU 线程时卡住"
+    assert result["path"] == kwargs["output_path"]
+    with open(tmp_path / "windows" / "windows.txt", encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 2
+    assert commands and commands[0][-1] == kwargs["output_path"]
+    assert resource_scheduler.get_scheduler().cpu_pool.in_use == 0
+    assert not os.path.exists(tmp_path / "windows" / "window_0000.mp4")
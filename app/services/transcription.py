@@ -0,0 +1,430 @@
+"""
+本地语音识别服务（faster-whisper）
+
+- 通过 ffmpeg 管道直接解码音频/视频为 16kHz 单声道 PCM，不生成临时 WAV 文件
+- 按静音位置将音频切分为若干片段，边解码边提交，内存占用与片段数量无关
+- 使用常驻进程池并行识别，每个工作进程只加载一次模型（有可用的 CUDA 时使用 GPU 单进程）
+- 识别结果按片段偏移量还原为全局时间戳（包括逐词时间戳）
+- 识别结果按音频指纹和模型缓存，重复运行时直接复用
+"""
+
+import os
+import json
+import hashlib
+import subprocess
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from loguru import logger
+
+from app.config import config
+from app.utils import metrics
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2  # s16le
+
+# 识别参数（与原 subtitle.create 保持一致）
+TRANSCRIBE_OPTIONS = {
+    "beam_size": 5,
+    "word_timestamps": True,
+    "vad_filter": True,
+    "vad_parameters": {"min_silence_duration_ms": 500},
+    "initial_prompt": "以下是普通话的句子",
+}
+
+# 工作进程内的常驻模型
+_worker_model = None
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_key: Optional[Tuple] = None
+_pool_lock = threading.Lock()
+
+
+def default_model_path() -> str:
+    """默认的本地 faster-whisper 模型目录"""
+    from app.utils import utils
+    return f"{utils.root_dir()}/app/models/faster-whisper-large-v3"
+
+
+def _init_worker(model_path: str, device: str, compute_type: str, cpu_threads: int):
+    """工作进程初始化：加载一次模型并常驻内存"""
+    global _worker_model
+    from faster_whisper import WhisperModel
+
+    _worker_model = WhisperModel(
+        model_size_or_path=model_path,
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=cpu_threads,
+        local_files_only=True
+    )
+
+
+def _transcribe_chunk(samples, offset: float, options: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    在工作进程中识别一个音频片段
+
+    Args:
+        samples: int16 PCM 采样数据（numpy 数组）
+        offset: 片段在完整音频中的起始时间（秒）
+        options: 传给 WhisperModel.transcribe 的参数
+
+    Returns:
+        List[Dict]: 带全局时间戳的识别片段
+    """
+    import numpy as np
+
+    audio = samples.astype(np.float32) / 32768.0
+    segments, _ = _worker_model.transcribe(audio, **options)
+
+    results = []
+    for segment in segments:
+        results.append({
+            "start": segment.start + offset,
+            "end": segment.end + offset,
+            "text": segment.text,
+            "words": [
+                {"start": word.start + offset, "end": word.end + offset, "word": word.word}
+                for word in (segment.words or [])
+            ],
+        })
+    return results
+
+
+def _resolve_device() -> Tuple[str, str]:
+    """
+    根据配置和 CUDA 可用性确定设备与计算类型
+
+    未配置 device（或为 auto）时自动检测 CUDA，与原 subtitle.create 的行为一致；
+    配置为 cpu 时不检测
+    """
+    device = config.whisper.get("device", "auto") or "auto"
+    if device == "cpu":
+        return "cpu", config.whisper.get("compute_type", "int8")
+
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return "cuda", "float16"
+    except (ImportError, RuntimeError) as e:
+        logger.warning(f"检查CUDA可用性时出错: {e}")
+
+    if device == "cuda":
+        logger.warning("CUDA 不可用，回退到 CPU 模式")
+    return "cpu", config.whisper.get("compute_type", "int8")
+
+
+def _get_pool(model_path: str) -> Tuple[ProcessPoolExecutor, int]:
+    """
+    获取常驻识别进程池（模型路径或配置变化时重建）
+
+    Returns:
+        Tuple[ProcessPoolExecutor, int]: 进程池和工作进程数量
+    """
+    global _pool, _pool_key
+
+    device, compute_type = _resolve_device()
+    cpu_count = os.cpu_count() or 1
+    if device == "cuda":
+        # GPU 模式下多进程会争抢显存，只使用一个工作进程
+        workers = 1
+    else:
+        workers = int(config.whisper.get("workers", max(1, cpu_count // 4)))
+    cpu_threads = int(config.whisper.get("cpu_threads", max(1, cpu_count // workers)))
+
+    key = (model_path, device, compute_type, workers, cpu_threads)
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            logger.info(f"启动语音识别进程池: workers={workers}, device={device}, "
+                        f"compute_type={compute_type}, cpu_threads={cpu_threads}")
+            # spawn：子进程不继承父进程（Streamlit）的线程、锁和已初始化的 CUDA 上下文，避免 fork 后死锁
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_path, device, compute_type, cpu_threads)
+            )
+            _pool_key = key
+        return _pool, workers
+
+
+def shutdown_pool():
+    """关闭常驻识别进程池，释放模型占用的内存"""
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+            _pool_key = None
+
+
+def audio_fingerprint(file_path: str, sample_size: int = 1024 * 1024) -> str:
+    """
+    计算音频/视频文件指纹（文件大小 + 头、中、尾三段采样内容的哈希）
+
+    Args:
+        file_path: 文件路径
+        sample_size: 每段采样的字节数
+
+    Returns:
+        str: 文件指纹
+    """
+    file_size = os.path.getsize(file_path)
+    hasher = hashlib.md5(str(file_size).encode())
+    with open(file_path, "rb") as f:
+        for position in (0, max(0, file_size // 2 - sample_size // 2), max(0, file_size - sample_size)):
+            f.seek(position)
+            hasher.update(f.read(sample_size))
+    return hasher.hexdigest()
+
+
+def _find_cut(samples, start: int, end: int, frame_samples: int) -> int:
+    """在 [start, end) 范围内找到能量最低的帧作为切分点"""
+    import numpy as np
+
+    window = samples[start:end]
+    frame_count = len(window) // frame_samples
+    if frame_count == 0:
+        return end
+
+    frames = window[:frame_count * frame_samples].astype(np.float32).reshape(frame_count, frame_samples)
+    energy = np.sqrt(np.mean(frames * frames, axis=1))
+    quietest = int(np.argmin(energy))
+    return start + quietest * frame_samples + frame_samples // 2
+
+
+def iter_audio_chunks(media_file: str,
+                      target_seconds: float = 60.0,
+                      max_seconds: float = 90.0,
+                      frame_ms: int = 30) -> Iterator[Tuple[float, Any]]:
+    """
+    通过 ffmpeg 管道解码音频，并在静音处切分为片段
+
+    每个片段长度在 target_seconds 到 max_seconds 之间，切分点取该范围内能量最低的位置，
+    避免把一个词切成两半。解码与切分同步进行，只保留不超过 max_seconds 的缓冲数据。
+
+    Args:
+        media_file: 音频或视频文件路径
+        target_seconds: 片段目标长度（秒）
+        max_seconds: 片段最大长度（秒）
+        frame_ms: 计算能量的帧长度（毫秒）
+
+    Yields:
+        Tuple[float, numpy.ndarray]: (片段起始时间秒数, int16 采样数据)
+    """
+    import numpy as np
+
+    cmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel", "error",
+        "-nostdin",
+        "-i", media_file,
+        "-vn", "-sn", "-dn",
+        "-ac", "1",
+        "-ar", str(SAMPLE_RATE),
+        "-f", "s16le",
+        "pipe:1"
+    ]
+
+    target_samples = int(target_seconds * SAMPLE_RATE)
+    max_samples = int(max_seconds * SAMPLE_RATE)
+    frame_samples = int(SAMPLE_RATE * frame_ms / 1000)
+    read_size = SAMPLE_RATE * BYTES_PER_SAMPLE * 10  # 每次读取 10 秒
+
+    # stderr 写入临时文件：stdout 读到 EOF 之前不会读取 stderr，用管道时大量警告会填满缓冲区导致死锁
+    stderr_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+    metrics.record_subprocess()
+    buffer = np.zeros(0, dtype=np.int16)
+    pending = b""
+    offset_samples = 0
+    try:
+        while True:
+            data = process.stdout.read(read_size)
+            if not data:
+                break
+
+            data = pending + data
+            usable = len(data) - len(data) % BYTES_PER_SAMPLE
+            pending = data[usable:]
+            buffer = np.concatenate([buffer, np.frombuffer(data[:usable], dtype=np.int16)])
+
+            while len(buffer) >= max_samples:
+                cut = _find_cut(buffer, target_samples, max_samples, frame_samples)
+                yield offset_samples / SAMPLE_RATE, buffer[:cut].copy()
+                buffer = buffer[cut:]
+                offset_samples += cut
+
+        process.wait()
+        if process.returncode != 0:
+            stderr_file.seek(0)
+            error = stderr_file.read().decode("utf-8", errors="ignore").strip()[-2000:]
+            raise RuntimeError(f"ffmpeg 解码音频失败: {error}")
+
+        if len(buffer) > 0:
+            yield offset_samples / SAMPLE_RATE, buffer
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        stderr_file.close()
+
+
+def transcribe(media_file: str, model_path: Optional[str] = None, use_cache: bool = True) -> List[Dict[str, Any]]:
+    """
+    分片并行识别音频/视频文件
+
+    Args:
+        media_file: 音频或视频文件路径
+        model_path: faster-whisper 模型目录，默认使用 app/models/faster-whisper-large-v3
+        use_cache: 是否使用识别结果缓存
+
+    Returns:
+        List[Dict]: 按时间排序的识别片段，每项包含 start、end、text、words
+    """
+    model_path = model_path or default_model_path()
+    target_seconds = float(config.whisper.get("chunk_seconds", 60))
+    max_seconds = float(config.whisper.get("max_chunk_seconds", target_seconds * 1.5))
+
+    cache_file = None
+    if use_cache:
+        from app.utils import utils
+        cache_key = utils.md5(json.dumps({
+            "audio": audio_fingerprint(media_file),
+            "model": os.path.abspath(model_path),
+            "chunk": [target_seconds, max_seconds],
+            "options": TRANSCRIBE_OPTIONS,
+        }, sort_keys=True))
+        cache_file = os.path.join(utils.temp_dir("transcripts"), f"{cache_key}.json")
+        if os.path.isfile(cache_file):
+            try:
+                with open(cache_file, "r", encoding="utf-8") as f:
+                    segments = json.load(f)
+                logger.info(f"使用已缓存的识别结果: {cache_file}")
+                return segments
+            except Exception as e:
+                logger.warning(f"读取识别缓存失败，重新识别: {e}")
+
+    pool, workers = _get_pool(model_path)
+
+    # 限制同时在途的片段数量，避免解码速度快于识别速度时占满内存
+    max_in_flight = workers * 2
+    futures: List[Future] = []
+    results: List[List[Dict[str, Any]]] = []
+
+    def _collect(until: int):
+        while len(futures) > until:
+            results.append(futures.pop(0).result())
+
+    chunk_count = 0
+    for offset, samples in iter_audio_chunks(media_file, target_seconds, max_seconds):
+        futures.append(pool.submit(_transcribe_chunk, samples, offset, TRANSCRIBE_OPTIONS))
+        chunk_count += 1
+        logger.debug(f"已提交第 {chunk_count} 个音频片段，起始时间 {offset:.2f}s，时长 {len(samples) / SAMPLE_RATE:.2f}s")
+        _collect(max_in_flight)
+    _collect(0)
+
+    segments = sorted((segment for chunk in results for segment in chunk), key=lambda s: s["start"])
+    logger.info(f"语音识别完成，共 {chunk_count} 个音频片段，{len(segments)} 个识别片段")
+
+    if cache_file:
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump(segments, f, ensure_ascii=False)
+
+    return segments
+
+
+def segments_to_subtitles(segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    按标点将识别片段拆分为字幕行
+
+    Returns:
+        List[Dict]: 每项包含 msg、start_time、end_time
+    """
+    from app.utils import utils
+
+    subtitles = []
+
+    def recognized(seg_text, seg_start, seg_end):
+        seg_text = seg_text.strip()
+        if not seg_text:
+            return
+
+        logger.debug("[%.2fs -> %.2fs] %s" % (seg_start, seg_end, seg_text))
+        subtitles.append({"msg": seg_text, "start_time": seg_start, "end_time": seg_end})
+
+    for segment in segments:
+        words = segment.get("words") or []
+        if not words:
+            recognized(segment["text"], segment["start"], segment["end"])
+            continue
+
+        seg_start = 0
+        seg_end = 0
+        seg_text = ""
+        is_segmented = False
+        for words_idx, word in enumerate(words):
+            if not is_segmented:
+                seg_start = word["start"]
+                is_segmented = True
+
+            seg_end = word["end"]
+            # 如果包含标点,则断句
+            seg_text += word["word"]
+
+            if utils.str_contains_punctuation(word["word"]):
+                # remove last char
+                seg_text = seg_text[:-1]
+                if not seg_text:
+                    continue
+
+                recognized(seg_text, seg_start, seg_end)
+
+                is_segmented = False
+                seg_text = ""
+
+            if words_idx == 0 and segment["start"] < word["start"]:
+                seg_start = word["start"]
+            if words_idx == len(words) - 1 and segment["end"] > word["end"]:
+                seg_end = word["end"]
+
+        if seg_text:
+            recognized(seg_text, seg_start, seg_end)
+
+    return subtitles
+
+
+def transcribe_to_srt(media_file: str, subtitle_file: str = "", model_path: Optional[str] = None) -> Optional[str]:
+    """
+    识别音频/视频文件并生成 SRT 字幕文件
+
+    Args:
+        media_file: 音频或视频文件路径
+        subtitle_file: 字幕输出路径，默认为 "<media_file>.srt"
+        model_path: faster-whisper 模型目录
+
+    Returns:
+        Optional[str]: 字幕文件路径，失败时返回 None
+    """
+    from app.utils import utils
+
+    if not subtitle_file:
+        subtitle_file = f"{media_file}.srt"
+
+    segments = transcribe(media_file, model_path=model_path)
+    subtitles = segments_to_subtitles(segments)
+
+    lines = []
+    for idx, subtitle in enumerate(subtitles, start=1):
+        lines.append(utils.text_to_srt(idx, subtitle["msg"], subtitle["start_time"], subtitle["end_time"]))
+
+    with open(subtitle_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    logger.info(f"subtitle file created: {subtitle_file}")
+    return subtitle_file
@@ -1,28 +1,38 @@
+from __future__ import annotations
+
 import os
 import re
 import json
+import hashlib
+import shutil
+import threading
 import traceback
-import edge_tts
-import asyncio
 import requests
 import uuid
 from loguru import logger
-from typing import List, Union, Tuple
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Union, Tuple
 from datetime import datetime
 from xml.sax.saxutils import unescape
-from edge_tts import submaker, SubMaker
-# from edge_tts.submaker import mktimestamp  # 函数可能不存在，我们自己实现
-from moviepy.video.tools import subtitles
-try:
-    from moviepy import AudioFileClip
-    MOVIEPY_AVAILABLE = True
-except ImportError:
-    MOVIEPY_AVAILABLE = False
-    logger.warning("moviepy 未安装，将使用估算方法计算音频时长")
 import time
 
+# edge_tts、moviepy 及各 TTS 引擎的 SDK 在首次使用时才导入，
+# 只使用单个引擎的进程（以及仅渲染界面的 WebUI）不需要加载全部 SDK
+if TYPE_CHECKING:
+    from edge_tts import submaker, SubMaker
+
 from app.config import config
 from app.utils import utils
+from app.utils import http_client
+from app.utils import metrics
+from app.utils import async_runtime
+
+
+def _new_sub_maker() -> SubMaker:
+    """创建 edge_tts 的 SubMaker（首次调用时导入 edge_tts）"""
+    from edge_tts import SubMaker
+    return SubMaker()
 
 
 def mktimestamp(time_seconds: float) -> str:
@@ -1144,13 +1154,15 @@ def azure_tts_v1(
     text = text.strip()
     rate_str = convert_rate_to_percent(voice_rate)
     pitch_str = convert_pitch_to_percent(voice_pitch)
+    import edge_tts
+
     for i in range(3):
         try:
             logger.info(f"第 {i+1} 次使用 edge_tts 生成音频")
 
             async def _do() -> tuple[SubMaker, bytes]:
                 communicate = edge_tts.Communicate(text, voice_name, rate=rate_str, pitch=pitch_str, proxy=config.proxy.get("http"))
-                sub_maker = edge_tts.SubMaker()
+                sub_maker = _new_sub_maker()
                 audio_data = bytes()  # 用于存储音频数据
                 
                 async for chunk in communicate.stream():
@@ -1163,7 +1175,7 @@ def azure_tts_v1(
                 return sub_maker, audio_data
 
             # 获取音频数据和字幕信息
-            sub_maker, audio_data = asyncio.run(_do())
+            sub_maker, audio_data = async_runtime.run(_do())
             
             # 验证数据是否有效
             if not sub_maker or not sub_maker.subs or not audio_data:
@@ -1220,7 +1232,7 @@ def azure_tts_v2(text: str, voice_name: str, voice_file: str) -> Union[SubMaker,
         try:
             logger.info(f"start, voice name: {processed_voice_name}, try: {i + 1}")
 
-            sub_maker = SubMaker()
+            sub_maker = _new_sub_maker()
 
             def speech_synthesizer_word_boundary_cb(evt: speechsdk.SessionEventArgs):
                 duration = _format_duration_to_offset(str(evt.duration))
@@ -1473,6 +1485,7 @@ def create_subtitle(sub_maker: submaker.SubMaker, text: str, subtitle_file: str)
             with open(subtitle_file, "w", encoding="utf-8") as file:
                 file.write("\n".join(sub_items) + "\n")
             try:
+                from moviepy.video.tools import subtitles
                 sbs = subtitles.file_to_subtitles(subtitle_file, encoding="utf-8")
                 duration = max([tb for ((ta, tb), txt) in sbs])
                 logger.info(
@@ -1506,7 +1519,121 @@ def get_audio_duration(sub_maker: submaker.SubMaker):
     return sub_maker.offset[-1][1] / 10000000
 
 
-def tts_multiple(task_id: str, list_script: list, voice_name: str, voice_rate: float, voice_pitch: float, tts_engine: str = "azure"):
+# 提前合成的配音：键为 (文本, 语音, 语速, 音调, 引擎) 的哈希，值为返回 (SubMaker, 音频文件) 的 Future
+_prefetched: "OrderedDict[str, Future]" = OrderedDict()
+_prefetched_lock = threading.Lock()
+# 最多保留的提前合成结果数量，超出时丢弃最早的结果
+MAX_PREFETCHED = 256
+
+
+def _prefetch_key(text: str, voice_name: str, voice_rate: float, voice_pitch: float, tts_engine: str) -> str:
+    raw = json.dumps([text, voice_name, float(voice_rate), float(voice_pitch), tts_engine], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _discard_prefetched(future: Future):
+    """删除已丢弃的提前合成结果对应的音频文件"""
+    def remove(done: Future):
+        if done.cancelled() or done.exception() is not None:
+            return
+        _, audio_file = done.result()
+        if audio_file and os.path.exists(audio_file):
+            os.remove(audio_file)
+
+    future.add_done_callback(remove)
+
+
+class TTSPrefetcher:
+    """
+    解说文案流式生成时提前合成配音
+
+    每生成一个片段就提交到后台线程合成，结果按 (文本, 语音, 语速, 音调, 引擎) 记录；
+    随后 tts_multiple 遇到相同参数的片段时直接使用已合成的音频，不再重复请求 TTS 服务
+    """
+
+    def __init__(self, voice_name: str, voice_rate: float, voice_pitch: float, tts_engine: str,
+                 max_workers: Optional[int] = None):
+        self.voice_name = parse_voice_name(voice_name)
+        self.voice_rate = voice_rate
+        self.voice_pitch = voice_pitch
+        self.tts_engine = tts_engine
+        workers = max_workers or int(config.app.get("llm_stream_tts_workers", 2))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="tts-prefetch")
+        self._output_dir = utils.temp_dir("tts_prefetch")
+
+    def submit(self, item: Dict) -> Optional[Future]:
+        """
+        提交一个解说片段进行合成，原声片段（OST=1）和空文案会被跳过
+
+        Args:
+            item: 解说文案片段
+
+        Returns:
+            Optional[Future]: 合成任务，跳过时返回 None
+        """
+        text = item.get("narration") or ""
+        if item.get("OST") == 1 or not text.strip():
+            return None
+        key = _prefetch_key(text, self.voice_name, self.voice_rate, self.voice_pitch, self.tts_engine)
+        with _prefetched_lock:
+            if key in _prefetched:
+                return _prefetched[key]
+            future = self._executor.submit(self._synthesize, key, text)
+            _prefetched[key] = future
+            while len(_prefetched) > MAX_PREFETCHED:
+                _, oldest = _prefetched.popitem(last=False)
+                _discard_prefetched(oldest)
+        return future
+
+    def _synthesize(self, key: str, text: str) -> Tuple[Optional[SubMaker], str]:
+        audio_file = os.path.join(self._output_dir, f"{key}.mp3")
+        try:
+            sub_maker = tts(
+                text=text,
+                voice_name=self.voice_name,
+                voice_rate=self.voice_rate,
+                voice_pitch=self.voice_pitch,
+                voice_file=audio_file,
+                tts_engine=self.tts_engine,
+            )
+        except Exception as e:
+            logger.warning(f"提前合成配音失败，将在生成视频时重新合成: {str(e)}")
+            sub_maker = None
+        if sub_maker is None or not os.path.exists(audio_file):
+            return None, ""
+        return sub_maker, audio_file
+
+    def close(self, wait: bool = False):
+        """停止接收新片段，已提交的合成任务继续在后台完成"""
+        self._executor.shutdown(wait=wait)
+
+
+def _take_prefetched(text: str, voice_name: str, voice_rate: float, voice_pitch: float, tts_engine: str,
+                     audio_file: str) -> Optional[SubMaker]:
+    """
+    取出提前合成的配音并移动到 audio_file
+
+    Returns:
+        Optional[SubMaker]: 没有可用的提前合成结果时返回 None
+    """
+    key = _prefetch_key(text, voice_name, voice_rate, voice_pitch, tts_engine)
+    with _prefetched_lock:
+        future = _prefetched.pop(key, None)
+    if future is None:
+        return None
+    try:
+        sub_maker, prefetched_file = future.result()
+    except Exception:
+        return None
+    if sub_maker is None or not os.path.exists(prefetched_file):
+        return None
+    shutil.move(prefetched_file, audio_file)
+    logger.info(f"使用提前合成的配音: {audio_file}")
+    return sub_maker
+
+
+def tts_multiple(task_id: str, list_script: list, voice_name: str, voice_rate: float, voice_pitch: float, tts_engine: str = "azure",
+                 output_dir: Optional[str] = None):
     """
     根据JSON文件中的多段文本进行TTS转换
     
@@ -1515,10 +1642,12 @@ def tts_multiple(task_id: str, list_script: list, voice_name: str, voice_rate: f
     :param voice_name: 语音名称
     :param voice_rate: 语音速率
     :param tts_engine: TTS 引擎
+    :param output_dir: 音频和字幕的输出目录，默认为任务目录
     :return: 生成的音频文件列表
     """
     voice_name = parse_voice_name(voice_name)
-    output_dir = utils.task_dir(task_id)
+    output_dir = output_dir or utils.task_dir(task_id)
+    os.makedirs(output_dir, exist_ok=True)
     tts_results = []
 
     for item in list_script:
@@ -1530,14 +1659,20 @@ def tts_multiple(task_id: str, list_script: list, voice_name: str, voice_rate: f
 
             text = item['narration']
 
-            sub_maker = tts(
-                text=text,
-                voice_name=voice_name,
-                voice_rate=voice_rate,
-                voice_pitch=voice_pitch,
-                voice_file=audio_file,
-                tts_engine=tts_engine,
-            )
+            with metrics.stage("tts_segment", segment=item['_id']) as tts_stage:
+                sub_maker = _take_prefetched(text, voice_name, voice_rate, voice_pitch, tts_engine, audio_file)
+                if sub_maker is None:
+                    sub_maker = tts(
+                        text=text,
+                        voice_name=voice_name,
+                        voice_rate=voice_rate,
+                        voice_pitch=voice_pitch,
+                        voice_file=audio_file,
+                        tts_engine=tts_engine,
+                    )
+                tts_stage.add(characters=len(text))
+                if sub_maker is not None and os.path.exists(audio_file):
+                    tts_stage.add(output_bytes=os.path.getsize(audio_file))
 
             if sub_maker is None:
                 logger.error(f"无法为时间戳 {timestamp} 生成音频; "
@@ -1602,7 +1737,12 @@ def get_audio_duration_from_file(audio_file: str, text: str = None) -> float:
         return duration
 
     # 方法 2: 使用 moviepy（如果可用）
-    if MOVIEPY_AVAILABLE:
+    try:
+        from moviepy import AudioFileClip
+    except ImportError:
+        AudioFileClip = None
+        logger.warning("moviepy 未安装，将使用估算方法计算音频时长")
+    if AudioFileClip is not None:
         try:
             audio_clip = AudioFileClip(audio_file)
             duration = audio_clip.duration
@@ -1788,7 +1928,7 @@ def qwen3_tts(text: str, voice_name: str, voice_file: str, speed: float = 1.0) -
     
                 if audio_url:
                     # 直接下载音频文件
-                    response = requests.get(audio_url, timeout=30)
+                    response = http_client.get(audio_url, timeout=(10, 30))
                     response.raise_for_status()
                     audio_bytes = response.content
                 else:
@@ -1808,7 +1948,7 @@ def qwen3_tts(text: str, voice_name: str, voice_file: str, speed: float = 1.0) -
                 f.write(audio_bytes)
 
             # 估算字幕
-            sub = SubMaker()
+            sub = _new_sub_maker()
             est_ms = max(800, int(len(text) * 180))
             sub.create_sub((0, est_ms), text)
             
@@ -1902,7 +2042,7 @@ def tencent_tts(text: str, voice_name: str, voice_file: str, speed: float = 1.0)
                 f.write(audio_data)
 
             # 创建字幕对象
-            sub_maker = SubMaker()
+            sub_maker = _new_sub_maker()
             if resp.Subtitles:
                 for sub in resp.Subtitles:
                     start_ms = sub.BeginTime
@@ -1964,56 +2104,41 @@ def soulvoice_tts(text: str, voice_name: str, voice_file: str, speed: float = 1.
         'speed': speed
     }
 
-    # 重试机制
-    for attempt in range(3):
-        try:
-            logger.info(f"第 {attempt + 1} 次调用 SoulVoice API")
-
-            # 设置代理
-            proxies = {}
-            if config.proxy.get("http"):
-                proxies = {
-                    'http': config.proxy.get("http"),
-                    'https': config.proxy.get("https", config.proxy.get("http"))
-                }
-
-            # 调用 API
-            response = requests.post(
-                api_url,
-                headers=headers,
-                json=data,
-                proxies=proxies,
-                timeout=60
-            )
-
-            if response.status_code == 200:
-                # 保存音频文件
-                with open(voice_file, 'wb') as f:
-                    f.write(response.content)
+    # 连接复用和代理由共享 HTTP 客户端处理；合成请求可以安全重放，429/5xx 时按 Retry-After 重试（读取超时不重放）
+    try:
+        logger.info("调用 SoulVoice API")
+        response = http_client.post(
+            api_url,
+            headers=headers,
+            json=data,
+            timeout=(10, 60),
+            retry_status=True
+        )
 
-                logger.info(f"SoulVoice TTS 成功生成音频: {voice_file}")
+        if response.status_code == 200:
+            # 保存音频文件
+            with open(voice_file, 'wb') as f:
+                f.write(response.content)
 
-                # SoulVoice 不支持精确字幕生成，返回简单的 SubMaker 对象
-                sub_maker = SubMaker()
-                sub_maker.subs = [text]  # 整个文本作为一个段落
-                sub_maker.offset = [(0, 0)]  # 占位时间戳
+            logger.info(f"SoulVoice TTS 成功生成音频: {voice_file}")
 
-                return sub_maker
+            # SoulVoice 不支持精确字幕生成，返回简单的 SubMaker 对象
+            sub_maker = _new_sub_maker()
+            sub_maker.subs = [text]  # 整个文本作为一个段落
+            sub_maker.offset = [(0, 0)]  # 占位时间戳
 
-            else:
-                logger.error(f"SoulVoice API 调用失败: {response.status_code} - {response.text}")
+            return sub_maker
 
-        except requests.exceptions.Timeout:
-            logger.error(f"SoulVoice API 调用超时 (尝试 {attempt + 1}/3)")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"SoulVoice API 网络错误: {str(e)} (尝试 {attempt + 1}/3)")
-        except Exception as e:
-            logger.error(f"SoulVoice TTS 处理错误: {str(e)} (尝试 {attempt + 1}/3)")
+        logger.error(f"SoulVoice API 调用失败: {response.status_code} - {response.text}")
 
-        if attempt < 2:  # 不是最后一次尝试
-            time.sleep(2)  # 等待2秒后重试
+    except requests.exceptions.Timeout:
+        logger.error("SoulVoice API 调用超时")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"SoulVoice API 网络错误: {str(e)}")
+    except Exception as e:
+        logger.error(f"SoulVoice TTS 处理错误: {str(e)}")
 
-    logger.error("SoulVoice TTS 生成失败，已达到最大重试次数")
+    logger.error("SoulVoice TTS 生成失败")
     return None
 
 
@@ -2080,10 +2205,6 @@ def indextts2_tts(text: str, voice_name: str, voice_file: str, speed: float = 1.
         return None
 
     # 准备请求数据
-    files = {
-        'prompt_audio': open(reference_audio_path, 'rb')
-    }
-    
     data = {
         'text': text.strip(),
         'infer_mode': infer_mode,
@@ -2095,69 +2216,45 @@ def indextts2_tts(text: str, voice_name: str, voice_file: str, speed: float = 1.
         'repetition_penalty': repetition_penalty,
     }
 
-    # 重试机制
-    for attempt in range(3):
-        try:
-            logger.info(f"第 {attempt + 1} 次调用 IndexTTS2 API")
-
-            # 设置代理
-            proxies = {}
-            if config.proxy.get("http"):
-                proxies = {
-                    'http': config.proxy.get("http"),
-                    'https': config.proxy.get("https", config.proxy.get("http"))
-                }
-
-            # 调用 API
-            response = requests.post(
-                api_url,
-                files=files,
-                data=data,
-                proxies=proxies,
-                timeout=120  # IndexTTS2 推理可能需要较长时间
-            )
+    # 连接复用和代理由共享 HTTP 客户端处理；合成请求可以安全重放，429/5xx 时按 Retry-After 重试（读取超时不重放）
+    try:
+        logger.info("调用 IndexTTS2 API")
+        # 参考音频先读入内存，重试时请求体可以重复发送
+        with open(reference_audio_path, 'rb') as prompt_audio:
+            prompt_audio_data = prompt_audio.read()
+        response = http_client.post(
+            api_url,
+            files={'prompt_audio': (os.path.basename(reference_audio_path), prompt_audio_data)},
+            data=data,
+            timeout=(10, 120),  # IndexTTS2 推理可能需要较长时间
+            retry_status=True
+        )
 
-            if response.status_code == 200:
-                # 保存音频文件
-                with open(voice_file, 'wb') as f:
-                    f.write(response.content)
+        if response.status_code == 200:
+            # 保存音频文件
+            with open(voice_file, 'wb') as f:
+                f.write(response.content)
 
-                logger.info(f"IndexTTS2 成功生成音频: {voice_file}, 大小: {len(response.content)} 字节")
+            logger.info(f"IndexTTS2 成功生成音频: {voice_file}, 大小: {len(response.content)} 字节")
 
-                # IndexTTS2 不支持精确字幕生成，返回简单的 SubMaker 对象
-                sub_maker = SubMaker()
-                # 估算音频时长（基于文本长度）
-                estimated_duration_ms = max(1000, int(len(text) * 200))
-                sub_maker.create_sub((0, estimated_duration_ms * 10000), text)
+            # IndexTTS2 不支持精确字幕生成，返回简单的 SubMaker 对象
+            sub_maker = _new_sub_maker()
+            # 估算音频时长（基于文本长度）
+            estimated_duration_ms = max(1000, int(len(text) * 200))
+            sub_maker.create_sub((0, estimated_duration_ms * 10000), text)
 
-                return sub_maker
+            return sub_maker
 
-            else:
-                logger.error(f"IndexTTS2 API 调用失败: {response.status_code} - {response.text}")
+        logger.error(f"IndexTTS2 API 调用失败: {response.status_code} - {response.text}")
 
-        except requests.exceptions.Timeout:
-            logger.error(f"IndexTTS2 API 调用超时 (尝试 {attempt + 1}/3)")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"IndexTTS2 API 网络错误: {str(e)} (尝试 {attempt + 1}/3)")
-        except Exception as e:
-            logger.error(f"IndexTTS2 TTS 处理错误: {str(e)} (尝试 {attempt + 1}/3)")
-        finally:
-            # 确保关闭文件
-            try:
-                files['prompt_audio'].close()
-            except:
-                pass
-
-        if attempt < 2:  # 不是最后一次尝试
-            time.sleep(2)  # 等待2秒后重试
-            # 重新打开文件用于下次重试
-            if attempt < 2:
-                try:
-                    files['prompt_audio'] = open(reference_audio_path, 'rb')
-                except:
-                    pass
-
-    logger.error("IndexTTS2 TTS 生成失败，已达到最大重试次数")
+    except requests.exceptions.Timeout:
+        logger.error("IndexTTS2 API 调用超时")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"IndexTTS2 API 网络错误: {str(e)}")
+    except Exception as e:
+        logger.error(f"IndexTTS2 TTS 处理错误: {str(e)}")
+
+    logger.error("IndexTTS2 TTS 生成失败")
     return None
 
 
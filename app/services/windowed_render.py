@@ -0,0 +1,196 @@
+"""
+按时间窗口分段渲染长视频
+
+merge_materials / merge_narration_to_full_video 会为整部视频创建 VideoFileClip 和所有音轨的 CompositeAudioClip，
+内存占用和失败后需要重做的范围都随时长增长，2~3 小时的原片在 8 GB 的机器上无法完成。这里：
+- 按帧对齐把时间轴切分为固定长度（render_window_minutes）的窗口
+- 每个窗口只渲染画面和字幕（options 的 time_range + video_only），可在多个进程中并行（render_window_workers）
+- 某个窗口失败时只重试该窗口（render_window_retries）
+- 音轨由调用方单独混合整条（只解码音频，内存占用很小），最后与各窗口无损拼接（-c copy）后封装
+
+用法:
+    if windowed_render.should_window(duration, options):
+        return windowed_render.render(merge_materials, kwargs, duration, fps, mixed_audio_path, work_dir)
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.config import config
+from app.utils import ffmpeg_runner, render_profile, resource_scheduler
+
+
+def window_seconds() -> float:
+    """窗口长度（秒），0 表示不分窗口"""
+    return max(0.0, float(config.app.get("render_window_minutes", 10) or 0) * 60)
+
+
+def should_window(duration: float, options: Optional[Dict[str, Any]]) -> bool:
+    """
+    是否需要分窗口渲染：视频长于一个窗口，且当前调用不是窗口本身（已指定 time_range 或 video_only）
+
+    Args:
+        duration: 视频时长（秒）
+        options: merge_materials / merge_narration_to_full_video 的选项
+    """
+    options = options or {}
+    window = window_seconds()
+    return bool(window) and duration > window and not options.get("time_range") and not options.get("video_only")
+
+
+def plan_windows(duration: float, window: float, fps: Optional[float] = None) -> List[Tuple[float, float]]:
+    """
+    切分时间窗口，边界对齐到帧（拼接后每个窗口的实际时长与窗口区间一致，音画不会逐窗口累积偏移）
+
+    Args:
+        duration: 视频时长（秒）
+        window: 窗口长度（秒）
+        fps: 输出帧率，未知时不做帧对齐
+
+    Returns:
+        List[Tuple[float, float]]: [(开始秒, 结束秒)]
+    """
+    if window <= 0 or duration <= window:
+        return [(0.0, duration)]
+    if fps:
+        frames = max(1, int(round(window * fps)))
+        window = frames / fps
+    windows = []
+    index = 0
+    while index * window < duration:
+        start = index * window
+        windows.append((start, min(duration, (index + 1) * window)))
+        index += 1
+    # 最后一个窗口不足一帧时并入前一个窗口
+    if len(windows) > 1 and fps and windows[-1][1] - windows[-1][0] < 1 / fps:
+        windows[-2] = (windows[-2][0], windows[-1][1])
+        windows.pop()
+    return windows
+
+
+def _render_window(render_fn: Callable[..., str], kwargs: Dict[str, Any],
+                   profile: Optional[render_profile.RenderProfile]) -> str:
+    """在（可能是子进程的）当前进程中渲染一个窗口；子进程中没有父进程的上下文，需要重新启用渲染档位"""
+    with render_profile.use(profile):
+        return render_fn(**kwargs)
+
+
+def _window_jobs(kwargs: Dict[str, Any], options: Dict[str, Any], windows: List[Tuple[float, float]],
+                 work_dir: str, threads: Optional[int]) -> Dict[int, Dict[str, Any]]:
+    """每个窗口的渲染参数：只渲染窗口区间的画面，输出到 work_dir"""
+    jobs = {}
+    for i, (start, end) in enumerate(windows):
+        window_options = dict(options, time_range=(start, end), video_only=True)
+        if threads:
+            window_options["threads"] = threads
+        jobs[i] = dict(kwargs, output_path=os.path.join(work_dir, f"window_{i:04d}.mp4"), options=window_options)
+    return jobs
+
+
+def _render_sequential(render_fn: Callable[..., str], jobs: Dict[int, Dict[str, Any]],
+                       profile: Optional[render_profile.RenderProfile], retries: int):
+    """在当前进程中逐个渲染窗口，失败的窗口最多重试 retries 次"""
+    with ffmpeg_runner.progress_scope(0, 0.95):
+        for done, i in enumerate(sorted(jobs), start=1):
+            attempts = 0
+            while True:
+                attempts += 1
+                try:
+                    _render_window(render_fn, jobs[i], profile)
+                    break
+                except Exception as e:
+                    if attempts > retries:
+                        raise
+                    logger.warning(f"窗口 {i + 1}/{len(jobs)} 渲染失败，重试（第 {attempts} 次）: {e}")
+            ffmpeg_runner.report_progress(done / len(jobs))
+
+
+def _render_parallel(render_fn: Callable[..., str], jobs: Dict[int, Dict[str, Any]],
+                     profile: Optional[render_profile.RenderProfile], retries: int, workers: int):
+    """在 workers 个子进程中并行渲染窗口，失败的窗口最多重试 retries 次"""
+    attempts = {i: 0 for i in jobs}
+    done = 0
+    with ffmpeg_runner.progress_scope(0, 0.95):
+        # spawn：子进程不继承父进程的线程和锁（日志、资源调度等），避免 fork 后死锁
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = {executor.submit(_render_window, render_fn, jobs[i], profile): i for i in jobs}
+            while futures:
+                future = next(as_completed(futures))
+                i = futures.pop(future)
+                attempts[i] += 1
+                try:
+                    future.result()
+                except Exception as e:
+                    if attempts[i] > retries:
+                        for other in futures:
+                            other.cancel()
+                        raise
+                    logger.warning(f"窗口 {i + 1}/{len(jobs)} 渲染失败，重试（第 {attempts[i]} 次）: {e}")
+                    futures[executor.submit(_render_window, render_fn, jobs[i], profile)] = i
+                    continue
+                done += 1
+                ffmpeg_runner.report_progress(done / len(jobs))
+
+
+def render(render_fn: Callable[..., str], kwargs: Dict[str, Any], duration: float, fps: Optional[float],
+           audio_path: Optional[str], work_dir: str) -> str:
+    """
+    分窗口渲染并拼接
+
+    Args:
+        render_fn: 渲染函数（merge_materials / merge_narration_to_full_video，需要是模块级函数以便传给子进程）
+        kwargs: 渲染函数的完整参数，output_path 为最终输出路径
+        duration: 视频时长（秒）
+        fps: 输出帧率，用于窗口边界对齐
+        audio_path: 已混合好的整条音轨，为空时输出无声视频
+        work_dir: 窗口文件目录
+
+    Returns:
+        str: 最终输出路径
+    """
+    output_path = kwargs["output_path"]
+    options = dict(kwargs.get("options") or {})
+    windows = plan_windows(duration, window_seconds(), fps)
+    workers = max(1, min(int(config.app.get("render_window_workers", 1)), len(windows)))
+    retries = max(0, int(config.app.get("render_window_retries", 1)))
+    profile = render_profile.current()
+    os.makedirs(work_dir, exist_ok=True)
+    logger.info(f"分窗口渲染：{len(windows)} 个窗口，每个 {window_seconds() / 60:.1f} 分钟，{workers} 个进程")
+
+    if workers == 1:
+        # 在当前进程中逐个渲染：每个窗口的编码自行借出 CPU 线程，这里不持有，避免嵌套等待同一资源池
+        jobs = _window_jobs(kwargs, options, windows, work_dir, options.get("threads"))
+        _render_sequential(render_fn, jobs, profile, retries)
+    else:
+        # 子进程有各自的调度器，不知道其他进程的占用：由父进程按总线程数借出，再平分给各进程
+        with resource_scheduler.cpu(options.get("threads", 2)) as granted_threads:
+            jobs = _window_jobs(kwargs, options, windows, work_dir, max(1, granted_threads // workers))
+            _render_parallel(render_fn, jobs, profile, retries, workers)
+
+    window_paths = [jobs[i]["output_path"] for i in sorted(jobs)]
+    concat_file = os.path.join(work_dir, "windows.txt")
+    with open(concat_file, "w", encoding="utf-8") as f:
+        for window_path in window_paths:
+            f.write(f"file '{os.path.abspath(window_path)}'\n")
+
+    cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", concat_file]
+    maps = ["-map", "0:v:0"]
+    if audio_path:
+        cmd += ["-i", audio_path]
+        maps += ["-map", "1:a:0"]
+    cmd += maps + ["-c", "copy", "-movflags", "+faststart", output_path]
+    with ffmpeg_runner.progress_scope(0.95, 1.0):
+        ffmpeg_runner.run(cmd)
+
+    for window_path in window_paths:
+        try:
+            os.remove(window_path)
+        except OSError:
+            pass
+    logger.success(f"分窗口渲染完成: {output_path}")
+    return output_path
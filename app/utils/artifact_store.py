@@ -0,0 +1,449 @@
+"""
+带磁盘配额的产物存储
+
+管理 storage 下会持续增长的缓存目录（裁剪片段、关键帧、任务目录、素材缓存、跨任务片段缓存）：
+- 每个类别有独立的配额，超出后按最近访问时间（LRU）淘汰最旧的条目；
+  任务目录（tasks）保存最终成片，只登记占用，不参与淘汰
+- 正在使用的条目可以被固定（pin），固定期间不会被淘汰
+- 生产方在写入前 pin()、写入完成后 commit() 登记；lookup() 只返回已登记的条目，
+  磁盘写满等原因留下的半成品（未登记且未固定）不会被当作缓存命中，会在下次查找时被清理
+- 在 retain() 上下文内调用 release() 时，条目保持固定直到上下文结束（如任务后续步骤还要读取裁剪片段）
+- 条目大小和各类别总量记录在 SQLite 索引中，配额检查不需要遍历目录
+
+使用示例:
+    store = artifact_store.get_store()
+    path = store.lookup("keyframes", video_hash)
+    if path is None:
+        with store.pinned("keyframes", video_hash) as path:
+            ...  # 生成内容
+            store.commit("keyframes", video_hash)
+"""
+
+import contextvars
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from app.config import config
+
+# 类别 -> storage 下的相对目录
+CATEGORIES = {
+    "clips": os.path.join("temp", "clip_video_unified"),
+    "keyframes": os.path.join("temp", "keyframes"),
+    "tasks": "tasks",
+    "cache_videos": "cache_videos",
+    "segments": os.path.join("temp", "clip_cache"),
+    "proxies": os.path.join("temp", "transcription_proxies"),
+}
+
+# 只登记占用、不参与淘汰的类别（任务目录中是用户的成片）
+UNEVICTABLE_CATEGORIES = ("tasks",)
+
+# 默认配额（MB），0 表示不限制
+DEFAULT_QUOTAS_MB = {
+    "clips": 20 * 1024,
+    "keyframes": 5 * 1024,
+    "cache_videos": 20 * 1024,
+    "segments": 20 * 1024,
+    "proxies": 10 * 1024,
+}
+
+# 固定超过该时间（秒）视为进程异常退出后遗留，不再阻止淘汰
+STALE_PIN_SECONDS = 24 * 3600
+
+_MB = 1024 * 1024
+
+# retain() 上下文内推迟解除固定的条目 [(类别, 键)]
+_retained: contextvars.ContextVar = contextvars.ContextVar("narrato_artifact_retained", default=None)
+
+
+def _entry_size(path: str) -> int:
+    """计算单个条目（文件或目录）的大小"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"删除缓存文件失败: {path}, {e}")
+
+
+class ArtifactStore:
+    """带配额和 LRU 淘汰的产物存储，索引保存在 storage/artifacts.db"""
+
+    def __init__(self, root: str, index_path: Optional[str] = None,
+                 quotas_mb: Optional[Dict[str, float]] = None, min_free_mb: float = 0):
+        self.root = root
+        self.quotas = {
+            category: int(float(quota) * _MB)
+            for category, quota in (quotas_mb or DEFAULT_QUOTAS_MB).items()
+        }
+        self.min_free_bytes = int(min_free_mb * _MB)
+        self._index_path = index_path or os.path.join(root, "artifacts.db")
+        self._local = threading.local()
+        self._lock = threading.RLock()
+
+        os.makedirs(root, exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS artifacts (
+                category TEXT NOT NULL,
+                key TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                pins INTEGER NOT NULL DEFAULT 0,
+                pinned_at REAL,
+                complete INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (category, key)
+            );
+            CREATE INDEX IF NOT EXISTS idx_artifacts_lru ON artifacts (category, pins, last_access);
+            CREATE TABLE IF NOT EXISTS totals (
+                category TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+            """
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._index_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connection()
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _add_total(conn: sqlite3.Connection, category: str, delta: int):
+        conn.execute(
+            "INSERT INTO totals (category, size) VALUES (?, ?) "
+            "ON CONFLICT(category) DO UPDATE SET size = size + excluded.size",
+            (category, delta),
+        )
+
+    def category_dir(self, category: str) -> str:
+        if category not in CATEGORIES:
+            raise ValueError(f"未知的产物类别: {category}")
+        return os.path.join(self.root, CATEGORIES[category])
+
+    def path(self, category: str, key: str) -> str:
+        """条目在磁盘上的路径（不会创建）"""
+        return os.path.join(self.category_dir(category), key)
+
+    def lookup(self, category: str, key: str) -> Optional[str]:
+        """
+        查找已登记的条目并更新访问时间
+
+        未完成（正在写入或写入中断）以及已被外部删除的条目返回 None，
+        没有被固定的未完成条目视为写入中断留下的半成品，会被直接删除
+
+        Returns:
+            str: 条目路径，不存在时返回 None
+        """
+        path = self.path(category, key)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT size, complete FROM artifacts WHERE category = ? AND key = ?", (category, key)
+            ).fetchone()
+            if row is not None and row[1]:
+                if os.path.exists(path):
+                    conn.execute(
+                        "UPDATE artifacts SET last_access = ? WHERE category = ? AND key = ?",
+                        (time.time(), category, key),
+                    )
+                    return path
+                # 已被外部删除
+                conn.execute("DELETE FROM artifacts WHERE category = ? AND key = ?", (category, key))
+                self._add_total(conn, category, -row[0])
+                return None
+
+        if os.path.exists(path) and not self._is_pinned(category, key):
+            logger.warning(f"发现未完成的缓存条目，已删除: {path}")
+            self.discard(category, key)
+        return None
+
+    def _is_pinned(self, category: str, key: str) -> bool:
+        row = self._connection().execute(
+            "SELECT pins, pinned_at FROM artifacts WHERE category = ? AND key = ?", (category, key)
+        ).fetchone()
+        return bool(row and row[0] > 0 and row[1] and time.time() - row[1] < STALE_PIN_SECONDS)
+
+    def commit(self, category: str, key: str, path: Optional[str] = None) -> Optional[str]:
+        """
+        登记写入完成的条目，并在超出配额时淘汰旧条目
+
+        Args:
+            category: 类别
+            key: 条目键（类别目录下的文件或目录名）
+            path: 条目路径，默认为 self.path(category, key)
+
+        Returns:
+            str: 条目路径；条目不存在时返回 None
+        """
+        path = path or self.path(category, key)
+        if not os.path.exists(path):
+            return None
+        size = _entry_size(path)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT size FROM artifacts WHERE category = ? AND key = ?", (category, key)
+            ).fetchone()
+            conn.execute(
+                """
+                INSERT INTO artifacts (category, key, path, size, last_access, complete)
+                VALUES (?, ?, ?, ?, ?, 1)
+                ON CONFLICT(category, key) DO UPDATE SET
+                    path = excluded.path, size = excluded.size, last_access = excluded.last_access, complete = 1
+                """,
+                (category, key, path, size, time.time()),
+            )
+            self._add_total(conn, category, size - (row[0] if row else 0))
+        self.enforce_quota(category)
+        return path
+
+    def discard(self, category: str, key: str):
+        """删除条目（文件和索引）"""
+        path = self.path(category, key)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT size, path FROM artifacts WHERE category = ? AND key = ?", (category, key)
+            ).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM artifacts WHERE category = ? AND key = ?", (category, key))
+                self._add_total(conn, category, -row[0])
+                path = row[1]
+        _remove(path)
+
+    def pin(self, category: str, key: str) -> str:
+        """
+        固定条目，防止正在使用的产物被淘汰，需与 unpin() 成对调用
+
+        条目尚未登记时会先登记为未完成状态（lookup() 不会命中），写入完成后由调用方 commit()
+
+        Returns:
+            str: 条目路径
+        """
+        path = self.path(category, key)
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                INSERT INTO artifacts (category, key, path, size, last_access, pins, pinned_at)
+                VALUES (?, ?, ?, 0, ?, 1, ?)
+                ON CONFLICT(category, key) DO UPDATE SET
+                    pins = pins + 1, pinned_at = excluded.pinned_at, last_access = excluded.last_access
+                """,
+                (category, key, path, now, now),
+            )
+        return path
+
+    def unpin(self, category: str, key: str):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE artifacts SET pins = MAX(pins - 1, 0) WHERE category = ? AND key = ?",
+                (category, key),
+            )
+
+    @contextmanager
+    def pinned(self, category: str, key: str) -> Iterator[str]:
+        """在上下文内固定条目，见 pin()"""
+        path = self.pin(category, key)
+        try:
+            yield path
+        finally:
+            self.unpin(category, key)
+
+    def release(self, category: str, key: str):
+        """解除 pin() 的固定；在 retain() 上下文内时推迟到上下文结束"""
+        retained = _retained.get()
+        if retained is not None:
+            retained.append((category, key))
+        else:
+            self.unpin(category, key)
+
+    @contextmanager
+    def retain(self) -> Iterator[None]:
+        """上下文内 release() 的条目保持固定，退出上下文时（包括异常）统一解除"""
+        retained = []
+        token = _retained.set(retained)
+        try:
+            yield
+        finally:
+            _retained.reset(token)
+            for category, key in reversed(retained):
+                self.unpin(category, key)
+
+    def usage(self, category: Optional[str] = None) -> Dict[str, int]:
+        """各类别已登记的总大小（字节）"""
+        conn = self._connection()
+        if category:
+            row = conn.execute("SELECT size FROM totals WHERE category = ?", (category,)).fetchone()
+            return {category: row[0] if row else 0}
+        return {name: size for name, size in conn.execute("SELECT category, size FROM totals")}
+
+    def _free_bytes(self) -> int:
+        try:
+            return shutil.disk_usage(self.root).free
+        except OSError:
+            return 0
+
+    def enforce_quota(self, category: str, reserve_bytes: int = 0) -> int:
+        """
+        淘汰最久未访问的未固定条目，直到类别总量加上 reserve_bytes 不超过配额，
+        且磁盘剩余空间不低于 artifact_min_free_mb
+
+        Args:
+            category: 类别
+            reserve_bytes: 即将写入的数据量
+
+        Returns:
+            int: 释放的字节数
+        """
+        if category in UNEVICTABLE_CATEGORIES:
+            return 0
+        quota = self.quotas.get(category, 0)
+        used = self.usage(category)[category]
+        over_quota = used + reserve_bytes - quota if quota > 0 else 0
+        under_free = self.min_free_bytes + reserve_bytes - self._free_bytes() if self.min_free_bytes else 0
+        need = max(over_quota, under_free)
+        if need <= 0:
+            return 0
+
+        freed = 0
+        stale_before = time.time() - STALE_PIN_SECONDS
+        candidates = self._connection().execute(
+            "SELECT key, path, size FROM artifacts "
+            "WHERE category = ? AND (pins = 0 OR pinned_at < ?) ORDER BY last_access",
+            (category, stale_before),
+        ).fetchall()
+        for key, path, size in candidates:
+            if freed >= need:
+                break
+            with self._transaction() as conn:
+                deleted = conn.execute(
+                    "DELETE FROM artifacts WHERE category = ? AND key = ? AND (pins = 0 OR pinned_at < ?)",
+                    (category, key, stale_before),
+                ).rowcount
+                if deleted:
+                    self._add_total(conn, category, -size)
+            if deleted:
+                _remove(path)
+                freed += size
+                logger.info(f"淘汰缓存 [{category}] {key} ({size / _MB:.1f} MB)")
+
+        if freed < need:
+            logger.warning(f"缓存类别 {category} 无法释放足够空间: 需要 {need / _MB:.1f} MB，"
+                           f"已释放 {freed / _MB:.1f} MB（其余条目正在使用）")
+        return freed
+
+    def ensure_space(self, category: str, expected_bytes: int) -> bool:
+        """
+        写入大文件前预留空间
+
+        Returns:
+            bool: 淘汰后磁盘剩余空间是否足够写入 expected_bytes
+        """
+        self.enforce_quota(category, reserve_bytes=expected_bytes)
+        return self._free_bytes() >= expected_bytes + self.min_free_bytes
+
+    def adopt_existing(self, category: str) -> int:
+        """
+        登记目录中已存在但不在索引里的条目（升级前生成的缓存），只需在首次启用时运行
+
+        Returns:
+            int: 新登记的条目数
+        """
+        directory = self.category_dir(category)
+        if not os.path.isdir(directory):
+            return 0
+        known = {key for (key,) in self._connection().execute(
+            "SELECT key FROM artifacts WHERE category = ?", (category,))}
+        adopted = 0
+        for name in os.listdir(directory):
+            if name in known:
+                continue
+            path = os.path.join(directory, name)
+            size = _entry_size(path)
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO artifacts (category, key, path, size, last_access, complete) "
+                    "VALUES (?, ?, ?, ?, ?, 1)",
+                    (category, name, path, size, os.path.getmtime(path)),
+                )
+                self._add_total(conn, category, size)
+            adopted += 1
+        if adopted:
+            logger.info(f"已登记 {adopted} 个现有缓存条目 [{category}]")
+        return adopted
+
+    def entries(self, category: str) -> List[Dict]:
+        """按最近访问时间排序的条目列表"""
+        rows = self._connection().execute(
+            "SELECT key, path, size, last_access, pins FROM artifacts WHERE category = ? "
+            "ORDER BY last_access DESC", (category,)
+        ).fetchall()
+        return [
+            {"key": key, "path": path, "size": size, "last_access": last_access, "pins": pins}
+            for key, path, size, last_access, pins in rows
+        ]
+
+
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ArtifactStore:
+    """全局产物存储，首次调用时根据配置创建并登记已有缓存"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from app.utils import utils
+
+                quotas = {
+                    category: config.app.get(f"artifact_quota_{category}_mb", default)
+                    for category, default in DEFAULT_QUOTAS_MB.items()
+                }
+                store = ArtifactStore(
+                    root=utils.storage_dir(create=True),
+                    quotas_mb=quotas,
+                    min_free_mb=config.app.get("artifact_min_free_mb", 2048),
+                )
+                for category in CATEGORIES:
+                    if not store.usage(category)[category]:
+                        store.adopt_existing(category)
+                _store = store
+    return _store
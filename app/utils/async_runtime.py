@@ -0,0 +1,153 @@
+"""
+进程级异步运行时
+
+LLM 服务和部分 TTS 引擎只提供异步接口，而 WebUI 和任务线程都是同步代码。
+以前每次调用都新建事件循环（asyncio.run / new_event_loop），LiteLLM 等库按事件循环缓存的
+异步 HTTP 客户端和连接在调用结束后随循环一起销毁，下一次调用只能重新建立连接。
+
+这里在专用的守护线程中运行一个长期存在的事件循环：
+- submit(coro) 线程安全地把协程提交到该循环，返回 concurrent.futures.Future
+- run(coro) 提交并阻塞等待结果，供同步代码调用
+- 循环在首次使用时启动，进程退出时关闭；fork 出的子进程中会重新创建
+
+用法:
+    from app.utils import async_runtime
+
+    result = async_runtime.run(provider.generate_text(prompt))
+    future = async_runtime.submit(provider.generate_text(prompt))
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import os
+import threading
+from typing import Any, Awaitable, Optional
+
+from loguru import logger
+
+
+class AsyncRuntime:
+    """在专用线程中运行的长期事件循环"""
+
+    def __init__(self, name: str = "narrato-async-runtime"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """运行时的事件循环（首次访问时启动）"""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            return loop
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._start()
+            return self._loop
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run_forever():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            try:
+                loop.run_forever()
+            finally:
+                try:
+                    _cancel_pending(loop)
+                    loop.run_until_complete(loop.shutdown_asyncgens())
+                finally:
+                    loop.close()
+
+        thread = threading.Thread(target=run_forever, name=self.name, daemon=True)
+        thread.start()
+        ready.wait()
+        self._loop, self._thread = loop, thread
+        logger.debug(f"异步运行时已启动: {self.name}")
+
+    def in_runtime_thread(self) -> bool:
+        """当前线程是否为运行时的事件循环线程"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """
+        把协程提交到运行时的事件循环（线程安全）
+
+        Args:
+            coro: 协程对象
+
+        Returns:
+            concurrent.futures.Future: 协程的执行结果
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """
+        在运行时中执行协程并等待结果
+
+        Args:
+            coro: 协程对象
+            timeout: 等待超时（秒），超时后取消协程并抛出 TimeoutError
+
+        Returns:
+            协程的返回值
+        """
+        if self.in_runtime_thread():
+            if hasattr(coro, "close"):
+                coro.close()
+            raise RuntimeError("不能在异步运行时线程中同步等待协程，请直接 await")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def shutdown(self, timeout: float = 5.0):
+        """停止事件循环并等待线程退出"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop, self._thread = None, None
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _reset_after_fork(self):
+        # 事件循环线程不会被 fork 到子进程中，子进程首次使用时重新创建
+        self._loop, self._thread = None, None
+        self._lock = threading.Lock()
+
+
+def _cancel_pending(loop: asyncio.AbstractEventLoop):
+    pending = [task for task in asyncio.all_tasks(loop) if not task.done()]
+    for task in pending:
+        task.cancel()
+    if pending:
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+
+_runtime = AsyncRuntime()
+atexit.register(_runtime.shutdown)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_runtime._reset_after_fork)
+
+
+def get_runtime() -> AsyncRuntime:
+    """获取进程级异步运行时"""
+    return _runtime
+
+
+def submit(coro: Awaitable) -> concurrent.futures.Future:
+    """把协程提交到进程级异步运行时，返回 concurrent.futures.Future"""
+    return _runtime.submit(coro)
+
+
+def run(coro: Awaitable, timeout: Optional[float] = None) -> Any:
+    """在进程级异步运行时中执行协程并等待结果"""
+    return _runtime.run(coro, timeout)
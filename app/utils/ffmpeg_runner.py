@@ -0,0 +1,389 @@
+"""
+共享 FFmpeg 执行器
+
+统一执行耗时的 FFmpeg 编码命令：
+- 自动添加 -progress pipe:1，实时解析 out_time / speed / fps
+- 看门狗线程在输出进度长时间不前进时终止进程并按配置重试，避免编码器卡死导致任务线程永久阻塞
+- 通过 progress_scope() 把单个命令的进度映射到任务进度（sm.state）中
+- 每个命令的编码速度（实时倍速）记录到当前任务的 metrics 阶段中，用于容量规划
+- 每个命令经过 resource_scheduler 分配 CPU 线程、硬件编码会话和磁盘 I/O，多个任务同时渲染时不会超额占用
+
+用法:
+    with ffmpeg_runner.progress_scope(20, 60, callback=lambda p: sm.state.update_task(...)):
+        for i, item in enumerate(items):
+            with ffmpeg_runner.progress_scope(i / len(items), (i + 1) / len(items)):
+                ffmpeg_runner.run(cmd)
+"""
+
+import contextvars
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from app.config import config
+from app.utils import metrics, resource_scheduler
+
+_DURATION_PATTERN = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+
+# 保留的 stderr 尾部行数（错误分析只需要最后的输出）
+STDERR_TAIL_LINES = 400
+
+
+class FFmpegError(subprocess.CalledProcessError):
+    """FFmpeg 执行失败（兼容 subprocess.CalledProcessError，调用方原有的异常处理无需修改）"""
+
+
+class FFmpegStalledError(FFmpegError):
+    """FFmpeg 进度长时间没有前进，进程已被终止"""
+
+
+class FFmpegTimeoutError(FFmpegError):
+    """FFmpeg 超过总超时，进程已被终止（不会重试）"""
+
+
+class FFmpegJobStats:
+    """单个 FFmpeg 命令的执行统计"""
+
+    def __init__(self):
+        self.out_time = 0.0     # 已输出的媒体时长（秒）
+        self.duration = None    # 预期输出时长（秒），未知时为 None
+        self.speed = None       # FFmpeg 报告的实时倍速
+        self.fps = None         # 编码帧率
+        self.frames = 0
+        self.wall_seconds = 0.0
+        self.attempts = 0
+
+    @property
+    def fraction(self) -> Optional[float]:
+        """完成比例，预期时长未知时返回 None"""
+        if not self.duration:
+            return None
+        return max(0.0, min(1.0, self.out_time / self.duration))
+
+    @property
+    def realtime_factor(self) -> Optional[float]:
+        """实际编码速度：输出媒体时长 / 墙钟时间"""
+        if self.wall_seconds <= 0 or self.out_time <= 0:
+            return None
+        return self.out_time / self.wall_seconds
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        return {
+            "out_time": round(self.out_time, 3),
+            "duration": self.duration,
+            "speed": self.speed,
+            "fps": self.fps,
+            "frames": self.frames,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "realtime_factor": round(self.realtime_factor, 3) if self.realtime_factor else None,
+            "attempts": self.attempts,
+        }
+
+
+class _ProgressScope:
+    """进度区间：把 [0, 1] 映射到父区间的 [start, end]"""
+
+    def __init__(self, start: float, end: float, parent: Optional["_ProgressScope"] = None,
+                 callback: Optional[Callable[[float], None]] = None):
+        self.start = start
+        self.end = end
+        self.parent = parent
+        self.callback = callback
+        self._last_reported = None
+
+    def report(self, fraction: float):
+        value = self.start + (self.end - self.start) * max(0.0, min(1.0, fraction))
+        if self.callback is not None:
+            # 只在整数百分比增加时回调：避免频繁写入状态存储，也避免多个连续命令使进度回退
+            rounded = int(value)
+            if self._last_reported is None or rounded > self._last_reported:
+                self._last_reported = rounded
+                try:
+                    self.callback(value)
+                except Exception as e:
+                    logger.debug(f"进度回调失败: {e}")
+        elif self.parent is not None:
+            self.parent.report(value)
+
+
+_current_scope: contextvars.ContextVar = contextvars.ContextVar("narrato_ffmpeg_progress", default=None)
+
+
+@contextmanager
+def progress_scope(start: float, end: float,
+                   callback: Optional[Callable[[float], None]] = None) -> Iterator[_ProgressScope]:
+    """
+    声明一段进度区间
+
+    Args:
+        start: 区间起点。带 callback 时为任务进度值（如 20），否则为父区间内的比例（0~1）
+        end: 区间终点
+        callback: 顶层区间的进度回调，参数为映射后的进度值
+    """
+    parent = None if callback is not None else _current_scope.get()
+    scope = _ProgressScope(start, end, parent, callback)
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+
+
+def report_progress(fraction: float):
+    """向当前进度区间报告完成比例（没有进度区间时忽略）"""
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.report(fraction)
+
+
+def _parse_time(value: str) -> Optional[float]:
+    """解析 HH:MM:SS.xxx 或秒数"""
+    try:
+        if ":" in value:
+            hours, minutes, seconds = value.split(":")
+            return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _expected_duration(cmd: List[str]) -> Optional[float]:
+    """从命令参数中推断输出时长（-t 或 -ss/-to）"""
+    values = {}
+    for idx, arg in enumerate(cmd[:-1]):
+        if arg in ("-t", "-ss", "-to"):
+            parsed = _parse_time(cmd[idx + 1])
+            if parsed is not None:
+                values[arg] = parsed
+    if "-t" in values:
+        return values["-t"]
+    if "-to" in values:
+        return values["-to"] - values.get("-ss", 0.0)
+    return None
+
+
+def _with_progress_args(cmd: List[str]) -> List[str]:
+    """在 ffmpeg 可执行文件之后插入 -progress 参数"""
+    if "-progress" in cmd:
+        return list(cmd)
+    return [cmd[0], "-progress", "pipe:1", "-nostats"] + list(cmd[1:])
+
+
+def _outputs_to_stdout(cmd: List[str]) -> bool:
+    return cmd[-1] in ("-", "pipe:", "pipe:1")
+
+
+def _run_once(cmd: List[str],
+              stats: FFmpegJobStats,
+              stall_timeout: float,
+              deadline: Optional[float]) -> subprocess.CompletedProcess:
+    track_progress = not _outputs_to_stdout(cmd)
+    full_cmd = _with_progress_args(cmd) if track_progress else list(cmd)
+
+    popen_kwargs = {"stdout": subprocess.PIPE, "stderr": subprocess.PIPE, "stdin": subprocess.DEVNULL}
+    if os.name == "nt":
+        popen_kwargs["creationflags"] = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+    process = subprocess.Popen(full_cmd, **popen_kwargs)
+    metrics.record_subprocess()
+
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    stdout_chunks = []
+    last_advance = [time.monotonic()]
+    started = time.monotonic()
+    killed_reason = []
+    timed_out = []
+    finished = threading.Event()
+
+    def read_stderr():
+        for raw in iter(process.stderr.readline, b""):
+            line = raw.decode("utf-8", errors="ignore").rstrip()
+            stderr_tail.append(line)
+            if stats.duration is None:
+                match = _DURATION_PATTERN.search(line)
+                if match:
+                    stats.duration = int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3))
+            if not track_progress:
+                last_advance[0] = time.monotonic()
+
+    def watchdog():
+        while not finished.wait(1.0) and process.poll() is None:
+            now = time.monotonic()
+            if stall_timeout and now - last_advance[0] > stall_timeout:
+                killed_reason.append(f"进度 {stall_timeout:.0f} 秒未更新")
+            elif deadline is not None and now > deadline:
+                killed_reason.append("超过总超时")
+                timed_out.append(True)
+            if killed_reason:
+                process.kill()
+                return
+
+    stderr_thread = threading.Thread(target=read_stderr, daemon=True)
+    stderr_thread.start()
+    watchdog_thread = threading.Thread(target=watchdog, daemon=True)
+    watchdog_thread.start()
+
+    try:
+        if track_progress:
+            block = {}
+            for raw in iter(process.stdout.readline, b""):
+                key, _, value = raw.decode("utf-8", errors="ignore").strip().partition("=")
+                if key != "progress":
+                    block[key] = value
+                    continue
+                _apply_progress_block(block, stats, last_advance)
+                block = {}
+        else:
+            for chunk in iter(lambda: process.stdout.read(65536), b""):
+                stdout_chunks.append(chunk)
+                last_advance[0] = time.monotonic()
+        process.wait()
+    finally:
+        finished.set()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        stderr_thread.join(timeout=5)
+        process.stdout.close()
+        process.stderr.close()
+
+    stats.wall_seconds += time.monotonic() - started
+    stderr_text = "\n".join(stderr_tail)
+
+    if timed_out:
+        raise FFmpegTimeoutError(process.returncode, full_cmd, output=b"", stderr=f"{killed_reason[0]}\n{stderr_text}")
+    if killed_reason:
+        raise FFmpegStalledError(process.returncode, full_cmd, output=b"", stderr=f"{killed_reason[0]}\n{stderr_text}")
+    return subprocess.CompletedProcess(full_cmd, process.returncode, b"".join(stdout_chunks), stderr_text)
+
+
+def _apply_progress_block(block: Dict[str, str], stats: FFmpegJobStats, last_advance: List[float]):
+    """处理一段 -progress 输出（以 progress=continue/end 结尾）"""
+    out_time = None
+    if block.get("out_time_us", "N/A") not in ("N/A", ""):
+        out_time = int(block["out_time_us"]) / 1_000_000
+    elif block.get("out_time", "N/A") not in ("N/A", ""):
+        out_time = _parse_time(block["out_time"])
+
+    frames = block.get("frame")
+    if frames and frames.isdigit() and int(frames) > stats.frames:
+        stats.frames = int(frames)
+        last_advance[0] = time.monotonic()
+
+    if out_time is not None and out_time > stats.out_time:
+        stats.out_time = out_time
+        last_advance[0] = time.monotonic()
+
+    speed = block.get("speed", "").rstrip("x").strip()
+    try:
+        stats.speed = float(speed)
+    except ValueError:
+        pass
+    try:
+        stats.fps = float(block.get("fps", ""))
+    except ValueError:
+        pass
+
+    if stats.fraction is not None:
+        report_progress(stats.fraction)
+
+
+def run(cmd: List[str],
+        check: bool = True,
+        text: bool = True,
+        duration: Optional[float] = None,
+        stall_timeout: Optional[float] = None,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        description: str = "") -> subprocess.CompletedProcess:
+    """
+    执行 FFmpeg 命令，实时解析进度并在卡住时终止重试
+
+    Args:
+        cmd: FFmpeg 命令列表（第一个元素为 ffmpeg 可执行文件）
+        check: 返回码非 0 时是否抛出 FFmpegError
+        text: stderr 是否以 str 返回（否则为 bytes，兼容原有 e.stderr.decode() 写法）
+        duration: 预期输出时长（秒），默认从 -t/-ss/-to 参数或输入时长推断
+        stall_timeout: 进度无变化的最长等待时间（秒），默认读取配置 ffmpeg_stall_timeout
+        timeout: 总超时时间（秒，包含重试），默认读取配置 ffmpeg_timeout，0 表示不限制
+        retries: 卡住后的重试次数，默认读取配置 ffmpeg_stall_retries
+        description: 日志中的描述
+
+    Returns:
+        subprocess.CompletedProcess: stderr 只保留最后 STDERR_TAIL_LINES 行
+
+    Raises:
+        FFmpegStalledError: 重试耗尽后仍然卡住
+        FFmpegTimeoutError: 超过总超时
+        FFmpegError: check=True 且返回码非 0
+    """
+    if stall_timeout is None:
+        stall_timeout = float(config.app.get("ffmpeg_stall_timeout", 120))
+    if timeout is None:
+        timeout = float(config.app.get("ffmpeg_timeout", 0)) or None
+    if retries is None:
+        retries = int(config.app.get("ffmpeg_stall_retries", 1))
+
+    stats = FFmpegJobStats()
+    label = description or os.path.basename(cmd[-1])
+    # 总超时覆盖所有重试，超时后不再重试
+    deadline = time.monotonic() + timeout if timeout else None
+
+    # 从进程级调度器借出 CPU 线程 / 硬件编码会话 / 磁盘 I/O 令牌，并写入显式的线程参数
+    with resource_scheduler.ffmpeg(cmd) as scheduled_cmd:
+        while True:
+            stats.attempts += 1
+            stats.out_time = 0.0
+            stats.frames = 0
+            stats.duration = duration if duration is not None else _expected_duration(cmd)
+            try:
+                result = _run_once(scheduled_cmd, stats, stall_timeout, deadline)
+                break
+            except FFmpegTimeoutError as e:
+                logger.error(f"FFmpeg 任务 {label} 超过总超时 {timeout:.0f} 秒，已终止")
+                _record(stats, "timeout")
+                if not text:
+                    e.stderr = e.stderr.encode("utf-8")
+                raise
+            except FFmpegStalledError as e:
+                if stats.attempts > retries:
+                    logger.error(f"FFmpeg 任务 {label} 卡住，已重试 {retries} 次: {e.stderr.splitlines()[0]}")
+                    _record(stats, "stalled")
+                    if not text:
+                        e.stderr = e.stderr.encode("utf-8")
+                    raise
+                logger.warning(f"FFmpeg 任务 {label} {e.stderr.splitlines()[0]}，终止并重试 "
+                               f"({stats.attempts}/{retries})")
+
+    status = "ok" if result.returncode == 0 else "error"
+    _record(stats, status)
+    if status == "ok":
+        report_progress(1.0)
+        factor = stats.realtime_factor
+        logger.debug(f"FFmpeg 任务 {label} 完成: 输出 {stats.out_time:.1f}s, 耗时 {stats.wall_seconds:.1f}s"
+                     + (f", {factor:.2f}x 实时" if factor else ""))
+
+    stderr = result.stderr if text else result.stderr.encode("utf-8")
+    result = subprocess.CompletedProcess(result.args, result.returncode, result.stdout, stderr)
+    result.stats = stats
+    if check and result.returncode != 0:
+        raise FFmpegError(result.returncode, result.args, output=result.stdout, stderr=stderr)
+    return result
+
+
+def _record(stats: FFmpegJobStats, status: str):
+    """把编码速度累加到当前 metrics 阶段"""
+    stage = metrics.current_stage()
+    if stage is None:
+        return
+    stage.add(ffmpeg_jobs=1,
+              ffmpeg_media_seconds=stats.out_time,
+              ffmpeg_wall_seconds=stats.wall_seconds,
+              ffmpeg_retries=stats.attempts - 1,
+              ffmpeg_failures=0 if status == "ok" else 1)
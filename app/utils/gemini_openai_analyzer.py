@@ -16,7 +16,7 @@ import PIL.Image
 import traceback
 import base64
 import io
-from app.utils import utils
+from app.utils import utils, async_runtime
 
 
 class GeminiOpenAIAnalyzer:
@@ -174,4 +174,4 @@ class GeminiOpenAIAnalyzer:
         """
         同步版本的图片分析方法
         """
-        return asyncio.run(self.analyze_images(images, prompt, batch_size))
+        return async_runtime.run(self.analyze_images(images, prompt, batch_size))
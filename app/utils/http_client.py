@@ -0,0 +1,199 @@
+"""
+共享 HTTP 客户端
+
+为 TTS、素材下载和 LLM REST 调用提供统一的连接池会话：
+- 全局共享一个 requests.Session，按主机复用 keep-alive 连接，避免每次请求重新建立 TCP/TLS 连接
+- 连接池大小、超时时间、重试次数和退避系数均可在 config.toml 的 [app] 中配置
+- 重试与指数退避由 urllib3 Retry 统一处理，调用方无需再手写 for/sleep 重试循环
+- 只有幂等方法（GET、HEAD、PUT、DELETE 等）在读取超时和 429/5xx 时重试；POST 等非幂等方法只在连接失败
+  （请求还没有发出）时重试，避免服务端已经处理的 TTS/LLM 请求被重复提交
+- 可以安全重放的 POST（TTS 合成、LLM 生成等）通过 retry_status=True 在 429/502/503/504 时重试，
+  遵守 Retry-After；读取超时仍然不重放
+- 读取超时重试耗尽时抛出 requests.exceptions.ReadTimeout（而不是 ConnectionError），调用方可以按超时处理
+"""
+
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ReadTimeoutError
+from urllib3.util.retry import Retry
+from loguru import logger
+
+from app.config import config
+
+# 需要自动重试的 HTTP 状态码（限流和服务端临时错误）
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# 非幂等请求显式允许重放时重试的状态码（不包括 500：请求可能已被部分处理）
+REPLAYABLE_STATUS_CODES = (429, 502, 503, 504)
+
+# Retry-After 等待时间上限（秒）
+MAX_RETRY_AFTER = 60.0
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _build_retry() -> Retry:
+    """根据配置构建统一的重试策略"""
+    max_retries = int(config.app.get("http_max_retries", 2))
+    return Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=float(config.app.get("http_backoff_factor", 1.0)),
+        status_forcelist=RETRY_STATUS_CODES,
+        # 读取超时和状态码重试只用于幂等方法；连接失败对所有方法都重试
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        respect_retry_after_header=True,
+        # 重试耗尽后返回最后一次响应，由调用方检查状态码
+        raise_on_status=False,
+    )
+
+
+def _create_session() -> requests.Session:
+    """创建带连接池和重试策略的会话"""
+    pool_connections = int(config.app.get("http_pool_connections", 10))
+    pool_maxsize = int(config.app.get("http_pool_maxsize", 20))
+
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=_build_retry(),
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    logger.debug(f"HTTP 连接池已创建: pool_connections={pool_connections}, pool_maxsize={pool_maxsize}")
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    获取全局共享的 HTTP 会话（线程安全的懒加载）
+
+    Returns:
+        requests.Session: 共享会话
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+
+def close_session():
+    """关闭共享会话，释放连接池（配置变更后下次请求会重新创建）"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_proxies() -> Dict[str, str]:
+    """
+    根据当前代理配置构建 requests 所需的 proxies 字典
+
+    代理配置可能在 WebUI 中被修改，因此每次请求时读取最新配置
+    """
+    http_proxy = config.proxy.get("http")
+    if not http_proxy:
+        return {}
+    return {
+        "http": http_proxy,
+        "https": config.proxy.get("https") or http_proxy,
+    }
+
+
+def default_timeout() -> Tuple[float, float]:
+    """默认超时时间 (连接超时, 读取超时)"""
+    return (
+        float(config.app.get("http_connect_timeout", 10)),
+        float(config.app.get("http_read_timeout", 120)),
+    )
+
+
+def _status_retry_delay(response: requests.Response, attempt: int) -> float:
+    """状态码重试前的等待时间：优先使用 Retry-After，否则按指数退避"""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(MAX_RETRY_AFTER, max(0.0, Retry().parse_retry_after(retry_after)))
+        except Exception:
+            pass
+    return min(MAX_RETRY_AFTER, float(config.app.get("http_backoff_factor", 1.0)) * (2 ** attempt))
+
+
+def request(method: str,
+            url: str,
+            timeout: Optional[Union[float, Tuple[float, float]]] = None,
+            use_proxy: bool = True,
+            retry_status: bool = False,
+            **kwargs) -> requests.Response:
+    """
+    通过共享连接池发送 HTTP 请求
+
+    Args:
+        method: 请求方法，如 GET、POST
+        url: 请求地址
+        timeout: 超时时间，可以是单个数值或 (连接超时, 读取超时)，默认读取配置
+        use_proxy: 是否使用配置中的代理（调用方显式传入 proxies 时以调用方为准）
+        retry_status: 非幂等请求可以安全重放时设为 True，在 429/502/503/504 时按 Retry-After 或指数退避重试，
+            最多 http_max_retries 次（幂等方法已由共享重试策略处理，此参数不起作用）；文件等请求体需可重复读取
+        **kwargs: 透传给 requests 的其他参数
+
+    Returns:
+        requests.Response: 响应对象（重试耗尽后返回最后一次响应）
+
+    Raises:
+        requests.exceptions.Timeout: 连接或读取超时（重试耗尽）时抛出
+        requests.exceptions.RequestException: 其他网络错误且重试耗尽时抛出
+    """
+    if timeout is None:
+        timeout = default_timeout()
+    if use_proxy and "proxies" not in kwargs:
+        proxies = get_proxies()
+        if proxies:
+            kwargs["proxies"] = proxies
+
+    retries = 0
+    if retry_status and method.upper() not in Retry.DEFAULT_ALLOWED_METHODS:
+        retries = int(config.app.get("http_max_retries", 2))
+    for attempt in range(retries + 1):
+        response = _send(method, url, timeout, **kwargs)
+        if attempt >= retries or response.status_code not in REPLAYABLE_STATUS_CODES:
+            return response
+        delay = _status_retry_delay(response, attempt)
+        logger.warning(f"{method} {url} 返回 HTTP {response.status_code}，{delay:.1f} 秒后重试 "
+                       f"({attempt + 1}/{retries})")
+        response.close()
+        time.sleep(delay)
+
+
+def _send(method: str, url: str, timeout, **kwargs) -> requests.Response:
+    """发送一次请求，读取超时重试耗尽时抛出 ReadTimeout"""
+    try:
+        return get_session().request(method, url, timeout=timeout, **kwargs)
+    except requests.exceptions.ConnectionError as e:
+        # requests 把读取超时重试耗尽（MaxRetryError）包装为 ConnectionError，这里还原为超时
+        reason = e.args[0] if e.args else None
+        if isinstance(reason, MaxRetryError) and isinstance(reason.reason, ReadTimeoutError):
+            raise requests.exceptions.ReadTimeout(e, request=e.request, response=e.response) from e
+        raise
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """发送 GET 请求，参数同 request()"""
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    """发送 POST 请求，参数同 request()"""
+    return request("POST", url, **kwargs)
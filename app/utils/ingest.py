@@ -0,0 +1,415 @@
+"""
+视频素材的流式导入
+
+上传和下载的视频可能有几个 GB，原来的实现一次性 read() / .content 把整个文件读入内存，
+并发上传时 Web 节点会被挤进 swap。这里统一按固定大小分块写入同目录下的临时文件，完成后原子重命名：
+- 写入过程中同步计算内容指纹（与 clip_cache 片段缓存、Gemini 转录代理使用的指纹一致），
+  导入完成时指纹已经登记，下游缓存（关键帧、片段、转录）在第一个处理阶段开始前就能确定缓存键
+- 完成后用 ffprobe 读取时长、分辨率、帧率等基本信息，下载的素材据此判断是否有效
+- 写入中断或大小不符时删除临时文件，目标路径上不会出现写了一半的视频
+- URL 下载写入固定的 .part 文件，连接中断或被中止后按 HTTP Range 从断点继续
+
+指纹格式：文件大小 + 均匀分布的采样块（首尾块必然包含）的 blake2b 哈希，只与内容有关，
+移动或重命名文件后不变
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import threading
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+# 分块大小
+CHUNK_SIZE = 1024 * 1024
+# 网络读取块大小：连接中断时当前块内已收到的数据会丢失，取较小值以减少续传时重复下载的数据量
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# 采样块数和每块大小；小于 SAMPLE_COUNT * SAMPLE_SIZE 的文件直接计算整体哈希
+SAMPLE_COUNT = 16
+SAMPLE_SIZE = 64 * 1024
+
+_fingerprints: Dict[Tuple[str, int, int], str] = {}
+_fingerprints_lock = threading.Lock()
+
+# 按内容指纹缓存的 ffprobe 结果
+_media_info: Dict[str, Dict] = {}
+
+_part_locks: Dict[str, threading.Lock] = {}
+_part_locks_guard = threading.Lock()
+
+
+class IngestError(IOError):
+    """导入失败（写入中断、大小不符等）"""
+
+
+@dataclass
+class IngestResult:
+    """导入结果"""
+    path: str
+    size: int
+    fingerprint: str
+    probe: Dict = field(default_factory=dict)
+
+    @property
+    def content_key(self) -> str:
+        return _content_key(self.fingerprint)
+
+
+def _sample_offsets(size: int) -> Optional[List[int]]:
+    """采样块的起始偏移，文件较小（整体哈希）时返回 None"""
+    if size <= SAMPLE_COUNT * SAMPLE_SIZE:
+        return None
+    step = (size - SAMPLE_SIZE) / (SAMPLE_COUNT - 1)
+    return [int(index * step) for index in range(SAMPLE_COUNT)]
+
+
+def _format_fingerprint(size: int, digest) -> str:
+    return f"{size:x}-{digest.hexdigest()}"
+
+
+def _content_key(fingerprint: str) -> str:
+    return hashlib.md5(fingerprint.encode("utf-8")).hexdigest()
+
+
+class StreamingFingerprint:
+    """
+    在数据流经时计算内容指纹（需要预先知道总大小，结果与 file_fingerprint() 相同）
+
+    大文件的采样块互不重叠且按偏移递增，只需缓存当前采样块；小文件最多缓存 1MB
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._digest = hashlib.blake2b(digest_size=16)
+        self._offsets = _sample_offsets(size)
+        self._position = 0
+        self._sample_index = 0
+
+    def update(self, chunk: bytes):
+        chunk_start = self._position
+        self._position += len(chunk)
+        if self._offsets is None:
+            self._digest.update(chunk)
+            return
+        view = memoryview(chunk)
+        while self._sample_index < len(self._offsets):
+            sample_start = self._offsets[self._sample_index]
+            sample_end = sample_start + SAMPLE_SIZE
+            if sample_start >= self._position:
+                break
+            begin = max(sample_start, chunk_start)
+            end = min(sample_end, self._position)
+            if begin < end:
+                self._digest.update(view[begin - chunk_start:end - chunk_start])
+            if sample_end > self._position:
+                break
+            self._sample_index += 1
+
+    def hexdigest(self) -> str:
+        if self._position != self.size:
+            raise IngestError(f"数据大小不符: 预期 {self.size} 字节，实际 {self._position} 字节")
+        return _format_fingerprint(self.size, self._digest)
+
+
+def _memo_key(file_path: str) -> Tuple[str, int, int]:
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+
+def remember_fingerprint(file_path: str, fingerprint: str):
+    """登记已知文件的指纹（文件修改后自动失效）"""
+    key = _memo_key(file_path)
+    with _fingerprints_lock:
+        _fingerprints[key] = fingerprint
+
+
+def file_fingerprint(file_path: str) -> str:
+    """
+    计算视频内容指纹：文件大小 + 均匀分布的采样块哈希
+
+    只读取约 1MB 数据，结果按 (路径, 大小, 修改时间) 在进程内缓存；通过本模块导入的文件在导入时已登记
+
+    Args:
+        file_path: 视频文件路径
+
+    Returns:
+        str: 指纹字符串
+    """
+    memo_key = _memo_key(file_path)
+    with _fingerprints_lock:
+        if memo_key in _fingerprints:
+            return _fingerprints[memo_key]
+
+    size = memo_key[1]
+    digest = hashlib.blake2b(digest_size=16)
+    offsets = _sample_offsets(size)
+    with open(file_path, "rb") as f:
+        if offsets is None:
+            digest.update(f.read())
+        else:
+            for offset in offsets:
+                f.seek(offset)
+                digest.update(f.read(SAMPLE_SIZE))
+    fingerprint = _format_fingerprint(size, digest)
+
+    with _fingerprints_lock:
+        _fingerprints[memo_key] = fingerprint
+    return fingerprint
+
+
+def content_key(file_path: str) -> str:
+    """基于内容指纹的缓存键（32 位十六进制，可用作目录名）"""
+    return _content_key(file_fingerprint(file_path))
+
+
+def probe(file_path: str) -> Dict:
+    """
+    用 ffprobe 读取视频基本信息
+
+    Returns:
+        Dict: duration、width、height、fps、video_codec、has_audio；无法解析时返回空字典
+    """
+    cmd = [
+        "ffprobe", "-v", "error", "-print_format", "json",
+        "-show_entries", "format=duration:stream=codec_type,codec_name,width,height,avg_frame_rate",
+        file_path,
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=60)
+        data = json.loads(result.stdout or "{}")
+    except (OSError, subprocess.SubprocessError, ValueError) as e:
+        logger.warning(f"读取视频信息失败: {file_path} => {e}")
+        return {}
+
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    info = {
+        "duration": float(data.get("format", {}).get("duration") or 0),
+        "has_audio": any(s.get("codec_type") == "audio" for s in streams),
+    }
+    if video:
+        num, _, den = (video.get("avg_frame_rate") or "0/1").partition("/")
+        try:
+            fps = float(num) / float(den or 1)
+        except (ValueError, ZeroDivisionError):
+            fps = 0.0
+        info.update({
+            "width": int(video.get("width") or 0),
+            "height": int(video.get("height") or 0),
+            "fps": round(fps, 3),
+            "video_codec": video.get("codec_name", ""),
+        })
+    return info
+
+
+def media_info(file_path: str) -> Dict:
+    """
+    带缓存的 probe()：按内容指纹缓存，同一素材只调用一次 ffprobe
+
+    Args:
+        file_path: 视频文件路径
+
+    Returns:
+        Dict: 同 probe()；ffprobe 失败的结果不缓存
+    """
+    fingerprint = file_fingerprint(file_path)
+    with _fingerprints_lock:
+        if fingerprint in _media_info:
+            return _media_info[fingerprint]
+    info = probe(file_path)
+    if info:
+        with _fingerprints_lock:
+            _media_info[fingerprint] = info
+    return info
+
+
+def ingest_stream(chunks: Iterable[bytes], dest_path: str, expected_size: Optional[int] = None,
+                  probe_media: bool = True) -> IngestResult:
+    """
+    把数据块流式写入 dest_path（临时文件 + 原子重命名），同时计算内容指纹
+
+    Args:
+        chunks: 数据块迭代器
+        dest_path: 目标路径
+        expected_size: 预期总大小，已知时边写边计算指纹并校验大小，未知时写完后读取采样块计算
+        probe_media: 是否用 ffprobe 读取视频信息
+
+    Returns:
+        IngestResult: 导入结果
+
+    Raises:
+        IngestError: 大小不符或写入失败
+    """
+    dest_dir = os.path.dirname(os.path.abspath(dest_path))
+    os.makedirs(dest_dir, exist_ok=True)
+    tmp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.part"
+    streaming = StreamingFingerprint(expected_size) if expected_size is not None else None
+    written = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                f.write(chunk)
+                written += len(chunk)
+                if streaming is not None:
+                    streaming.update(chunk)
+        fingerprint = streaming.hexdigest() if streaming is not None else None
+        os.replace(tmp_path, dest_path)
+    except (OSError, IngestError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if fingerprint is None:
+        fingerprint = file_fingerprint(dest_path)
+    else:
+        remember_fingerprint(dest_path, fingerprint)
+
+    result = IngestResult(path=dest_path, size=written, fingerprint=fingerprint)
+    if probe_media:
+        result.probe = media_info(dest_path)
+    logger.info(f"已导入 {os.path.basename(dest_path)}: {written / 1e6:.1f}MB, 指纹 {fingerprint}")
+    return result
+
+
+def iter_file_object(file_object: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterable[bytes]:
+    """按块读取文件对象"""
+    if hasattr(file_object, "seek"):
+        file_object.seek(0)
+    while True:
+        chunk = file_object.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def ingest_file_object(file_object: BinaryIO, dest_path: str, size: Optional[int] = None,
+                       probe_media: bool = True) -> IngestResult:
+    """
+    导入文件对象（如 Streamlit 的 UploadedFile），按块复制而不是一次性 read()
+
+    Args:
+        file_object: 可读的二进制文件对象
+        dest_path: 目标路径
+        size: 文件大小（UploadedFile.size），用于边写边计算指纹
+        probe_media: 是否用 ffprobe 读取视频信息
+    """
+    if size is None:
+        size = getattr(file_object, "size", None)
+    return ingest_stream(iter_file_object(file_object), dest_path, expected_size=size, probe_media=probe_media)
+
+
+def _part_lock(part_path: str) -> threading.Lock:
+    with _part_locks_guard:
+        return _part_locks.setdefault(os.path.abspath(part_path), threading.Lock())
+
+
+def _total_size(response) -> Optional[int]:
+    """从响应头解析完整文件大小（Content-Range 的总长度或 Content-Length）"""
+    content_range = response.headers.get("Content-Range", "")
+    if "/" in content_range:
+        total = content_range.rsplit("/", 1)[1].strip()
+        return int(total) if total.isdigit() else None
+    content_length = response.headers.get("Content-Length")
+    # 压缩传输时 Content-Length 是压缩后的大小，与写入的数据量不一致
+    if content_length and content_length.isdigit() and not response.headers.get("Content-Encoding"):
+        return int(content_length)
+    return None
+
+
+def ingest_url(url: str, dest_path: str, probe_media: bool = True, max_retries: int = 3,
+               stop_event: Optional[threading.Event] = None, **request_kwargs) -> IngestResult:
+    """
+    流式下载 URL 到 dest_path，支持断点续传
+
+    数据先写入 dest_path + ".part"，连接中断时按已写入的字节数发送 Range 请求继续下载；
+    下载被 stop_event 中止或重试耗尽时保留 .part 文件，下次下载同一路径时从断点继续。
+    服务器不支持 Range（返回 200）时从头下载。
+
+    Args:
+        url: 下载地址
+        dest_path: 目标路径
+        probe_media: 是否用 ffprobe 读取视频信息
+        max_retries: 连接中断后的续传次数
+        stop_event: 设置后在下一个数据块处中止下载
+        **request_kwargs: 透传给 http_client.get 的参数（timeout、verify 等）
+
+    Raises:
+        IngestError: HTTP 错误、下载中止、重试耗尽或大小不符
+    """
+    import requests
+
+    from app.utils import http_client
+
+    part_path = f"{dest_path}.part"
+    os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+
+    base_headers = dict(request_kwargs.pop("headers", None) or {})
+
+    with _part_lock(part_path):
+        # 只有从 0 字节开始写入时才能边下载边计算指纹
+        streaming = None
+        total = None
+        attempt = 0
+        while True:
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = dict(base_headers)
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+            try:
+                with http_client.get(url, stream=True, headers=headers, **request_kwargs) as response:
+                    if response.status_code == 416 and offset:
+                        # 请求范围越界：.part 已完整（上次写完但未来得及重命名）或已失效
+                        total = _total_size(response)
+                        if total == offset:
+                            break
+                        os.remove(part_path)
+                        streaming = None
+                        continue
+                    if response.status_code not in (200, 206):
+                        raise IngestError(f"下载失败: HTTP {response.status_code} {url}")
+                    if response.status_code == 200 or not offset:
+                        # 服务器忽略了 Range，从头写入
+                        offset = 0
+                        total = _total_size(response)
+                        streaming = StreamingFingerprint(total) if total is not None else None
+                    else:
+                        total = _total_size(response)
+                        logger.info(f"断点续传: {os.path.basename(dest_path)} 从 {offset / 1e6:.1f}MB 继续")
+
+                    with open(part_path, "ab" if offset else "wb") as f:
+                        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                            if stop_event is not None and stop_event.is_set():
+                                raise IngestError(f"下载已中止: {url}")
+                            if not chunk:
+                                continue
+                            f.write(chunk)
+                            if streaming is not None:
+                                streaming.update(chunk)
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                attempt += 1
+                if attempt > max_retries:
+                    raise IngestError(f"下载中断且重试耗尽: {url} => {e}") from e
+                logger.warning(f"下载中断，准备续传（{attempt}/{max_retries}）: {url} => {e}")
+
+        size = os.path.getsize(part_path)
+        if total is not None and size != total:
+            os.remove(part_path)
+            raise IngestError(f"数据大小不符: 预期 {total} 字节，实际 {size} 字节")
+        os.replace(part_path, dest_path)
+
+    # 只有一次性完整下载时才有流式指纹，续传的文件读取采样块计算
+    if streaming is not None and streaming.size == size:
+        remember_fingerprint(dest_path, streaming.hexdigest())
+    result = IngestResult(path=dest_path, size=size, fingerprint=file_fingerprint(dest_path))
+    if probe_media:
+        result.probe = media_info(dest_path)
+    logger.info(f"已下载 {os.path.basename(dest_path)}: {size / 1e6:.1f}MB, 指纹 {result.fingerprint}")
+    return result
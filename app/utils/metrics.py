@@ -0,0 +1,516 @@
+"""
+任务性能指标
+
+记录渲染任务每个阶段、每个片段的资源消耗，以及 LLM / 视觉模型调用的延迟和 token 用量：
+- 阶段指标：墙钟时间、CPU 时间（含已结束的子进程，如 FFmpeg）、峰值内存、读写字节数、子进程数
+- 子进程数按阶段统计：ffmpeg_runner 等启动子进程的位置调用 record_subprocess()，计入当前阶段及其上级阶段
+- CPU 时间、读写字节数和峰值内存来自进程级计数器（getrusage / io_counters）：
+  同一进程中并发运行多个任务时包含其他任务的消耗；峰值内存是进程启动以来的最大值（ru_maxrss），
+  不是阶段内的峰值。需要精确的单任务数据时应单独运行任务（如 app.benchmark）
+- 每个任务结束时在任务目录下写入 metrics.json 报告
+- 所有任务的累计数据可以导出为 Prometheus 文本格式，写入 textfile 或通过内置 HTTP 端口暴露
+
+用法:
+    with metrics.task(task_id):
+        with metrics.stage("tts"):
+            for item in items:
+                with metrics.stage("tts_segment", segment=item["_id"]) as s:
+                    ...
+                    s.add(bytes_written=os.path.getsize(audio_file))
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from app.config import config
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+_current_task: contextvars.ContextVar = contextvars.ContextVar("narrato_task_metrics", default=None)
+_current_stage: contextvars.ContextVar = contextvars.ContextVar("narrato_stage_metrics", default=None)
+
+# 阶段子进程计数的锁（同一阶段可能在多个线程中启动子进程）
+_subprocess_lock = threading.Lock()
+
+# Prometheus 累计数据
+_registry_lock = threading.Lock()
+_stage_totals: Dict[str, Dict[str, float]] = {}
+_llm_totals: Dict[tuple, Dict[str, float]] = {}
+_peak_rss_bytes = 0
+
+_http_server = None
+
+
+def enabled() -> bool:
+    """是否启用指标采集"""
+    return bool(config.app.get("enable_task_metrics", True))
+
+
+def record_subprocess(count: int = 1):
+    """
+    记录当前阶段启动的子进程，同时计入所有上级阶段（由启动子进程的调用方调用，如 ffmpeg_runner）
+
+    Args:
+        count: 子进程数
+    """
+    current: Optional[StageMetrics] = _current_stage.get()
+    with _subprocess_lock:
+        while current is not None:
+            current.subprocesses += count
+            current = current.parent
+
+
+def _rss_to_bytes(value: int) -> int:
+    # ru_maxrss 在 Linux 上单位为 KB，在 macOS 上为字节
+    return value if sys.platform == "darwin" else value * 1024
+
+
+def _snapshot() -> Dict[str, float]:
+    """采集当前进程的资源使用快照（进程级计数器，包含同一进程中其他任务的消耗）"""
+    snap = {"wall": time.perf_counter()}
+
+    if resource is not None:
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        snap["cpu"] = self_usage.ru_utime + self_usage.ru_stime
+        snap["child_cpu"] = child_usage.ru_utime + child_usage.ru_stime
+        snap["peak_rss"] = _rss_to_bytes(self_usage.ru_maxrss)
+        snap["child_peak_rss"] = _rss_to_bytes(child_usage.ru_maxrss)
+    else:
+        snap["cpu"] = time.process_time()
+        snap["child_cpu"] = 0.0
+        snap["peak_rss"] = psutil.Process().memory_info().rss if psutil else 0
+        snap["child_peak_rss"] = 0
+
+    io = _io_counters()
+    snap["bytes_read"], snap["bytes_written"] = io
+    return snap
+
+
+def _io_counters():
+    """当前进程累计读写字节数"""
+    if psutil is not None:
+        try:
+            counters = psutil.Process().io_counters()
+            return counters.read_bytes, counters.write_bytes
+        except (AttributeError, OSError):
+            pass
+    try:
+        values = {}
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                values[name.strip()] = int(value)
+        return values.get("read_bytes", 0), values.get("write_bytes", 0)
+    except (OSError, ValueError):
+        return 0, 0
+
+
+class StageMetrics:
+    """单个阶段（或片段）的指标记录"""
+
+    def __init__(self, name: str, labels: Dict[str, Any], parent: Optional["StageMetrics"] = None,
+                 counts_into: Optional["StageMetrics"] = None):
+        self.name = name
+        self.labels = labels
+        self.path = f"{parent.path}/{name}" if parent else name
+        # 子进程数同时计入的上级阶段（包括不参与阶段路径的任务根阶段）
+        self.parent = counts_into or parent
+        self.status = "ok"
+        self.subprocesses = 0
+        self.values: Dict[str, float] = {}
+        self.extra: Dict[str, float] = {}
+        self._start: Dict[str, float] = {}
+
+    def add(self, **counters: float):
+        """累加自定义计数，如 bytes_written、frames、tokens 等"""
+        for key, value in counters.items():
+            if value is not None:
+                self.extra[key] = self.extra.get(key, 0) + value
+
+    def _begin(self):
+        self._start = _snapshot()
+
+    def _finish(self):
+        end = _snapshot()
+        start = self._start
+        self.values = {
+            "wall_seconds": end["wall"] - start["wall"],
+            "cpu_seconds": end["cpu"] - start["cpu"],
+            "child_cpu_seconds": end["child_cpu"] - start["child_cpu"],
+            "peak_rss_bytes": end["peak_rss"],
+            "child_peak_rss_bytes": end["child_peak_rss"],
+            "bytes_read": end["bytes_read"] - start["bytes_read"],
+            "bytes_written": end["bytes_written"] - start["bytes_written"],
+            "subprocesses": self.subprocesses,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"stage": self.path, "status": self.status}
+        if self.labels:
+            data["labels"] = self.labels
+        data.update({key: round(value, 4) if isinstance(value, float) else value
+                     for key, value in self.values.items()})
+        if self.extra:
+            data["extra"] = dict(self.extra)
+            # FFmpeg 编码速度（输出媒体时长 / 墙钟时间）
+            if self.extra.get("ffmpeg_wall_seconds"):
+                data["extra"]["ffmpeg_realtime_factor"] = round(
+                    self.extra.get("ffmpeg_media_seconds", 0) / self.extra["ffmpeg_wall_seconds"], 3)
+        return data
+
+
+class TaskMetrics:
+    """单个任务的全部指标"""
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.stages: List[StageMetrics] = []
+        self.llm_calls: List[Dict[str, Any]] = []
+        self.started_at = time.time()
+        self._root = StageMetrics("task", {})
+        self._lock = threading.Lock()
+
+    def record_stage(self, stage: StageMetrics):
+        with self._lock:
+            self.stages.append(stage)
+
+    def record_llm_call(self, call: Dict[str, Any]):
+        with self._lock:
+            self.llm_calls.append(call)
+
+    def summary(self) -> Dict[str, Any]:
+        """按阶段汇总（片段级阶段按名称合并）"""
+        totals: Dict[str, Dict[str, float]] = {}
+        for stage in self.stages:
+            entry = totals.setdefault(stage.path, {"count": 0})
+            entry["count"] += 1
+            for key in ("wall_seconds", "cpu_seconds", "child_cpu_seconds",
+                        "bytes_read", "bytes_written", "subprocesses"):
+                entry[key] = entry.get(key, 0) + stage.values.get(key, 0)
+            entry["peak_rss_bytes"] = max(entry.get("peak_rss_bytes", 0), stage.values.get("peak_rss_bytes", 0))
+        return totals
+
+    def to_dict(self) -> Dict[str, Any]:
+        llm_summary = {
+            "calls": len(self.llm_calls),
+            "latency_seconds": round(sum(call["latency_seconds"] for call in self.llm_calls), 4),
+            "prompt_tokens": sum(call.get("prompt_tokens", 0) for call in self.llm_calls),
+            "completion_tokens": sum(call.get("completion_tokens", 0) for call in self.llm_calls),
+        }
+        return {
+            "task_id": self.task_id,
+            "started_at": self.started_at,
+            "status": self._root.status,
+            "total": self._root.to_dict(),
+            "summary": self.summary(),
+            "stages": [stage.to_dict() for stage in self.stages],
+            "llm": {"summary": llm_summary, "calls": self.llm_calls},
+        }
+
+
+def _update_stage_totals(stage: StageMetrics):
+    global _peak_rss_bytes
+    with _registry_lock:
+        entry = _stage_totals.setdefault(stage.path, {})
+        entry["runs_ok" if stage.status == "ok" else "runs_error"] = \
+            entry.get("runs_ok" if stage.status == "ok" else "runs_error", 0) + 1
+        for key in ("wall_seconds", "cpu_seconds", "child_cpu_seconds",
+                    "bytes_read", "bytes_written", "subprocesses"):
+            entry[key] = entry.get(key, 0) + stage.values.get(key, 0)
+        _peak_rss_bytes = max(_peak_rss_bytes, stage.values.get("peak_rss_bytes", 0))
+
+
+@contextmanager
+def task(task_id: str, report_dir: Optional[str] = None) -> Iterator[Optional[TaskMetrics]]:
+    """
+    记录一个任务的指标，结束时写入 metrics.json
+
+    Args:
+        task_id: 任务ID
+        report_dir: 报告目录，默认为任务目录
+    """
+    if not enabled():
+        yield None
+        return
+
+    metrics = TaskMetrics(task_id)
+    # 外层有 measure() 时，任务内的子进程也计入外层
+    metrics._root.parent = _current_stage.get()
+    task_token = _current_task.set(metrics)
+    stage_token = _current_stage.set(metrics._root)
+    metrics._root._begin()
+    try:
+        yield metrics
+    except BaseException:
+        metrics._root.status = "error"
+        raise
+    finally:
+        metrics._root._finish()
+        _current_stage.reset(stage_token)
+        _current_task.reset(task_token)
+        _write_report(metrics, report_dir)
+        write_prometheus_textfile()
+
+
+@contextmanager
+def stage(name: str, **labels) -> Iterator[StageMetrics]:
+    """
+    记录一个阶段或片段的指标，嵌套调用时阶段名会拼接为 "父阶段/子阶段"
+
+    没有活动任务或未启用指标时只返回一个不记录的占位对象
+    """
+    metrics: Optional[TaskMetrics] = _current_task.get()
+    parent: Optional[StageMetrics] = _current_stage.get()
+    if metrics is None:
+        yield StageMetrics(name, labels)
+        return
+
+    current = StageMetrics(name, labels, None if parent is metrics._root else parent, counts_into=parent)
+    token = _current_stage.set(current)
+    current._begin()
+    try:
+        yield current
+    except BaseException:
+        current.status = "error"
+        raise
+    finally:
+        current._finish()
+        _current_stage.reset(token)
+        metrics.record_stage(current)
+        _update_stage_totals(current)
+
+
+@contextmanager
+def measure(name: str = "measure", **labels) -> Iterator[StageMetrics]:
+    """
+    独立测量一段代码的资源消耗（不依赖活动任务，也不写入累计数据），供基准测试等场景使用
+
+    退出后可从返回对象的 values 中读取 wall_seconds、cpu_seconds 等指标
+    """
+    current = StageMetrics(name, labels, counts_into=_current_stage.get())
+    token = _current_stage.set(current)
+    current._begin()
+    try:
+        yield current
+    except BaseException:
+        current.status = "error"
+        raise
+    finally:
+        current._finish()
+        _current_stage.reset(token)
+
+
+def current_task() -> Optional[TaskMetrics]:
+    """当前线程/协程中活动的任务指标"""
+    return _current_task.get()
+
+
+def current_stage() -> Optional[StageMetrics]:
+    """当前活动的阶段（没有活动任务时返回 None）"""
+    if _current_task.get() is None:
+        return None
+    return _current_stage.get()
+
+
+def record_llm_call(kind: str,
+                    provider: str,
+                    model: str,
+                    latency_seconds: float,
+                    status: str = "ok",
+                    prompt_tokens: int = 0,
+                    completion_tokens: int = 0):
+    """
+    记录一次 LLM / 视觉模型调用
+
+    Args:
+        kind: 调用类型，如 text、text_stream、vision
+        provider: 提供商名称
+        model: 模型名称
+        latency_seconds: 调用耗时（秒）
+        status: ok 或 error
+        prompt_tokens: 输入 token 数
+        completion_tokens: 输出 token 数
+    """
+    if not enabled():
+        return
+
+    call = {
+        "kind": kind,
+        "provider": provider,
+        "model": model,
+        "status": status,
+        "latency_seconds": round(latency_seconds, 4),
+        "prompt_tokens": prompt_tokens or 0,
+        "completion_tokens": completion_tokens or 0,
+    }
+    metrics = _current_task.get()
+    if metrics is not None:
+        metrics.record_llm_call(call)
+
+    with _registry_lock:
+        entry = _llm_totals.setdefault((kind, provider, model, status), {})
+        entry["requests"] = entry.get("requests", 0) + 1
+        entry["latency_seconds"] = entry.get("latency_seconds", 0) + latency_seconds
+        entry["prompt_tokens"] = entry.get("prompt_tokens", 0) + call["prompt_tokens"]
+        entry["completion_tokens"] = entry.get("completion_tokens", 0) + call["completion_tokens"]
+
+
+def usage_tokens(usage) -> tuple:
+    """从 LiteLLM/OpenAI 的 usage 对象中取出 (输入 token, 输出 token)"""
+    if not usage:
+        return 0, 0
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens", 0) or 0, usage.get("completion_tokens", 0) or 0
+    return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+
+
+def _write_report(metrics: TaskMetrics, report_dir: Optional[str]):
+    try:
+        if report_dir is None:
+            from app.utils import utils
+            report_dir = utils.task_dir(metrics.task_id)
+        report_path = os.path.join(report_dir, "metrics.json")
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(metrics.to_dict(), f, ensure_ascii=False, indent=2)
+        logger.info(f"任务指标已保存: {report_path} (耗时 {metrics._root.values.get('wall_seconds', 0):.2f}s)")
+    except Exception as e:
+        logger.warning(f"写入任务指标失败: {e}")
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    """将进程内累计的指标渲染为 Prometheus 文本格式"""
+    stage_metrics = [
+        ("narrato_stage_wall_seconds_total", "counter", "Wall time spent in each stage", "wall_seconds"),
+        ("narrato_stage_cpu_seconds_total", "counter",
+         "Process-wide CPU time during each stage (includes concurrent tasks)", "cpu_seconds"),
+        ("narrato_stage_child_cpu_seconds_total", "counter",
+         "Process-wide CPU time of reaped child processes during each stage (includes concurrent tasks)",
+         "child_cpu_seconds"),
+        ("narrato_stage_read_bytes_total", "counter",
+         "Process-wide bytes read during each stage (includes concurrent tasks)", "bytes_read"),
+        ("narrato_stage_written_bytes_total", "counter",
+         "Process-wide bytes written during each stage (includes concurrent tasks)", "bytes_written"),
+        ("narrato_stage_subprocesses_total", "counter", "Subprocesses started in each stage", "subprocesses"),
+    ]
+    llm_metrics = [
+        ("narrato_llm_requests_total", "counter", "LLM and vision requests", "requests"),
+        ("narrato_llm_latency_seconds_total", "counter", "Total LLM and vision request latency", "latency_seconds"),
+        ("narrato_llm_prompt_tokens_total", "counter", "Prompt tokens used", "prompt_tokens"),
+        ("narrato_llm_completion_tokens_total", "counter", "Completion tokens used", "completion_tokens"),
+    ]
+
+    lines = []
+    with _registry_lock:
+        stage_totals = {path: dict(values) for path, values in _stage_totals.items()}
+        llm_totals = {key: dict(values) for key, values in _llm_totals.items()}
+        peak_rss = _peak_rss_bytes
+
+    lines += ["# HELP narrato_stage_runs_total Stage executions by status",
+              "# TYPE narrato_stage_runs_total counter"]
+    for path, values in sorted(stage_totals.items()):
+        for status in ("ok", "error"):
+            if f"runs_{status}" in values:
+                lines.append(f'narrato_stage_runs_total{{stage="{_escape_label(path)}",status="{status}"}} '
+                             f'{values[f"runs_{status}"]}')
+
+    for metric, metric_type, help_text, key in stage_metrics:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {metric_type}"]
+        for path, values in sorted(stage_totals.items()):
+            lines.append(f'{metric}{{stage="{_escape_label(path)}"}} {values.get(key, 0)}')
+
+    lines += ["# HELP narrato_peak_rss_bytes Peak resident memory of the process since start (ru_maxrss)",
+              "# TYPE narrato_peak_rss_bytes gauge",
+              f"narrato_peak_rss_bytes {peak_rss}"]
+
+    for metric, metric_type, help_text, key in llm_metrics:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {metric_type}"]
+        for (kind, provider, model, status), values in sorted(llm_totals.items()):
+            labels = (f'kind="{_escape_label(kind)}",provider="{_escape_label(provider)}",'
+                      f'model="{_escape_label(model)}",status="{status}"')
+            lines.append(f"{metric}{{{labels}}} {values.get(key, 0)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(path: Optional[str] = None):
+    """
+    将指标写入 Prometheus textfile（供 node_exporter textfile collector 采集）
+
+    Args:
+        path: 输出路径，默认读取配置 metrics_textfile，未配置则不写入
+    """
+    path = path or config.app.get("metrics_textfile", "")
+    if not path:
+        return
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(render_prometheus())
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"写入 Prometheus 指标文件失败: {e}")
+
+
+def start_http_server(port: Optional[int] = None) -> bool:
+    """
+    在后台线程中启动 /metrics HTTP 端点
+
+    Args:
+        port: 监听端口，默认读取配置 metrics_port，为 0 时不启动
+
+    Returns:
+        bool: 是否已启动
+    """
+    global _http_server
+    port = int(port if port is not None else config.app.get("metrics_port", 0))
+    if not port or _http_server is not None:
+        return _http_server is not None
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        _http_server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    except OSError as e:
+        logger.warning(f"指标端口 {port} 启动失败: {e}")
+        return False
+
+    threading.Thread(target=_http_server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Prometheus 指标端点已启动: http://0.0.0.0:{port}/metrics")
+    return True
@@ -6,7 +6,6 @@ from loguru import logger
 from tqdm import tqdm
 import asyncio
 from tenacity import retry, stop_after_attempt, RetryError, wait_exponential
-from openai import OpenAI
 import PIL.Image
 import base64
 import io
@@ -41,6 +40,8 @@ class QwenAnalyzer:
         使用最简化的参数配置，避免不必要的参数
         """
         try:
+            from openai import OpenAI
+
             self.client = OpenAI(
                 api_key=self.api_key,
                 base_url=self.base_url
@@ -0,0 +1,112 @@
+"""
+渲染档位（预览模式）
+
+审核脚本时不需要等待完整质量的渲染。预览档位在保持时间线、音频和字幕不变的前提下：
+- 把画面缩小到短边 360/480 像素
+- 使用 libx264 ultrafast 预设和较低码率/较高 CRF
+- 降低输出帧率
+
+档位通过上下文变量传递，与 metrics.stage() / ffmpeg_runner.progress_scope() 相同，
+各编码环节（clip_video、merger_video、generate_video）调用 current() 读取当前档位，
+不在预览上下文中时返回 None，保持原有的完整质量参数。
+
+用法:
+    with render_profile.use(render_profile.get_preview_profile("480p")):
+        ...
+"""
+
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """编码档位参数"""
+    name: str
+    short_side: int                 # 输出画面短边像素
+    preset: str = "ultrafast"       # libx264 预设
+    crf: int = 30                   # libx264 CRF
+    video_bitrate: str = "1M"       # 需要指定码率的环节（合并、MoviePy 输出）使用的目标码率
+    max_bitrate: str = "1500k"
+    buffer_size: str = "2M"
+    audio_bitrate: str = "96k"
+    fps: int = 24
+
+    def scale_factor(self, width: int, height: int) -> float:
+        """画面缩放比例（不放大）"""
+        short = min(width, height)
+        if short <= 0:
+            return 1.0
+        return min(1.0, self.short_side / short)
+
+    def scale_size(self, width: int, height: int) -> Tuple[int, int]:
+        """
+        按短边缩放画面尺寸，保持宽高比，结果为偶数（libx264 yuv420p 要求）
+
+        Args:
+            width: 原始宽度
+            height: 原始高度
+
+        Returns:
+            Tuple[int, int]: 缩放后的 (宽, 高)
+        """
+        factor = self.scale_factor(width, height)
+        return _even(width * factor), _even(height * factor)
+
+    def scale_filter(self) -> str:
+        """
+        FFmpeg 缩放滤镜：短边不超过 short_side，另一边按比例取偶数
+        用于裁剪阶段（此时还不知道原视频尺寸）
+        """
+        side = self.short_side
+        return (f"scale=w='if(gte(iw,ih),-2,trunc(min(iw,{side})/2)*2)'"
+                f":h='if(gte(iw,ih),trunc(min(ih,{side})/2)*2,-2)'")
+
+
+PREVIEW_PROFILES = {
+    "360p": RenderProfile(name="360p", short_side=360, crf=32, video_bitrate="600k", max_bitrate="900k",
+                          buffer_size="1200k", audio_bitrate="64k"),
+    "480p": RenderProfile(name="480p", short_side=480, crf=30, video_bitrate="1M", max_bitrate="1500k",
+                          buffer_size="2M", audio_bitrate="96k"),
+}
+
+DEFAULT_PREVIEW_PROFILE = "480p"
+
+_current_profile: contextvars.ContextVar = contextvars.ContextVar("narrato_render_profile", default=None)
+
+
+def _even(value: float) -> int:
+    return max(2, int(round(value / 2)) * 2)
+
+
+def get_preview_profile(name: str = "") -> RenderProfile:
+    """
+    获取预览档位
+
+    Args:
+        name: 档位名称（"360p" / "480p"），为空时使用默认档位
+
+    Returns:
+        RenderProfile: 预览档位
+    """
+    name = name or DEFAULT_PREVIEW_PROFILE
+    if name not in PREVIEW_PROFILES:
+        raise ValueError(f"不支持的预览分辨率: {name}，可选: {', '.join(PREVIEW_PROFILES)}")
+    return PREVIEW_PROFILES[name]
+
+
+def current() -> Optional[RenderProfile]:
+    """当前上下文中的渲染档位，完整质量渲染时返回 None"""
+    return _current_profile.get()
+
+
+@contextmanager
+def use(profile: Optional[RenderProfile]) -> Iterator[Optional[RenderProfile]]:
+    """在上下文中启用渲染档位，profile 为 None 时保持完整质量"""
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
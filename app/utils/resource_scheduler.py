@@ -0,0 +1,383 @@
+"""
+进程级资源调度
+
+多个任务同时渲染时，各自的 FFmpeg / MoviePy 编码都按默认线程数占满 CPU，NVENC 等硬件编码器的
+并发会话数也没有限制（消费级显卡超过限制时直接报错），LLM 请求的并发完全由调用方决定。
+这里统一分配以下资源：
+- CPU 线程：总量默认为 CPU 核数，每个编码命令按任务的 n_threads 和当前活动任务数取公平份额
+- 硬件编码会话：使用 *_nvenc / *_qsv / *_vaapi / *_amf / *_videotoolbox 编码器的命令需要先获得会话名额
+- 磁盘 I/O 令牌：只做流复制（-c copy）的命令受 CPU 影响很小，主要消耗磁盘带宽，单独限制并发数
+- 提供商 API 并发：按提供商名称限制同时进行的 LLM 请求数
+
+ffmpeg_runner.run() 执行的每个命令都会经过调度：获得资源后改写命令中的 -threads、-filter_threads、
+-filter_complex_threads，资源在命令结束（包括重试）后归还。等待时间记录到当前 metrics 阶段。
+
+借出是可重入的：已持有某类资源的上下文（同一线程，或复制了上下文的 asyncio.to_thread）再次申请时
+直接复用已借出的数量，不会再向资源池申请，避免外层持有资源、内层等待同一资源池而死锁。
+
+用法:
+    with resource_scheduler.task(task_id, n_threads=params.n_threads):
+        ...
+        with resource_scheduler.cpu(threads) as granted:
+            clip.write_videofile(output_path, threads=granted)
+
+    async with resource_scheduler.api_slot("gemini"):
+        response = await acompletion(...)
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from app.config import config
+from app.utils import metrics
+
+# 硬件编码器名称后缀
+HW_ENCODER_SUFFIXES = ("_nvenc", "_qsv", "_vaapi", "_amf", "_videotoolbox", "_mf")
+
+# 硬件编码命令使用的 CPU 线程数（解码和滤镜仍在 CPU 上进行）
+HW_ENCODE_THREADS = 2
+
+_CODEC_OPTIONS = ("-c", "-codec", "-c:v", "-codec:v", "-vcodec", "-c:a", "-codec:a", "-acodec")
+_FILTER_OPTIONS = ("-vf", "-af", "-filter:v", "-filter:a", "-filter_complex", "-filter_complex_script", "-lavfi")
+_COMPLEX_FILTER_OPTIONS = ("-filter_complex", "-filter_complex_script", "-lavfi")
+_THREAD_OPTIONS = ("-threads", "-filter_threads", "-filter_complex_threads")
+
+_current_task: contextvars.ContextVar = contextvars.ContextVar("narrato_scheduler_task", default=None)
+
+# 当前上下文已持有的资源 {资源池名称: 借出数量}
+_held: contextvars.ContextVar = contextvars.ContextVar("narrato_scheduler_held", default=None)
+
+
+class ResourcePool:
+    """可按数量借出的资源池（线程安全）"""
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = max(1, int(capacity))
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    @property
+    def available(self) -> int:
+        return self.capacity - self.in_use
+
+    def acquire(self, amount: int = 1, minimum: Optional[int] = None) -> int:
+        """
+        借出资源，可用数量不足 minimum 时阻塞等待
+
+        Args:
+            amount: 希望借出的数量（超过容量时按容量计）
+            minimum: 可以接受的最少数量，默认等于 amount；可用数量介于两者之间时按可用数量借出
+
+        Returns:
+            int: 实际借出的数量
+        """
+        amount = max(1, min(int(amount), self.capacity))
+        minimum = amount if minimum is None else max(1, min(int(minimum), amount))
+        with self._cond:
+            while self.available < minimum:
+                self._cond.wait()
+            granted = min(amount, self.available)
+            self.in_use += granted
+            return granted
+
+    def try_acquire(self, amount: int = 1) -> bool:
+        """不等待地借出 amount 个资源，不足时返回 False"""
+        amount = max(1, min(int(amount), self.capacity))
+        with self._cond:
+            if self.available < amount:
+                return False
+            self.in_use += amount
+            return True
+
+    def release(self, amount: int = 1):
+        with self._cond:
+            self.in_use = max(0, self.in_use - amount)
+            self._cond.notify_all()
+
+
+class _TaskBudget:
+    """单个任务的资源上限"""
+
+    def __init__(self, task_id: str, n_threads: Optional[int]):
+        self.task_id = task_id
+        self.n_threads = n_threads
+
+
+class ResourceScheduler:
+    """进程级资源调度器"""
+
+    def __init__(self):
+        cpu_threads = int(config.app.get("scheduler_cpu_threads", 0)) or (os.cpu_count() or 1)
+        self.cpu_pool = ResourcePool("cpu_threads", cpu_threads)
+        self.hw_encoder_pool = ResourcePool("hw_encoder_sessions",
+                                            int(config.app.get("scheduler_hw_encoder_sessions", 3)))
+        self.io_pool = ResourcePool("disk_io", int(config.app.get("scheduler_io_tokens", 2)))
+        self._provider_limits: Dict[str, int] = {
+            str(name).lower(): int(limit)
+            for name, limit in (config.app.get("scheduler_provider_concurrency", {}) or {}).items()
+        }
+        self._default_provider_limit = int(config.app.get("scheduler_default_provider_concurrency", 4))
+        self._provider_pools: Dict[str, ResourcePool] = {}
+        self._tasks: Dict[str, _TaskBudget] = {}
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------------- 任务
+
+    @contextmanager
+    def task(self, task_id: str, n_threads: Optional[int] = None) -> Iterator[None]:
+        """登记活动任务；任务内的编码命令按 n_threads 和活动任务数分配 CPU 线程"""
+        budget = _TaskBudget(task_id, n_threads)
+        with self._lock:
+            self._tasks[task_id] = budget
+        token = _current_task.set(budget)
+        try:
+            yield
+        finally:
+            _current_task.reset(token)
+            with self._lock:
+                if self._tasks.get(task_id) is budget:
+                    del self._tasks[task_id]
+
+    def active_tasks(self) -> int:
+        with self._lock:
+            return len(self._tasks)
+
+    def thread_budget(self, requested: Optional[int] = None) -> int:
+        """
+        单个编码命令的 CPU 线程数：不超过请求值、任务的 n_threads 和按活动任务数平分的份额
+
+        Args:
+            requested: 调用方请求的线程数，None 表示不限制
+        """
+        share = max(1, self.cpu_pool.capacity // max(1, self.active_tasks()))
+        limits = [share]
+        budget = _current_task.get()
+        if budget is not None and budget.n_threads:
+            limits.append(int(budget.n_threads))
+        if requested:
+            limits.append(int(requested))
+        return max(1, min(limits))
+
+    # ---------------------------------------------------------------- 同步资源
+
+    @contextmanager
+    def cpu(self, threads: Optional[int] = None) -> Iterator[int]:
+        """
+        借出 CPU 线程
+
+        可用线程不足请求值时，至少有一半可用即开始执行，不必等待全部线程空闲
+
+        Args:
+            threads: 请求的线程数，默认按 thread_budget() 计算
+
+        Yields:
+            int: 实际借出的线程数，应作为编码器的线程参数
+        """
+        wanted = self.thread_budget(threads)
+        with self._hold(self.cpu_pool, wanted, minimum=max(1, wanted // 2)) as granted:
+            yield granted
+
+    @contextmanager
+    def hw_encoder(self) -> Iterator[None]:
+        """借出一个硬件编码会话"""
+        with self._hold(self.hw_encoder_pool, 1):
+            yield
+
+    @contextmanager
+    def disk_io(self) -> Iterator[None]:
+        """借出一个磁盘 I/O 令牌"""
+        with self._hold(self.io_pool, 1):
+            yield
+
+    @contextmanager
+    def _hold(self, pool: ResourcePool, amount: int, minimum: Optional[int] = None) -> Iterator[int]:
+        held = _held.get() or {}
+        if pool.name in held:
+            # 嵌套申请：在外层已借出的数量内执行
+            yield max(1, min(int(amount), held[pool.name]))
+            return
+
+        started = time.monotonic()
+        granted = pool.acquire(amount, minimum)
+        _record_wait(pool.name, time.monotonic() - started)
+        token = _held.set(dict(held, **{pool.name: granted}))
+        try:
+            yield granted
+        finally:
+            _held.reset(token)
+            pool.release(granted)
+
+    # ---------------------------------------------------------------- FFmpeg
+
+    @contextmanager
+    def ffmpeg(self, cmd: List[str]) -> Iterator[List[str]]:
+        """
+        为 FFmpeg 命令借出资源，并返回带有显式线程参数的命令
+
+        - 硬件编码：一个编码会话 + HW_ENCODE_THREADS 个 CPU 线程
+        - 只做流复制：一个磁盘 I/O 令牌 + 1 个 CPU 线程
+        - 其他（软件编码）：按 thread_budget() 借出 CPU 线程；命令中已有 -threads 时作为请求值
+          （多路输出各有一个 -threads 时按总和请求）
+
+        Args:
+            cmd: FFmpeg 命令列表
+
+        Yields:
+            List[str]: 改写了线程参数的新命令
+        """
+        kind = classify_ffmpeg(cmd)
+        requested = _requested_threads(cmd)
+        if kind == "hw":
+            with self.hw_encoder(), self.cpu(min(HW_ENCODE_THREADS, requested or HW_ENCODE_THREADS)) as threads:
+                yield with_thread_args(cmd, threads)
+        elif kind == "copy":
+            with self.disk_io(), self.cpu(1) as threads:
+                yield with_thread_args(cmd, threads)
+        else:
+            with self.cpu(requested) as threads:
+                yield with_thread_args(cmd, threads)
+
+    # ---------------------------------------------------------------- 提供商 API
+
+    def provider_pool(self, provider: str) -> ResourcePool:
+        name = (provider or "default").lower()
+        with self._lock:
+            pool = self._provider_pools.get(name)
+            if pool is None:
+                limit = self._provider_limits.get(name, self._default_provider_limit)
+                pool = ResourcePool(f"api:{name}", limit)
+                self._provider_pools[name] = pool
+            return pool
+
+    @asynccontextmanager
+    async def api_slot(self, provider: str) -> AsyncIterator[None]:
+        """
+        借出提供商 API 并发名额（在事件循环中轮询等待，不阻塞循环）
+
+        Args:
+            provider: 提供商名称，如 gemini、openai
+        """
+        pool = self.provider_pool(provider)
+        started = time.monotonic()
+        delay = 0.02
+        while not pool.try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+        _record_wait(pool.name, time.monotonic() - started)
+        try:
+            yield
+        finally:
+            pool.release(1)
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """各资源池的容量和占用情况"""
+        with self._lock:
+            pools = [self.cpu_pool, self.hw_encoder_pool, self.io_pool] + list(self._provider_pools.values())
+            tasks = len(self._tasks)
+        result = {pool.name: {"capacity": pool.capacity, "in_use": pool.in_use} for pool in pools}
+        result["tasks"] = {"active": tasks}
+        return result
+
+
+def classify_ffmpeg(cmd: List[str]) -> str:
+    """
+    判断 FFmpeg 命令的资源类型
+
+    Returns:
+        str: "hw"（硬件编码）、"copy"（只做流复制）或 "cpu"（软件编码）
+    """
+    codecs = [cmd[i + 1] for i, arg in enumerate(cmd[:-1]) if arg in _CODEC_OPTIONS]
+    if any(codec.endswith(HW_ENCODER_SUFFIXES) for codec in codecs):
+        return "hw"
+    has_filters = any(arg in _FILTER_OPTIONS for arg in cmd)
+    if codecs and not has_filters and all(codec == "copy" for codec in codecs):
+        return "copy"
+    return "cpu"
+
+
+def _requested_threads(cmd: List[str]) -> Optional[int]:
+    """命令中 -threads 的总和（多路输出每路一个编码器），没有或无法解析时返回 None"""
+    total = 0
+    for i, arg in enumerate(cmd[:-1]):
+        if arg == "-threads":
+            try:
+                total += int(cmd[i + 1])
+            except ValueError:
+                return None
+    return total or None
+
+
+def with_thread_args(cmd: List[str], threads: int) -> List[str]:
+    """
+    设置命令的线程参数：-filter_threads / -filter_complex_threads 为全局参数，放在可执行文件之后；
+    -threads 放在输出文件之前。命令中已有的线程参数改写为 threads，
+    有多个 -threads（多路输出，每路一个编码器）时按数量均分
+    """
+    value = str(threads)
+    encoder_value = str(max(1, threads // max(1, cmd.count("-threads"))))
+    result = list(cmd)
+    for i, arg in enumerate(result[:-1]):
+        if arg in _THREAD_OPTIONS:
+            result[i + 1] = encoder_value if arg == "-threads" else value
+    if "-filter_threads" not in result:
+        result[1:1] = ["-filter_threads", value]
+    if any(arg in _COMPLEX_FILTER_OPTIONS for arg in result) and "-filter_complex_threads" not in result:
+        result[1:1] = ["-filter_complex_threads", value]
+    if "-threads" not in result:
+        result[-1:-1] = ["-threads", value]
+    return result
+
+
+def _record_wait(pool_name: str, seconds: float):
+    if seconds >= 0.01:
+        logger.debug(f"等待资源 {pool_name} {seconds:.2f}s")
+    stage = metrics.current_stage()
+    if stage is not None:
+        stage.add(scheduler_waits=1, scheduler_wait_seconds=seconds)
+
+
+_scheduler: Optional[ResourceScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> ResourceScheduler:
+    """获取进程级资源调度器（首次调用时按配置创建）"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = ResourceScheduler()
+    return _scheduler
+
+
+def task(task_id: str, n_threads: Optional[int] = None):
+    """登记活动任务，参数同 ResourceScheduler.task()"""
+    return get_scheduler().task(task_id, n_threads)
+
+
+def thread_budget(requested: Optional[int] = None) -> int:
+    """当前任务单个编码命令可用的 CPU 线程数，参数同 ResourceScheduler.thread_budget()"""
+    return get_scheduler().thread_budget(requested)
+
+
+def cpu(threads: Optional[int] = None):
+    """借出 CPU 线程，参数同 ResourceScheduler.cpu()"""
+    return get_scheduler().cpu(threads)
+
+
+def ffmpeg(cmd: List[str]):
+    """为 FFmpeg 命令借出资源，参数同 ResourceScheduler.ffmpeg()"""
+    return get_scheduler().ffmpeg(cmd)
+
+
+def api_slot(provider: str):
+    """借出提供商 API 并发名额，参数同 ResourceScheduler.api_slot()"""
+    return get_scheduler().api_slot(provider)
@@ -5,7 +5,6 @@ from loguru import logger
 # import tiktoken
 from typing import List, Dict
 from datetime import datetime
-from openai import OpenAI
 import requests
 import time
 
@@ -84,6 +83,7 @@ class OpenAIGenerator(BaseGenerator):
     def __init__(self, model_name: str, api_key: str, prompt: str, base_url: str):
         super().__init__(model_name, api_key, prompt)
         base_url = base_url or f"https://api.openai.com/v1"
+        from openai import OpenAI
         self.client = OpenAI(api_key=api_key, base_url=base_url)
         self.max_tokens = 5000
         
@@ -317,6 +317,7 @@ class QwenGenerator(BaseGenerator):
     """阿里云千问 API 生成器实现"""
     def __init__(self, model_name: str, api_key: str, prompt: str, base_url: str):
         super().__init__(model_name, api_key, prompt)
+        from openai import OpenAI
         self.client = OpenAI(
             api_key=api_key,
             base_url=base_url or "https://dashscope.aliyuncs.com/compatible-mode/v1"
@@ -353,6 +354,7 @@ class MoonshotGenerator(BaseGenerator):
     """Moonshot API 生成器实现"""
     def __init__(self, model_name: str, api_key: str, prompt: str, base_url: str):
         super().__init__(model_name, api_key, prompt)
+        from openai import OpenAI
         self.client = OpenAI(
             api_key=api_key,
             base_url=base_url or "https://api.moonshot.cn/v1"
@@ -398,6 +400,7 @@ class DeepSeekGenerator(BaseGenerator):
     """DeepSeek API 生成器实现"""
     def __init__(self, model_name: str, api_key: str, prompt: str, base_url: str):
         super().__init__(model_name, api_key, prompt)
+        from openai import OpenAI
         self.client = OpenAI(
             api_key=api_key,
             base_url=base_url or "https://api.deepseek.com"
@@ -582,12 +582,13 @@ def clear_keyframes_cache(video_path: str = None):
             return
 
         if video_path:
-            # 理指定视频的缓存
-            video_hash = md5(video_path + str(os.path.getmtime(video_path)))
+            # 理指定视频的缓存（同时移除产物存储中的索引）
+            from app.utils import artifact_store, ingest
+
+            video_hash = ingest.content_key(video_path)
             video_keyframes_dir = os.path.join(keyframes_dir, video_hash)
             if os.path.exists(video_keyframes_dir):
-                import shutil
-                shutil.rmtree(video_keyframes_dir)
+                artifact_store.get_store().discard("keyframes", video_hash)
                 logger.info(f"已清理视频关键帧缓存: {video_path}")
         else:
             # 清理所有缓存
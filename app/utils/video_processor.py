@@ -7,19 +7,22 @@
 3. 支持多种视频格式
 4. 支持高清视频帧输出
 5. 直接从原视频提取高质量关键帧
+6. 支持单次解码、在滤镜中缩放到视觉模型目标尺寸，逐帧输出关键帧文件（每帧只写入一次）
 
 不依赖OpenCV和sklearn等库，只使用ffmpeg作为外部依赖，降低了安装和使用的复杂度。
 """
 
 import os
 import re
+import shutil
+import tempfile
 import time
 import subprocess
-from typing import List, Dict
+from typing import List, Dict, Iterator, Tuple
 from loguru import logger
 from tqdm import tqdm
 
-from app.utils import ffmpeg_utils
+from app.utils import ffmpeg_utils, ffmpeg_runner, metrics
 from app.config.ffmpeg_config import FFmpegConfigManager
 
 
@@ -419,20 +422,8 @@ class VideoProcessor:
             bool: 是否成功
         """
         try:
-            # 参考 clip_video.py 中的 Windows 处理方式
-            is_windows = os.name == 'nt'
-            process_kwargs = {
-                "stdout": subprocess.PIPE,
-                "stderr": subprocess.PIPE,
-                "text": True,
-                "check": True,
-                "timeout": 30  # 30秒超时
-            }
-
-            if is_windows:
-                process_kwargs["encoding"] = 'utf-8'
-
-            result = subprocess.run(cmd, **process_kwargs)
+            # 单帧提取很快，卡住时直接放弃（调用方会尝试其他提取方式）
+            ffmpeg_runner.run(cmd, timeout=30, stall_timeout=30, retries=0, description=description)
 
             # 验证输出文件
             output_path = cmd[-1]
@@ -492,6 +483,131 @@ class VideoProcessor:
             logger.error(f"视频处理失败: \n{traceback.format_exc()}")
             raise
 
+    @staticmethod
+    def _keyframe_filename(frame_number: int, timestamp: float) -> str:
+        """生成关键帧文件名：keyframe_帧序号_HHMMSSmmm.jpg"""
+        hours = int(timestamp // 3600)
+        minutes = int((timestamp % 3600) // 60)
+        seconds = int(timestamp % 60)
+        milliseconds = int((timestamp % 1) * 1000)
+        return f"keyframe_{frame_number:06d}_{hours:02d}{minutes:02d}{seconds:02d}{milliseconds:03d}.jpg"
+
+    def iter_frames_by_interval(self, output_dir: str, interval_seconds: float = 5.0, max_size: int = 1024,
+                                quality: int = 3) -> Iterator[Tuple[float, int, str]]:
+        """
+        单次解码按时间间隔逐帧输出关键帧文件
+
+        在 ffmpeg 滤镜中完成抽帧和缩放（长边不超过 max_size），image2 muxer 把每帧写入 output_dir 下的
+        临时子目录；下一帧文件出现（或进程结束）时当前帧已写完，直接重命名为关键帧文件名，
+        每帧只写入磁盘一次，不需要在 JPEG 字节流中查找帧边界。调用方停止迭代时会终止 ffmpeg 进程。
+
+        Args:
+            output_dir: 输出目录
+            interval_seconds: 帧提取间隔（秒）
+            max_size: 输出图片的最大边长（与视觉模型预处理尺寸一致）
+            quality: JPEG 质量参数（-q:v，2-31，越小质量越高）
+
+        Yields:
+            Tuple[float, int, str]: (时间戳秒数, 帧号, 关键帧文件路径)
+
+        Raises:
+            Exception: ffmpeg 非正常退出（即使已经输出了部分帧）
+        """
+        video_filter = (
+            f"fps=1/{interval_seconds},"
+            f"scale=w='min(iw,{max_size})':h='min(ih,{max_size})'"
+            f":force_original_aspect_ratio=decrease:flags=lanczos"
+        )
+        os.makedirs(output_dir, exist_ok=True)
+        # 与输出目录在同一文件系统上，重命名不需要复制数据
+        work_dir = tempfile.mkdtemp(prefix=".extracting_", dir=output_dir)
+        cmd = [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel", "error",
+            "-nostats",
+            "-i", self.video_path,
+            "-an", "-sn",
+            "-vf", video_filter,
+            "-pix_fmt", "yuvj420p",
+            "-c:v", "mjpeg",
+            "-q:v", str(quality),
+            "-f", "image2",
+            os.path.join(work_dir, "%06d.jpg")
+        ]
+
+        def frame_path(number: int) -> str:
+            return os.path.join(work_dir, f"{number:06d}.jpg")
+
+        # stderr 写入文件，大量解码警告不会填满管道阻塞 ffmpeg
+        log_path = os.path.join(work_dir, "ffmpeg.log")
+        log_file = open(log_path, "wb")
+        process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=log_file)
+        metrics.record_subprocess()
+        index = 0
+        try:
+            while True:
+                finished = process.poll() is not None
+                while os.path.exists(frame_path(index + 1)):
+                    if not finished and not os.path.exists(frame_path(index + 2)):
+                        break
+                    timestamp = index * interval_seconds
+                    frame_number = int(timestamp * self.fps)
+                    output_path = os.path.join(output_dir, self._keyframe_filename(frame_number, timestamp))
+                    os.replace(frame_path(index + 1), output_path)
+                    index += 1
+                    yield timestamp, frame_number, output_path
+                if finished:
+                    break
+                time.sleep(0.05)
+
+            if process.returncode != 0:
+                log_file.flush()
+                with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
+                    error = f.read().strip()[-2000:]
+                raise Exception(f"流式提取关键帧失败（已输出 {index} 帧）: {error}")
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            log_file.close()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def extract_frames_by_interval_scaled(self, output_dir: str, interval_seconds: float = 5.0,
+                                          max_size: int = 1024) -> List[int]:
+        """
+        单次解码提取已缩放到视觉模型目标尺寸的关键帧
+
+        与逐帧调用 ffmpeg 的方案相比，只启动一个 ffmpeg 进程，并且输出图片已经是
+        视觉模型所需尺寸，后续分析时可直接使用 JPEG 数据，无需再次解码和编码。
+
+        Args:
+            output_dir: 输出目录
+            interval_seconds: 帧提取间隔（秒）
+            max_size: 输出图片的最大边长
+
+        Returns:
+            List[int]: 提取的帧号列表
+        """
+        expected = int(self.duration // interval_seconds) + 1 if self.duration > 0 else None
+        frame_numbers = []
+
+        logger.info(f"开始单次解码提取关键帧，间隔 {interval_seconds} 秒，最大边长 {max_size}px")
+
+        with tqdm(total=expected, desc="🎬 提取关键帧", unit="帧",
+                 bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]") as pbar:
+            for timestamp, frame_number, _ in self.iter_frames_by_interval(output_dir, interval_seconds, max_size):
+                frame_numbers.append(frame_number)
+                pbar.set_postfix({"时间": f"{timestamp:.1f}s"})
+                pbar.update(1)
+
+        logger.info(f"关键帧提取完成: 共 {len(frame_numbers)} 帧")
+
+        if not frame_numbers:
+            raise Exception("关键帧提取完全失败，请检查视频文件")
+
+        return frame_numbers
+
     def extract_frames_by_interval_ultra_compatible(self, output_dir: str, interval_seconds: float = 5.0) -> List[int]:
         """
         使用超级兼容性方案按指定时间间隔提取视频帧
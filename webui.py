@@ -8,6 +8,7 @@ from webui.components import basic_settings, video_settings, audio_settings, sub
 # from webui.utils import cache, file_utils
 from app.utils import utils
 from app.utils import ffmpeg_utils
+from app.utils import metrics
 from app.models.schema import VideoClipParams, VideoAspect
 
 
@@ -134,7 +135,6 @@ def render_generate_button():
         from app.services import state as sm
         from app.models import const
         import threading
-        import time
         import uuid
 
         config.save_config()
@@ -208,9 +208,8 @@ def render_generate_button():
         thread = threading.Thread(target=run_task)
         thread.start()
 
-        # 轮询任务状态
-        while True:
-            task = sm.state.get_task(task_id)
+        # 订阅任务状态变化（内存状态通过条件变量唤醒，Redis 通过 pub/sub 推送）
+        for task in sm.state.watch_task(task_id):
             if task:
                 progress = task.get("progress", 0)
                 state = task.get("state")
@@ -239,8 +238,6 @@ def render_generate_button():
                 elif state == const.TASK_STATE_FAILED:
                     st.error(f"任务失败: {task.get('message', 'Unknown error')}")
                     break
-            
-            time.sleep(0.5)
 
 
 
@@ -264,6 +261,9 @@ def main():
             st.error(f"⚠️ LLM 初始化失败: {str(e)}\n\n请检查配置文件和依赖是否正确安装。")
             # 不抛出异常，允许应用继续运行（但 LLM 功能不可用）
 
+    # 按配置启动 Prometheus 指标端点（metrics_port 为 0 时不启动，重复调用不会重复启动）
+    metrics.start_http_server()
+
     # 检测FFmpeg硬件加速，但只打印一次日志（使用 session_state 持久化）
     if 'hwaccel_logged' not in st.session_state:
         st.session_state['hwaccel_logged'] = False
@@ -9,7 +9,7 @@ from loguru import logger
 from app.config import config
 from app.models.schema import VideoClipParams
 from app.services.subtitle_text import decode_subtitle_bytes
-from app.utils import utils, check_script
+from app.utils import utils, check_script, ingest
 from webui.tools.generate_script_docu import generate_script_docu
 from webui.tools.generate_script_short import generate_script_short
 from webui.tools.generate_short_summary import generate_script_short_sunmmary
@@ -261,13 +261,13 @@ def render_video_file(tr, params):
                 file_name_with_timestamp = f"{file_name}_{timestamp}"
                 video_file_path = os.path.join(utils.video_dir(), file_name_with_timestamp + file_extension)
 
-            with open(video_file_path, "wb") as f:
-                f.write(uploaded_file.read())
-                st.success(tr("File Uploaded Successfully"))
-                st.session_state['video_origin_path'] = video_file_path
-                params.video_origin_path = video_file_path
-                time.sleep(1)
-                st.rerun()
+            # 分块写入并在写入时计算内容指纹，后续关键帧/片段缓存直接使用
+            ingest.ingest_file_object(uploaded_file, video_file_path, size=uploaded_file.size)
+            st.success(tr("File Uploaded Successfully"))
+            st.session_state['video_origin_path'] = video_file_path
+            params.video_origin_path = video_file_path
+            time.sleep(1)
+            st.rerun()
 
 
 def render_short_generate_options(tr):
@@ -39,11 +39,31 @@ def render_subtitle_panel(tr):
             st.session_state['subtitle_enabled'] = enable_subtitles
 
             if enable_subtitles:
+                render_subtitle_mode_settings(tr)
                 render_font_settings(tr)
                 render_position_settings(tr)
                 render_style_settings(tr)
 
 
+def render_subtitle_mode_settings(tr):
+    """渲染叠加解说的字幕输出方式"""
+    subtitle_modes = [
+        ("软字幕轨（不重新编码）", "soft"),
+        ("外挂字幕文件（不重新编码）", "sidecar"),
+        ("烧录到画面（只重新编码字幕区间）", "burn"),
+    ]
+    saved_mode = st.session_state.get('subtitle_mode', 'soft')
+    mode_values = [value for _, value in subtitle_modes]
+    selected_index = st.selectbox(
+        tr("字幕输出方式"),
+        options=range(len(subtitle_modes)),
+        index=mode_values.index(saved_mode) if saved_mode in mode_values else 0,
+        format_func=lambda x: subtitle_modes[x][0],
+        help="仅用于叠加解说：软字幕和外挂字幕直接复制原视频流，几秒到几分钟即可输出整部影片；烧录字幕只重新编码字幕所在的区间"
+    )
+    st.session_state['subtitle_mode'] = subtitle_modes[selected_index][1]
+
+
 def render_font_settings(tr):
     """渲染字体设置"""
     # 获取字体列表
@@ -161,4 +181,5 @@ def get_subtitle_params():
         'custom_position': st.session_state.get('custom_position', 70.0),
         'stroke_color': st.session_state.get('stroke_color', '#000000'),
         'stroke_width': st.session_state.get('stroke_width', 1.5),
+        'subtitle_mode': st.session_state.get('subtitle_mode', 'soft'),
     }
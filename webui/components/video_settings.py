@@ -25,6 +25,24 @@ def render_video_config(tr, params):
     params.video_aspect = VideoAspect(video_aspect_ratios[selected_index][1])
     st.session_state['video_aspect'] = params.video_aspect.value
 
+    # 额外输出比例：与主比例共用配音、混音和字幕，从一次解码同时生成
+    extra_aspect_options = [
+        (tr("Portrait"), VideoAspect.portrait.value),
+        (tr("Landscape"), VideoAspect.landscape.value),
+        ("1:1", VideoAspect.square.value),
+    ]
+    extra_aspect_options = [item for item in extra_aspect_options if item[1] != params.video_aspect.value]
+    extra_labels = {value: label for label, value in extra_aspect_options}
+    saved_extra = [value for value in st.session_state.get('output_aspects') or [] if value in extra_labels]
+    output_aspects = st.multiselect(
+        tr("同时输出其他比例"),
+        options=list(extra_labels),
+        default=saved_extra,
+        format_func=lambda value: extra_labels[value],
+        help="一次渲染同时生成多个画面比例的版本，字幕按各版本画面重新排版"
+    )
+    st.session_state['output_aspects'] = output_aspects
+
     # 视频画质
     video_qualities = [
         ("4K (2160p)", "2160p"),
@@ -74,6 +92,51 @@ def render_video_config(tr, params):
         if 'mute_original_audio' in st.session_state:
             del st.session_state['mute_original_audio']
 
+    # 快速预览：低分辨率 ultrafast 渲染，用于审核脚本
+    preview_modes = [
+        ("关闭（完整质量）", ""),
+        ("360p", "360p"),
+        ("480p", "480p"),
+    ]
+    preview_values = [mode for _, mode in preview_modes]
+    saved_mode = st.session_state.get('preview_mode', '')
+    preview_index = st.selectbox(
+        tr("快速预览"),
+        options=range(len(preview_modes)),
+        format_func=lambda x: preview_modes[x][0],
+        index=preview_values.index(saved_mode) if saved_mode in preview_values else 0,
+        help="以低分辨率快速渲染预览，时间线、音频和字幕与成片一致"
+    )
+    st.session_state['preview_mode'] = preview_modes[preview_index][1]
+
+    if st.session_state['preview_mode']:
+        segments_text = st.text_input(
+            tr("预览片段"),
+            value=st.session_state.get('preview_segments_text', ''),
+            help="只渲染指定片段的 _id，例如 1-3,5；留空渲染全部片段"
+        )
+        st.session_state['preview_segments_text'] = segments_text
+        st.session_state['preview_segments'] = parse_segment_ids(segments_text)
+    else:
+        st.session_state['preview_segments'] = None
+
+
+def parse_segment_ids(text):
+    """解析片段 _id 输入，例如 "1-3,5" -> [1, 2, 3, 5]；无法解析的部分忽略"""
+    segment_ids = []
+    for part in (text or "").replace("，", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        try:
+            start = int(start)
+            end = int(end) if end.strip() else start
+        except ValueError:
+            continue
+        segment_ids.extend(range(min(start, end), max(start, end) + 1))
+    return segment_ids or None
+
 
 
 def get_video_params():
@@ -83,5 +146,8 @@ def get_video_params():
         'video_quality': st.session_state.get('video_quality', '1080p'),
         'original_volume': st.session_state.get('original_volume', AudioVolumeDefaults.ORIGINAL_VOLUME),
         'overlay_mode': st.session_state.get('overlay_mode', False),  # 新增
-        'mute_original_audio': st.session_state.get('mute_original_audio', True)  # 新增
+        'mute_original_audio': st.session_state.get('mute_original_audio', True),  # 新增
+        'preview_mode': st.session_state.get('preview_mode', ''),
+        'preview_segments': st.session_state.get('preview_segments'),
+        'output_aspects': st.session_state.get('output_aspects') or None
     }
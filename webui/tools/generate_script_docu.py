@@ -2,14 +2,13 @@
 import os
 import json
 import time
-import asyncio
 import traceback
 import streamlit as st
 from loguru import logger
 from datetime import datetime
 
 from app.config import config
-from app.utils import utils, video_processor
+from app.utils import utils, video_processor, artifact_store, async_runtime, ingest
 from webui.tools.base import create_vision_analyzer, get_batch_files, get_batch_timestamps
 
 
@@ -39,14 +38,15 @@ def generate_script_docu(params):
             """
             update_progress(10, "正在提取关键帧...")
 
-            # 创建临时目录用于存储关键帧
-            keyframes_dir = os.path.join(utils.temp_dir(), "keyframes")
-            video_hash = utils.md5(params.video_origin_path + str(os.path.getmtime(params.video_origin_path)))
-            video_keyframes_dir = os.path.join(keyframes_dir, video_hash)
+            # 关键帧目录由产物存储管理（配额、LRU 淘汰），只有完整提取并登记过的目录才算命中
+            store = artifact_store.get_store()
+            # 按内容指纹区分视频：上传时已计算好，文件移动或重命名后仍能命中
+            video_hash = ingest.content_key(params.video_origin_path)
+            video_keyframes_dir = store.path("keyframes", video_hash)
 
             # 检查是否已经提取过关键帧
             keyframe_files = []
-            if os.path.exists(video_keyframes_dir):
+            if store.lookup("keyframes", video_hash):
                 # 取已有的关键帧文件
                 for filename in sorted(os.listdir(video_keyframes_dir)):
                     if filename.endswith('.jpg'):
@@ -59,63 +59,73 @@ def generate_script_docu(params):
 
             # 如果没有缓存的关键帧，则进行提取
             if not keyframe_files:
-                try:
-                    # 确保目录存在
-                    os.makedirs(video_keyframes_dir, exist_ok=True)
-
-                    # 初始化视频处理器
-                    processor = video_processor.VideoProcessor(params.video_origin_path)
-
-                    # 显示视频信息
-                    st.info(f"📹 视频信息: {processor.width}x{processor.height}, {processor.fps:.1f}fps, {processor.duration:.1f}秒")
-
-                    # 处理视频并提取关键帧 - 直接使用超级兼容性方案
-                    update_progress(15, "正在提取关键帧（使用超级兼容性方案）...")
-
+                with store.pinned("keyframes", video_hash):
                     try:
-                        # 使用优化的关键帧提取方法
-                        processor.extract_frames_by_interval_ultra_compatible(
-                            output_dir=video_keyframes_dir,
-                            interval_seconds=st.session_state.get('frame_interval_input'),
-                        )
-                    except Exception as extract_error:
-                        logger.error(f"关键帧提取失败: {extract_error}")
+                        # 确保目录存在
+                        os.makedirs(video_keyframes_dir, exist_ok=True)
+
+                        # 初始化视频处理器
+                        processor = video_processor.VideoProcessor(params.video_origin_path)
+
+                        # 显示视频信息
+                        st.info(f"📹 视频信息: {processor.width}x{processor.height}, {processor.fps:.1f}fps, {processor.duration:.1f}秒")
+
+                        # 处理视频并提取关键帧 - 优先单次解码并直接缩放到视觉模型尺寸，失败时使用超级兼容性方案
+                        update_progress(15, "正在提取关键帧...")
+                        frame_interval = st.session_state.get('frame_interval_input')
+
+                        try:
+                            try:
+                                processor.extract_frames_by_interval_scaled(
+                                    output_dir=video_keyframes_dir,
+                                    interval_seconds=frame_interval,
+                                )
+                            except Exception as scaled_error:
+                                logger.warning(f"单次解码提取关键帧失败，改用超级兼容性方案: {scaled_error}")
+                                update_progress(15, "正在提取关键帧（使用超级兼容性方案）...")
+                                for filename in os.listdir(video_keyframes_dir):
+                                    os.remove(os.path.join(video_keyframes_dir, filename))
+                                processor.extract_frames_by_interval_ultra_compatible(
+                                    output_dir=video_keyframes_dir,
+                                    interval_seconds=frame_interval,
+                                )
+                        except Exception as extract_error:
+                            logger.error(f"关键帧提取失败: {extract_error}")
                         
-                        # 提供详细的错误信息和解决建议
-                        error_msg = str(extract_error)
-                        if "权限" in error_msg or "permission" in error_msg.lower():
-                            suggestion = "建议：检查输出目录权限，或更换输出位置"
-                        elif "空间" in error_msg or "space" in error_msg.lower():
-                            suggestion = "建议：检查磁盘空间是否足够"
-                        else:
-                            suggestion = "建议：检查视频文件是否损坏，或尝试转换为标准格式"
-
-                        raise Exception(f"关键帧提取失败: {error_msg}\n{suggestion}")
+                            # 提供详细的错误信息和解决建议
+                            error_msg = str(extract_error)
+                            if "权限" in error_msg or "permission" in error_msg.lower():
+                                suggestion = "建议：检查输出目录权限，或更换输出位置"
+                            elif "空间" in error_msg or "space" in error_msg.lower():
+                                suggestion = "建议：检查磁盘空间是否足够"
+                            else:
+                                suggestion = "建议：检查视频文件是否损坏，或尝试转换为标准格式"
+
+                            raise Exception(f"关键帧提取失败: {error_msg}\n{suggestion}")
+
+                        # 获取所有关键文件路径
+                        for filename in sorted(os.listdir(video_keyframes_dir)):
+                            if filename.endswith('.jpg'):
+                                keyframe_files.append(os.path.join(video_keyframes_dir, filename))
+
+                        if not keyframe_files:
+                            # 检查目录中是否有其他文件
+                            all_files = os.listdir(video_keyframes_dir)
+                            logger.error(f"关键帧目录内容: {all_files}")
+                            raise Exception("未提取到任何关键帧文件，请检查视频文件格式")
+
+                        update_progress(20, f"关键帧提取完成，共 {len(keyframe_files)} 帧")
+                        st.success(f"✅ 成功提取 {len(keyframe_files)} 个关键帧")
 
-                    # 获取所有关键文件路径
-                    for filename in sorted(os.listdir(video_keyframes_dir)):
-                        if filename.endswith('.jpg'):
-                            keyframe_files.append(os.path.join(video_keyframes_dir, filename))
-
-                    if not keyframe_files:
-                        # 检查目录中是否有其他文件
-                        all_files = os.listdir(video_keyframes_dir)
-                        logger.error(f"关键帧目录内容: {all_files}")
-                        raise Exception("未提取到任何关键帧文件，请检查视频文件格式")
-
-                    update_progress(20, f"关键帧提取完成，共 {len(keyframe_files)} 帧")
-                    st.success(f"✅ 成功提取 {len(keyframe_files)} 个关键帧")
-
-                except Exception as e:
-                    # 如果提取失败，清理创建的目录
-                    try:
-                        if os.path.exists(video_keyframes_dir):
-                            import shutil
-                            shutil.rmtree(video_keyframes_dir)
-                    except Exception as cleanup_err:
-                        logger.error(f"清理失败的关键帧目录时出错: {cleanup_err}")
+                    except Exception as e:
+                        # 如果提取失败，清理创建的目录
+                        try:
+                            store.discard("keyframes", video_hash)
+                        except Exception as cleanup_err:
+                            logger.error(f"清理失败的关键帧目录时出错: {cleanup_err}")
 
-                    raise Exception(f"关键帧提取失败: {str(e)}")
+                        raise Exception(f"关键帧提取失败: {str(e)}")
+                store.commit("keyframes", video_hash)
 
             """
             2. 视觉分析(批量分析每一帧)
@@ -172,10 +182,6 @@ def generate_script_docu(params):
 
                 update_progress(40, "正在分析关键帧...")
 
-                # ===================创建异步事件循环===================
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-
                 # 执行异步分析
                 vision_batch_size = st.session_state.get('vision_batch_size') or config.frames.get("vision_batch_size")
                 vision_analysis_prompt = """
@@ -200,14 +206,14 @@ def generate_script_docu(params):
 
 请只返回 JSON 字符串，不要包含任何其他解释性文字。
                 """
-                results = loop.run_until_complete(
+                # 在进程级异步运行时中执行，复用 LLM 客户端连接
+                results = async_runtime.run(
                     analyzer.analyze_images(
                         images=keyframe_files,
                         prompt=vision_analysis_prompt,
                         batch_size=vision_batch_size
                     )
                 )
-                loop.close()
 
                 """
                 3. 处理分析结果（格式化为 json 数据）
@@ -17,9 +17,11 @@ from loguru import logger
 from app.config import config
 from app.services.SDE.short_drama_explanation import analyze_subtitle, generate_narration_script
 from app.services.subtitle_text import read_subtitle_text
+from app.services import voice
 # 导入新的LLM服务模块 - 确保提供商被注册
 import app.services.llm  # 这会触发提供商注册
 from app.services.llm.migration_adapter import SubtitleAnalyzerAdapter
+from webui.components import audio_settings
 import re
 
 
@@ -206,14 +208,32 @@ def generate_script_short_sunmmary(params, subtitle_path, video_theme, temperatu
                 update_progress(60, "正在生成文案...")
 
                 # 根据剧情生成解说文案 - 使用新的LLM服务架构
+                tts_prefetcher = None
+                if config.app.get('llm_stream_output', False):
+                    # 流式生成时每完成一个片段就按当前配音设置提前合成，生成视频时直接复用
+                    audio_params = audio_settings.get_audio_params()
+                    tts_prefetcher = voice.TTSPrefetcher(
+                        audio_params['voice_name'],
+                        audio_params['voice_rate'],
+                        audio_params['voice_pitch'],
+                        audio_params['tts_engine']
+                    )
                 try:
                     # 优先使用新的LLM服务架构
                     logger.info("使用新的LLM服务架构生成解说文案")
+                    def on_narration_item(item):
+                        # 在 LLM 事件循环线程中回调：没有 Streamlit 脚本上下文，不能刷新界面，
+                        # 也不能阻塞事件循环，只把片段交给后台线程池预合成
+                        logger.debug(f"已生成第 {item.get('_id')} 段文案")
+                        if tts_prefetcher:
+                            tts_prefetcher.submit(item)
+
                     narration_result = analyzer.generate_narration_script(
                         short_name=video_theme,
                         plot_analysis=analysis_result["analysis"],
                         subtitle_content=subtitle_content,  # 传递原始字幕内容
-                        temperature=temperature
+                        temperature=temperature,
+                        on_item=on_narration_item
                     )
                 except Exception as e:
                     logger.warning(f"使用新LLM服务失败，回退到旧实现: {str(e)}")
@@ -229,6 +249,9 @@ def generate_script_short_sunmmary(params, subtitle_path, video_theme, temperatu
                         temperature=temperature,
                         provider=text_provider
                     )
+                finally:
+                    if tts_prefetcher:
+                        tts_prefetcher.close()
 
                 if narration_result["status"] == "success":
                     logger.info("\n解说文案生成成功！")
@@ -5,7 +5,7 @@ import platform
 import shutil
 from uuid import uuid4
 from loguru import logger
-from app.utils import utils
+from app.utils import utils, ingest
 
 def open_task_folder(root_dir, task_id):
     """打开任务文件夹
@@ -113,9 +113,9 @@ def save_uploaded_file(uploaded_file, save_dir, allowed_types=None):
             new_file_name = f"{file_name}_{timestamp}{file_extension}"
             save_path = os.path.join(save_dir, new_file_name)
         
-        # 保存文件
-        with open(save_path, "wb") as f:
-            f.write(uploaded_file.read())
+        # 分块保存文件（同时计算内容指纹），避免把整个视频读入内存
+        ingest.ingest_file_object(uploaded_file, save_path, size=getattr(uploaded_file, "size", None),
+                                  probe_media=False)
         
         logger.info(f"文件保存成功: {save_path}")
         return save_path